@@ -1,6 +1,8 @@
 import copy
 import torch
 from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.aggregators.flat_buffer import \
+    pairwise_distances, stack_state_dicts
 
 
 class BulyanAggregator(ClientsAvgAggregator):
@@ -34,39 +36,17 @@ class BulyanAggregator(ClientsAvgAggregator):
             updated_model[key] = init_model[key] + avg_model[key]
         return updated_model
 
-    def _calculate_distance(self, model_a, model_b):
+    def _calculate_score(self, updates, layout):
         """
-        Calculate the Euclidean distance between two given model para delta
+        Calculate Krum scores of the stacked model para delta (one row per
+        client), whose distance is the sum of the Euclidean distances of
+        each key
         """
-        distance = 0.0
-
-        for key in model_a:
-            if isinstance(model_a[key], torch.Tensor):
-                model_a[key] = model_a[key].float()
-                model_b[key] = model_b[key].float()
-            else:
-                model_a[key] = torch.FloatTensor(model_a[key])
-                model_b[key] = torch.FloatTensor(model_b[key])
-
-            distance += torch.dist(model_a[key], model_b[key], p=2)
-        return distance
-
-    def _calculate_score(self, models):
-        """
-        Calculate Krum scores
-        """
-        model_num = len(models)
+        model_num = updates.size(0)
         closest_num = model_num - self.byzantine_node_num - 2
 
-        distance_matrix = torch.zeros(model_num, model_num)
-        for index_a in range(model_num):
-            for index_b in range(index_a, model_num):
-                if index_a == index_b:
-                    distance_matrix[index_a, index_b] = float('inf')
-                else:
-                    distance_matrix[index_a, index_b] = distance_matrix[
-                        index_b, index_a] = self._calculate_distance(
-                            models[index_a], models[index_b])
+        distance_matrix = pairwise_distances(updates, layout).cpu()
+        distance_matrix.fill_diagonal_(float('inf'))
 
         sorted_distance = torch.sort(distance_matrix)[0]
         krum_scores = torch.sum(sorted_distance[:, :closest_num], axis=-1)
@@ -80,27 +60,31 @@ class BulyanAggregator(ClientsAvgAggregator):
         init_model = self.model.state_dict()
         global_update = copy.deepcopy(init_model)
         models_para = [each_model[1] for each_model in models]
-        krum_scores = self._calculate_score(models_para)
-        index_order = torch.sort(krum_scores)[1].numpy()
-        reliable_models = list()
-        for number, index in enumerate(index_order):
-            if number < len(models) - int(
-                    2 * self.sample_client_rate * self.byzantine_node_num):
-                reliable_models.append(models[index])
+        updates, layout = stack_state_dicts(models_para,
+                                            keys=init_model,
+                                            layouts=self._flat_layouts)
+        krum_scores = self._calculate_score(updates, layout)
+        index_order = torch.sort(krum_scores)[1]
+        reliable_num = len(models) - int(
+            2 * self.sample_client_rate * self.byzantine_node_num)
+        reliable_updates = updates.select_rows(
+            index_order[:reliable_num].tolist())
         '''
         Sort parameter for each coordinate of the rest \theta reliable
         local models, and find \gamma (gamma<\theta-2*self.byzantine_num)
         parameters closest to the median to perform averaging
         '''
         exluded_num = int(self.sample_client_rate * self.byzantine_node_num)
-        gamma = len(reliable_models) - 2 * exluded_num
-        for key in init_model:
-            temp = torch.stack(
-                [each_model[1][key] for each_model in reliable_models], 0)
-            pos_largest, _ = torch.topk(temp, exluded_num, 0)
-            neg_smallest, _ = torch.topk(-temp, exluded_num, 0)
-            new_stacked = torch.cat([temp, -pos_largest,
-                                     neg_smallest]).sum(0).float()
-            new_stacked /= gamma
-            global_update[key] = new_stacked
+        gamma = len(reliable_updates) - 2 * exluded_num
+
+        def trimmed_mean(block):
+            pos_largest, _ = torch.topk(block, exluded_num, 0)
+            neg_smallest, _ = torch.topk(-block, exluded_num, 0)
+            new_stacked = block.sum(0) - pos_largest.sum(0) + \
+                neg_smallest.sum(0)
+            return new_stacked / gamma
+
+        global_update.update(
+            layout.unflatten(reliable_updates.reduce_columns(trimmed_mean),
+                             cast=True))
         return global_update
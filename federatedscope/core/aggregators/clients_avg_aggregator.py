@@ -1,7 +1,8 @@
 import os
 import torch
 from federatedscope.core.aggregators import Aggregator
-from federatedscope.core.auxiliaries.utils import param2tensor
+from federatedscope.core.aggregators.flat_buffer import flat_weighted_sum
+from federatedscope.core.aggregators.running_sum import RunningWeightedSum
 
 
 class ClientsAvgAggregator(Aggregator):
@@ -15,6 +16,25 @@ class ClientsAvgAggregator(Aggregator):
         self.model = model
         self.device = device
         self.cfg = config
+        # The layouts of the flattened state dicts, reused across the rounds
+        self._flat_layouts = dict()
+        # The feedbacks folded in as they arrive (for streaming aggregation)
+        self.running_sum = None
+
+    def fold(self, content):
+        """
+        Fold the feedback of a client into the running sum, which is
+        averaged by the next ``aggregate`` (instead of the feedbacks in
+        ``agg_info``).
+
+        Arguments:
+            content (tuple): (sample_size, model_para)
+        """
+        sample_size, model_para = content
+        if self.running_sum is None:
+            self.running_sum = RunningWeightedSum()
+        weight = 1.0 if self.cfg.federate.ignore_weight else sample_size
+        self.running_sum.add(model_para, weight)
 
     def aggregate(self, agg_info):
         """
@@ -26,6 +46,10 @@ class ClientsAvgAggregator(Aggregator):
         Returns:
             dict: the aggregated results
         """
+        if self.running_sum is not None:
+            avg_model = self.running_sum.average()
+            self.running_sum = None
+            return avg_model
 
         models = agg_info["client_feedback"]
         recover_fun = agg_info['recover_fun'] if (
@@ -52,13 +76,27 @@ class ClientsAvgAggregator(Aggregator):
             }
         else:
             ckpt = {'cur_round': cur_round, 'model': self.model.state_dict()}
-        torch.save(ckpt, path)
+
+        if self.cfg.llm.checkpoint.use:
+            from federatedscope.llm.model.checkpoint import save_checkpoint
+            save_checkpoint(path,
+                            ckpt['model'],
+                            cur_round,
+                            save_to=self.cfg.federate.save_to,
+                            blocking=not self.cfg.llm.checkpoint.async_write)
+        else:
+            torch.save(ckpt, path)
 
     def load_model(self, path):
         assert self.model is not None
 
         if os.path.exists(path):
-            ckpt = torch.load(path, map_location='cpu')
+            if self.cfg.llm.checkpoint.use:
+                from federatedscope.llm.model.checkpoint import \
+                    load_checkpoint
+                ckpt = load_checkpoint(path)
+            else:
+                ckpt = torch.load(path, map_location='cpu')
             self.model.load_state_dict(ckpt['model'])
             return ckpt['cur_round']
         else:
@@ -73,6 +111,21 @@ class ClientsAvgAggregator(Aggregator):
             sample_size, _ = models[i]
             training_set_size += sample_size
 
+        if not self.cfg.federate.use_ss:
+            if self.cfg.federate.ignore_weight:
+                weights = [1.0 / len(models)] * len(models)
+            else:
+                weights = [
+                    local_sample_size / training_set_size
+                    for local_sample_size, _ in models
+                ]
+            avg_model, _ = flat_weighted_sum(
+                [local_model for _, local_model in models],
+                weights,
+                normalize=False,
+                layouts=self._flat_layouts)
+            return avg_model
+
         sample_size, avg_model = models[0]
         for key in avg_model:
             for i in range(len(models)):
@@ -80,15 +133,12 @@ class ClientsAvgAggregator(Aggregator):
 
                 if self.cfg.federate.ignore_weight:
                     weight = 1.0 / len(models)
-                elif self.cfg.federate.use_ss:
-                    # When using secret sharing, what the server receives
-                    # are sample_size * model_para
-                    weight = 1.0
                 else:
-                    weight = local_sample_size / training_set_size
+                    # When using secret sharing, what the server receives
+                    # are sample_size * model_para (as int64 frames, which
+                    # should be summed up without casting to float)
+                    weight = 1
 
-                if not self.cfg.federate.use_ss:
-                    local_model[key] = param2tensor(local_model[key])
                 if i == 0:
                     avg_model[key] = local_model[key] * weight
                 else:
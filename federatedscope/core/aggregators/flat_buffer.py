@@ -0,0 +1,421 @@
+import bisect
+import operator
+import time
+
+import torch
+from torch._utils import _flatten_dense_tensors
+
+from federatedscope.core.auxiliaries.utils import param2tensor
+
+# Budget of the buffer which packs the state dicts of a block of clients
+MAX_BLOCK_BYTES = 256 * 1024 * 1024
+
+
+class FlatLayout(object):
+    """
+    Layout of the tensors of several state dicts (which may hold different
+    keys) in a flat buffer. The keys held by the same clients are grouped
+    into a contiguous segment, so that they share their weights.
+
+    Arguments:
+        key_sets: the distinct tuples of keys held by the clients
+        state_dicts: a state dict holding each tuple of keys, which gives
+            the shapes and dtypes of the tensors
+    """
+    def __init__(self, key_sets, state_dicts):
+        holders, tensors = dict(), dict()
+        for set_idx, (keys,
+                      state_dict) in enumerate(zip(key_sets, state_dicts)):
+            for key in keys:
+                holders.setdefault(key, set()).add(set_idx)
+                tensors.setdefault(key, state_dict[key])
+
+        # key -> (offset, numel, shape, dtype)
+        self.entries = dict()
+        # The segments of the groups of keys, as (start, end, the indices of
+        # the key sets holding them, the keys)
+        self.groups = []
+        group_keys = dict()
+        for key, set_ids in holders.items():
+            group_keys.setdefault(frozenset(set_ids), []).append(key)
+        offset = 0
+        for set_ids, keys in group_keys.items():
+            start = offset
+            for key in keys:
+                tensor = tensors[key]
+                self.entries[key] = (offset, tensor.numel(),
+                                     tuple(tensor.shape), tensor.dtype)
+                offset += tensor.numel()
+            self.groups.append((start, offset, set_ids, keys))
+        self.numel = offset
+        # The keys in the order of their offsets, and the ends of their
+        # tensors in the buffer
+        self._entry_keys = list(self.entries)
+        self._entry_ends = [
+            offset + numel for offset, numel, _, _ in self.entries.values()
+        ]
+
+        # The segments of each key set in the buffer, with the getters of
+        # the tensors of the keys
+        self.segments = [[] for _ in key_sets]
+        for start, end, set_ids, keys in self.groups:
+            getter = operator.itemgetter(*keys) if len(keys) > 1 else \
+                (lambda state_dict, key=keys[0]: (state_dict[key], ))
+            for set_idx in set_ids:
+                self.segments[set_idx].append((start, end, getter))
+
+        dtypes = {entry[3] for entry in self.entries.values()}
+        self.dtype = torch.float64 if torch.float64 in dtypes else \
+            torch.float32
+
+    def pack(self, state_dict, set_idx, out):
+        """
+        Copy the tensors of ``state_dict`` (whose keys are the ``set_idx``-th
+        key set) into ``out``, a flat buffer of ``numel`` elements, group by
+        group of keys.
+        """
+        for start, end, getter in self.segments[set_idx]:
+            out[start:end].copy_(_flatten_dense_tensors(getter(state_dict)))
+
+    def pack_columns(self, state_dict, start, end, out):
+        """
+        Copy the elements ``[start, end)`` of the flat buffer of
+        ``state_dict`` (which holds all the keys of the layout) into
+        ``out``, without flattening the other tensors.
+        """
+        idx = bisect.bisect_right(self._entry_ends, start)
+        while idx < len(self._entry_keys) and \
+                self.entries[self._entry_keys[idx]][0] < end:
+            key = self._entry_keys[idx]
+            offset, numel, _, _ = self.entries[key]
+            low, high = max(start, offset), min(end, offset + numel)
+            if high > low:
+                out[low - start:high - start].copy_(
+                    state_dict[key].reshape(-1)[low - offset:high - offset])
+            idx += 1
+
+    def unflatten(self, flat, cast=False):
+        """
+        Unflatten ``flat`` into a state dict, whose tensors are views on it
+        (if of the same dtype). The floating tensors are cast back to their
+        dtypes, and so are the others (e.g., integer buffers, rounded) with
+        ``cast``.
+        """
+        state_dict = dict()
+        for key, (offset, numel, shape, dtype) in self.entries.items():
+            tensor = flat[offset:offset + numel].view(shape)
+            if dtype != flat.dtype:
+                if dtype.is_floating_point:
+                    tensor = tensor.to(dtype)
+                elif cast:
+                    tensor = tensor.round().to(dtype)
+            state_dict[key] = tensor
+        return state_dict
+
+
+def flat_weighted_sum(state_dicts,
+                      weights,
+                      normalize=True,
+                      layouts=None,
+                      max_block_bytes=MAX_BLOCK_BYTES,
+                      cast=False):
+    """
+    Calculate the key-wise weighted sum of the state dicts, i.e.,
+    ``sum_i weights[i] * state_dicts[i][key]`` over the clients holding
+    ``key``. The state dicts of a block of clients are packed into the
+    rows of one flat buffer, which are summed up by a single
+    matrix-vector product per block.
+
+    Arguments:
+        state_dicts: the state dicts of the clients, which may hold
+            different keys
+        weights: the weight of each client
+        normalize: divide the sum of each key by the total weight of the
+            clients holding it
+        layouts: a dict to cache the layouts across the calls
+        max_block_bytes: budget of the buffer of a block of clients
+        cast: cast the non-floating tensors (e.g., integer buffers) of the
+            sum back to their dtypes
+
+    Returns:
+        The weighted sum (whose tensors are views on one flat buffer) and
+        the total weight of each key
+    """
+    state_dicts = [
+        state_dict if all(
+            isinstance(value, torch.Tensor)
+            for value in state_dict.values()) else {
+                key: torch.as_tensor(param2tensor(value))
+                for key, value in state_dict.items()
+            } for state_dict in state_dicts
+    ]
+
+    # The clients are grouped by the keys they hold
+    key_sets, set_ids = dict(), []
+    for state_dict in state_dicts:
+        set_ids.append(key_sets.setdefault(tuple(state_dict), len(key_sets)))
+    signature = tuple(key_sets)
+    layout = None if layouts is None else layouts.get(signature)
+    if layout is None:
+        first = dict()
+        for set_idx, state_dict in zip(set_ids, state_dicts):
+            first.setdefault(set_idx, state_dict)
+        layout = FlatLayout(list(key_sets),
+                            [first[idx] for idx in range(len(key_sets))])
+        if layouts is not None:
+            layouts[signature] = layout
+
+    device = next(iter(state_dicts[0].values())).device
+    weights = torch.as_tensor(weights, dtype=layout.dtype, device=device)
+    row_bytes = max(1, layout.numel * weights.element_size())
+    block_size = max(1, min(len(state_dicts), max_block_bytes // row_bytes))
+    flat = torch.zeros(layout.numel, dtype=layout.dtype, device=device)
+    block = torch.empty(block_size,
+                        layout.numel,
+                        dtype=layout.dtype,
+                        device=device)
+    for begin in range(0, len(state_dicts), block_size):
+        end = min(begin + block_size, len(state_dicts))
+        rows = block[:end - begin]
+        if len(key_sets) > 1:
+            # Not all the keys are overwritten
+            rows.zero_()
+        for row, state_dict, set_idx in zip(rows, state_dicts[begin:end],
+                                            set_ids[begin:end]):
+            layout.pack(state_dict, set_idx, row)
+        flat.addmv_(rows.t(), weights[begin:end])
+
+    # The total weight of each group of keys
+    set_weights = torch.zeros(len(key_sets), dtype=torch.float64)
+    set_weights.index_add_(0, torch.as_tensor(set_ids),
+                           weights.to('cpu', torch.float64))
+    key_totals = dict()
+    for start, end, group_sets, keys in layout.groups:
+        total = set_weights[list(group_sets)].sum().item()
+        if normalize:
+            flat[start:end].div_(total)
+            total = 1.0
+        for key in keys:
+            key_totals[key] = total
+
+    return layout.unflatten(flat, cast=cast), key_totals
+
+
+class StackedStateDicts(object):
+    """
+    The state dicts (which hold the same keys) stacked into the rows of a
+    (clients x parameters) matrix, e.g., for the robust aggregation rules,
+    which work on all the clients at once. The matrix is never
+    materialized as a whole, but in blocks of columns of at most
+    ``max_block_bytes``, which bounds the memory for large models.
+
+    Arguments:
+        state_dicts: the state dicts of the clients
+        layout: the layout of the rows
+        max_block_bytes: budget of a block of columns
+    """
+    def __init__(self, state_dicts, layout, max_block_bytes=MAX_BLOCK_BYTES):
+        self.state_dicts = state_dicts
+        self.layout = layout
+        self.max_block_bytes = max_block_bytes
+        self.dtype = layout.dtype
+        self.device = next(iter(state_dicts[0].values())).device
+
+    def size(self, dim=None):
+        size = (len(self.state_dicts), self.layout.numel)
+        return size if dim is None else size[dim]
+
+    def __len__(self):
+        return len(self.state_dicts)
+
+    def select_rows(self, rows):
+        """
+        The stacked state dicts of the clients ``rows``.
+        """
+        return StackedStateDicts([self.state_dicts[row] for row in rows],
+                                 self.layout, self.max_block_bytes)
+
+    def columns(self, start, end):
+        """
+        The (clients x (end - start)) block of the columns ``[start, end)``.
+        """
+        block = torch.empty(len(self.state_dicts),
+                            end - start,
+                            dtype=self.dtype,
+                            device=self.device)
+        for row, state_dict in zip(block, self.state_dicts):
+            self.layout.pack_columns(state_dict, start, end, row)
+        return block
+
+    def column_blocks(self, block_cols=None):
+        """
+        Iterate over the blocks of columns as ``(start, end, block)``.
+        """
+        if block_cols is None:
+            element_size = torch.empty(0, dtype=self.dtype).element_size()
+            block_cols = max(
+                1, self.max_block_bytes // (len(self) * element_size))
+        for start in range(0, self.layout.numel, block_cols):
+            end = min(start + block_cols, self.layout.numel)
+            yield start, end, self.columns(start, end)
+
+    def reduce_columns(self, func):
+        """
+        Apply ``func``, which reduces a block of columns to a vector (e.g.,
+        the coordinate-wise median), block by block, and return the flat
+        buffer of the results.
+        """
+        flat = torch.empty(self.layout.numel,
+                           dtype=self.dtype,
+                           device=self.device)
+        for start, end, block in self.column_blocks():
+            flat[start:end] = func(block)
+        return flat
+
+    def row_norms(self):
+        """
+        The Euclidean norm of each row.
+        """
+        squared = torch.zeros(len(self), dtype=self.dtype, device=self.device)
+        for _, _, block in self.column_blocks():
+            squared += block.pow(2).sum(1)
+        return squared.sqrt_()
+
+
+def stack_state_dicts(state_dicts,
+                      keys=None,
+                      layouts=None,
+                      max_block_bytes=MAX_BLOCK_BYTES):
+    """
+    Stack the state dicts (which hold the same keys) into the rows of one
+    (clients x parameters) matrix, see ``StackedStateDicts``.
+
+    Arguments:
+        state_dicts: the state dicts of the clients
+        keys: the keys to stack (default: the keys of the first state dict)
+        layouts: a dict to cache the layouts across the calls
+        max_block_bytes: budget of a block of columns
+
+    Returns:
+        The ``StackedStateDicts`` and the layout of its rows (whose
+        ``unflatten`` turns a row back into a state dict)
+    """
+    keys = tuple(state_dicts[0] if keys is None else keys)
+    state_dicts = [{
+        key: value if isinstance(value, torch.Tensor) else torch.as_tensor(
+            param2tensor(value))
+        for key, value in ((key, state_dict[key]) for key in keys)
+    } for state_dict in state_dicts]
+
+    layout = None if layouts is None else layouts.get((keys, ))
+    if layout is None:
+        layout = FlatLayout([keys], state_dicts[:1])
+        if layouts is not None:
+            layouts[(keys, )] = layout
+    return StackedStateDicts(state_dicts, layout, max_block_bytes), layout
+
+
+def _column_blocks(matrix, block_cols):
+    if isinstance(matrix, StackedStateDicts):
+        yield from matrix.column_blocks(block_cols)
+        return
+    for start in range(0, matrix.size(1), block_cols):
+        end = min(start + block_cols, matrix.size(1))
+        yield start, end, matrix[:, start:end]
+
+
+def pairwise_distances(matrix, layout=None, max_block_bytes=MAX_BLOCK_BYTES):
+    """
+    Calculate the Euclidean distances between all the pairs of rows of
+    ``matrix`` with ``torch.cdist`` (i.e., from their Gram matrix), on
+    blocks of columns of at most ``max_block_bytes``.
+
+    Arguments:
+        matrix: the stacked updates of the clients, as a tensor or
+            ``StackedStateDicts`` (whose blocks are packed one by one)
+        layout: if given, the distance of two rows is the sum of the
+            distances of each key of the layout
+        max_block_bytes: budget of a block of columns
+
+    Returns:
+        The (rows x rows) matrix of distances
+    """
+    num = matrix.size(0)
+    if layout is None:
+        segments = [(0, matrix.size(1))]
+    else:
+        segments = sorted((offset, offset + numel)
+                          for offset, numel, _, _ in layout.entries.values())
+    element_size = torch.empty(0, dtype=matrix.dtype).element_size()
+    block_cols = max(1, max_block_bytes // (num * element_size))
+
+    distances = torch.zeros(num, num, dtype=matrix.dtype, device=matrix.device)
+    # The squared distances of the current segment, summed up block by block
+    squared = torch.zeros_like(distances)
+    seg_idx = 0
+    for begin, end, block in _column_blocks(matrix, block_cols):
+        while seg_idx < len(segments) and segments[seg_idx][0] < end:
+            start, stop = segments[seg_idx]
+            low, high = max(start, begin), min(stop, end)
+            if high > low:
+                columns = block[:, low - begin:high - begin]
+                squared += torch.cdist(columns, columns).pow_(2)
+            if stop > end:
+                # The segment goes on in the next block
+                break
+            distances += squared.sqrt_()
+            squared.zero_()
+            seg_idx += 1
+    # Rather than the rounding errors of the Gram matrix
+    distances.fill_diagonal_(0.)
+    return distances
+
+
+def _loop_weighted_sum(state_dicts, weights):
+    # The key by key and client by client weighted average, as reference
+    avg_model = dict()
+    for key in state_dicts[0]:
+        for i, state_dict in enumerate(state_dicts):
+            param = param2tensor(state_dict[key])
+            if i == 0:
+                avg_model[key] = param * weights[i]
+            else:
+                avg_model[key] += param * weights[i]
+    return avg_model
+
+
+def benchmark_flat_aggregation(
+        num_clients=(10, 100, 1000), num_keys=200, shape=(8, 64), repeat=3):
+    """
+    Compare the key by key weighted average with ``flat_weighted_sum``, on
+    state dicts of ``num_keys`` tensors of ``shape`` (e.g., LoRA matrices)
+    from each number of clients in ``num_clients``.
+
+    Returns:
+        A list of dicts with the seconds taken by each method.
+    """
+    results = []
+    layouts = dict()
+    for num in num_clients:
+        state_dicts = [{
+            f'layer.{idx}.lora_A': torch.randn(shape)
+            for idx in range(num_keys)
+        } for _ in range(num)]
+        weights = [1.0 / num] * num
+        result = dict(num_clients=num)
+        for name, func in [
+            ('loop', lambda: _loop_weighted_sum(state_dicts, weights)),
+            ('flat', lambda: flat_weighted_sum(
+                state_dicts, weights, normalize=False, layouts=layouts))
+        ]:
+            start = time.time()
+            for _ in range(repeat):
+                func()
+            result[name] = (time.time() - start) / repeat
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    for result in benchmark_flat_aggregation():
+        print(result)
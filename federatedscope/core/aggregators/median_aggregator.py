@@ -2,6 +2,7 @@ import copy
 import torch
 import numpy as np
 from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.aggregators.flat_buffer import stack_state_dicts
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,10 +44,16 @@ class MedianAggregator(ClientsAvgAggregator):
     def _aggre_with_median(self, models):
         init_model = self.model.state_dict()
         global_update = copy.deepcopy(init_model)
-        for key in init_model:
-            temp = torch.stack([each_model[1][key] for each_model in models],
-                               0)
-            temp_pos, _ = torch.median(temp, dim=0)
-            temp_neg, _ = torch.median(-temp, dim=0)
-            global_update[key] = (temp_pos - temp_neg) / 2
+        temp, layout = stack_state_dicts(
+            [each_model[1] for each_model in models],
+            keys=init_model,
+            layouts=self._flat_layouts)
+
+        def median(block):
+            temp_pos, _ = torch.median(block, dim=0)
+            temp_neg, _ = torch.median(-block, dim=0)
+            return (temp_pos - temp_neg) / 2
+
+        global_update.update(
+            layout.unflatten(temp.reduce_columns(median), cast=True))
         return global_update
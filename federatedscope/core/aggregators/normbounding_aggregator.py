@@ -3,6 +3,8 @@ import copy
 import torch
 import numpy as np
 from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.aggregators.flat_buffer import \
+    flat_weighted_sum, stack_state_dicts
 
 logger = logging.getLogger(__name__)
 
@@ -33,32 +35,29 @@ class NormboundingAggregator(ClientsAvgAggregator):
         return updated_model
 
     def _aggre_with_normbounding(self, models):
-        models_temp = []
-        for each_model in models:
-            param = self._flatten_updates(each_model[1])
-            if torch.norm(param, p=2) > self.norm_bound:
-                scaling_rate = self.norm_bound / torch.norm(param, p=2)
-                scaled_param = scaling_rate * param
-                models_temp.append(
-                    (each_model[0], self._reconstruct_updates(scaled_param)))
-            else:
-                models_temp.append(each_model)
-        return self._para_weighted_avg(models_temp)
-
-    def _flatten_updates(self, model):
-        model_update = []
-        init_model = self.model.state_dict()
-        for key in init_model:
-            model_update.append(model[key].view(-1))
-        return torch.cat(model_update, dim=0)
-
-    def _reconstruct_updates(self, flatten_updates):
-        start_idx = 0
         init_model = self.model.state_dict()
-        reconstructed_model = copy.deepcopy(init_model)
-        for key in init_model:
-            reconstructed_model[key] = flatten_updates[
-                start_idx:start_idx + len(init_model[key].view(-1))].reshape(
-                    init_model[key].shape)
-            start_idx = start_idx + len(init_model[key].view(-1))
-        return reconstructed_model
+        params, layout = stack_state_dicts(
+            [each_model[1] for each_model in models],
+            keys=init_model,
+            layouts=self._flat_layouts)
+        norms = params.row_norms()
+        scaling_rates = torch.where(norms > self.norm_bound,
+                                    self.norm_bound / norms,
+                                    torch.ones_like(norms))
+        # The clipping is folded into the weights of the average, rather
+        # than applied to copies of the updates
+        if self.cfg.federate.ignore_weight:
+            weights = [1.0 / len(models)] * len(models)
+        else:
+            training_set_size = sum(each_model[0] for each_model in models)
+            weights = [
+                each_model[0] / training_set_size for each_model in models
+            ]
+        weights = torch.as_tensor(weights, dtype=norms.dtype) * \
+            scaling_rates.cpu()
+        avg_model, _ = flat_weighted_sum(params.state_dicts,
+                                         weights,
+                                         normalize=False,
+                                         layouts=self._flat_layouts,
+                                         cast=True)
+        return avg_model
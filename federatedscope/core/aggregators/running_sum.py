@@ -0,0 +1,63 @@
+import torch
+
+from federatedscope.core.auxiliaries.utils import param2tensor
+
+
+class RunningWeightedSum(object):
+    """
+    Key-wise running weighted sum of the model parameters of the clients,
+    which are folded in one by one as they arrive (and can be dropped
+    afterwards), so that the memory is O(model) whatever the number of
+    clients.
+
+    Attributes:
+        sums: key -> the weighted sum of the parameters (in float32 or
+            float64)
+        totals: key -> the total weight of the clients holding the key
+        counts: key -> the number of clients holding the key
+        num: the number of state dicts folded
+    """
+    def __init__(self):
+        self.sums = dict()
+        self.totals = dict()
+        self.counts = dict()
+        self.dtypes = dict()
+        self.num = 0
+
+    def add(self, model_para, weight=1.0):
+        for key, param in model_para.items():
+            param = torch.as_tensor(param2tensor(param))
+            if key not in self.sums:
+                dtype = torch.float64 if param.dtype == torch.float64 \
+                    else torch.float32
+                self.sums[key] = param.to(dtype, copy=True).mul_(weight)
+                self.totals[key] = weight
+                self.counts[key] = 1
+                self.dtypes[key] = param.dtype
+            else:
+                self.sums[key].add_(param, alpha=weight)
+                self.totals[key] += weight
+                self.counts[key] += 1
+        self.num += 1
+
+    def scale(self, key, factor):
+        """
+        Return the sum of ``key`` multiplied by ``factor``, in the dtype of
+        the folded parameters (if floating).
+        """
+        param = self.sums[key].mul_(factor)
+        dtype = self.dtypes[key]
+        if dtype.is_floating_point and dtype != param.dtype:
+            param = param.to(dtype)
+        return param
+
+    def average(self):
+        """
+        The key-wise weighted average of the folded parameters, i.e., the
+        sum of each key divided by the total weight of the clients holding
+        it. The sums are reused (and should not be used afterwards).
+        """
+        return {
+            key: self.scale(key, 1.0 / self.totals[key])
+            for key in self.sums
+        }
@@ -2,6 +2,7 @@ import copy
 import torch
 import numpy as np
 from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.aggregators.flat_buffer import stack_state_dicts
 import logging
 
 logger = logging.getLogger(__name__)
@@ -45,13 +46,18 @@ class TrimmedmeanAggregator(ClientsAvgAggregator):
         init_model = self.model.state_dict()
         global_update = copy.deepcopy(init_model)
         excluded_num = int(len(models) * self.excluded_ratio)
-        for key in init_model:
-            temp = torch.stack([each_model[1][key] for each_model in models],
-                               0)
-            pos_largest, _ = torch.topk(temp, excluded_num, 0)
-            neg_smallest, _ = torch.topk(-temp, excluded_num, 0)
-            new_stacked = torch.cat([temp, -pos_largest,
-                                     neg_smallest]).sum(0).float()
-            new_stacked /= len(temp) - 2 * excluded_num
-            global_update[key] = new_stacked
+        temp, layout = stack_state_dicts(
+            [each_model[1] for each_model in models],
+            keys=init_model,
+            layouts=self._flat_layouts)
+
+        def trimmed_mean(block):
+            pos_largest, _ = torch.topk(block, excluded_num, 0)
+            neg_smallest, _ = torch.topk(-block, excluded_num, 0)
+            new_stacked = block.sum(0) - pos_largest.sum(0) + \
+                neg_smallest.sum(0)
+            return new_stacked / (len(block) - 2 * excluded_num)
+
+        global_update.update(
+            layout.unflatten(temp.reduce_columns(trimmed_mean), cast=True))
         return global_update
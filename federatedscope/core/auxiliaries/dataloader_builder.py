@@ -84,23 +84,39 @@ def get_dataloader(dataset, config, split='train'):
             dataset = dataset[0].edge_index
     filtered_args = filter_dict(loader_cls.__init__, raw_args)
 
+    is_llm = False
     if config.data.type.lower().endswith('@llm-rlhf') or config.llm.rlhf:
         from federatedscope.llm.dataloader import get_tokenizer, \
             LLMRewardCollator
         model_name, _ = config.model.type.split('@')
-        tokenizer, _ = get_tokenizer(model_name, config.data.root,
-                                     config.llm.tok_len)
+        tokenizer, _ = get_tokenizer(model_name,
+                                     config.data.root,
+                                     config.llm.tok_len,
+                                     use_fast=config.llm.tok_use_fast)
         data_collator = LLMRewardCollator(tokenizer=tokenizer)
         filtered_args['collate_fn'] = data_collator
+        is_llm = True
 
     elif config.data.type.lower().endswith('@llm'):
         from federatedscope.llm.dataloader import get_tokenizer, \
             LLMDataCollator
         model_name, _ = config.model.type.split('@')
-        tokenizer, _ = get_tokenizer(model_name, config.data.root,
-                                     config.llm.tok_len)
+        tokenizer, _ = get_tokenizer(model_name,
+                                     config.data.root,
+                                     config.llm.tok_len,
+                                     use_fast=config.llm.tok_use_fast)
         data_collator = LLMDataCollator(tokenizer=tokenizer)
         filtered_args['collate_fn'] = data_collator
+        is_llm = True
+
+    if is_llm and config.dataloader.max_tokens > 0:
+        # Token budget batches replace the ones of fixed size
+        from federatedscope.llm.dataloader.sampler import \
+            get_token_budget_batch_sampler
+        for key in ['batch_size', 'shuffle', 'sampler', 'drop_last']:
+            filtered_args.pop(key, None)
+        filtered_args['batch_sampler'] = get_token_budget_batch_sampler(
+            dataset, config, split)
 
     dataloader = loader_cls(dataset, **filtered_args)
     return dataloader
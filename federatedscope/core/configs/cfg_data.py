@@ -53,6 +53,10 @@ def extend_data_cfg(cfg):
     cfg.dataloader.num_workers = 0
     cfg.dataloader.drop_last = False
     cfg.dataloader.pin_memory = False
+    # LLM: batches of at most `max_tokens` padded tokens, made of samples of
+    # similar lengths (in buckets of `bucket_size` samples), 0 to disable
+    cfg.dataloader.max_tokens = 0
+    cfg.dataloader.bucket_size = 512
     # GFL: graphsaint DataLoader
     cfg.dataloader.walk_length = 2
     cfg.dataloader.num_steps = 30
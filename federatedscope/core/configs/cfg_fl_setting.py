@@ -24,6 +24,9 @@ def extend_fl_setting_cfg(cfg):
     cfg.federate.data_weighted_aggr = False  # If True, the weight of aggr is
     # the number of training samples in dataset.
     cfg.federate.online_aggr = False
+    cfg.federate.streaming_aggr = False  # If True, the model parameters
+    # received are folded into running sums as they arrive (rather than
+    # kept until the aggregation), so that the server memory is O(model)
     cfg.federate.make_global_eval = False
     cfg.federate.use_diff = False
     cfg.federate.merge_test_data = False  # For efficient simulation, users
@@ -37,6 +40,14 @@ def extend_fl_setting_cfg(cfg):
     cfg.federate.method = "FedAvg"
     cfg.federate.ignore_weight = False
     cfg.federate.use_ss = False  # Whether to apply Secret Sharing
+    cfg.federate.ss_type = 'additive'  # 'additive' or 'pairwise_mask'
+    cfg.federate.ss_threshold = 0  # The number of clients to recover the
+    # pairwise masks (0 for a majority of the clients)
+    cfg.federate.ss_timeout = 0  # Seconds to wait for the masked models of
+    # all the clients before unmasking those received (0 for no timeout)
+    cfg.federate.exact_msg_bytes = False  # Whether to count the exact bytes
+    # of the serialized messages (slow) instead of estimating them from the
+    # sizes of the tensors
     cfg.federate.restore_from = ''
     cfg.federate.save_to = ''
     cfg.federate.save_freq = -1
@@ -79,6 +90,24 @@ def extend_fl_setting_cfg(cfg):
     cfg.distribute.grpc_max_receive_message_length = 300 * 1024 * 1024  # 300M
     cfg.distribute.grpc_enable_http_proxy = False
     cfg.distribute.grpc_compression = 'nocompression'  # [deflate, gzip]
+    # Carry the tensors of the messages in a binary frame, if the receiver
+    # supports it, instead of pickled strings or nested lists
+    cfg.distribute.grpc_tensor_frame = True
+    # The messages larger than `grpc_chunk_size` bytes are streamed in chunks
+    # of it (0 to disable), and resumed after reconnecting if the transfer
+    # fails
+    cfg.distribute.grpc_chunk_size = 4 * 1024 * 1024
+    # The messages to several receivers are sent concurrently by
+    # `grpc_send_workers` threads, and each send is retried up to
+    # `grpc_send_retries` times with exponential backoff if it fails or
+    # exceeds `grpc_send_timeout` seconds (0 for no timeout)
+    cfg.distribute.grpc_send_workers = 16
+    cfg.distribute.grpc_send_timeout = 0.
+    cfg.distribute.grpc_send_retries = 3
+    # The channel to each neighbor is reused across the messages, and kept
+    # alive by pinging it every `grpc_keepalive_time_ms` milliseconds
+    cfg.distribute.grpc_keepalive_time_ms = 30 * 1000
+    cfg.distribute.grpc_keepalive_timeout_ms = 10 * 1000
 
     # ---------------------------------------------------------------------- #
     # Vertical FL related options (for demo)
@@ -199,12 +228,42 @@ def assert_fl_setting_cfg(cfg):
         assert cfg.federate.method != "local", \
             "Secret sharing is not supported in local training mode"
 
+        assert cfg.federate.ss_type in ['additive', 'pairwise_mask'], \
+            f"Secret sharing type {cfg.federate.ss_type} is not supported, " \
+            f"please use 'additive' or 'pairwise_mask'"
+        assert 0 <= cfg.federate.ss_threshold <= cfg.federate.client_num, \
+            "federate.ss_threshold should be in [0, federate.client_num]"
+        assert cfg.federate.ss_timeout >= 0, \
+            "federate.ss_timeout should be non-negative"
+        if cfg.federate.ss_type == 'pairwise_mask':
+            # The peers of each client are all the other clients, whose
+            # masks cancel out only if they are all sampled in each round
+            assert cfg.federate.sample_client_num == \
+                cfg.federate.client_num and not cfg.asyn.use, \
+                "Pairwise-mask secret sharing requires all the clients to " \
+                "participate in each round, please use neither client " \
+                "sampling (federate.sample_client_num/sample_client_rate, " \
+                "federate.unseen_clients_rate) nor asynchronous training"
+
     # =============   aggregator related   ================
     assert (not cfg.federate.online_aggr) or (
         not cfg.federate.use_ss
     ), "Have not supported to use online aggregator and secrete sharing at " \
        "the same time"
 
+    if cfg.federate.streaming_aggr:
+        from federatedscope.core.configs import constants
+        assert constants.AGGREGATOR_TYPE.get(
+            cfg.federate.method.lower(), 'clients_avg') in [
+            'clients_avg', 'fedopt'
+        ] and cfg.aggregator.robust_rule == 'fedavg', \
+            "Streaming aggregation is only supported for the (weighted) " \
+            "average of the clients, e.g., FedAvg and FedOpt"
+        assert not cfg.federate.online_aggr and not cfg.federate.use_ss \
+            and not cfg.asyn.use, \
+            "Have not supported to use streaming aggregation with online " \
+            "aggregator, secret sharing or asynchronous training"
+
     assert not cfg.federate.merge_test_data or (
             cfg.federate.merge_test_data and cfg.federate.mode == 'standalone'
     ), "The operation of merging test data can only used in standalone for " \
@@ -274,6 +333,11 @@ def assert_fl_setting_cfg(cfg):
                              f'must be in (0, 1.0], but got '
                              f'{cfg.vertical.feature_subsample_ratio}')
 
+    if cfg.distribute.use and cfg.distribute.grpc_chunk_size < 0:
+        raise ValueError(f'The value of distribute.grpc_chunk_size must be '
+                         f'positive (or 0 to disable the streaming), but got '
+                         f'{cfg.distribute.grpc_chunk_size}')
+
     if cfg.distribute.use and cfg.distribute.grpc_compression.lower() not in [
             'nocompression', 'deflate', 'gzip'
     ]:
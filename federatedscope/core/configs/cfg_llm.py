@@ -12,12 +12,21 @@ def extend_llm_cfg(cfg):
     # ---------------------------------------------------------------------- #
     cfg.llm = CN(new_allowed=True)
     cfg.llm.tok_len = 128
+    # Use the (Rust) fast tokenizer, with which the datasets are tokenized
+    # in batches
+    cfg.llm.tok_use_fast = False
     cfg.llm.max_new_token = 60
     cfg.llm.num_completions = 2
+    # Number of prompts in each checkpointed chunk of the RLHF artifacts
+    # (the generated pairs and the selector's preferences)
+    cfg.llm.artifact_chunk_size = 100
     cfg.llm.retry_on_nan_loss = False
 
     # Training the reward model
     cfg.llm.reward_coeff = 0.1
+    # Cache the log-probs of the reference (frozen base) model in DPO, which
+    # never change, instead of recomputing them for every batch
+    cfg.llm.dpo_ref_cache = True
 
     # ---------------------------------------------------------------------- #
     # RLHF for LLM
@@ -48,6 +57,17 @@ def extend_llm_cfg(cfg):
     cfg.llm.cache = CN()
     cfg.llm.cache.model = ''
 
+    # ---------------------------------------------------------------------- #
+    # Checkpoints of LLM
+    # ---------------------------------------------------------------------- #
+    cfg.llm.checkpoint = CN()
+    # Save the (adapter) checkpoints as safetensors with a round index of
+    # `federate.save_to`, which are loaded lazily from the memory-mapped
+    # files, instead of pickles
+    cfg.llm.checkpoint.use = False
+    # Write the checkpoints in a background thread
+    cfg.llm.checkpoint.async_write = True
+
     # ---------------------------------------------------------------------- #
     # Chat tools for LLM
     # ---------------------------------------------------------------------- #
@@ -55,6 +75,16 @@ def extend_llm_cfg(cfg):
     cfg.llm.chat.max_history_len = 10
     cfg.llm.chat.max_len = 100
 
+    # ---------------------------------------------------------------------- #
+    # Generation (`FSChatBot.generate` and the pairwise data of RLHF)
+    # ---------------------------------------------------------------------- #
+    cfg.llm.generation = CN()
+    # Decode a rolling batch of sequences, which admits the queued prompts
+    # as the others finish, instead of windows of prompts with `generate`
+    cfg.llm.generation.continuous_batching = False
+    # Maximum number of sequences decoded together
+    cfg.llm.generation.max_batch_size = 16
+
     # ---------------------------------------------------------------------- #
     # Deepspeed related options
     # ---------------------------------------------------------------------- #
@@ -91,6 +121,29 @@ def extend_llm_cfg(cfg):
     cfg.llm.adapter.grouping.use = False
     cfg.llm.adapter.grouping.round = 50
 
+    # Rank the adapters by successive halving on val mini-batches, instead
+    # of evaluating every adapter on the whole val split
+    cfg.llm.adapter.adaptive_eval = CN()
+    cfg.llm.adapter.adaptive_eval.use = False
+    # Number of val samples of the first rung, which grows by `eta` times
+    cfg.llm.adapter.adaptive_eval.init_samples = 16
+    # Keep the best 1 / `eta` of the adapters after each rung
+    cfg.llm.adapter.adaptive_eval.eta = 2
+
+    # ---------------------------------------------------------------------- #
+    # Pairwise selector evaluation (e.g., best-of-n)
+    # ---------------------------------------------------------------------- #
+    cfg.llm.selector = CN()
+    cfg.llm.selector.batch_size = 16
+    # Best-of-n schedule of the comparisons, one of `sequential` (king of the
+    # hill), `knockout` and `all_pairs` (Bradley-Terry)
+    cfg.llm.selector.schedule = 'sequential'
+
+    # Encode the prompt prefix shared by the comparisons of a post only once
+    cfg.llm.selector.prefix_cache = CN()
+    cfg.llm.selector.prefix_cache.use = False
+    cfg.llm.selector.prefix_cache.max_memory = 4096  # in MB
+
     # ---------------------------------------------------------------------- #
     # Offsite-tuning related options
     # ---------------------------------------------------------------------- #
@@ -107,6 +160,17 @@ def extend_llm_cfg(cfg):
     # Used in `aggregator`
     cfg.llm.offsite_tuning.save_full_model = False
 
+    # Distribute the emulator and adapter as content-addressed safetensors
+    # shards in `root`, instead of a pickled model in the message. Clients
+    # read the shards from `root` if it is shared, otherwise fetch the
+    # missing ones into `client_root` (`root` if empty) chunk by chunk
+    cfg.llm.offsite_tuning.shard_transport = CN()
+    cfg.llm.offsite_tuning.shard_transport.use = False
+    cfg.llm.offsite_tuning.shard_transport.root = 'emulator_shards'
+    cfg.llm.offsite_tuning.shard_transport.client_root = ''
+    cfg.llm.offsite_tuning.shard_transport.shard_size = 512  # in MB
+    cfg.llm.offsite_tuning.shard_transport.chunk_size = 16  # in MB
+
     # Emulator alignment will use dataset in Server
     cfg.llm.offsite_tuning.emu_align = CN()
     cfg.llm.offsite_tuning.emu_align.use = False
@@ -121,6 +185,15 @@ def extend_llm_cfg(cfg):
     cfg.llm.offsite_tuning.emu_align.save_to = ''
     cfg.llm.offsite_tuning.emu_align.exit_after_align = False
 
+    # Precompute the outputs of the teacher on the held-out data once, and
+    # read them from a memory-mapped cache in the alignment instead of
+    # running the teacher for every batch
+    cfg.llm.offsite_tuning.emu_align.teacher_cache = CN()
+    cfg.llm.offsite_tuning.emu_align.teacher_cache.use = False
+    # Directory of the caches, `emu_align.data.root` if empty
+    cfg.llm.offsite_tuning.emu_align.teacher_cache.root = ''
+    cfg.llm.offsite_tuning.emu_align.teacher_cache.fp16 = True
+
     # Server held-out data
     cfg.llm.offsite_tuning.emu_align.data = CN()
     cfg.llm.offsite_tuning.emu_align.data.root = 'data'
@@ -146,6 +219,13 @@ def extend_llm_cfg(cfg):
 
 
 def assert_llm_cfg(cfg):
+    if cfg.llm.adapter.adaptive_eval.use:
+        if cfg.llm.adapter.adaptive_eval.eta < 2:
+            raise ValueError('`llm.adapter.adaptive_eval.eta` should be at '
+                             'least 2.')
+        if cfg.llm.adapter.adaptive_eval.init_samples < 1:
+            raise ValueError('`llm.adapter.adaptive_eval.init_samples` '
+                             'should be positive.')
     if cfg.llm.offsite_tuning.emu_align.use:
         if cfg.llm.offsite_tuning.emu_align.restore_from != '':
             logger.warning(
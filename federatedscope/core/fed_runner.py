@@ -414,7 +414,8 @@ class StandaloneRunner(BaseRunner):
             return
 
         _, receiver = msg.sender, msg.receiver
-        download_bytes, upload_bytes = msg.count_bytes()
+        download_bytes, upload_bytes = msg.count_bytes(
+            exact=self.cfg.federate.exact_msg_bytes)
         if not isinstance(receiver, list):
             receiver = [receiver]
         for each_receiver in receiver:
@@ -503,6 +504,12 @@ class StandaloneRunner(BaseRunner):
                     if len(self.shared_comm_queue) == 0 and \
                             len(server_msg_cache) == 0:
                         break
+                elif self.server.ss_manager is not None and \
+                        self.cfg.federate.ss_timeout and \
+                        self.server.trigger_for_ss_time_up():
+                    # No more masked model para would come, the clients
+                    # which have not uploaded them are treated as dropped
+                    continue
                 else:
                     # terminate when shared_comm_queue and
                     # server_msg_cache are all empty
@@ -820,6 +827,12 @@ class FedRunner(object):
                     if len(self.shared_comm_queue) == 0 and \
                             len(server_msg_cache) == 0:
                         break
+                elif self.server.ss_manager is not None and \
+                        self.cfg.federate.ss_timeout and \
+                        self.server.trigger_for_ss_time_up():
+                    # No more masked model para would come, the clients
+                    # which have not uploaded them are treated as dropped
+                    continue
                 else:
                     # terminate when shared_comm_queue and
                     # server_msg_cache are all empty
@@ -951,7 +964,8 @@ class FedRunner(object):
             return
 
         _, receiver = msg.sender, msg.receiver
-        download_bytes, upload_bytes = msg.count_bytes()
+        download_bytes, upload_bytes = msg.count_bytes(
+            exact=self.cfg.federate.exact_msg_bytes)
         if not isinstance(receiver, list):
             receiver = [receiver]
         for each_receiver in receiver:
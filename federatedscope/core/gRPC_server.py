@@ -1,21 +1,149 @@
 import queue
-from collections import deque
+import threading
+import time
+from collections import OrderedDict
+
+import grpc
 
 from federatedscope.core.proto import gRPC_comm_manager_pb2, \
     gRPC_comm_manager_pb2_grpc
+from federatedscope.core.proto.tensor_frame import TENSOR_FRAME_VERSION
+
+# Version of the wire format which streams the large messages in chunks
+MESSAGE_STREAM_VERSION = TENSOR_FRAME_VERSION + 1
+# The latest version of the wire format
+WIRE_VERSION = MESSAGE_STREAM_VERSION
+
+
+class PartialMessage(object):
+    """
+    A streamed message being received, whose chunks are written into a
+    buffer preallocated to the size of the serialized message.
+    """
+    def __init__(self, total_size, chunk_size):
+        if total_size < 0 or chunk_size <= 0:
+            raise ValueError(f'Invalid stream of {total_size} bytes in '
+                             f'chunks of {chunk_size} bytes.')
+        self.total_size = total_size
+        self.buffer = bytearray(total_size)
+        self.chunk_size = chunk_size
+        self.num_chunks = max(1, -(-total_size // chunk_size))
+        self.received = set()
+        # Number of the leading chunks received
+        self.next_seq = 0
+        self.last_update = time.time()
+
+    def write(self, seq, data):
+        start = seq * self.chunk_size
+        # Only the last chunk may be shorter than `chunk_size`
+        if not 0 <= seq < self.num_chunks or len(data) != min(
+                self.chunk_size, self.total_size - start):
+            raise ValueError(f'Chunk {seq} of {len(data)} bytes does not fit '
+                             f'the message of {self.total_size} bytes in '
+                             f'chunks of {self.chunk_size} bytes.')
+        self.buffer[start:start + len(data)] = data
+        self.received.add(seq)
+        while self.next_seq in self.received:
+            self.next_seq += 1
+        self.last_update = time.time()
+
+    def is_complete(self):
+        return self.next_seq >= self.num_chunks
 
 
 class gRPCComServeFunc(gRPC_comm_manager_pb2_grpc.gRPCComServeFuncServicer):
-    def __init__(self):
-        self.msg_queue = deque()
+    def __init__(self,
+                 version=WIRE_VERSION,
+                 partial_timeout=3600,
+                 max_completed_ids=1024):
+        self.msg_queue = queue.Queue()
+        # The latest version of the wire format supported, which is sent
+        # back to the senders
+        self.version = version
+
+        # The streamed messages being received, which are dropped after
+        # `partial_timeout` seconds without any chunk, and the ids of the
+        # last completed ones (to acknowledge their retries)
+        self.partial_msgs = dict()
+        self.completed_msgs = OrderedDict()
+        self.partial_timeout = partial_timeout
+        self.max_completed_ids = max_completed_ids
+        self._lock = threading.Lock()
 
     def sendMessage(self, request, context):
-        self.msg_queue.append(request)
+        self.msg_queue.put(request)
+
+        return gRPC_comm_manager_pb2.MessageResponse(msg='ACK',
+                                                     version=self.version)
+
+    def _get_partial_msg(self, chunk):
+        with self._lock:
+            if chunk.msg_id in self.completed_msgs:
+                return None
+            partial_msg = self.partial_msgs.get(chunk.msg_id)
+            if partial_msg is None:
+                now = time.time()
+                for msg_id in list(self.partial_msgs):
+                    if now - self.partial_msgs[msg_id].last_update > \
+                            self.partial_timeout:
+                        del self.partial_msgs[msg_id]
+                partial_msg = PartialMessage(chunk.total_size,
+                                             chunk.chunk_size)
+                self.partial_msgs[chunk.msg_id] = partial_msg
+            elif (chunk.total_size, chunk.chunk_size) != (
+                    partial_msg.total_size, partial_msg.chunk_size):
+                raise ValueError(f'Chunk {chunk.seq} of the message '
+                                 f'{chunk.msg_id} declares different sizes '
+                                 f'from the previous ones.')
+            return partial_msg
+
+    def _get_next_seq(self, msg_id):
+        with self._lock:
+            if msg_id in self.completed_msgs:
+                return self.completed_msgs[msg_id]
+            partial_msg = self.partial_msgs.get(msg_id)
+            return 0 if partial_msg is None else partial_msg.next_seq
+
+    def _complete(self, msg_id, partial_msg):
+        with self._lock:
+            if self.partial_msgs.pop(msg_id, None) is None:
+                return
+            self.completed_msgs[msg_id] = partial_msg.num_chunks
+            while len(self.completed_msgs) > self.max_completed_ids:
+                self.completed_msgs.popitem(last=False)
+        self.msg_queue.put(
+            gRPC_comm_manager_pb2.MessageRequest.FromString(
+                partial_msg.buffer))
+
+    def sendMessageStream(self, request_iterator, context):
+        msg_id = None
+        for chunk in request_iterator:
+            msg_id = chunk.msg_id
+            try:
+                partial_msg = self._get_partial_msg(chunk)
+                if partial_msg is None:
+                    # Delivered before
+                    break
+                partial_msg.write(chunk.seq, chunk.data)
+            except ValueError as error:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(error))
+            if partial_msg.is_complete():
+                self._complete(msg_id, partial_msg)
+
+        return gRPC_comm_manager_pb2.MessageResponse(
+            msg='ACK',
+            version=self.version,
+            next_seq=self._get_next_seq(msg_id))
 
-        return gRPC_comm_manager_pb2.MessageResponse(msg='ACK')
+    def queryMessageStream(self, request, context):
+        return gRPC_comm_manager_pb2.MessageResponse(
+            msg='ACK',
+            version=self.version,
+            next_seq=self._get_next_seq(request.msg_id))
 
-    def receive(self):
-        while len(self.msg_queue) == 0:
-            continue
-        msg = self.msg_queue.popleft()
-        return msg
+    def receive(self, timeout=None):
+        """
+        Block until a message is received (without spinning), and raise
+        ``queue.Empty`` if there is none within ``timeout`` seconds.
+        """
+        return self.msg_queue.get(timeout=timeout)
@@ -1,8 +1,42 @@
 import json
+import sys
+
 import numpy as np
 
 from federatedscope.core.auxiliaries.utils import b64serializer
 from federatedscope.core.proto import gRPC_comm_manager_pb2
+from federatedscope.core.proto.tensor_frame import TENSOR_FRAME_VERSION, \
+    TensorRef, encode_tensor_frame, decode_tensor_frame, is_frame_tensor
+
+
+def estimate_bytes(x):
+    """
+    Estimate the number of bytes of ``x`` in O(#objects): the tensors and
+    arrays count their raw buffers (``numel * element_size``), the strings
+    and bytes their lengths, the numbers 8 bytes, and the containers the
+    sum of their items (and keys). Other objects fall back to
+    ``sys.getsizeof``.
+    """
+    if isinstance(x, np.ndarray):
+        return x.nbytes
+    elif hasattr(x, 'element_size') and hasattr(x, 'numel'):
+        # torch tensors
+        return x.numel() * x.element_size()
+    elif isinstance(x, dict):
+        return sum(
+            estimate_bytes(key) + estimate_bytes(value)
+            for key, value in x.items())
+    elif isinstance(x, (list, tuple, set)):
+        return sum(estimate_bytes(each_x) for each_x in x)
+    elif isinstance(x, str):
+        return len(x.encode('utf-8'))
+    elif isinstance(x, (bytes, bytearray)):
+        return len(x)
+    elif isinstance(x, (bool, int, float, np.number)):
+        return 8
+    elif x is None:
+        return 0
+    return sys.getsizeof(x)
 
 
 class Message(object):
@@ -36,6 +70,9 @@ class Message(object):
         self._strategy = strategy
         self.serial_num = serial_num
         self.param_serializer = b64serializer
+        # The exact bytes of the serialized message, cached with the
+        # estimated bytes of the content they were counted for
+        self._exact_bytes = None
 
     @property
     def msg_type(self):
@@ -76,6 +113,7 @@ class Message(object):
     @content.setter
     def content(self, value):
         self._content = value
+        self._exact_bytes = None
 
     @property
     def timestamp(self):
@@ -119,6 +157,25 @@ class Message(object):
             else:
                 return x
 
+    def transform_to_frame(self, x, tensors):
+        """
+        Like ``transform_to_list``, but the tensors are appended to
+        ``tensors`` (to be carried in a binary frame) and replaced by their
+        ``TensorRef``, and ``x`` is left untouched.
+        """
+        if isinstance(x, list) or isinstance(x, tuple):
+            return [self.transform_to_frame(each_x, tensors) for each_x in x]
+        elif isinstance(x, dict):
+            return {
+                key: self.transform_to_frame(value, tensors)
+                for key, value in x.items()
+            }
+        elif is_frame_tensor(x):
+            tensors.append(x)
+            return TensorRef(len(tensors) - 1)
+        else:
+            return self.transform_to_list(x)
+
     def msg_to_json(self, to_list=False):
         if to_list:
             self.content = self.transform_to_list(self.content)
@@ -184,6 +241,8 @@ class Message(object):
                 m_single.str_value = value
             elif type(value) in [float, np.float32]:
                 m_single.float_value = value
+            elif isinstance(value, TensorRef):
+                m_single.tensor_ref = value.index
             else:
                 raise ValueError(
                     'The data type {} has not been supported.'.format(
@@ -212,9 +271,19 @@ class Message(object):
 
         return msg_value
 
-    def transform(self, to_list=False):
-        if to_list:
-            self.content = self.transform_to_list(self.content)
+    def transform(self, to_list=False, version=0):
+        """
+        Transform the message into a gRPC request. With ``version`` of
+        ``TENSOR_FRAME_VERSION`` (supported by the receiver), the tensors
+        of the content are carried in a binary frame, instead of pickled
+        strings or nested lists.
+        """
+        content = self.content
+        tensors = []
+        if to_list and version >= TENSOR_FRAME_VERSION:
+            content = self.transform_to_frame(self.content, tensors)
+        elif to_list:
+            self.content = content = self.transform_to_list(self.content)
 
         splited_msg = gRPC_comm_manager_pb2.MessageRequest()  # map/dict
         splited_msg.msg['sender'].MergeFrom(self.build_msg_value(self.sender))
@@ -223,42 +292,69 @@ class Message(object):
         splited_msg.msg['state'].MergeFrom(self.build_msg_value(self.state))
         splited_msg.msg['msg_type'].MergeFrom(
             self.build_msg_value(self.msg_type))
-        splited_msg.msg['content'].MergeFrom(self.build_msg_value(
-            self.content))
+        splited_msg.msg['content'].MergeFrom(self.build_msg_value(content))
         splited_msg.msg['timestamp'].MergeFrom(
             self.build_msg_value(self.timestamp))
+        if len(tensors) > 0:
+            splited_msg.tensor_frame = encode_tensor_frame(tensors)
         return splited_msg
 
-    def _parse_msg(self, value):
+    def _parse_msg(self, value, tensors=None):
         if isinstance(value, gRPC_comm_manager_pb2.MsgValue) or isinstance(
                 value, gRPC_comm_manager_pb2.mSingle):
-            return self._parse_msg(getattr(value, value.WhichOneof("type")))
+            field = value.WhichOneof("type")
+            if field == 'tensor_ref':
+                return tensors[value.tensor_ref]
+            return self._parse_msg(getattr(value, field), tensors)
         elif isinstance(value, gRPC_comm_manager_pb2.mList):
-            return [self._parse_msg(each) for each in value.list_value]
+            return [
+                self._parse_msg(each, tensors) for each in value.list_value
+            ]
         elif isinstance(value, gRPC_comm_manager_pb2.mDict_keyIsString) or \
                 isinstance(value, gRPC_comm_manager_pb2.mDict_keyIsInt):
             return {
-                k: self._parse_msg(value.dict_value[k])
+                k: self._parse_msg(value.dict_value[k], tensors)
                 for k in value.dict_value
             }
         else:
             return value
 
-    def parse(self, received_msg):
+    def parse(self, received_msg, tensor_frame=b''):
+        """
+        Parse the ``msg`` map of a received request, whose tensors (if any)
+        are decoded from ``tensor_frame`` as views on it.
+        """
+        tensors = decode_tensor_frame(tensor_frame) \
+            if len(tensor_frame) > 0 else None
         self.sender = self._parse_msg(received_msg['sender'])
         self.receiver = self._parse_msg(received_msg['receiver'])
         self.msg_type = self._parse_msg(received_msg['msg_type'])
         self.state = self._parse_msg(received_msg['state'])
-        self.content = self._parse_msg(received_msg['content'])
+        self.content = self._parse_msg(received_msg['content'], tensors)
         self.timestamp = self._parse_msg(received_msg['timestamp'])
 
-    def count_bytes(self):
+    def count_bytes(self, exact=False):
         """
             calculate the message bytes to be sent/received
+        :param exact: count the bytes of the message serialized in the gRPC
+            wire format, which is much slower than the estimation from the
+            sizes of the tensors (see ``estimate_bytes``)
         :return: tuple of bytes of the message to be sent and received
+
+        The bytes are counted once for all the receivers. The estimation is
+        cheap and done at each call, so that it follows the changes of the
+        content in place, while the exact bytes are cached until the
+        estimation changes.
         """
-        from pympler import asizeof
-        download_bytes = asizeof.asizeof(self.content)
+        download_bytes = estimate_bytes(self.content)
+        if exact:
+            if self._exact_bytes is None or \
+                    self._exact_bytes[0] != download_bytes:
+                request = self.transform(to_list=True,
+                                         version=TENSOR_FRAME_VERSION)
+                self._exact_bytes = (download_bytes,
+                                     len(request.SerializeToString()))
+            download_bytes = self._exact_bytes[1]
         upload_cnt = len(self.receiver) if isinstance(self.receiver,
                                                       list) else 1
         upload_bytes = download_bytes * upload_cnt
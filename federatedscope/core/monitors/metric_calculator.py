@@ -370,3 +370,59 @@ def calc_l2_dissim(last_model, local_updated_models):
         l2_dissimilarity['raw'].append(grad_norm)
     l2_dissimilarity['mean'] = np.mean(l2_dissimilarity['raw'])
     return l2_dissimilarity
+
+
+class StreamingBLocalDissim(object):
+    """
+    Streaming estimator of ``calc_blocal_dissim``, into which the local
+    updated models are folded one by one. Only the weighted sums of the
+    gradients and of their squared norms are kept.
+    """
+    def __init__(self, last_model):
+        self.last_model = last_model
+        self.total_weight = 0.
+        self.gnorms = dict()
+        self.grads = dict()
+
+    def update(self, data_size, model):
+        self.total_weight += data_size
+        for k, v in model.items():
+            grad = v - self.last_model[k]
+            self.gnorms[k] = self.gnorms.get(k, .0) + \
+                data_size * torch.sum(grad**2).item()
+            if k not in self.grads:
+                self.grads[k] = torch.zeros_like(v, dtype=torch.float32)
+            self.grads[k] += data_size * grad
+
+    def result(self):
+        b_local_dissimilarity = dict()
+        for k in self.gnorms:
+            global_grad = self.grads[k] / self.total_weight
+            b_local_dissimilarity[k] = np.sqrt(
+                self.gnorms[k] / self.total_weight /
+                torch.sum(global_grad**2).item())
+        return b_local_dissimilarity
+
+
+class StreamingL2Dissim(object):
+    """
+    Streaming estimator of ``calc_l2_dissim``, into which the local updated
+    models are folded one by one.
+    """
+    def __init__(self, last_model):
+        self.last_model = last_model
+        self.raw = []
+
+    def update(self, data_size, model):
+        grads = [(w - self.last_model[key]).flatten()
+                 for key, w in model.items()]
+        self.raw.append(torch.norm(torch.cat(grads)).item())
+
+    def result(self):
+        return {'raw': self.raw, 'mean': np.mean(self.raw)}
+
+
+STREAMING_MODEL_METRICS = {
+    'blocal_dissim': StreamingBLocalDissim,
+    'l2_dissim': StreamingL2Dissim,
+}
@@ -82,10 +82,18 @@ class Monitor(object):
         # flops_per_sample
         self.total_flops = 0  # total computation flops to convergence until
         # current fl round
+        self.total_tokens = 0  # total non-padding tokens in the training
+        # batches of sequence models (e.g., LLMs)
+        self.total_padded_tokens = 0  # total tokens in these batches
+        # including the padding ones
         self.total_upload_bytes = 0  # total upload space cost in bytes
         # until current fl round
         self.total_download_bytes = 0  # total download space cost in bytes
         # until current fl round
+        self.send_latency = dict()  # number, total and max time (in
+        # seconds) of the sends to each receiver
+        self.model_metric_estimators = None  # streaming estimators of the
+        # model metrics of the current round
         self.fl_begin_wall_time = datetime.datetime.now()
         self.fl_end_wall_time = 0
         # for the metrics whose names includes "convergence", 0 indicates
@@ -158,8 +166,18 @@ class Monitor(object):
             60 if isinstance(self.fl_end_wall_time, datetime.timedelta) else 0,
             "total_model_size": self.total_model_size,
             "total_flops": self.total_flops,
+            "total_tokens": self.total_tokens,
+            "total_padded_tokens": self.total_padded_tokens,
+            "padding_efficiency": self.total_tokens /
+            self.total_padded_tokens if self.total_padded_tokens else 0,
             "total_upload_bytes": self.total_upload_bytes,
             "total_download_bytes": self.total_download_bytes,
+            "avg_send_latency_seconds": sum(
+                latency[1] for latency in self.send_latency.values()) /
+            max(1, sum(latency[0] for latency in self.send_latency.values())),
+            "max_send_latency_seconds": max(
+                [latency[2] for latency in self.send_latency.values()],
+                default=0),
             "global_convergence_round": self.global_convergence_round,
             "local_convergence_round": self.local_convergence_round,
             "global_convergence_time_minutes": self.
@@ -534,6 +552,50 @@ class Monitor(object):
                 func_name)
             metric_value = calc_metric(last_model, local_updated_models)
             model_metric_dict[f'train_{metric}'] = metric_value
+        self._log_model_metric(model_metric_dict, rnd)
+
+        return model_metric_dict
+
+    def track_model_metric(self, last_model, local_updated_model):
+        """
+        Fold a local updated model into the streaming estimators of the \
+        model metrics of the current round, so that the local updated \
+        models need not be kept until ``finish_model_metric``.
+
+        Arguments:
+            last_model (dict): the state of last round.
+            local_updated_model (tuple): (data_size, model).
+        """
+        if len(self.cfg.eval.monitoring) == 0:
+            return
+        if self.model_metric_estimators is None:
+            from federatedscope.core.monitors.metric_calculator import \
+                STREAMING_MODEL_METRICS
+            self.model_metric_estimators = {
+                metric: STREAMING_MODEL_METRICS[metric](last_model)
+                for metric in self.cfg.eval.monitoring
+            }
+        for estimator in self.model_metric_estimators.values():
+            estimator.update(*local_updated_model)
+
+    def finish_model_metric(self, rnd):
+        """
+        Like ``calc_model_metric``, from the local updated models folded \
+        by ``track_model_metric``.
+
+        Returns:
+            dict: model_metric_dict
+        """
+        model_metric_dict = {}
+        if self.model_metric_estimators is not None:
+            for metric, estimator in self.model_metric_estimators.items():
+                model_metric_dict[f'train_{metric}'] = estimator.result()
+            self.model_metric_estimators = None
+        self._log_model_metric(model_metric_dict, rnd)
+
+        return model_metric_dict
+
+    def _log_model_metric(self, model_metric_dict, rnd):
         formatted_log = {
             'Role': 'Server #',
             'Round': rnd,
@@ -542,8 +604,6 @@ class Monitor(object):
         if len(model_metric_dict.keys()):
             logger.info(formatted_log)
 
-        return model_metric_dict
-
     def convert_size(self, size_bytes):
         """
         Convert bytes to human-readable size.
@@ -590,6 +650,14 @@ class Monitor(object):
                                  flops) / (self.flop_count + sample_num)
         self.flop_count += 1
 
+    def track_padding(self, num_tokens, num_padded_tokens):
+        """
+        Track the number of non-padding tokens and all the tokens \
+        (including the padding ones) in a batch of sequences.
+        """
+        self.total_tokens += num_tokens
+        self.total_padded_tokens += num_padded_tokens
+
     def track_upload_bytes(self, bytes):
         """
         Track the number of bytes uploaded.
@@ -602,6 +670,14 @@ class Monitor(object):
         """
         self.total_download_bytes += bytes
 
+    def track_send_latency(self, receiver, latency):
+        """
+        Track the time (in seconds) taken to send a message to a receiver.
+        """
+        num, total, max_latency = self.send_latency.get(receiver, (0, 0., 0.))
+        self.send_latency[receiver] = (num + 1, total + latency,
+                                       max(max_latency, latency))
+
     def update_best_result(self, best_results, new_results, results_type):
         """
         Update best evaluation results. \
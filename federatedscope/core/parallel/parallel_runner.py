@@ -283,7 +283,8 @@ class ServerRunner(Runner):
         standalone mode)
         """
         sender, receiver = msg.sender, msg.receiver
-        download_bytes, upload_bytes = msg.count_bytes()
+        download_bytes, upload_bytes = msg.count_bytes(
+            exact=self.config.federate.exact_msg_bytes)
         if msg.msg_type == 'model_para':
             sender_rank = self.id2comm[sender] + 1
             tmp_model_para = copy.deepcopy(self.template_para)
@@ -380,7 +381,8 @@ class ClientRunner(Runner):
             # recv from server
             recv_mode_para(self.template_para, 0)
             msg.content = self.template_para
-        download_bytes, upload_bytes = msg.count_bytes()
+        download_bytes, upload_bytes = msg.count_bytes(
+            exact=self.config.federate.exact_msg_bytes)
         if not isinstance(receiver, list):
             receiver = [receiver]
         for each_receiver in receiver:
@@ -17,7 +17,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
     serialized_options=None,
     create_key=_descriptor._internal_create_key,
     serialized_pb=
-    b'\n\x17gRPC_comm_manager.proto\"n\n\x0eMessageRequest\x12%\n\x03msg\x18\x01 \x03(\x0b\x32\x18.MessageRequest.MsgEntry\x1a\x35\n\x08MsgEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x18\n\x05value\x18\x02 \x01(\x0b\x32\t.MsgValue:\x02\x38\x01\"\xac\x01\n\x08MsgValue\x12\x1e\n\nsingle_msg\x18\x01 \x01(\x0b\x32\x08.mSingleH\x00\x12\x1a\n\x08list_msg\x18\x02 \x01(\x0b\x32\x06.mListH\x00\x12\x30\n\x12\x64ict_msg_stringkey\x18\x03 \x01(\x0b\x32\x12.mDict_keyIsStringH\x00\x12*\n\x0f\x64ict_msg_intkey\x18\x04 \x01(\x0b\x32\x0f.mDict_keyIsIntH\x00\x42\x06\n\x04type\"R\n\x07mSingle\x12\x15\n\x0b\x66loat_value\x18\x01 \x01(\x02H\x00\x12\x13\n\tint_value\x18\x02 \x01(\x05H\x00\x12\x13\n\tstr_value\x18\x03 \x01(\tH\x00\x42\x06\n\x04type\"&\n\x05mList\x12\x1d\n\nlist_value\x18\x01 \x03(\x0b\x32\t.MsgValue\"\x87\x01\n\x11mDict_keyIsString\x12\x35\n\ndict_value\x18\x01 \x03(\x0b\x32!.mDict_keyIsString.DictValueEntry\x1a;\n\x0e\x44ictValueEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x18\n\x05value\x18\x02 \x01(\x0b\x32\t.MsgValue:\x02\x38\x01\"\x81\x01\n\x0emDict_keyIsInt\x12\x32\n\ndict_value\x18\x01 \x03(\x0b\x32\x1e.mDict_keyIsInt.DictValueEntry\x1a;\n\x0e\x44ictValueEntry\x12\x0b\n\x03key\x18\x01 \x01(\x05\x12\x18\n\x05value\x18\x02 \x01(\x0b\x32\t.MsgValue:\x02\x38\x01\"\x1e\n\x0fMessageResponse\x12\x0b\n\x03msg\x18\x01 \x01(\t2F\n\x10gRPCComServeFunc\x12\x32\n\x0bsendMessage\x12\x0f.MessageRequest\x1a\x10.MessageResponse\"\x00\x62\x06proto3'
+    b'\n\x17gRPC_comm_manager.proto\"\x95\x01\n\x0eMessageRequest\x12%\n\x03msg\x18\x01 \x03(\x0b\x32\x18.MessageRequest.MsgEntry\x12\x0f\n\x07version\x18\x02 \x01(\x05\x12\x14\n\x0ctensor_frame\x18\x03 \x01(\x0c\x1a\x35\n\x08MsgEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x18\n\x05value\x18\x02 \x01(\x0b\x32\t.MsgValue:\x02\x38\x01\"\xac\x01\n\x08MsgValue\x12\x1e\n\nsingle_msg\x18\x01 \x01(\x0b\x32\x08.mSingleH\x00\x12\x1a\n\x08list_msg\x18\x02 \x01(\x0b\x32\x06.mListH\x00\x12\x30\n\x12\x64ict_msg_stringkey\x18\x03 \x01(\x0b\x32\x12.mDict_keyIsStringH\x00\x12*\n\x0f\x64ict_msg_intkey\x18\x04 \x01(\x0b\x32\x0f.mDict_keyIsIntH\x00\x42\x06\n\x04type\"h\n\x07mSingle\x12\x15\n\x0b\x66loat_value\x18\x01 \x01(\x02H\x00\x12\x13\n\tint_value\x18\x02 \x01(\x05H\x00\x12\x13\n\tstr_value\x18\x03 \x01(\tH\x00\x12\x14\n\ntensor_ref\x18\x04 \x01(\x05H\x00\x42\x06\n\x04type\"&\n\x05mList\x12\x1d\n\nlist_value\x18\x01 \x03(\x0b\x32\t.MsgValue\"\x87\x01\n\x11mDict_keyIsString\x12\x35\n\ndict_value\x18\x01 \x03(\x0b\x32!.mDict_keyIsString.DictValueEntry\x1a;\n\x0e\x44ictValueEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x18\n\x05value\x18\x02 \x01(\x0b\x32\t.MsgValue:\x02\x38\x01\"\x81\x01\n\x0emDict_keyIsInt\x12\x32\n\ndict_value\x18\x01 \x03(\x0b\x32\x1e.mDict_keyIsInt.DictValueEntry\x1a;\n\x0e\x44ictValueEntry\x12\x0b\n\x03key\x18\x01 \x01(\x05\x12\x18\n\x05value\x18\x02 \x01(\x0b\x32\t.MsgValue:\x02\x38\x01\"A\n\x0fMessageResponse\x12\x0b\n\x03msg\x18\x01 \x01(\t\x12\x0f\n\x07version\x18\x02 \x01(\x05\x12\x10\n\x08next_seq\x18\x03 \x01(\x03\"a\n\x0cMessageChunk\x12\x0e\n\x06msg_id\x18\x01 \x01(\t\x12\x0b\n\x03seq\x18\x02 \x01(\x03\x12\x12\n\ntotal_size\x18\x03 \x01(\x03\x12\x12\n\nchunk_size\x18\x04 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x32\xb9\x01\n\x10gRPCComServeFunc\x12\x32\n\x0bsendMessage\x12\x0f.MessageRequest\x1a\x10.MessageResponse\"\x00\x12\x38\n\x11sendMessageStream\x12\r.MessageChunk\x1a\x10.MessageResponse\"\x00(\x01\x12\x37\n\x12queryMessageStream\x12\r.MessageChunk\x1a\x10.MessageResponse\"\x00\x62\x06proto3'
 )
 
 _MESSAGEREQUEST_MSGENTRY = _descriptor.Descriptor(
@@ -73,8 +73,8 @@ _MESSAGEREQUEST_MSGENTRY = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=84,
-    serialized_end=137,
+    serialized_start=124,
+    serialized_end=177,
 )
 
 _MESSAGEREQUEST = _descriptor.Descriptor(
@@ -103,6 +103,42 @@ _MESSAGEREQUEST = _descriptor.Descriptor(
             serialized_options=None,
             file=DESCRIPTOR,
             create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='version',
+            full_name='MessageRequest.version',
+            index=1,
+            number=2,
+            type=5,
+            cpp_type=1,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='tensor_frame',
+            full_name='MessageRequest.tensor_frame',
+            index=2,
+            number=3,
+            type=12,
+            cpp_type=9,
+            label=1,
+            has_default_value=False,
+            default_value=b"",
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
     ],
     extensions=[],
     nested_types=[
@@ -114,8 +150,8 @@ _MESSAGEREQUEST = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=27,
-    serialized_end=137,
+    serialized_start=28,
+    serialized_end=177,
 )
 
 _MSGVALUE = _descriptor.Descriptor(
@@ -215,8 +251,8 @@ _MSGVALUE = _descriptor.Descriptor(
             create_key=_descriptor._internal_create_key,
             fields=[]),
     ],
-    serialized_start=140,
-    serialized_end=312,
+    serialized_start=180,
+    serialized_end=352,
 )
 
 _MSINGLE = _descriptor.Descriptor(
@@ -281,6 +317,24 @@ _MSINGLE = _descriptor.Descriptor(
             serialized_options=None,
             file=DESCRIPTOR,
             create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='tensor_ref',
+            full_name='mSingle.tensor_ref',
+            index=3,
+            number=4,
+            type=5,
+            cpp_type=1,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
     ],
     extensions=[],
     nested_types=[],
@@ -298,8 +352,8 @@ _MSINGLE = _descriptor.Descriptor(
             create_key=_descriptor._internal_create_key,
             fields=[]),
     ],
-    serialized_start=314,
-    serialized_end=396,
+    serialized_start=354,
+    serialized_end=458,
 )
 
 _MLIST = _descriptor.Descriptor(
@@ -337,8 +391,8 @@ _MLIST = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=398,
-    serialized_end=436,
+    serialized_start=460,
+    serialized_end=498,
 )
 
 _MDICT_KEYISSTRING_DICTVALUEENTRY = _descriptor.Descriptor(
@@ -394,8 +448,8 @@ _MDICT_KEYISSTRING_DICTVALUEENTRY = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=515,
-    serialized_end=574,
+    serialized_start=577,
+    serialized_end=636,
 )
 
 _MDICT_KEYISSTRING = _descriptor.Descriptor(
@@ -435,8 +489,8 @@ _MDICT_KEYISSTRING = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=439,
-    serialized_end=574,
+    serialized_start=501,
+    serialized_end=636,
 )
 
 _MDICT_KEYISINT_DICTVALUEENTRY = _descriptor.Descriptor(
@@ -492,8 +546,8 @@ _MDICT_KEYISINT_DICTVALUEENTRY = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=647,
-    serialized_end=706,
+    serialized_start=709,
+    serialized_end=768,
 )
 
 _MDICT_KEYISINT = _descriptor.Descriptor(
@@ -533,8 +587,8 @@ _MDICT_KEYISINT = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=577,
-    serialized_end=706,
+    serialized_start=639,
+    serialized_end=768,
 )
 
 _MESSAGERESPONSE = _descriptor.Descriptor(
@@ -563,6 +617,42 @@ _MESSAGERESPONSE = _descriptor.Descriptor(
             serialized_options=None,
             file=DESCRIPTOR,
             create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='version',
+            full_name='MessageResponse.version',
+            index=1,
+            number=2,
+            type=5,
+            cpp_type=1,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='next_seq',
+            full_name='MessageResponse.next_seq',
+            index=2,
+            number=3,
+            type=3,
+            cpp_type=2,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
     ],
     extensions=[],
     nested_types=[],
@@ -572,8 +662,119 @@ _MESSAGERESPONSE = _descriptor.Descriptor(
     syntax='proto3',
     extension_ranges=[],
     oneofs=[],
-    serialized_start=708,
-    serialized_end=738,
+    serialized_start=770,
+    serialized_end=835,
+)
+
+_MESSAGECHUNK = _descriptor.Descriptor(
+    name='MessageChunk',
+    full_name='MessageChunk',
+    filename=None,
+    file=DESCRIPTOR,
+    containing_type=None,
+    create_key=_descriptor._internal_create_key,
+    fields=[
+        _descriptor.FieldDescriptor(
+            name='msg_id',
+            full_name='MessageChunk.msg_id',
+            index=0,
+            number=1,
+            type=9,
+            cpp_type=9,
+            label=1,
+            has_default_value=False,
+            default_value=b"".decode('utf-8'),
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='seq',
+            full_name='MessageChunk.seq',
+            index=1,
+            number=2,
+            type=3,
+            cpp_type=2,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='total_size',
+            full_name='MessageChunk.total_size',
+            index=2,
+            number=3,
+            type=3,
+            cpp_type=2,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='chunk_size',
+            full_name='MessageChunk.chunk_size',
+            index=3,
+            number=4,
+            type=3,
+            cpp_type=2,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+        _descriptor.FieldDescriptor(
+            name='data',
+            full_name='MessageChunk.data',
+            index=4,
+            number=5,
+            type=12,
+            cpp_type=9,
+            label=1,
+            has_default_value=False,
+            default_value=b"",
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key),
+    ],
+    extensions=[],
+    nested_types=[],
+    enum_types=[],
+    serialized_options=None,
+    is_extendable=False,
+    syntax='proto3',
+    extension_ranges=[],
+    oneofs=[],
+    serialized_start=837,
+    serialized_end=934,
 )
 
 _MESSAGEREQUEST_MSGENTRY.fields_by_name['value'].message_type = _MSGVALUE
@@ -612,6 +813,10 @@ _MSINGLE.oneofs_by_name['type'].fields.append(
     _MSINGLE.fields_by_name['str_value'])
 _MSINGLE.fields_by_name[
     'str_value'].containing_oneof = _MSINGLE.oneofs_by_name['type']
+_MSINGLE.oneofs_by_name['type'].fields.append(
+    _MSINGLE.fields_by_name['tensor_ref'])
+_MSINGLE.fields_by_name[
+    'tensor_ref'].containing_oneof = _MSINGLE.oneofs_by_name['type']
 _MLIST.fields_by_name['list_value'].message_type = _MSGVALUE
 _MDICT_KEYISSTRING_DICTVALUEENTRY.fields_by_name[
     'value'].message_type = _MSGVALUE
@@ -629,6 +834,7 @@ DESCRIPTOR.message_types_by_name['mList'] = _MLIST
 DESCRIPTOR.message_types_by_name['mDict_keyIsString'] = _MDICT_KEYISSTRING
 DESCRIPTOR.message_types_by_name['mDict_keyIsInt'] = _MDICT_KEYISINT
 DESCRIPTOR.message_types_by_name['MessageResponse'] = _MESSAGERESPONSE
+DESCRIPTOR.message_types_by_name['MessageChunk'] = _MESSAGECHUNK
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
 MessageRequest = _reflection.GeneratedProtocolMessageType(
@@ -728,6 +934,16 @@ MessageResponse = _reflection.GeneratedProtocolMessageType(
     })
 _sym_db.RegisterMessage(MessageResponse)
 
+MessageChunk = _reflection.GeneratedProtocolMessageType(
+    'MessageChunk',
+    (_message.Message, ),
+    {
+        'DESCRIPTOR': _MESSAGECHUNK,
+        '__module__': 'gRPC_comm_manager_pb2'
+        # @@protoc_insertion_point(class_scope:MessageChunk)
+    })
+_sym_db.RegisterMessage(MessageChunk)
+
 _MESSAGEREQUEST_MSGENTRY._options = None
 _MDICT_KEYISSTRING_DICTVALUEENTRY._options = None
 _MDICT_KEYISINT_DICTVALUEENTRY._options = None
@@ -739,8 +955,8 @@ _GRPCCOMSERVEFUNC = _descriptor.ServiceDescriptor(
     index=0,
     serialized_options=None,
     create_key=_descriptor._internal_create_key,
-    serialized_start=740,
-    serialized_end=810,
+    serialized_start=937,
+    serialized_end=1122,
     methods=[
         _descriptor.MethodDescriptor(
             name='sendMessage',
@@ -752,6 +968,26 @@ _GRPCCOMSERVEFUNC = _descriptor.ServiceDescriptor(
             serialized_options=None,
             create_key=_descriptor._internal_create_key,
         ),
+        _descriptor.MethodDescriptor(
+            name='sendMessageStream',
+            full_name='gRPCComServeFunc.sendMessageStream',
+            index=1,
+            containing_service=None,
+            input_type=_MESSAGECHUNK,
+            output_type=_MESSAGERESPONSE,
+            serialized_options=None,
+            create_key=_descriptor._internal_create_key,
+        ),
+        _descriptor.MethodDescriptor(
+            name='queryMessageStream',
+            full_name='gRPCComServeFunc.queryMessageStream',
+            index=2,
+            containing_service=None,
+            input_type=_MESSAGECHUNK,
+            output_type=_MESSAGERESPONSE,
+            serialized_options=None,
+            create_key=_descriptor._internal_create_key,
+        ),
     ])
 _sym_db.RegisterServiceDescriptor(_GRPCCOMSERVEFUNC)
 
@@ -21,6 +21,20 @@ class gRPCComServeFuncStub(object):
             response_deserializer=gRPC__comm__manager__pb2.MessageResponse.
             FromString,
         )
+        self.sendMessageStream = channel.stream_unary(
+            '/gRPCComServeFunc/sendMessageStream',
+            request_serializer=gRPC__comm__manager__pb2.MessageChunk.
+            SerializeToString,
+            response_deserializer=gRPC__comm__manager__pb2.MessageResponse.
+            FromString,
+        )
+        self.queryMessageStream = channel.unary_unary(
+            '/gRPCComServeFunc/queryMessageStream',
+            request_serializer=gRPC__comm__manager__pb2.MessageChunk.
+            SerializeToString,
+            response_deserializer=gRPC__comm__manager__pb2.MessageResponse.
+            FromString,
+        )
 
 
 class gRPCComServeFuncServicer(object):
@@ -31,6 +45,18 @@ class gRPCComServeFuncServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def sendMessageStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def queryMessageStream(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_gRPCComServeFuncServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -41,6 +67,20 @@ def add_gRPCComServeFuncServicer_to_server(servicer, server):
             response_serializer=gRPC__comm__manager__pb2.MessageResponse.
             SerializeToString,
         ),
+        'sendMessageStream': grpc.stream_unary_rpc_method_handler(
+            servicer.sendMessageStream,
+            request_deserializer=gRPC__comm__manager__pb2.MessageChunk.
+            FromString,
+            response_serializer=gRPC__comm__manager__pb2.MessageResponse.
+            SerializeToString,
+        ),
+        'queryMessageStream': grpc.unary_unary_rpc_method_handler(
+            servicer.queryMessageStream,
+            request_deserializer=gRPC__comm__manager__pb2.MessageChunk.
+            FromString,
+            response_serializer=gRPC__comm__manager__pb2.MessageResponse.
+            SerializeToString,
+        ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
         'gRPCComServeFunc', rpc_method_handlers)
@@ -67,3 +107,39 @@ class gRPCComServeFunc(object):
             gRPC__comm__manager__pb2.MessageResponse.FromString, options,
             channel_credentials, insecure, call_credentials, compression,
             wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def sendMessageStream(request_iterator,
+                          target,
+                          options=(),
+                          channel_credentials=None,
+                          call_credentials=None,
+                          insecure=False,
+                          compression=None,
+                          wait_for_ready=None,
+                          timeout=None,
+                          metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator, target, '/gRPCComServeFunc/sendMessageStream',
+            gRPC__comm__manager__pb2.MessageChunk.SerializeToString,
+            gRPC__comm__manager__pb2.MessageResponse.FromString, options,
+            channel_credentials, insecure, call_credentials, compression,
+            wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def queryMessageStream(request,
+                           target,
+                           options=(),
+                           channel_credentials=None,
+                           call_credentials=None,
+                           insecure=False,
+                           compression=None,
+                           wait_for_ready=None,
+                           timeout=None,
+                           metadata=None):
+        return grpc.experimental.unary_unary(
+            request, target, '/gRPCComServeFunc/queryMessageStream',
+            gRPC__comm__manager__pb2.MessageChunk.SerializeToString,
+            gRPC__comm__manager__pb2.MessageResponse.FromString, options,
+            channel_credentials, insecure, call_credentials, compression,
+            wait_for_ready, timeout, metadata)
@@ -0,0 +1,198 @@
+import json
+import struct
+import time
+import warnings
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# Version of the gRPC wire format which carries the tensors of a message in a
+# binary frame (`MessageRequest.tensor_frame`); 0 is the legacy format with
+# the tensors as pickled strings or nested lists
+TENSOR_FRAME_VERSION = 1
+
+# The buffers are aligned to it within the frame
+FRAME_ALIGNMENT = 64
+# Length of the JSON manifest at the head of the frame
+_MANIFEST_LEN = struct.Struct('<Q')
+
+
+class TensorRef(object):
+    """
+    Placeholder of a tensor in the content of a message, which refers to its
+    index in the binary frame.
+    """
+    __slots__ = ['index']
+
+    def __init__(self, index):
+        self.index = index
+
+
+def _align(offset):
+    return (offset + FRAME_ALIGNMENT - 1) // FRAME_ALIGNMENT * \
+        FRAME_ALIGNMENT
+
+
+def is_frame_tensor(value):
+    """
+    Whether ``value`` can be carried in a tensor frame, i.e., a (dense)
+    torch tensor or a numpy array of numbers.
+    """
+    if torch is not None and isinstance(value, torch.Tensor):
+        return value.layout == torch.strided and not value.is_quantized
+    return isinstance(value, np.ndarray) and value.dtype.kind in 'biufc'
+
+
+def _raw_buffer(value):
+    """
+    Return the library, dtype, shape and the raw bytes (a ``memoryview``
+    on the memory of the tensor, if contiguous and on cpu) of ``value``.
+    """
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return 'numpy', array.dtype.str, list(array.shape), \
+            memoryview(array.reshape(-1).view(np.uint8))
+    tensor = value.detach()
+    if tensor.device.type != 'cpu':
+        tensor = tensor.cpu()
+    tensor = tensor.contiguous()
+    return 'torch', str(tensor.dtype).replace('torch.', ''), \
+        list(tensor.shape), \
+        memoryview(tensor.reshape(-1).view(torch.uint8).numpy())
+
+
+def encode_tensor_frame(tensors):
+    """
+    Encode the ``tensors`` (torch tensors or numpy arrays) into a binary
+    frame, which is laid out as::
+
+        manifest length     8 bytes, little-endian
+        manifest            JSON list with the library, dtype, shape, offset
+                            and number of bytes of each tensor
+        buffers             raw bytes of the tensors, each aligned to
+                            ``FRAME_ALIGNMENT`` bytes
+
+    The buffers are copied straight from the memory of the tensors into
+    the frame, without any intermediate serialization.
+    """
+    manifest, buffers = [], []
+    offset = 0
+    for tensor in tensors:
+        lib, dtype, shape, buffer = _raw_buffer(tensor)
+        offset = _align(offset)
+        manifest.append(
+            dict(lib=lib,
+                 dtype=dtype,
+                 shape=shape,
+                 offset=offset,
+                 nbytes=buffer.nbytes))
+        buffers.append((offset, buffer))
+        offset += buffer.nbytes
+
+    manifest = json.dumps(manifest).encode('utf-8')
+    head = _MANIFEST_LEN.pack(len(manifest)) + manifest
+    parts = [head, bytes(_align(len(head)) - len(head))]
+    end = 0
+    for offset, buffer in buffers:
+        parts.append(bytes(offset - end))
+        parts.append(buffer)
+        end = offset + buffer.nbytes
+    return b''.join(parts)
+
+
+def decode_tensor_frame(frame):
+    """
+    Decode the tensors of a binary frame, which are views on the frame
+    rather than copies. The numpy arrays are read-only; the torch tensors
+    should not be modified in place either, as they share the (immutable)
+    buffer of the frame, which they keep alive.
+    """
+    manifest_len, = _MANIFEST_LEN.unpack_from(frame)
+    manifest = json.loads(
+        bytes(frame[_MANIFEST_LEN.size:_MANIFEST_LEN.size + manifest_len]))
+    start = _align(_MANIFEST_LEN.size + manifest_len)
+
+    tensors = []
+    for entry in manifest:
+        offset = start + entry['offset']
+        if entry['lib'] == 'numpy':
+            dtype = np.dtype(entry['dtype'])
+            array = np.frombuffer(frame,
+                                  dtype=dtype,
+                                  count=entry['nbytes'] // dtype.itemsize,
+                                  offset=offset)
+            tensors.append(array.reshape(entry['shape']))
+        else:
+            dtype = getattr(torch, entry['dtype'])
+            itemsize = torch.empty(0, dtype=dtype).element_size()
+            if entry['nbytes'] == 0:
+                tensors.append(torch.empty(entry['shape'], dtype=dtype))
+                continue
+            with warnings.catch_warnings():
+                # The frame is not writable
+                warnings.simplefilter('ignore', UserWarning)
+                tensor = torch.frombuffer(frame,
+                                          dtype=dtype,
+                                          count=entry['nbytes'] // itemsize,
+                                          offset=offset)
+            tensors.append(tensor.view(entry['shape']))
+    return tensors
+
+
+def benchmark_tensor_frame(
+        sizes_mb=(1, 16, 128, 1024), tensor_mb=4, msg_type='model_para'):
+    """
+    Compare the legacy wire format with the tensor frame on state dicts of
+    ``sizes_mb`` MB (made of float32 tensors of ``tensor_mb`` MB), for the
+    time to encode a ``Message`` into a serialized request and to decode it,
+    and the size of the request.
+
+    Returns:
+        A list of dicts with the results of each size.
+    """
+    from federatedscope.core.auxiliaries.utils import param2tensor
+    from federatedscope.core.message import Message
+    from federatedscope.core.proto import gRPC_comm_manager_pb2
+
+    results = []
+    for size_mb in sizes_mb:
+        numel = int(min(size_mb, tensor_mb) * 2**20) // 4
+        state_dict = {
+            f'layer.{idx}.weight': torch.randn(numel)
+            for idx in range(max(1, int(size_mb / tensor_mb)))
+        }
+        result = dict(size_mb=size_mb)
+        for name, version in [('legacy', 0), ('frame', TENSOR_FRAME_VERSION)]:
+            message = Message(msg_type=msg_type,
+                              sender=0,
+                              receiver=[1],
+                              state=0,
+                              content=dict(state_dict))
+            start = time.time()
+            data = message.transform(to_list=True,
+                                     version=version).SerializeToString()
+            encode_time = time.time() - start
+
+            start = time.time()
+            request = gRPC_comm_manager_pb2.MessageRequest.FromString(data)
+            received = Message()
+            received.parse(request.msg, request.tensor_frame)
+            if version == 0:
+                # The pickled tensors are decoded by the receiver
+                for key in received.content:
+                    received.content[key] = param2tensor(received.content[key])
+            decode_time = time.time() - start
+            result[name] = dict(bytes=len(data),
+                                encode_time=encode_time,
+                                decode_time=decode_time)
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    for result in benchmark_tensor_frame():
+        print(result)
@@ -1,2 +1,4 @@
-from federatedscope.core.secret_sharing.secret_sharing import \
-    AdditiveSecretSharing
+from federatedscope.core.secret_sharing.secret_sharing import \
+    AdditiveSecretSharing, ShamirSecretSharing
+from federatedscope.core.secret_sharing.pairwise_mask import \
+    PairwiseMaskSecretSharing
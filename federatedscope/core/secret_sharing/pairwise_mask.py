@@ -0,0 +1,198 @@
+import random
+import secrets
+
+import numpy as np
+try:
+    import torch
+except ImportError:
+    torch = None
+
+from federatedscope.core.secret_sharing.secret_sharing import \
+    AdditiveSecretSharing, ShamirSecretSharing
+from federatedscope.core.secure import DiffieHellmanKeypair
+
+
+class PairwiseMaskSecretSharing(AdditiveSecretSharing):
+    """
+    Secure aggregation with pairwise masks refer to `Practical Secure
+    Aggregation for Privacy-Preserving Machine Learning`
+    [Bonawitz et al., 2017]
+    (https://dl.acm.org/doi/10.1145/3133956.3133982)
+
+    Each pair of clients agrees on a short seed (by the Diffie-Hellman key
+    agreement), from which both expand the same mask with a counter-based
+    PRG (Philox); one adds it to its (fixed-point) model para and the other
+    subtracts it, so that the masks cancel out in the sum on the server.
+    Each client also adds a self mask, and splits its private key and the
+    seed of its self mask among the clients with Shamir's secret sharing.
+    From the frames of any ``threshold`` clients, the server removes the
+    self masks of the clients which upload their model para, and the
+    pairwise masks shared with the ones which drop out.
+
+    Thus each client uploads a single masked model para, and sends (and
+    receives) a few integers to (and from) each other client.
+
+    Arguments:
+        shared_party_num: the number of clients, whose IDs are 1, ...,
+            shared_party_num
+        threshold: the number of clients to recover the masks (a majority
+            if None)
+        size: see ``AdditiveSecretSharing``
+        seed: the seed of the keys and of the masks (from the system
+            randomness if None)
+    """
+    def __init__(self, shared_party_num, threshold=None, size=60, seed=None):
+        super(PairwiseMaskSecretSharing, self).__init__(shared_party_num,
+                                                        size=size,
+                                                        seed=seed)
+        if threshold is None:
+            threshold = shared_party_num // 2 + 1
+        self.random = random.Random(seed) if seed is not None else \
+            secrets.SystemRandom()
+        self.key_agreement = DiffieHellmanKeypair(random=self.random)
+        self.seed_sharing = ShamirSecretSharing(
+            shared_party_num,
+            threshold,
+            seed=None if seed is None else self.random.getrandbits(64))
+        self.ID = None
+        # round -> (private key, self seed)
+        self.keys = dict()
+        # round -> client -> (public key, frame of the private key, frame
+        # of the self seed), from each client including itself
+        self.frames = dict()
+
+    def setup_round(self, round, ID):
+        """
+        Generate the keys of the client ``ID`` for a new round, and return
+        the frames to send to each other client (with the integers as hex
+        strings, to be carried by the messages)
+        """
+        self.ID = ID
+        public_key, private_key = self.key_agreement.generate_keypair()
+        self_seed = self.random.getrandbits(128)
+        self.keys[round] = (private_key, self_seed)
+
+        contents = dict()
+        for (client, key_frame), (_, seed_frame) in zip(
+                self.seed_sharing.secret_split(private_key),
+                self.seed_sharing.secret_split(self_seed)):
+            contents[client] = [
+                hex(public_key),
+                hex(key_frame),
+                hex(seed_frame)
+            ]
+        self.receive_frames(round, ID, contents.pop(ID))
+        return contents
+
+    def receive_frames(self, round, sender, content):
+        self.frames.setdefault(round, dict())[sender] = \
+            [int(value, 16) for value in content]
+
+    def ready(self, round):
+        """
+        Whether the frames of all the clients have been received
+        """
+        return round in self.keys and \
+            len(self.frames.get(round, [])) == self.shared_party_num
+
+    def mask(self, round, secret):
+        """
+        Encode the ``secret`` (a state dict, or a list of state dicts) as
+        fixed-point int64 numbers and add the masks of the round
+        """
+        private_key, self_seed = self.keys[round]
+        if isinstance(secret, list):
+            masked = [self._encode(each) for each in secret]
+        else:
+            masked = self._encode(secret)
+        self._add_mask(masked, self_seed)
+        for client, (public_key, _, _) in self.frames[round].items():
+            if client != self.ID:
+                seed = self.key_agreement.agree(private_key, public_key)
+                self._add_mask(masked, seed, negative=client < self.ID)
+        # Clean up the previous rounds
+        for key in [key for key in self.frames if key < round]:
+            del self.frames[key]
+        return masked
+
+    def unmask_frames(self, round, survivors, dropped):
+        """
+        The frames revealed to the server, i.e., the public keys, the
+        frames of the self seeds of the ``survivors`` (the clients whose
+        masked model para has been received) and of the private keys of
+        the ``dropped`` clients, as lists of [client, hex string]
+        """
+        assert self.ID in survivors and not set(survivors) & set(dropped), \
+            'A client should not be both survivor and dropped!'
+        # Never reveal the frames of a round twice
+        frames = self.frames.pop(round)
+        self.keys.pop(round, None)
+        return {
+            'public_keys': [[client, hex(value[0])]
+                            for client, value in frames.items()],
+            'self_seed_frames': [[client, hex(frames[client][2])]
+                                 for client in survivors if client in frames],
+            'private_key_frames': [[client, hex(frames[client][1])]
+                                   for client in dropped if client in frames],
+        }
+
+    def remove_masks(self, masked_models, replies):
+        """
+        Remove the masks which do not cancel out in the sum of the
+        ``masked_models`` (client -> masked model para, modified in place)
+
+        Arguments:
+            masked_models: the masked model para of the survivors
+            replies: client -> ``unmask_frames`` of at least ``threshold``
+                clients
+        """
+        public_keys, seed_frames, key_frames = dict(), dict(), dict()
+        for client, reply in replies.items():
+            for owner, value in reply['public_keys']:
+                public_keys[owner] = int(value, 16)
+            for owner, value in reply['self_seed_frames']:
+                seed_frames.setdefault(owner, []).append(
+                    (client, int(value, 16)))
+            for owner, value in reply['private_key_frames']:
+                key_frames.setdefault(owner, []).append(
+                    (client, int(value, 16)))
+
+        for client, model_para in masked_models.items():
+            self_seed = self.seed_sharing.secret_reconstruct(
+                seed_frames[client])
+            self._add_mask(model_para, self_seed, negative=True)
+        for dropped, frames in key_frames.items():
+            private_key = self.seed_sharing.secret_reconstruct(frames)
+            for client, model_para in masked_models.items():
+                seed = self.key_agreement.agree(private_key,
+                                                public_keys[client])
+                # Which ``client`` has added if its ID is smaller
+                self._add_mask(model_para, seed, negative=client < dropped)
+
+    def _encode(self, state_dict):
+        return {
+            key: self.float2fixedpoint(
+                value.detach().cpu().numpy() if torch is not None
+                and isinstance(value, torch.Tensor) else value)
+            for key, value in state_dict.items()
+        }
+
+    def _add_mask(self, model_para, seed, negative=False):
+        """
+        Add (or subtract) the mask expanded from ``seed`` to ``model_para``,
+        key by key in the sorted order
+        """
+        generator = np.random.Generator(np.random.Philox(key=seed))
+        info = np.iinfo(np.int64)
+        model_paras = model_para if isinstance(model_para, list) else \
+            [model_para]
+        with np.errstate(over='ignore'):
+            for each in model_paras:
+                for key in sorted(each):
+                    value = np.asarray(each[key], dtype=np.int64)
+                    mask = generator.integers(info.min,
+                                              info.max,
+                                              size=value.shape,
+                                              dtype=np.int64,
+                                              endpoint=True)
+                    each[key] = value - mask if negative else value + mask
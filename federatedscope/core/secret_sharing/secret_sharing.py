@@ -1,4 +1,8 @@
+import random
+import secrets
+import time
 from abc import ABC, abstractmethod
+
 import numpy as np
 try:
     import torch
@@ -23,18 +27,29 @@ class AdditiveSecretSharing(SecretSharing):
     """
     AdditiveSecretSharing class, which can split a number into frames and
     recover it by summing up
+
+    The secrets are encoded as fixed-point int64 numbers, and the frames
+    are shares in the ring of integers modulo 2^64, i.e., the wrap-around
+    of the int64 arithmetic is the modulo and the frames can be summed up
+    (by numpy) without overflow. The secrets are split and recovered as
+    whole arrays.
+
+    Arguments:
+        shared_party_num: the number of frames to split a secret into
+        size: the absolute value of the fixed-point secrets (and of their
+            sums) should be less than 2^size (at most 2^63)
+        seed: the seed of the generator of the random frames
     """
-    def __init__(self, shared_party_num, size=60):
+    def __init__(self, shared_party_num, size=60, seed=None):
         super(SecretSharing, self).__init__()
         assert shared_party_num > 1, "AdditiveSecretSharing require " \
                                      "shared_party_num > 1"
+        assert size <= 63, "The fixed-point numbers are int64"
         self.shared_party_num = shared_party_num
         self.maximum = 2**size
-        self.mod_number = 2 * self.maximum + 1
+        self.mod_number = 2**64
         self.epsilon = 1e8
-        self.mod_funs = np.vectorize(lambda x: x % self.mod_number)
-        self.float2fixedpoint = np.vectorize(self._float2fixedpoint)
-        self.fixedpoint2float = np.vectorize(self._fixedpoint2float)
+        self.rng = np.random.default_rng(seed)
 
     def secret_split(self, secret):
         """
@@ -47,25 +62,20 @@ class AdditiveSecretSharing(SecretSharing):
                     secret_list[idx][key] = each
             return secret_list
 
-        if isinstance(secret, list) or isinstance(secret, np.ndarray):
-            secret = np.asarray(secret)
-            shape = [self.shared_party_num - 1] + list(secret.shape)
-        elif isinstance(secret, torch.Tensor):
-            secret = secret.numpy()
-            shape = [self.shared_party_num - 1] + list(secret.shape)
-        else:
-            shape = [self.shared_party_num - 1]
-
+        if torch is not None and isinstance(secret, torch.Tensor):
+            secret = secret.detach().cpu().numpy()
         secret = self.float2fixedpoint(secret)
-        secret_seq = np.random.randint(low=0, high=self.mod_number, size=shape)
-        # last_seq = self.mod_funs(secret - self.mod_funs(np.sum(secret_seq,
-        # axis=0)))
-        last_seq = self.mod_funs(secret -
-                                 self.mod_funs(np.sum(secret_seq, axis=0)))
-
-        secret_seq = np.append(secret_seq,
-                               np.expand_dims(last_seq, axis=0),
-                               axis=0)
+
+        info = np.iinfo(np.int64)
+        secret_seq = self.rng.integers(info.min,
+                                       info.max,
+                                       size=(self.shared_party_num, ) +
+                                       secret.shape,
+                                       dtype=np.int64,
+                                       endpoint=True)
+        # The last frame makes the frames sum up to the secret (mod 2^64)
+        with np.errstate(over='ignore'):
+            secret_seq[-1] = secret - secret_seq[:-1].sum(axis=0)
         return secret_seq
 
     def secret_reconstruct(self, secret_seq):
@@ -76,23 +86,128 @@ class AdditiveSecretSharing(SecretSharing):
         merge_model = secret_seq[0].copy()
         if isinstance(merge_model, dict):
             for key in merge_model:
-                for idx in range(len(secret_seq)):
-                    if idx == 0:
-                        merge_model[key] = secret_seq[idx][key]
-                    else:
-                        merge_model[key] += secret_seq[idx][key]
-                merge_model[key] = self.fixedpoint2float(merge_model[key])
+                merge_model[key] = self.fixedpoint2float(
+                    np.sum([np.asarray(each[key]) for each in secret_seq],
+                           axis=0,
+                           dtype=np.int64))
+        else:
+            merge_model = self.fixedpoint2float(
+                np.sum(np.asarray(secret_seq), axis=0, dtype=np.int64))
 
         return merge_model
 
-    def _float2fixedpoint(self, x):
-        x = round(x * self.epsilon, 0)
-        assert abs(x) < self.maximum
-        return x % self.mod_number
+    def float2fixedpoint(self, x):
+        """
+        Encode ``x`` (a number or an array) as fixed-point int64 numbers
+        """
+        x = np.round(np.asarray(x, dtype=np.float64) * self.epsilon)
+        assert np.all(np.abs(x) < self.maximum)
+        return x.astype(np.int64)
+
+    def fixedpoint2float(self, x):
+        """
+        Decode the fixed-point int64 numbers ``x`` (e.g., the sum of the
+        frames, mod 2^64) into floats
+        """
+        return np.asarray(x).astype(np.int64) / self.epsilon
 
-    def _fixedpoint2float(self, x):
-        x = x % self.mod_number
-        if x > self.maximum:
-            return -1 * (self.mod_number - x) / self.epsilon
-        else:
-            return x / self.epsilon
+
+class ShamirSecretSharing(SecretSharing):
+    """
+    ShamirSecretSharing class, which splits an integer (e.g., a seed or a
+    key) into frames, any ``threshold`` of which recover it, by evaluating
+    a random polynomial of degree ``threshold - 1`` over a prime field
+
+    Arguments:
+        shared_party_num: the number of frames, the i-th of which is the
+            polynomial evaluated at i + 1 (e.g., the ID of a client)
+        threshold: the number of frames to recover the secret
+        prime: the modulus of the field, larger than the secrets
+        seed: the seed of the random coefficients (from the system
+            randomness if None)
+    """
+    def __init__(self,
+                 shared_party_num,
+                 threshold,
+                 prime=2**521 - 1,
+                 seed=None):
+        super(SecretSharing, self).__init__()
+        assert 0 < threshold <= shared_party_num, \
+            "ShamirSecretSharing require 0 < threshold <= shared_party_num"
+        self.shared_party_num = shared_party_num
+        self.threshold = threshold
+        self.prime = prime
+        self.random = random.Random(seed) if seed is not None else \
+            secrets.SystemRandom()
+
+    def secret_split(self, secret):
+        """
+        To split the secret into frames according to the shared_party_num,
+        as a list of (x, y)
+        """
+        assert 0 <= secret < self.prime
+        coefficients = [secret] + [
+            self.random.randrange(self.prime)
+            for _ in range(self.threshold - 1)
+        ]
+        secret_seq = []
+        for x in range(1, self.shared_party_num + 1):
+            y = 0
+            for coefficient in reversed(coefficients):
+                y = (y * x + coefficient) % self.prime
+            secret_seq.append((x, y))
+        return secret_seq
+
+    def secret_reconstruct(self, secret_seq):
+        """
+        To recover the secret from (at least ``threshold``) frames, by the
+        Lagrange interpolation at 0
+        """
+        assert len(secret_seq) >= self.threshold, \
+            f"At least {self.threshold} frames are required"
+        secret_seq = list(secret_seq)[:self.threshold]
+        secret = 0
+        for x_i, y_i in secret_seq:
+            numerator, denominator = 1, 1
+            for x_j, _ in secret_seq:
+                if x_j != x_i:
+                    numerator = numerator * -x_j % self.prime
+                    denominator = denominator * (x_i - x_j) % self.prime
+            secret = (secret + y_i * numerator *
+                      pow(denominator, -1, self.prime)) % self.prime
+        return secret
+
+
+def benchmark_secret_sharing(
+        num_params=(10**4, 10**6), shared_party_num=3, repeat=3):
+    """
+    Measure the throughput (in parameters/s) of splitting a state dict of
+    ``num_params`` float32 parameters into ``shared_party_num`` frames and
+    of recovering it.
+
+    Returns:
+        A list of dicts with the throughput of each size.
+    """
+    ss_manager = AdditiveSecretSharing(shared_party_num=shared_party_num,
+                                       seed=0)
+    results = []
+    for num in num_params:
+        secret = {'weight': np.random.randn(num).astype(np.float32)}
+        start = time.time()
+        for _ in range(repeat):
+            frames = ss_manager.secret_split(secret)
+        split_time = (time.time() - start) / repeat
+        start = time.time()
+        for _ in range(repeat):
+            ss_manager.secret_reconstruct(frames)
+        reconstruct_time = (time.time() - start) / repeat
+        results.append(
+            dict(num_params=num,
+                 split_params_per_second=num / split_time,
+                 reconstruct_params_per_second=num / reconstruct_time))
+    return results
+
+
+if __name__ == '__main__':
+    for result in benchmark_secret_sharing():
+        print(result)
@@ -0,0 +1,5 @@
+from federatedscope.core.secure.encrypt.dummy_encrypt import \
+    DummyEncryptKeypair
+from federatedscope.core.secure.key_agreement import DiffieHellmanKeypair
+
+__all__ = ['DummyEncryptKeypair', 'DiffieHellmanKeypair']
@@ -0,0 +1,55 @@
+import hashlib
+import secrets
+
+# The 2048-bit MODP group of RFC 3526, whose prime is safe
+MODP_2048_PRIME = int(
+    'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74'
+    '020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437'
+    '4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED'
+    'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05'
+    '98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB'
+    '9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B'
+    'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718'
+    '3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF', 16)
+MODP_2048_GENERATOR = 2
+
+
+class DiffieHellmanKeypair(object):
+    """
+    Diffie-Hellman key agreement, by which two parties agree on a short
+    seed from their own private key and the public key of the other.
+
+    Arguments:
+        prime: the prime of the group
+        generator: the generator of the group
+        key_bits: the number of bits of the private keys
+        random: the source of the private keys (the system randomness if
+            None)
+    """
+    def __init__(self,
+                 prime=MODP_2048_PRIME,
+                 generator=MODP_2048_GENERATOR,
+                 key_bits=256,
+                 random=None):
+        self.prime = prime
+        self.generator = generator
+        self.key_bits = key_bits
+        self.random = random if random is not None else \
+            secrets.SystemRandom()
+
+    def generate_keypair(self):
+        private_key = self.random.getrandbits(self.key_bits) | 1
+        public_key = pow(self.generator, private_key, self.prime)
+        return public_key, private_key
+
+    def agree(self, private_key, peer_public_key, seed_bits=128):
+        """
+        The seed shared with the owner of ``peer_public_key``, hashed from
+        the shared secret of the group
+        """
+        assert 1 < peer_public_key < self.prime - 1, 'Invalid public key!'
+        shared = pow(peer_public_key, private_key, self.prime)
+        digest = hashlib.sha256(
+            shared.to_bytes((self.prime.bit_length() + 7) // 8,
+                            'big')).digest()
+        return int.from_bytes(digest, 'big') >> (256 - seed_bits)
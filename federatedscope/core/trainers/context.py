@@ -234,6 +234,17 @@ class Context(LifecycleDict):
         else:
             cur_split = self.cur_split
 
+        num_data = self.get(f'num_{cur_split}_data')
+        batch_size = self.cfg.dataloader.batch_size
+        drop_last = self.cfg.dataloader.drop_last
+        if self.cfg.dataloader.get('max_tokens', 0) > 0:
+            # The batches of a token budget vary in size, count them by the
+            # loader (possibly wrapped by `ReIterator`) instead
+            loader = self.get(f'{cur_split}_loader')
+            loader = getattr(loader, 'loader', loader)
+            if hasattr(loader, 'batch_sampler') and hasattr(loader, '__len__'):
+                num_data, batch_size, drop_last = len(loader), 1, False
+
         num_batch_last_epoch, num_total_batch = None, None
         if mode in ['train', 'finetune']:
             num_batch, num_batch_last_epoch, num_epoch, num_total_batch = \
@@ -241,17 +252,13 @@ class Context(LifecycleDict):
                     self.cfg.train.local_update_steps *
                     self.cfg.grad.grad_accum_count,
                     self.cfg.train.batch_or_epoch,
-                    self.get(f'num_{cur_split}_data'),
-                    self.cfg.dataloader.batch_size,
-                    self.cfg.dataloader.drop_last)
+                    num_data,
+                    batch_size,
+                    drop_last)
         elif mode in ['val', 'test']:
             num_epoch = 1
-            num_batch = self.get(f'num_{cur_split}_data'
-                                 ) // self.cfg.dataloader.batch_size + int(
-                                     not self.cfg.dataloader.drop_last
-                                     and bool(
-                                         self.get(f'num_{cur_split}_data') %
-                                         self.cfg.dataloader.batch_size))
+            num_batch = num_data // batch_size + int(
+                not drop_last and bool(num_data % batch_size))
         else:
             raise ValueError(f'Invalid mode {mode}.')
 
@@ -37,6 +37,8 @@ class BaseClient(Worker):
             ``address``                  ``callback_funcs_for_address()``
             ``model_para``               ``callback_funcs_for_model_para()``
             ``ss_model_para``            ``callback_funcs_for_model_para()``
+            ``ss_mask_seeds``            ``callback_funcs_for_mask_seeds()``
+            ``ss_unmask``                ``callback_funcs_for_unmask()``
             ``evaluate``                 ``callback_funcs_for_evaluate()``
             ``finish``                   ``callback_funcs_for_finish()``
             ``converged``                ``callback_funcs_for_converged()``
@@ -55,6 +57,11 @@ class BaseClient(Worker):
         self.register_handlers('ss_model_para',
                                self.callback_funcs_for_model_para,
                                ['ss_model_para', 'model_para'])
+        self.register_handlers('ss_mask_seeds',
+                               self.callback_funcs_for_mask_seeds,
+                               ['model_para'])
+        self.register_handlers('ss_unmask', self.callback_funcs_for_unmask,
+                               ['ss_unmask_frames'])
         self.register_handlers('evaluate', self.callback_funcs_for_evaluate,
                                ['metrics'])
         self.register_handlers('finish', self.callback_funcs_for_finish,
@@ -117,6 +124,29 @@ class BaseClient(Worker):
         """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def callback_funcs_for_mask_seeds(self, message):
+        """
+        The handling function for receiving the public key and the frames \
+        of the seeds of another client, used for secure aggregation with \
+        pairwise masks
+
+        Arguments:
+            message: The received message
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def callback_funcs_for_unmask(self, message):
+        """
+        The handling function for receiving the request of the frames to \
+        remove the pairwise masks (used for secure aggregation)
+
+        Arguments:
+            message: The received message
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def callback_funcs_for_evaluate(self, message):
         """
@@ -36,6 +36,7 @@ class BaseServer(Worker):
             ``join_in_info``             ``callback_funcs_for_join_in()``
             ``model_para``               ``callback_funcs_model_para()``
             ``metrics``                  ``callback_funcs_for_metrics``
+            ``ss_unmask_frames``         ``callback_funcs_for_unmask_frames``
             ============================ ==================================
         """
         self.register_handlers('join_in', self.callback_funcs_for_join_in, [
@@ -47,6 +48,9 @@ class BaseServer(Worker):
                                ['model_para', 'evaluate', 'finish'])
         self.register_handlers('metrics', self.callback_funcs_for_metrics,
                                ['converged'])
+        self.register_handlers('ss_unmask_frames',
+                               self.callback_funcs_for_unmask_frames,
+                               ['model_para', 'evaluate', 'finish'])
 
     @abc.abstractmethod
     def run(self):
@@ -94,3 +98,16 @@ class BaseServer(Worker):
             message: The received message
         """
         raise NotImplementedError
+
+    @abc.abstractmethod
+    def callback_funcs_for_unmask_frames(self, message):
+        """
+        The handling function for receiving the frames to remove the \
+        pairwise masks of the model parameters (used for secure \
+        aggregation), which triggers ``check_and_move_on`` when enough \
+        frames have been received.
+
+        Arguments:
+            message: The received message
+        """
+        raise NotImplementedError
@@ -8,7 +8,8 @@ from federatedscope.core.communication import StandaloneCommManager, \
     StandaloneDDPCommManager, gRPCCommManager
 from federatedscope.core.monitors.early_stopper import EarlyStopper
 from federatedscope.core.auxiliaries.trainer_builder import get_trainer
-from federatedscope.core.secret_sharing import AdditiveSecretSharing
+from federatedscope.core.secret_sharing import AdditiveSecretSharing, \
+    PairwiseMaskSecretSharing
 from federatedscope.core.auxiliaries.utils import merge_dict_of_results, \
     calculate_time_cost, add_prefix_to_path, get_ds_rank
 from federatedscope.core.workers.base_client import BaseClient
@@ -127,9 +128,15 @@ class Client(BaseClient):
             self._monitor.the_larger_the_better)
 
         # Secret Sharing Manager and message buffer
-        self.ss_manager = AdditiveSecretSharing(
-            shared_party_num=int(self._cfg.federate.sample_client_num
-                                 )) if self._cfg.federate.use_ss else None
+        if not self._cfg.federate.use_ss:
+            self.ss_manager = None
+        elif self._cfg.federate.ss_type == 'pairwise_mask':
+            self.ss_manager = PairwiseMaskSecretSharing(
+                shared_party_num=int(self._cfg.federate.client_num),
+                threshold=self._cfg.federate.ss_threshold or None)
+        else:
+            self.ss_manager = AdditiveSecretSharing(
+                shared_party_num=int(self._cfg.federate.sample_client_num))
         self.msg_buffer = {'train': dict(), 'eval': dict()}
 
         # Communication and communication ability
@@ -175,7 +182,8 @@ class Client(BaseClient):
                 host=host,
                 port=port,
                 client_num=self._cfg.federate.client_num,
-                cfg=self._cfg.distribute)
+                cfg=self._cfg.distribute,
+                monitor=self._monitor)
             logger.info('Client: Listen to {}:{}...'.format(host, port))
             self.comm_manager.add_neighbors(neighbor_id=server_id,
                                             address={
@@ -324,6 +332,10 @@ class Client(BaseClient):
             self.trainer.update(content,
                                 strict=self._cfg.federate.share_local_model)
             self.state = round
+            if isinstance(self.ss_manager, PairwiseMaskSecretSharing):
+                # Exchange the seeds before the local training, so that the
+                # masks can be removed if this client drops out during it
+                self._send_mask_seeds(timestamp)
             skip_train_isolated_or_global_mode = \
                 self.early_stopper.early_stopped and \
                 self._cfg.federate.method in ["local", "global"]
@@ -360,7 +372,25 @@ class Client(BaseClient):
                                                          save_file_name="")
 
             # Return the feedbacks to the server after local update
-            if self._cfg.federate.use_ss:
+            if isinstance(self.ss_manager, PairwiseMaskSecretSharing):
+                assert not self.is_unseen_client, \
+                    "Un-support using secret sharing for unseen clients." \
+                    "i.e., you set cfg.federate.use_ss=True and " \
+                    "cfg.federate.unseen_clients_rate in (0, 1)"
+                if isinstance(model_para_all, list):
+                    secret = [{
+                        key: value * sample_size
+                        for key, value in model_para.items()
+                    } for model_para in model_para_all]
+                else:
+                    secret = {
+                        key: value * sample_size
+                        for key, value in model_para_all.items()
+                    }
+                self.msg_buffer['train'][self.state] = (sample_size, secret,
+                                                        timestamp)
+                self._upload_masked_model_para(self.state)
+            elif self._cfg.federate.use_ss:
                 assert not self.is_unseen_client, \
                     "Un-support using secret sharing for unseen clients." \
                     "i.e., you set cfg.federate.use_ss=True and " \
@@ -441,6 +471,79 @@ class Client(BaseClient):
                                 instance_number=sample_size),
                             content=(sample_size, shared_model_para)))
 
+    def _send_mask_seeds(self, timestamp):
+        """
+        Generate the keys of the round for secure aggregation with pairwise \
+        masks, and send the public key and the frames of the seeds to the \
+        other clients
+
+        Arguments:
+            timestamp: The timestamp of the received model parameters
+        """
+        contents = self.ss_manager.setup_round(self.state, self.ID)
+        for neighbor in self.comm_manager.neighbors:
+            if neighbor != self.server_id:
+                self.comm_manager.send(
+                    Message(msg_type='ss_mask_seeds',
+                            sender=self.ID,
+                            receiver=[neighbor],
+                            state=self.state,
+                            timestamp=timestamp,
+                            content=contents[int(neighbor)]))
+
+    def _upload_masked_model_para(self, round):
+        """
+        Upload the masked model parameters of the round, once the local \
+        training is done and the seeds of all the other clients have been \
+        received
+        """
+        if round not in self.msg_buffer['train'] or \
+                not self.ss_manager.ready(round):
+            return
+        sample_size, secret, timestamp = self.msg_buffer['train'].pop(round)
+        self.comm_manager.send(
+            Message(msg_type='model_para',
+                    sender=self.ID,
+                    receiver=[self.server_id],
+                    state=round,
+                    timestamp=self._gen_timestamp(init_timestamp=timestamp,
+                                                  instance_number=sample_size),
+                    content=(sample_size, self.ss_manager.mask(round,
+                                                               secret))))
+
+    def callback_funcs_for_mask_seeds(self, message: Message):
+        """
+        The handling function for receiving the public key and the frames \
+        of the seeds of another client, which triggers the upload of the \
+        masked model parameters once those of all the clients are received
+
+        Arguments:
+            message: The received message
+        """
+        self.ss_manager.receive_frames(message.state, message.sender,
+                                       message.content)
+        self._upload_masked_model_para(message.state)
+
+    def callback_funcs_for_unmask(self, message: Message):
+        """
+        The handling function for receiving the request of the frames to \
+        remove the pairwise masks, i.e., the clients whose masked model \
+        parameters have been received by the server and the dropped ones
+
+        Arguments:
+            message: The received message
+        """
+        content = message.content
+        self.comm_manager.send(
+            Message(msg_type='ss_unmask_frames',
+                    sender=self.ID,
+                    receiver=[self.server_id],
+                    state=message.state,
+                    timestamp=message.timestamp,
+                    content=self.ss_manager.unmask_frames(
+                        message.state, content['survivors'],
+                        content['dropped'])))
+
     def callback_funcs_for_assign_id(self, message: Message):
         """
         The handling function for receiving the client_ID assigned by the \
@@ -15,7 +15,8 @@ from federatedscope.core.auxiliaries.sampler_builder import get_sampler
 from federatedscope.core.auxiliaries.utils import merge_dict_of_results, \
     Timeout, merge_param_dict, add_prefix_to_path, get_ds_rank
 from federatedscope.core.auxiliaries.trainer_builder import get_trainer
-from federatedscope.core.secret_sharing import AdditiveSecretSharing
+from federatedscope.core.secret_sharing import AdditiveSecretSharing, \
+    PairwiseMaskSecretSharing
 from federatedscope.core.workers.base_server import BaseServer
 
 logger = logging.getLogger(__name__)
@@ -139,9 +140,18 @@ class Server(BaseServer):
             ])
 
         # function for recovering shared secret
-        self.recover_fun = AdditiveSecretSharing(
-            shared_party_num=int(self._cfg.federate.sample_client_num)
-        ).fixedpoint2float if self._cfg.federate.use_ss else None
+        self.ss_manager = None
+        if not self._cfg.federate.use_ss:
+            self.recover_fun = None
+        elif self._cfg.federate.ss_type == 'pairwise_mask':
+            # The masks are removed before the aggregation
+            self.ss_manager = PairwiseMaskSecretSharing(
+                shared_party_num=int(self._cfg.federate.client_num),
+                threshold=self._cfg.federate.ss_threshold or None)
+            self.recover_fun = self.ss_manager.fixedpoint2float
+        else:
+            self.recover_fun = AdditiveSecretSharing(shared_party_num=int(
+                self._cfg.federate.sample_client_num)).fixedpoint2float
 
         if self._cfg.federate.make_global_eval:
             # set up a trainer for conducting evaluation in server
@@ -215,6 +225,11 @@ class Server(BaseServer):
         # Initialize communication manager and message buffer
         self.msg_buffer = {'train': dict(), 'eval': dict()}
         self.staled_msg_buffer = list()
+        # For secure aggregation with pairwise masks, the clients whose
+        # masked model para are unmasked in the current round (None before
+        # the request of the frames), and the last unmasked round
+        self.ss_survivors = None
+        self.ss_unmasked_round = -1
         if self.mode == 'standalone':
             comm_queue = kwargs.get('shared_comm_queue', None)
             if self._cfg.federate.process_num > 1:
@@ -232,7 +247,8 @@ class Server(BaseServer):
             self.comm_manager = gRPCCommManager(host=host,
                                                 port=port,
                                                 client_num=client_num,
-                                                cfg=self._cfg.distribute)
+                                                cfg=self._cfg.distribute,
+                                                monitor=self._monitor)
             logger.info('Server: Listen to {}:{}...'.format(host, port))
 
         # inject noise before broadcast
@@ -273,7 +289,12 @@ class Server(BaseServer):
         min_received_num = self._cfg.asyn.min_received_num \
             if self._cfg.asyn.use else self._cfg.federate.sample_client_num
         num_failure = 0
-        time_budget = self._cfg.asyn.time_budget if self._cfg.asyn.use else -1
+        if self._cfg.asyn.use:
+            time_budget = self._cfg.asyn.time_budget
+        elif self.ss_manager is not None and self._cfg.federate.ss_timeout:
+            time_budget = self._cfg.federate.ss_timeout
+        else:
+            time_budget = -1
         with Timeout(time_budget) as time_counter:
             while self.state <= self.total_round_num:
                 try:
@@ -284,6 +305,11 @@ class Server(BaseServer):
                 except TimeoutError:
                     logger.info('Time out at the training round #{}'.format(
                         self.state))
+                    if self.ss_manager is not None and \
+                            self.trigger_for_ss_time_up():
+                        # Wait for the frames of the survivors
+                        time_counter.reset()
+                        continue
                     move_on_flag_eval = self.check_and_move_on(
                         min_received_num=min_received_num,
                         check_eval_result=True)
@@ -307,6 +333,11 @@ class Server(BaseServer):
                         # TODO: Clean the msg_buffer
                         if self.state in self.msg_buffer['train']:
                             self.msg_buffer['train'][self.state].clear()
+                        self.ss_survivors = None
+                        if self._cfg.federate.streaming_aggr:
+                            for aggregator in self.aggregators:
+                                aggregator.running_sum = None
+                            self._monitor.model_metric_estimators = None
 
                         self.broadcast_model_para(
                             msg_type='model_para',
@@ -347,7 +378,17 @@ class Server(BaseServer):
 
         move_on_flag = True  # To record whether moving to a new training
         # round or finishing the evaluation
-        if self.check_buffer(self.state, min_received_num, check_eval_result):
+        # With pairwise masks, the unmasked model para of the survivors are
+        # aggregated, even if some clients have dropped out
+        unmasked = not check_eval_result and \
+            self.ss_unmasked_round == self.state
+        if unmasked or self.check_buffer(self.state, min_received_num,
+                                         check_eval_result):
+            if not check_eval_result and self.ss_manager is not None and \
+                    self.ss_unmasked_round != self.state:
+                # The pairwise masks should be removed before the aggregation
+                self._request_unmask_frames()
+                return False
             if not check_eval_result:
                 # Receiving enough feedback in the training process
                 aggregated_num = self._perform_federated_aggregation()
@@ -483,9 +524,12 @@ class Server(BaseServer):
                 staleness.append((client_id, self.state - state))
 
             # Trigger the monitor here (for training)
-            self._monitor.calc_model_metric(self.models[0].state_dict(),
-                                            msg_list,
-                                            rnd=self.state)
+            if self._cfg.federate.streaming_aggr:
+                self._monitor.finish_model_metric(rnd=self.state)
+            else:
+                self._monitor.calc_model_metric(self.models[0].state_dict(),
+                                                msg_list,
+                                                rnd=self.state)
 
             # Aggregate
             aggregated_num = len(msg_list)
@@ -920,6 +964,32 @@ class Server(BaseServer):
         self.check_and_move_on()
         return True
 
+    def trigger_for_ss_time_up(self):
+        """
+        The handler for time up with secure aggregation with pairwise \
+        masks: the clients whose masked model parameters have not been \
+        received are treated as dropped, and the others are asked for the \
+        frames to remove the masks, if they are at least ``threshold``
+
+        Returns:
+            bool: Whether the frames have been requested
+        """
+        if self.is_finish or self.ss_survivors is not None or \
+                self.ss_unmasked_round == self.state:
+            return False
+        received_num = len(self.msg_buffer['train'].get(self.state, dict()))
+        if received_num < self.ss_manager.seed_sharing.threshold:
+            logger.warning(
+                f'Server: Only {received_num} masked model para have been '
+                f'received at round #{self.state}, fewer than the '
+                f'{self.ss_manager.seed_sharing.threshold} required to '
+                f'remove the masks.')
+            return False
+        logger.info(f'Server: Time up at round #{self.state}, unmasking the '
+                    f'model para of {received_num} clients.')
+        self._request_unmask_frames()
+        return True
+
     def terminate(self, msg_type='finish'):
         """
         To terminate the FL course
@@ -1019,10 +1089,12 @@ class Server(BaseServer):
             if round not in self.msg_buffer['train']:
                 self.msg_buffer['train'][round] = dict()
             # Save the messages in this round
-            self.msg_buffer['train'][round][sender] = content
+            self.msg_buffer['train'][round][sender] = \
+                self._fold_model_para(content)
         elif round >= self.state - self.staleness_toleration:
             # Save the staled messages
-            self.staled_msg_buffer.append((round, sender, content))
+            self.staled_msg_buffer.append(
+                (round, sender, self._fold_model_para(content)))
         else:
             # Drop the out-of-date messages
             logger.info(f'Drop a out-of-date message from round #{round}')
@@ -1039,6 +1111,95 @@ class Server(BaseServer):
 
         return move_on_flag
 
+    def _fold_model_para(self, content):
+        """
+        With streaming aggregation, fold the received model parameters into \
+        the running sums of the aggregators (and the estimators of the \
+        model metrics), and drop them from the content to be buffered, \
+        which keeps the sample size only.
+
+        Arguments:
+            content: (sample_size, model_para) received from a client.
+
+        Returns:
+            The content to be saved in the message buffer.
+        """
+        if not self._cfg.federate.streaming_aggr:
+            return content
+
+        sample_size, model_para = content
+        for model_idx in range(self.model_num):
+            para = model_para if self.model_num == 1 else \
+                model_para[model_idx]
+            if model_idx == 0 and len(self._cfg.eval.monitoring) > 0:
+                self._monitor.track_model_metric(self.models[0].state_dict(),
+                                                 (sample_size, para))
+            self.aggregators[model_idx].fold((sample_size, para))
+
+        if self.model_num == 1:
+            return sample_size, dict()
+        return sample_size, [dict() for _ in range(self.model_num)]
+
+    def _request_unmask_frames(self):
+        """
+        Ask the clients whose masked model parameters have been received \
+        (i.e., the survivors) for the frames to remove the pairwise masks \
+        (once per round)
+        """
+        if self.ss_survivors is not None:
+            return
+        self.ss_survivors = sorted(self.msg_buffer['train'][self.state])
+        dropped = [
+            client_id for client_id in range(1, self.client_num + 1)
+            if client_id not in self.ss_survivors
+        ]
+        # The dropped clients are sampled again in the next round, and
+        # treated as dropped again if they are still out
+        self.sampler.change_state(dropped, 'idle')
+        self.msg_buffer['ss_unmask'] = dict()
+        self.comm_manager.send(
+            Message(msg_type='ss_unmask',
+                    sender=self.ID,
+                    receiver=self.ss_survivors,
+                    state=self.state,
+                    timestamp=self.cur_timestamp,
+                    content={
+                        'survivors': self.ss_survivors,
+                        'dropped': dropped
+                    }))
+
+    def callback_funcs_for_unmask_frames(self, message: Message):
+        """
+        The handling function for receiving the frames to remove the \
+        pairwise masks. Once the frames of ``threshold`` clients have been \
+        received, the masks which do not cancel out in the sum are removed \
+        from the buffered model parameters, which are then aggregated.
+
+        Arguments:
+            message: The received message
+        """
+        if message.state != self.state or self.ss_survivors is None:
+            # Out-of-date or already unmasked
+            return False
+        self.msg_buffer['ss_unmask'][message.sender] = message.content
+        if len(self.msg_buffer['ss_unmask']) < \
+                self.ss_manager.seed_sharing.threshold:
+            return False
+
+        train_msg_buffer = self.msg_buffer['train'][self.state]
+        # The model para received after the request are treated as dropped
+        for client_id in list(train_msg_buffer):
+            if client_id not in self.ss_survivors:
+                del train_msg_buffer[client_id]
+        self.ss_manager.remove_masks(
+            {
+                client_id: content[1]
+                for client_id, content in train_msg_buffer.items()
+            }, self.msg_buffer['ss_unmask'])
+        self.ss_survivors = None
+        self.ss_unmasked_round = self.state
+        return self.check_and_move_on()
+
     def callback_funcs_for_join_in(self, message: Message):
         """
         The handling function for receiving the join in information. The \
@@ -110,7 +110,11 @@ class Generator:
         return response_tokens
 
 
-def get_tokenizer(model_name, cache_dir, tok_len=128, padding_side="right"):
+def get_tokenizer(model_name,
+                  cache_dir,
+                  tok_len=128,
+                  padding_side="right",
+                  use_fast=False):
     from transformers import AutoTokenizer, GPT2Tokenizer
 
     if model_name == 'CarperAI/openai_summarize_tldr_sft':
@@ -119,7 +123,7 @@ def get_tokenizer(model_name, cache_dir, tok_len=128, padding_side="right"):
             cache_dir=cache_dir,
             model_max_length=tok_len,
             padding_side=padding_side,
-            use_fast=False,
+            use_fast=use_fast,
         )
     else:
         tokenizer = AutoTokenizer.from_pretrained(
@@ -127,7 +131,7 @@ def get_tokenizer(model_name, cache_dir, tok_len=128, padding_side="right"):
             cache_dir=cache_dir,
             model_max_length=tok_len,
             padding_side=padding_side,
-            use_fast=False,
+            use_fast=use_fast,
         )
 
     special_tokens = dict()
@@ -252,7 +256,8 @@ def load_jsonls(file_paths,
 def load_llm_dataset(config=None, **kwargs):
     model_name, _ = config.model.type.split('@')
     tokenizer, num_new_tokens = \
-        get_tokenizer(model_name, config.data.root, config.llm.tok_len)
+        get_tokenizer(model_name, config.data.root, config.llm.tok_len,
+                      use_fast=config.llm.tok_use_fast)
 
     dataset_name, _ = config.data.type.split('@')
 
@@ -1,12 +1,13 @@
 import os
 import json
 import copy
-import pickle
 
 from federatedscope.core.data.utils import download_url
 from federatedscope.llm.dataloader.dataloader import load_jsonls, load_jsonl
 from federatedscope.llm.dataset.llm_dataset import DefaultToken, \
     LLMDataset, LLMComparisonDataset
+from federatedscope.llm.dataset.token_store import get_token_store_path, \
+    load_or_build_token_stores
 
 TLDR_PROMPT_DICT = {
     # "summary": ("Below is a forum post. Write a precise and concise summary "
@@ -262,20 +263,16 @@ def load_human_finetuning_dataset(data_root,
 
 
 def load_comparison_dataset(data_root, tokenizer, max_num_test=-1):
-    token_name = os.path.basename(tokenizer.name_or_path)
-    train_set_path = os.path.join(data_root, f'{token_name}_train.pickle')
-    val_set_path = os.path.join(data_root, f'{token_name}_val.pickle')
-    test_set_path = os.path.join(data_root, f'{token_name}_test.pickle')
-    if os.path.exists(train_set_path) and os.path.exists(val_set_path) \
-            and os.path.exists(test_set_path):
-        with open(train_set_path, 'rb') as f_train, \
-                open(val_set_path, 'rb') as f_val, \
-                open(test_set_path, 'rb') as f_test:
-            train_dataset = pickle.load(f_train)
-            val_dataset = pickle.load(f_val)
-            test_dataset = pickle.load(f_test)
+    train_fp, val_fp, test_fp = [
+        get_token_store_path(data_root,
+                             split,
+                             tokenizer,
+                             prompt=TLDR_PROMPT_DICT['summary'],
+                             output_tags=['output_A', 'output_B'])
+        for split in ['train', 'val', 'test']
+    ]
 
-    else:
+    def build_datasets():
         list_train_dict, list_val_dict, list_test_dict = \
             _download_tldr_cmpr(data_root)
 
@@ -305,13 +302,10 @@ def load_comparison_dataset(data_root, tokenizer, max_num_test=-1):
             output_B='output_B',
             choice='choice')
 
-        # Store these three lists to a pickle file
-        with open(train_set_path, 'wb') as f_train, \
-                open(val_set_path, 'wb') as f_val, \
-                open(test_set_path, 'wb') as f_test:
-            pickle.dump(train_dataset, f_train)
-            pickle.dump(val_dataset, f_val)
-            pickle.dump(test_dataset, f_test)
+        return train_dataset, val_dataset, test_dataset
+
+    train_dataset, val_dataset, test_dataset = load_or_build_token_stores(
+        [train_fp, val_fp, test_fp], build_datasets, tokenizer)
 
     # shrink val and test dataset
     if max_num_test > 0:
@@ -339,21 +333,16 @@ def load_best_dataset(data_root, tokenizer, max_num_test=-1):
 
 
 def load_comparison_dataset_by_choice(data_root, tokenizer, max_num_test=-1):
-    token_name = os.path.basename(tokenizer.name_or_path)
-    train_set_path = os.path.join(data_root,
-                                  f'{token_name}_train_choice.pickle')
-    val_set_path = os.path.join(data_root, f'{token_name}_val_choice.pickle')
-    test_set_path = os.path.join(data_root, f'{token_name}_test_choice.pickle')
-    if os.path.exists(train_set_path) and os.path.exists(val_set_path) and \
-            os.path.exists(test_set_path):
-        with open(train_set_path, 'rb') as f_train, \
-                open(val_set_path, 'rb') as f_val, \
-                open(test_set_path, 'rb') as f_test:
-            train_dataset = pickle.load(f_train)
-            val_dataset = pickle.load(f_val)
-            test_dataset = pickle.load(f_test)
+    train_fp, val_fp, test_fp = [
+        get_token_store_path(data_root,
+                             f'{split}_choice',
+                             tokenizer,
+                             prompt=TLDR_PROMPT_DICT['summary_cmp'],
+                             output_tags=['choice'])
+        for split in ['train', 'val', 'test']
+    ]
 
-    else:
+    def build_datasets():
         list_train_dict, list_val_dict, list_test_dict = \
             _download_tldr_cmpr(data_root)
 
@@ -390,13 +379,10 @@ def load_comparison_dataset_by_choice(data_root, tokenizer, max_num_test=-1):
             prompt_no_input=TLDR_PROMPT_DICT['summary_cmp'],
             output_tag='choice')
 
-        # Store these three lists to a pickle file
-        with open(train_set_path, 'wb') as f_train, \
-                open(val_set_path, 'wb') as f_val, \
-                open(test_set_path, 'wb') as f_test:
-            pickle.dump(train_dataset, f_train)
-            pickle.dump(val_dataset, f_val)
-            pickle.dump(test_dataset, f_test)
+        return train_dataset, val_dataset, test_dataset
+
+    train_dataset, val_dataset, test_dataset = load_or_build_token_stores(
+        [train_fp, val_fp, test_fp], build_datasets, tokenizer)
 
     # shrink val and test dataset
     if max_num_test > 0:
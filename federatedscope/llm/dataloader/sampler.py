@@ -0,0 +1,143 @@
+import logging
+
+import numpy as np
+from torch.utils.data import Sampler, Subset
+
+from federatedscope.llm.dataset.llm_dataset import LLMComparisonDataset
+
+logger = logging.getLogger(__name__)
+
+
+def get_sequence_lengths(dataset):
+    """
+    Return the number of tokens of each sample in ``dataset`` and the
+    number of padded rows each sample takes in a batch (``2`` for the
+    win/lose pairs of ``LLMComparisonDataset``, which are padded together).
+    """
+    if isinstance(dataset, Subset):
+        lengths, rows = get_sequence_lengths(dataset.dataset)
+        return lengths[np.asarray(dataset.indices, dtype=np.int64)], rows
+    if isinstance(dataset, LLMComparisonDataset):
+        win_lengths, _ = get_sequence_lengths(dataset.win_dataset)
+        lose_lengths, _ = get_sequence_lengths(dataset.lose_dataset)
+        return np.maximum(win_lengths, lose_lengths), 2
+    input_ids = getattr(dataset, 'input_ids', None)
+    if input_ids is not None:
+        # `TokenSequence` knows the lengths without reading the tokens
+        lengths = getattr(input_ids, 'lengths', None)
+        if lengths is None:
+            lengths = [len(ids) for ids in input_ids]
+        return np.asarray(lengths, dtype=np.int64), 1
+    return np.array([len(sample['input_ids']) for sample in dataset],
+                    dtype=np.int64), 1
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """
+    Batch sampler which groups the samples of similar lengths, so that the
+    batches padded by ``LLMDataCollator`` waste few tokens on padding.
+
+    The samples are sorted by length (ties broken randomly) and cut into
+    buckets of ``bucket_size`` samples. In each epoch, the samples of a
+    bucket are shuffled and chunked into batches of at most ``max_tokens``
+    tokens after padding to the longest sample of the bucket, and the order
+    of all the batches is shuffled. The number of batches is the same in
+    every epoch.
+
+    Arguments:
+        lengths: number of tokens of each sample
+        max_tokens: maximum number of (padded) tokens in a batch; a sample
+            longer than it makes a batch on its own
+        bucket_size: number of samples in a bucket, the larger the more
+            random the batches and the more padding
+        shuffle: shuffle the samples in the buckets and the batches, or
+            yield the batches from the shortest samples to the longest ones
+        rows_per_sample: number of padded rows of each sample in a batch
+        seed: seed of the random generator
+    """
+    def __init__(self,
+                 lengths,
+                 max_tokens,
+                 bucket_size=512,
+                 shuffle=True,
+                 rows_per_sample=1,
+                 seed=None):
+        if max_tokens <= 0:
+            raise ValueError(f'max_tokens should be positive, but got '
+                             f'{max_tokens}.')
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = max_tokens
+        self.bucket_size = max(int(bucket_size), 1)
+        self.shuffle = shuffle
+        self.rows_per_sample = rows_per_sample
+        self.rng = np.random.default_rng(seed)
+
+        # The lengths in each bucket do not depend on how the ties are broken
+        sorted_lengths = np.sort(self.lengths, kind='stable')
+        buckets = [
+            sorted_lengths[left:left + self.bucket_size]
+            for left in range(0, len(sorted_lengths), self.bucket_size)
+        ]
+        self.bucket_sizes = [len(bucket) for bucket in buckets]
+        self.bucket_max_lengths = [int(bucket.max()) for bucket in buckets]
+        self.bucket_capacities = [
+            max(1, self.max_tokens // max(length * self.rows_per_sample, 1))
+            for length in self.bucket_max_lengths
+        ]
+
+    def _buckets(self):
+        order = np.arange(len(self.lengths))
+        if self.shuffle:
+            order = self.rng.permutation(order)
+        order = order[np.argsort(self.lengths[order], kind='stable')]
+        return [
+            order[left:left + self.bucket_size]
+            for left in range(0, len(order), self.bucket_size)
+        ]
+
+    def __iter__(self):
+        batches = []
+        for bucket, capacity in zip(self._buckets(), self.bucket_capacities):
+            if self.shuffle:
+                bucket = self.rng.permutation(bucket)
+            batches += [
+                bucket[left:left + capacity].tolist()
+                for left in range(0, len(bucket), capacity)
+            ]
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        return iter(batches)
+
+    def __len__(self):
+        return sum(-(-size // capacity) for size, capacity in zip(
+            self.bucket_sizes, self.bucket_capacities))
+
+    def padding_efficiency(self):
+        """
+        Return the expected ratio of the real tokens to the padded tokens
+        in the batches, assuming that every batch is padded to the longest
+        sample of its bucket.
+        """
+        padded = sum(size * length for size, length in zip(
+            self.bucket_sizes, self.bucket_max_lengths))
+        return float(self.lengths.sum()) / max(padded, 1)
+
+
+def get_token_budget_batch_sampler(dataset, config, split='train'):
+    """
+    Build the ``TokenBudgetBatchSampler`` of ``dataset`` with
+    ``cfg.dataloader.max_tokens`` and ``cfg.dataloader.bucket_size``.
+    """
+    lengths, rows_per_sample = get_sequence_lengths(dataset)
+    sampler = TokenBudgetBatchSampler(
+        lengths,
+        config.dataloader.max_tokens,
+        bucket_size=config.dataloader.bucket_size,
+        shuffle=config.dataloader.shuffle and split == 'train',
+        rows_per_sample=rows_per_sample,
+        seed=config.seed)
+    logger.info(f'Token budget batch sampler for the {split} split: '
+                f'{len(lengths)} samples in {len(sampler)} batches, '
+                f'expected padding efficiency '
+                f'{sampler.padding_efficiency():.4f}.')
+    return sampler
@@ -1,7 +1,6 @@
 import os
 import json
 import copy
-import pickle
 import datasets
 
 from federatedscope.core.splitters.generic.lda_splitter import LDASplitter
@@ -9,6 +8,8 @@ from federatedscope.core.data.utils import download_url
 from federatedscope.llm.dataloader.dataloader import load_jsonls, load_jsonl
 from federatedscope.llm.dataset.llm_dataset import LLMComparisonDataset, \
     LLMDataset
+from federatedscope.llm.dataset.token_store import get_token_store_path, \
+    load_or_build_token_stores
 
 SHP_PROMPT_DICT = {
     "shp": ("Below is an instruction that describes a task. "
@@ -206,23 +207,20 @@ def load_safe_dataset():
 
 
 def load_comparison_dataset(data_root, tokenizer, config, max_num_test=-1):
-    token_name = os.path.basename(tokenizer.name_or_path)
     num_clients = config.federate.client_num
+    # The training data depends on the number of clients
     train_fp, val_fp, test_fp = [
-        os.path.join(data_root, f'{token_name}_train_{num_clients}.pickle'),
-        os.path.join(data_root, f'{token_name}_val.pickle'),
-        os.path.join(data_root, f'{token_name}_test.pickle')
+        get_token_store_path(
+            data_root,
+            split,
+            tokenizer,
+            prompt=SHP_PROMPT_DICT['shp'],
+            output_tags=['output_A', 'output_B'],
+            num_clients=num_clients if split == 'train' else None)
+        for split in ['train', 'val', 'test']
     ]
 
-    if os.path.exists(train_fp) and os.path.exists(val_fp) and os.path.exists(
-            test_fp):
-        with open(train_fp, 'rb') as f_train, open(val_fp, 'rb') as f_val, \
-                open(test_fp, 'rb') as f_test:
-            train_dataset = pickle.load(f_train)
-            val_dataset = pickle.load(f_val)
-            test_dataset = pickle.load(f_test)
-
-    else:
+    def build_datasets():
         list_train_dict, list_val_dict, list_test_dict = \
             shp_dataset(data_root, num_clients, tokenizer)
 
@@ -252,13 +250,10 @@ def load_comparison_dataset(data_root, tokenizer, config, max_num_test=-1):
             output_B='output_B',
             choice='choice')
 
-        # Store these three lists to a pickle file
-        with open(train_fp, 'wb') as f_train, \
-                open(val_fp, 'wb') as f_val, \
-                open(test_fp, 'wb') as f_test:
-            pickle.dump(train_dataset, f_train)
-            pickle.dump(val_dataset, f_val)
-            pickle.dump(test_dataset, f_test)
+        return train_dataset, val_dataset, test_dataset
+
+    train_dataset, val_dataset, test_dataset = load_or_build_token_stores(
+        [train_fp, val_fp, test_fp], build_datasets, tokenizer)
 
     # shrink val and test dataset
     if max_num_test > 0:
@@ -289,24 +284,20 @@ def load_shp_cmp_dataset_by_choice(data_root,
                                    tokenizer,
                                    config,
                                    max_num_test=-1):
-    token_name = os.path.basename(tokenizer.name_or_path)
     num_clients = config.federate.client_num
+    # The training data depends on the number of clients
     train_fp, val_fp, test_fp = [
-        os.path.join(data_root,
-                     f'{token_name}_train_choice_{num_clients}.pickle'),
-        os.path.join(data_root, f'{token_name}_val_choice.pickle'),
-        os.path.join(data_root, f'{token_name}_test_choice.pickle')
+        get_token_store_path(
+            data_root,
+            f'{split}_choice',
+            tokenizer,
+            prompt=SHP_PROMPT_DICT['shp_cmp'],
+            output_tags=['choice'],
+            num_clients=num_clients if split == 'train' else None)
+        for split in ['train', 'val', 'test']
     ]
 
-    if os.path.exists(train_fp) and os.path.exists(val_fp) and os.path.exists(
-            test_fp):
-        with open(train_fp, 'rb') as f_train, open(val_fp, 'rb') as f_val, \
-                open(test_fp, 'rb') as f_test:
-            train_dataset = pickle.load(f_train)
-            val_dataset = pickle.load(f_val)
-            test_dataset = pickle.load(f_test)
-
-    else:
+    def build_datasets():
         list_train_dict, list_val_dict, list_test_dict = \
             shp_dataset(data_root, num_clients, tokenizer)
 
@@ -340,13 +331,10 @@ def load_shp_cmp_dataset_by_choice(data_root,
                                   prompt_no_input=SHP_PROMPT_DICT['shp_cmp'],
                                   output_tag='choice')
 
-        # Store these three lists to a pickle file
-        with open(train_fp, 'wb') as f_train, \
-                open(val_fp, 'wb') as f_val, \
-                open(test_fp, 'wb') as f_test:
-            pickle.dump(train_dataset, f_train)
-            pickle.dump(val_dataset, f_val)
-            pickle.dump(test_dataset, f_test)
+        return train_dataset, val_dataset, test_dataset
+
+    train_dataset, val_dataset, test_dataset = load_or_build_token_stores(
+        [train_fp, val_fp, test_fp], build_datasets, tokenizer)
 
     # shrink val and test dataset
     if max_num_test > 0:
@@ -359,13 +347,13 @@ def load_shp_cmp_dataset_by_choice(data_root,
 
 
 def load_alpacafarm_human_for_eval(data_root, tokenizer):
-    token_name = os.path.basename(tokenizer.name_or_path)
-    path = os.path.join(data_root,
-                        f'{token_name}_alpacafarm_human_choice.pickle')
-    if os.path.exists(path):
-        with open(path, 'rb') as f:
-            test_dataset = pickle.load(f)
-    else:
+    path = get_token_store_path(data_root,
+                                'alpacafarm_human_choice',
+                                tokenizer,
+                                prompt=SHP_PROMPT_DICT['shp_cmp'],
+                                output_tags=['choice'])
+
+    def build_datasets():
         ds = datasets.load_dataset("tatsu-lab/alpaca_farm",
                                    "alpaca_human_preference")["preference"]
         list_data_dict = []
@@ -388,8 +376,8 @@ def load_alpacafarm_human_for_eval(data_root, tokenizer):
                                   prompt_input=SHP_PROMPT_DICT['shp_cmp'],
                                   prompt_no_input=SHP_PROMPT_DICT['shp_cmp'],
                                   output_tag='choice')
+        return test_dataset,
 
-        with open(path, 'wb') as f:
-            pickle.dump(test_dataset, f)
-
+    test_dataset, = load_or_build_token_stores([path], build_datasets,
+                                               tokenizer)
     return test_dataset
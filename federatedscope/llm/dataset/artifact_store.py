@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedArtifactStore(object):
+    """
+    Append-only store of the records (dicts) produced by a stage of a
+    pipeline (e.g., the generated pairs and the selector's preferences of
+    RLHF), in chunks of JSON lines. Each chunk is written to a temporary
+    file and renamed, so a crash never leaves a partial chunk, and the
+    stage resumes from the chunks that are missing. The chunks are read
+    one at a time, which keeps the whole artifact out of memory.
+
+    Layout of the directory ``path``::
+
+        meta.json           chunk size, and number of chunks once finished
+        chunk_000000.jsonl  records of the first chunk of inputs
+        ...
+
+    Arguments:
+        path: directory of the store
+        chunk_size: number of inputs (e.g., prompts) in each chunk
+    """
+    def __init__(self, path, chunk_size=100):
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+
+        meta = self._read_meta()
+        if meta is None:
+            self._write_meta(dict(chunk_size=chunk_size, num_chunks=None))
+        elif meta['chunk_size'] != chunk_size and meta['num_chunks'] is None:
+            raise ValueError(
+                f'The unfinished store {path} has chunks of '
+                f'{meta["chunk_size"]} inputs, which cannot be resumed with '
+                f'chunks of {chunk_size}.')
+
+    def _read_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp_path = os.path.join(self.path, f'meta.json.tmp{os.getpid()}')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+
+    def chunk_path(self, idx):
+        return os.path.join(self.path, f'chunk_{idx:06d}.jsonl')
+
+    def has_chunk(self, idx):
+        return os.path.exists(self.chunk_path(idx))
+
+    @property
+    def num_chunks(self):
+        """
+        Number of chunks of the finished store, ``None`` if unfinished.
+        """
+        return self._read_meta()['num_chunks']
+
+    def is_finished(self):
+        return self.num_chunks is not None
+
+    def finish(self, num_chunks):
+        meta = self._read_meta()
+        meta['num_chunks'] = num_chunks
+        self._write_meta(meta)
+
+    def write_chunk(self, idx, records):
+        tmp_path = f'{self.chunk_path(idx)}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.chunk_path(idx))
+
+    def read_chunk(self, idx):
+        with open(self.chunk_path(idx), 'r') as f:
+            return [json.loads(line) for line in f]
+
+    def iter_chunks(self, wait=False, poll_interval=10.):
+        """
+        Yield the records of the chunks in order. With ``wait``, the chunks
+        still being produced (e.g., by another process) are waited for
+        until the store is finished; otherwise it stops at the first
+        missing chunk.
+        """
+        idx = 0
+        while True:
+            num_chunks = self.num_chunks
+            if num_chunks is not None and idx >= num_chunks:
+                return
+            if self.has_chunk(idx):
+                yield self.read_chunk(idx)
+                idx += 1
+            elif wait and num_chunks is None:
+                time.sleep(poll_interval)
+            else:
+                return
+
+    def iter_records(self, wait=False):
+        for records in self.iter_chunks(wait):
+            yield from records
+
+    def write_records(self, records):
+        """
+        Write all the ``records`` (e.g., of a legacy JSON artifact) in
+        chunks of ``chunk_size`` records and finish the store.
+        """
+        num_chunks = 0
+        for idx, left in enumerate(range(0, len(records), self.chunk_size)):
+            self.write_chunk(idx, records[left:left + self.chunk_size])
+            num_chunks = idx + 1
+        self.finish(num_chunks)
+
+
+def run_chunked_pipeline(inputs, stages):
+    """
+    Run the ``stages`` of a pipeline chunk by chunk, so that each chunk of
+    ``inputs`` goes through all the stages (e.g., generation and then
+    selection) before the next one, and every stage is checkpointed after
+    each chunk. The chunks found in a store are skipped, and only read if
+    a later stage still needs them.
+
+    Arguments:
+        inputs: list of the inputs of the first stage
+        stages: list of ``(store, process_fn)``, where ``process_fn`` maps
+            the records of a chunk of the previous stage (or the inputs) to
+            the records of the stage; all the stores share the chunk size
+
+    Returns:
+        The stores of the stages, all finished.
+    """
+    first_store = stages[0][0]
+    chunk_size = first_store.chunk_size
+    if first_store.is_finished():
+        num_chunks = first_store.num_chunks
+    else:
+        num_chunks = (len(inputs) + chunk_size - 1) // chunk_size
+
+    for idx in range(num_chunks):
+        # The last stage which already has the chunk
+        done = max([-1] + [
+            stage_idx for stage_idx, (store, _) in enumerate(stages)
+            if store.has_chunk(idx)
+        ])
+        if done == len(stages) - 1:
+            continue
+        if done >= 0:
+            records = stages[done][0].read_chunk(idx)
+        else:
+            records = inputs[idx * chunk_size:(idx + 1) * chunk_size]
+        for store, process_fn in stages[done + 1:]:
+            records = process_fn(records)
+            store.write_chunk(idx, records)
+        logger.info(f'Chunk {idx + 1}/{num_chunks} of the pipeline is done '
+                    f'and saved to {stages[-1][0].path}.')
+
+    for store, _ in stages:
+        if not store.is_finished():
+            store.finish(num_chunks)
+    return [store for store, _ in stages]
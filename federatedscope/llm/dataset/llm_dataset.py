@@ -5,8 +5,11 @@ Some code snippets are borrowed from the open-sourced stanford_alpaca (
 
 import copy
 import logging
+import os
 import pandas as pd
+import torch
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from torch.utils.data import Dataset
 
@@ -35,6 +38,115 @@ PROMPT_DICT = {
 }
 
 
+def format_sources(list_data_dict, prompt_input, prompt_no_input):
+    sources = []
+    for example in list_data_dict:
+        input = example.get("input", None)
+        if input is not None and input != "":
+            sources.append(prompt_input.format_map(example))
+        else:
+            sources.append(prompt_no_input.format_map(example))
+    return sources
+
+
+def get_categories(list_data_dict):
+    categories = [
+        example['category'] if 'category' in example else None
+        for example in list_data_dict
+    ]
+    df = pd.DataFrame(categories, columns=["category"])
+    return list(pd.Categorical(df["category"]).codes)
+
+
+def _preprocess_chunk(sources, targets, tokenizer):
+    examples = [s + t for s, t in zip(sources, targets)]
+    tokenized = tokenizer(examples,
+                          max_length=tokenizer.model_max_length,
+                          truncation=True)
+    # Special tokens appended after the text (e.g., eos) by the template
+    special_tokens_mask = tokenizer(
+        'a', return_special_tokens_mask=True)['special_tokens_mask']
+    num_suffix_tokens = special_tokens_mask[::-1].index(0)
+
+    input_ids, labels, source_lens, merged = [], [], [], []
+    for idx, (ids, source) in enumerate(zip(tokenized['input_ids'], sources)):
+        # The source ends at the token of its last character, unless the
+        # token also covers the target. Trailing whitespace is grouped
+        # according to the next character by some pre-tokenizers (e.g.,
+        # byte-level BPE), so the source alone might be tokenized
+        # differently as well.
+        last = tokenized.char_to_token(idx, len(source) - 1) \
+            if len(source) else None
+        if last is None or source[-1].isspace() or \
+                last == tokenized.char_to_token(idx, len(source)):
+            merged.append(idx)
+            source_lens.append(None)
+        else:
+            source_lens.append(min(last + 1 + num_suffix_tokens, len(ids)))
+        input_ids.append(torch.tensor(ids, dtype=torch.long))
+
+    if len(merged):
+        tokenized = tokenizer([sources[idx] for idx in merged],
+                              max_length=tokenizer.model_max_length,
+                              truncation=True)
+        for idx, ids in zip(merged, tokenized['input_ids']):
+            source_lens[idx] = len(ids)
+
+    for ids, source_len in zip(input_ids, source_lens):
+        label = ids.clone()
+        label[:source_len] = DefaultToken.IGNORE_INDEX.value
+        labels.append(label)
+    return input_ids, labels
+
+
+def preprocess_batched(sources, targets, tokenizer, num_workers=None):
+    """
+    Tokenize ``source + target`` in batches with a fast tokenizer, and mask
+    the labels of the source according to the character offsets of the
+    tokens (``char_to_token``), so that each source is tokenized only once.
+    The batches are dispatched to a pool of ``num_workers`` threads (the
+    number of CPUs by default) as the fast tokenizer releases the GIL.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    chunk_size = max(-(-len(sources) // num_workers), 256)
+    # At most `num_workers` chunks, each of which has its own copy of the
+    # tokenizer, as a fast tokenizer can not be called concurrently
+    # ("Already borrowed")
+    chunks = [
+        (sources[left:left + chunk_size], targets[left:left + chunk_size],
+         tokenizer if left == 0 else copy.deepcopy(tokenizer))
+        for left in range(0, len(sources), chunk_size)
+    ]
+
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(num_workers) as executor:
+            results = list(
+                executor.map(lambda args: _preprocess_chunk(*args), chunks))
+    else:
+        results = [_preprocess_chunk(*args) for args in chunks]
+
+    input_ids, labels = [], []
+    for chunk_input_ids, chunk_labels in results:
+        input_ids += chunk_input_ids
+        labels += chunk_labels
+    return dict(input_ids=input_ids, labels=labels)
+
+
+def check_preprocess(sources, targets, tokenizer):
+    """
+    Return the indices of the samples whose ``input_ids`` or ``labels`` from
+    ``preprocess_batched`` differ from the ones of tokenizing sample by
+    sample (``LLMDataset._preprocess_by_sample``).
+    """
+    batched = preprocess_batched(sources, targets, tokenizer)
+    reference = LLMDataset._preprocess_by_sample(sources, targets, tokenizer)
+    return [
+        idx for idx in range(len(sources)) if
+        not torch.equal(batched['input_ids'][idx], reference['input_ids'][idx])
+        or not torch.equal(batched['labels'][idx], reference['labels'][idx])
+    ]
+
+
 # TODO: support LDA when 'category' in keys
 class LLMDataset(Dataset):
     def __init__(self,
@@ -42,20 +154,16 @@ class LLMDataset(Dataset):
                  tokenizer,
                  prompt_input=PROMPT_DICT["prompt_input"],
                  prompt_no_input=PROMPT_DICT["prompt_no_input"],
-                 output_tag='output'):
+                 output_tag='output',
+                 num_workers=None):
         super(LLMDataset, self).__init__()
 
         # Print prompt info
         logger.info(f'prompt_input: {prompt_input}')
         logger.info(f'prompt_no_input: {prompt_no_input}')
 
-        self.sources = []
-        for example in list_data_dict:
-            input = example.get("input", None)
-            if input is not None and input != "":
-                self.sources.append(prompt_input.format_map(example))
-            else:
-                self.sources.append(prompt_no_input.format_map(example))
+        self.sources = format_sources(list_data_dict, prompt_input,
+                                      prompt_no_input)
 
         targets = [
             f"{example[output_tag]}{tokenizer.eos_token}"
@@ -67,21 +175,32 @@ class LLMDataset(Dataset):
         #     for example in list_data_dict
         # ]
 
-        data_dict = self.preprocess(self.sources, targets, tokenizer)
+        data_dict = self.preprocess(self.sources, targets, tokenizer,
+                                    num_workers)
 
         self.input_ids = data_dict["input_ids"]
         self.labels = data_dict["labels"]
 
         self.tokenizer = tokenizer
-
-        categories = [
-            example['category'] if 'category' in example else None
-            for example in list_data_dict
-        ]
-        df = pd.DataFrame(categories, columns=["category"])
-        self.categories = list(pd.Categorical(df["category"]).codes)
-
-    def _tokenize_fn(self, strings, tokenizer):
+        self.categories = get_categories(list_data_dict)
+
+    @classmethod
+    def from_tokenized(cls, sources, data_dict, tokenizer, categories):
+        """
+        Build the dataset from the sources and the outputs of
+        ``preprocess`` without tokenizing again.
+        """
+        dataset = cls.__new__(cls)
+        super(LLMDataset, dataset).__init__()
+        dataset.sources = sources
+        dataset.input_ids = data_dict["input_ids"]
+        dataset.labels = data_dict["labels"]
+        dataset.tokenizer = tokenizer
+        dataset.categories = categories
+        return dataset
+
+    @staticmethod
+    def _tokenize_fn(strings, tokenizer):
         tokenized_list = [
             tokenizer(
                 text,
@@ -105,10 +224,18 @@ class LLMDataset(Dataset):
             labels_lens=labels_lens,
         )
 
-    def preprocess(self, sources, targets, tokenizer):
+    def preprocess(self, sources, targets, tokenizer, num_workers=None):
+        if getattr(tokenizer, 'is_fast', False):
+            return preprocess_batched(sources, targets, tokenizer, num_workers)
+        return self._preprocess_by_sample(sources, targets, tokenizer)
+
+    @staticmethod
+    def _preprocess_by_sample(sources, targets, tokenizer):
+        # Each source is tokenized twice (alone and followed by the target),
+        # which is the reference of `preprocess_batched`
         examples = [s + t for s, t in zip(sources, targets)]
         examples_tokenized, sources_tokenized = [
-            self._tokenize_fn(strings, tokenizer)
+            LLMDataset._tokenize_fn(strings, tokenizer)
             for strings in (examples, sources)
         ]
         input_ids = examples_tokenized["input_ids"]
@@ -148,7 +275,8 @@ class LLMComparisonDataset(Dataset):
                  prompt_no_input=PROMPT_DICT["prompt_no_input"],
                  output_A='output_A',
                  output_B='output_B',
-                 choice='choice'):
+                 choice='choice',
+                 num_workers=None):
         new_list_data_dict = []
         for example in list_data_dict:
             if choice in example and int(example[choice]) == 1:
@@ -159,24 +287,33 @@ class LLMComparisonDataset(Dataset):
         # remove the data without choice
         list_data_dict = new_list_data_dict
 
-        # After switching, output_A > output_B
-        self.win_dataset = LLMDataset(list_data_dict=list_data_dict,
-                                      tokenizer=tokenizer,
-                                      prompt_input=prompt_input,
-                                      prompt_no_input=prompt_no_input,
-                                      output_tag=output_A)
-        self.lose_dataset = LLMDataset(list_data_dict=list_data_dict,
-                                       tokenizer=tokenizer,
-                                       prompt_input=prompt_input,
-                                       prompt_no_input=prompt_no_input,
-                                       output_tag=output_B)
-
-        categories = [
-            example['category'] if 'category' in example else None
+        # After switching, output_A > output_B. The sources are shared by
+        # the win and lose datasets.
+        sources = format_sources(list_data_dict, prompt_input, prompt_no_input)
+        win_targets, lose_targets = [[
+            f"{example[output_tag]}{tokenizer.eos_token}"
             for example in list_data_dict
-        ]
-        df = pd.DataFrame(categories, columns=["category"])
-        self.categories = list(pd.Categorical(df["category"]).codes)
+        ] for output_tag in (output_A, output_B)]
+        categories = get_categories(list_data_dict)
+
+        # Tokenize the win and lose examples in one batch
+        if getattr(tokenizer, 'is_fast', False):
+            data_dict = preprocess_batched(sources * 2,
+                                           win_targets + lose_targets,
+                                           tokenizer, num_workers)
+        else:
+            data_dict = LLMDataset._preprocess_by_sample(
+                sources * 2, win_targets + lose_targets, tokenizer)
+        num = len(sources)
+        win_dict, lose_dict = [{
+            key: value[left:left + num]
+            for key, value in data_dict.items()
+        } for left in (0, num)]
+        self.win_dataset = LLMDataset.from_tokenized(sources, win_dict,
+                                                     tokenizer, categories)
+        self.lose_dataset = LLMDataset.from_tokenized(sources, lose_dict,
+                                                      tokenizer, categories)
+        self.categories = categories
 
         # super(LLMComparisonDataset, self).__init__(
         #     list_data_dict, tokenizer, prompt_input,
@@ -191,6 +328,62 @@ class LLMComparisonDataset(Dataset):
         # data_dict_B = self.preprocess(self.sources, targets_B, tokenizer)
         # self.lose_labels = data_dict_B["labels"]
 
+    @classmethod
+    def from_datasets(cls, win_dataset, lose_dataset):
+        """
+        Build the dataset from the win and lose ``LLMDataset``s, which are
+        aligned sample by sample.
+        """
+        dataset = cls.__new__(cls)
+        super(LLMComparisonDataset, dataset).__init__()
+        dataset.win_dataset = win_dataset
+        dataset.lose_dataset = lose_dataset
+        dataset.categories = win_dataset.categories
+        return dataset
+
+    @classmethod
+    def from_chunks(cls,
+                    chunks,
+                    tokenizer,
+                    choice='choice',
+                    num_workers=None,
+                    **kwargs):
+        """
+        Build the dataset from the chunks of ``list_data_dict`` (e.g.,
+        streamed from a ``ChunkedArtifactStore``), which are tokenized one
+        at a time, so that only the tokens of the whole data are kept in
+        memory. ``kwargs`` are the arguments of ``__init__``.
+        """
+        sources, examples = [], []
+        win_dict, lose_dict = [dict(input_ids=[], labels=[]) for _ in range(2)]
+        for chunk in chunks:
+            chunk = [
+                example for example in chunk
+                if choice in example and int(example[choice]) == 1
+            ]
+            dataset = cls(chunk,
+                          tokenizer,
+                          choice=choice,
+                          num_workers=num_workers,
+                          **kwargs)
+            sources += dataset.win_dataset.sources
+            for data_dict, subset in [(win_dict, dataset.win_dataset),
+                                      (lose_dict, dataset.lose_dataset)]:
+                data_dict['input_ids'] += subset.input_ids
+                data_dict['labels'] += subset.labels
+            # Only the categories, which are encoded on the whole data
+            examples += [{
+                key: example[key]
+                for key in ['category'] if key in example
+            } for example in chunk]
+
+        categories = get_categories(examples)
+        return cls.from_datasets(
+            LLMDataset.from_tokenized(sources, win_dict, tokenizer,
+                                      categories),
+            LLMDataset.from_tokenized(sources, lose_dict, tokenizer,
+                                      categories))
+
     def __len__(self):
         return len(self.win_dataset)
 
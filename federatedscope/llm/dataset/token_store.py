@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import torch
+
+from federatedscope.llm.dataset.llm_dataset import DefaultToken, LLMDataset, \
+    LLMComparisonDataset
+
+logger = logging.getLogger(__name__)
+
+# Bump it when the layout of the files changes
+TOKEN_STORE_VERSION = 1
+
+
+class TokenSequence(object):
+    """
+    Lazy view of the sequences in a token store, which behaves like the
+    list of tensors in ``LLMDataset`` (``input_ids`` or ``labels``). Only the
+    indexed sequences are read (and copied) from the memory-mapped files;
+    slicing returns another view.
+
+    Arguments:
+        tokens: flat ``np.memmap`` of all the tokens
+        offsets: ``np.memmap`` with the start of each sequence (and the end
+            of the last one) in ``tokens``
+        source_lens: ``np.memmap`` with the number of source tokens of each
+            sequence, whose labels are ignored; ``None`` for ``input_ids``
+        indices: indices of the sequences in the view
+    """
+    def __init__(self, tokens, offsets, source_lens=None, indices=None):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.source_lens = source_lens
+        self.indices = range(len(offsets) - 1) if indices is None else \
+            indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return TokenSequence(self.tokens, self.offsets, self.source_lens,
+                                 self.indices[i])
+        idx = self.indices[i]
+        ids = torch.from_numpy(
+            self.tokens[self.offsets[idx]:self.offsets[idx + 1]].astype(
+                np.int64))
+        if self.source_lens is not None:
+            ids[:self.source_lens[idx]] = DefaultToken.IGNORE_INDEX.value
+        return ids
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self):
+        """
+        Lengths of the sequences in the view, read from the offsets only.
+        """
+        return np.diff(self.offsets)[np.asarray(self.indices, dtype=np.int64)]
+
+
+def get_token_store_path(data_root, name, tokenizer, **kwargs):
+    """
+    Return the directory of a token store, whose key covers the tokenizer
+    (name, type and ``tok_len``) and ``kwargs`` (e.g., the prompt template
+    and the number of clients the data is split for).
+    """
+    token_name = os.path.basename(tokenizer.name_or_path)
+    key = dict(version=TOKEN_STORE_VERSION,
+               tokenizer=tokenizer.name_or_path,
+               tokenizer_cls=type(tokenizer).__name__,
+               tok_len=tokenizer.model_max_length,
+               **kwargs)
+    digest = hashlib.sha1(
+        json.dumps(key, sort_keys=True,
+                   default=str).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(data_root, 'token_store',
+                        f'{token_name}_{name}_{digest}')
+
+
+def _save_llm_dataset(path, dataset):
+    lengths = np.array([len(ids) for ids in dataset.input_ids], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    tokens = np.memmap(os.path.join(path, 'tokens.bin'),
+                       dtype=np.int32,
+                       mode='w+',
+                       shape=(max(offsets[-1], 1), ))
+    source_lens = np.zeros(len(lengths), dtype=np.int64)
+    for idx, (ids, labels) in enumerate(zip(dataset.input_ids,
+                                            dataset.labels)):
+        tokens[offsets[idx]:offsets[idx + 1]] = ids.numpy()
+        # The labels are the tokens with the source ignored
+        ignored = labels.eq(DefaultToken.IGNORE_INDEX.value)
+        source_lens[idx] = ignored.sum().item()
+        if not ignored[:source_lens[idx]].all() or \
+                not torch.equal(labels[~ignored], ids[~ignored]):
+            raise ValueError(f'The labels of sample {idx} are not the '
+                             f'input_ids with the source ignored.')
+    tokens.flush()
+    del tokens
+
+    offsets.tofile(os.path.join(path, 'offsets.bin'))
+    source_lens.tofile(os.path.join(path, 'source_lens.bin'))
+    np.array(dataset.categories,
+             dtype=np.int64).tofile(os.path.join(path, 'categories.bin'))
+
+
+def _load_llm_dataset(path, tokenizer, num):
+    def memmap(name, dtype, shape):
+        return np.memmap(os.path.join(path, name),
+                         dtype=dtype,
+                         mode='r',
+                         shape=shape)
+
+    offsets = memmap('offsets.bin', np.int64, (num + 1, ))
+    tokens = memmap('tokens.bin', np.int32, (max(offsets[-1], 1), ))
+    source_lens = memmap('source_lens.bin', np.int64, (num, ))
+    data_dict = dict(input_ids=TokenSequence(tokens, offsets),
+                     labels=TokenSequence(tokens, offsets, source_lens))
+    categories = memmap('categories.bin', np.int64, (num, ))
+    return LLMDataset.from_tokenized(None, data_dict, tokenizer, categories)
+
+
+def save_token_store(path, dataset):
+    """
+    Write a ``LLMDataset`` or ``LLMComparisonDataset`` into the token store
+    at ``path``. The files are written to a temporary directory first, so
+    that concurrent processes never see a partial store.
+    """
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    os.makedirs(tmp_path, exist_ok=True)
+    if isinstance(dataset, LLMComparisonDataset):
+        meta = dict(type='comparison', num=len(dataset.win_dataset))
+        for name in ['win', 'lose']:
+            os.makedirs(os.path.join(tmp_path, name), exist_ok=True)
+            _save_llm_dataset(os.path.join(tmp_path, name),
+                              getattr(dataset, f'{name}_dataset'))
+    else:
+        meta = dict(type='llm', num=len(dataset.input_ids))
+        _save_llm_dataset(tmp_path, dataset)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Written by another process in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    logger.info(f'Token store saved to {path}.')
+
+
+def load_token_store(path, tokenizer):
+    """
+    Open the token store at ``path`` as a ``LLMDataset`` or
+    ``LLMComparisonDataset`` whose sequences are read lazily from the
+    memory-mapped files. The pages are shared by all the processes (e.g.,
+    the simulated clients) through the page cache.
+    """
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta['type'] == 'comparison':
+        win_dataset, lose_dataset = [
+            _load_llm_dataset(os.path.join(path, name), tokenizer, meta['num'])
+            for name in ['win', 'lose']
+        ]
+        return LLMComparisonDataset.from_datasets(win_dataset, lose_dataset)
+    return _load_llm_dataset(path, tokenizer, meta['num'])
+
+
+def exists_token_store(path):
+    return os.path.exists(os.path.join(path, 'meta.json'))
+
+
+def load_or_build_token_stores(paths, build_fn, tokenizer):
+    """
+    Load the datasets from the token stores at ``paths``, or build them with
+    ``build_fn`` (returning the datasets in the order of ``paths``) and save
+    them first.
+    """
+    if not all(exists_token_store(path) for path in paths):
+        for path, dataset in zip(paths, build_fn()):
+            save_token_store(path, dataset)
+    return tuple(load_token_store(path, tokenizer) for path in paths)
@@ -15,6 +15,8 @@ from federatedscope.llm.misc.fschat import FSChatBot
 from federatedscope.llm.dataset.llm_dataset import DefaultToken, \
     LLMDataset
 from federatedscope.llm.model.model_builder import get_llm
+from federatedscope.llm.model.checkpoint import find_latest_checkpoint, \
+    load_checkpoint
 from federatedscope.llm.dataloader import get_tokenizer, LLMDataCollator
 
 PROMPT = "### User: {instruction}\n\n### Assistant:"
@@ -33,19 +35,10 @@ PROMPT_CMP = ("Below is a query followed by two responses. Pick a "
               "### YOUR CHOICE:")
 
 
-def cal_acc(logits, labels, choices):
-    shift_logits = logits[..., :-1, :].contiguous()
-    shift_labels = labels[..., 1:].contiguous()
-
-    new_labels = torch.full_like(shift_labels, DefaultToken.IGNORE_INDEX.value)
-    for idx, choice in enumerate(choices):
-        new_labels[shift_labels == choice] = idx
-
-    new_labels = new_labels.view(-1)
-    new_logits = shift_logits[..., choices].view(-1, len(choices))
-    new_logits = new_logits[(new_labels != DefaultToken.IGNORE_INDEX.value), :]
-    new_labels = new_labels[(new_labels != DefaultToken.IGNORE_INDEX.value)]
-    _, predicted = new_logits.max(1)
+def cal_acc(outputs):
+    # `outputs` comes from the selector head (`AdapterModel.choice_forward`)
+    new_labels = outputs.labels
+    _, predicted = outputs.logits.max(1)
 
     return new_labels, predicted, predicted.eq(new_labels).sum().item()
 
@@ -59,11 +52,13 @@ def evaluation(model, dataloader, choices):
         labels = data_batch["labels"].to('cuda:0')
         attention_mask = data_batch["attention_mask"].to('cuda:0')
 
-        outputs = model(input_ids=input_ids, attention_mask=attention_mask)
+        outputs = model(input_ids=input_ids,
+                        attention_mask=attention_mask,
+                        labels=labels,
+                        choices=choices)
 
         # calculate the correctness
-        new_labels, predicted, batch_correct = \
-            cal_acc(outputs.logits, labels, choices)
+        new_labels, predicted, batch_correct = cal_acc(outputs)
 
         # collect the expected and actual results
         expected_choice += new_labels.tolist()
@@ -137,25 +132,20 @@ def eval_for_agreement(init_cfg, label, prompt=PROMPT_CMP):
     # get model and tokenizer
     model_name, _ = init_cfg.model.type.split('@')
     model = get_llm(init_cfg, device_map='auto')
-    tokenizer, _ = get_tokenizer(model_name, init_cfg.data.root,
-                                 init_cfg.llm.tok_len)
+    tokenizer, _ = get_tokenizer(model_name,
+                                 init_cfg.data.root,
+                                 init_cfg.llm.tok_len,
+                                 use_fast=init_cfg.llm.tok_use_fast)
 
     # load model from checkpoint
-    num_ckpt = \
-        init_cfg.federate.total_round_num // init_cfg.federate.save_freq
-    prefix = ['final_'] + \
-             [str(i*init_cfg.federate.save_freq) + '_'
-              for i in range(num_ckpt, -1, -1)] + ['']
-    dirname, filename = os.path.split(init_cfg.federate.save_to)
-    for pre in prefix:
-        print(os.path.join(dirname, pre + filename))
-        if os.path.exists(os.path.join(dirname, pre + filename)):
-            ckpt_path = os.path.join(dirname, pre + filename)
-            ckpt = torch.load(ckpt_path, map_location='cpu')
-            model.load_state_dict(ckpt['model'])
-            print(f'Model of Round {ckpt["cur_round"]} loads '
-                  f'from the checkpoint {ckpt_path}')
-            break
+    ckpt_path = find_latest_checkpoint(init_cfg.federate.save_to,
+                                       init_cfg.federate.save_freq,
+                                       init_cfg.federate.total_round_num)
+    if ckpt_path is not None:
+        ckpt = load_checkpoint(ckpt_path)
+        model.load_state_dict(ckpt['model'])
+        print(f'Model of Round {ckpt["cur_round"]} loads '
+              f'from the checkpoint {ckpt_path}')
 
     # list all choices
     choices = []
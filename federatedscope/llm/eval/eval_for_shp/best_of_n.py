@@ -13,6 +13,9 @@ from federatedscope.core.auxiliaries.utils import setup_seed
 from federatedscope.core.auxiliaries.logging import update_logger
 from federatedscope.core.data.utils import download_url
 from federatedscope.llm.model.model_builder import get_llm
+from federatedscope.llm.model.checkpoint import find_latest_checkpoint, \
+    load_checkpoint
+from federatedscope.llm.model.adapter_builder import majority_vote
 from federatedscope.llm.dataloader.dataloader import load_jsonl, \
     LLMDataCollator, get_tokenizer
 from federatedscope.llm.misc.fschat import FSChatBot
@@ -81,20 +84,10 @@ def best_of_n_dataset(init_cfg, gen_cfg=None, n=16):
 
 
 @torch.no_grad()
-def cal_acc(logits, labels, choices):
-    shift_logits = logits[..., :-1, :].contiguous()
-    shift_labels = labels[..., 1:].contiguous()
-
-    new_labels = torch.full_like(shift_labels, DefaultToken.IGNORE_INDEX.value)
-    for idx, choice in enumerate(choices):
-        new_labels[shift_labels == choice] = idx
-
-    new_labels = new_labels.view(-1)
-    new_logits = shift_logits[..., choices].view(-1, len(choices))
-    new_logits = new_logits[(new_labels != DefaultToken.IGNORE_INDEX.value), :]
-    # print(new_logits)
-    new_labels = new_labels[(new_labels != DefaultToken.IGNORE_INDEX.value)]
-    _, predicted = new_logits.max(1)
+def cal_acc(outputs):
+    # `outputs` comes from the selector head (`AdapterModel.choice_forward`)
+    new_labels, new_logits = outputs.labels, outputs.logits
+    _, predicted = new_logits.max(-1)
 
     return new_labels, new_logits, predicted, predicted.eq(
         new_labels).sum().item()
@@ -144,9 +137,11 @@ def best_of_n(model, dataset, tokenizer, n=16, output_dir=None):
             input_ids = data_batch["input_ids"].to('cuda:0')
             labels = data_batch["labels"].to('cuda:0')
             attention_mask = data_batch["attention_mask"].to('cuda:0')
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-            _, new_logits, predicted, _ = cal_acc(outputs.logits, labels,
-                                                  choices)
+            outputs = model(input_ids=input_ids,
+                            attention_mask=attention_mask,
+                            labels=labels,
+                            choices=choices)
+            _, new_logits, predicted, _ = cal_acc(outputs)
             predicted_indices += predicted.tolist()
 
             # results_display.write(f'{new_logits}\n\n')
@@ -237,10 +232,7 @@ def best_of_n_local(model,
             # evaluation(path)
 
     # Choose the indices with most votes
-    array = np.array(clients_best_idx).T
-    majority_votes_idx = [
-        np.bincount(array[i]).argmax() for i in range(len(array))
-    ]
+    majority_votes_idx = majority_vote(np.array(clients_best_idx)).tolist()
 
     return clients_best_idx, majority_votes_idx
 
@@ -284,26 +276,22 @@ def best_of_n_multilora(model, dataset, tokenizer, n=16):
 
         predicted_indices = []
 
+        model.eval()
         for idx, data_batch in enumerate(tqdm(dataloader)):
             input_ids = data_batch["input_ids"].to('cuda:0')
             labels = data_batch["labels"].to('cuda:0')
             attention_mask = data_batch["attention_mask"].to('cuda:0')
-            collective_choices = []
-            for name in model.adapter_names:
-                if name == 'default':
-                    continue
-                model.set_active_adapter(name)
-                model.eval()
-                outputs = model(input_ids=input_ids,
-                                attention_mask=attention_mask)
-                _, new_logits, predicted, _ = cal_acc(outputs.logits, labels,
-                                                      choices)
-                collective_choices.append(predicted.tolist())
+            # all adapters (exclude "default" one) share one forward pass
+            outputs = model.multi_adapter_forward(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                labels=labels,
+                choices=choices)
+            # predicted: [num_adapters, batch_size]
+            _, _, predicted, _ = cal_acc(outputs)
             # finalize the output chosen by most adapters
-            array = np.array(collective_choices).T
-            predicted_indices += [
-                np.bincount(array[i]).argmax() for i in range(len(array))
-            ]
+            predicted_indices += majority_vote(predicted,
+                                               len(choices)).tolist()
 
         predicted_indices = np.array(predicted_indices)
         last_better_idx[predicted_indices == 0] = i
@@ -365,25 +353,20 @@ def main():
     # get model and tokenizer
     model_name, _ = init_cfg.model.type.split('@')
     model = get_llm(init_cfg, device_map='auto')
-    tokenizer, _ = get_tokenizer(model_name, init_cfg.data.root,
-                                 init_cfg.llm.tok_len)
+    tokenizer, _ = get_tokenizer(model_name,
+                                 init_cfg.data.root,
+                                 init_cfg.llm.tok_len,
+                                 use_fast=init_cfg.llm.tok_use_fast)
 
     # load model from checkpoint
-    num_ckpt = \
-        init_cfg.federate.total_round_num // init_cfg.federate.save_freq
-    prefix = ['final_'] + \
-             [str(i*init_cfg.federate.save_freq) + '_'
-              for i in range(num_ckpt, -1, -1)] + ['']
-    dirname, filename = os.path.split(init_cfg.federate.save_to)
-    for pre in prefix:
-        print(os.path.join(dirname, pre + filename))
-        if os.path.exists(os.path.join(dirname, pre + filename)):
-            ckpt_path = os.path.join(dirname, pre + filename)
-            ckpt = torch.load(ckpt_path, map_location='cpu')
-            model.load_state_dict(ckpt['model'])
-            print(f'Model of Round {ckpt["cur_round"]} loads '
-                  f'from the checkpoint {ckpt_path}')
-            break
+    ckpt_path = find_latest_checkpoint(init_cfg.federate.save_to,
+                                       init_cfg.federate.save_freq,
+                                       init_cfg.federate.total_round_num)
+    if ckpt_path is not None:
+        ckpt = load_checkpoint(ckpt_path)
+        model.load_state_dict(ckpt['model'])
+        print(f'Model of Round {ckpt["cur_round"]} loads '
+              f'from the checkpoint {ckpt_path}')
     # model = model.merge_and_unload()
 
     # get the best-of-n results and display them
@@ -15,6 +15,13 @@ from federatedscope.core.auxiliaries.utils import setup_seed
 from federatedscope.core.auxiliaries.logging import update_logger
 from federatedscope.core.data.utils import download_url
 from federatedscope.llm.model.model_builder import get_llm
+from federatedscope.llm.model.checkpoint import find_latest_checkpoint, \
+    load_checkpoint
+from federatedscope.llm.model.adapter_builder import majority_vote
+from federatedscope.llm.eval.pairwise_selector import PairwiseSelector, \
+    PrefixCachedSelector
+from federatedscope.llm.eval.selection_scheduler import \
+    get_selection_scheduler
 from federatedscope.llm.dataloader.dataloader import load_jsonl, \
     LLMDataCollator, get_tokenizer
 from federatedscope.llm.misc.fschat import FSChatBot
@@ -62,7 +69,9 @@ def _generate_best_of_n_dataset(gen_cfg, n=16):
                                    f'{fschatbot.curpfx}_summarization.txt')
     results_display = open(results_display, 'w')
 
-    for input_data in get_input_data(list_data_dict):
+    # More prompts at a time keep the rolling batch of the engine full
+    window = 64 if gen_cfg.llm.generation.continuous_batching else 5
+    for input_data in get_input_data(list_data_dict, window):
         input_texts = [prompt.format_map(data) for data in input_data]
         generate_kwargs = dict(
             top_p=1.0,
@@ -86,6 +95,8 @@ def _generate_best_of_n_dataset(gen_cfg, n=16):
             results_display.write('==========================\n\n')
             results_display.flush()
 
+    logger.info(f'Generation of the best-of-{n} dataset: '
+                f'{fschatbot.generation_stats()}')
     return list_data_dict
 
 
@@ -158,20 +169,10 @@ def best_of_n_dataset_eval(init_cfg, gen_cfg, n=16):
 
 
 @torch.no_grad()
-def cal_acc(logits, labels, choices):
-    shift_logits = logits[..., :-1, :].contiguous()
-    shift_labels = labels[..., 1:].contiguous()
-
-    new_labels = torch.full_like(shift_labels, DefaultToken.IGNORE_INDEX.value)
-    for idx, choice in enumerate(choices):
-        new_labels[shift_labels == choice] = idx
-
-    new_labels = new_labels.view(-1)
-    new_logits = shift_logits[..., choices].view(-1, len(choices))
-    new_logits = new_logits[(new_labels != DefaultToken.IGNORE_INDEX.value), :]
-    # print(new_logits)
-    new_labels = new_labels[(new_labels != DefaultToken.IGNORE_INDEX.value)]
-    _, predicted = new_logits.max(1)
+def cal_acc(outputs):
+    # `outputs` comes from the selector head (`AdapterModel.choice_forward`)
+    new_labels, new_logits = outputs.labels, outputs.logits
+    _, predicted = new_logits.max(-1)
 
     return new_labels, new_logits, predicted, predicted.eq(
         new_labels).sum().item()
@@ -221,9 +222,11 @@ def best_of_n(model, dataset, tokenizer, n=16):
             input_ids = data_batch["input_ids"].to('cuda:0')
             labels = data_batch["labels"].to('cuda:0')
             attention_mask = data_batch["attention_mask"].to('cuda:0')
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask)
-            _, new_logits, predicted, _ = cal_acc(outputs.logits, labels,
-                                                  choices)
+            outputs = model(input_ids=input_ids,
+                            attention_mask=attention_mask,
+                            labels=labels,
+                            choices=choices)
+            _, new_logits, predicted, _ = cal_acc(outputs)
             predicted_indices += predicted.tolist()
 
         predicted_indices = np.array(predicted_indices)
@@ -295,10 +298,7 @@ def best_of_n_local(model,
             # evaluation(path)
 
     # Choose the indices with most votes
-    array = np.array(clients_best_idx).T
-    majority_votes_idx = [
-        np.bincount(array[i]).argmax() for i in range(len(array))
-    ]
+    majority_votes_idx = majority_vote(np.array(clients_best_idx)).tolist()
 
     return clients_best_idx, majority_votes_idx
 
@@ -344,26 +344,22 @@ def best_of_n_multilora(model, dataset, tokenizer, n=16):
 
         predicted_indices = []
 
+        model.eval()
         for idx, data_batch in enumerate(tqdm(dataloader)):
             input_ids = data_batch["input_ids"].to('cuda:0')
             labels = data_batch["labels"].to('cuda:0')
             attention_mask = data_batch["attention_mask"].to('cuda:0')
-            collective_choices = []
-            for name in model.adapter_names:
-                if name == 'default':
-                    continue
-                model.set_active_adapter(name)
-                model.eval()
-                outputs = model(input_ids=input_ids,
-                                attention_mask=attention_mask)
-                _, new_logits, predicted, _ = cal_acc(outputs.logits, labels,
-                                                      choices)
-                collective_choices.append(predicted.tolist())
+            # all adapters (exclude "default" one) share one forward pass
+            outputs = model.multi_adapter_forward(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                labels=labels,
+                choices=choices)
+            # predicted: [num_adapters, batch_size]
+            _, _, predicted, _ = cal_acc(outputs)
             # finalize the output chosen by most adapters
-            array = np.array(collective_choices).T
-            predicted_indices += [
-                np.bincount(array[i]).argmax() for i in range(len(array))
-            ]
+            predicted_indices += majority_vote(predicted,
+                                               len(choices)).tolist()
 
         predicted_indices = np.array(predicted_indices)
         last_better_idx[predicted_indices == 1] = i
@@ -372,6 +368,61 @@ def best_of_n_multilora(model, dataset, tokenizer, n=16):
     return last_better_idx
 
 
+def build_tldr_comparison(sample, idx_a, idx_b):
+    output_A = sample['summaries'][idx_a]
+    output_B = sample['summaries'][idx_b]
+    return {
+        'subreddit': sample['subreddit'],
+        'title': sample['title'],
+        'post': sample['post'],
+        'output_A': output_A if output_A.startswith(" ") else " " + output_A,
+        'output_B': output_B if output_B.startswith(" ") else " " + output_B,
+        'choice': random.choice([" A", " B"])
+    }
+
+
+@torch.no_grad()
+def best_of_n_by_scheduler(model,
+                           dataset,
+                           tokenizer,
+                           n=16,
+                           schedule='sequential',
+                           adapter_names=None,
+                           batch_size=16,
+                           prefix_cache=False,
+                           max_memory=4096):
+    prompt = TLDR_PROMPT_DICT["summary_cmp"]
+
+    choices = [tokenizer(f': {c}')['input_ids'][-1] for c in ['A', 'B']]
+    if prefix_cache:
+        selector = PrefixCachedSelector(model,
+                                        tokenizer,
+                                        prompt,
+                                        choices,
+                                        adapter_names=adapter_names,
+                                        batch_size=batch_size,
+                                        max_memory=max_memory)
+    else:
+        selector = PairwiseSelector(model,
+                                    tokenizer,
+                                    prompt,
+                                    choices,
+                                    adapter_names=adapter_names,
+                                    batch_size=batch_size)
+
+    # The posts are independent, so all the rounds of a chunk of posts run
+    # before the next chunk, and their prefixes stay in the cache
+    scheduler = get_selection_scheduler(schedule,
+                                        selector,
+                                        build_tldr_comparison,
+                                        chunk_size=batch_size)
+    best_idx = scheduler.select(dataset, n)
+
+    logger.info(f'Selection schedule `{schedule}`: {scheduler.stats()}')
+    logger.info(f'Selector statistics: {selector.stats()}')
+    return best_idx
+
+
 def print_results(results_display, dataset, bsn_results):
     auto_j_ratings = []
     for best_idx, sample in zip(bsn_results, dataset):
@@ -447,25 +498,20 @@ def main():
     # get model and tokenizer
     model_name, _ = init_cfg.model.type.split('@')
     model = get_llm(init_cfg, device_map='auto')
-    tokenizer, _ = get_tokenizer(model_name, init_cfg.data.root,
-                                 init_cfg.llm.tok_len)
+    tokenizer, _ = get_tokenizer(model_name,
+                                 init_cfg.data.root,
+                                 init_cfg.llm.tok_len,
+                                 use_fast=init_cfg.llm.tok_use_fast)
 
     # load model from checkpoint
-    num_ckpt = \
-        init_cfg.federate.total_round_num // init_cfg.federate.save_freq
-    prefix = ['final_'] + \
-             [str(i*init_cfg.federate.save_freq) + '_'
-              for i in range(num_ckpt, -1, -1)] + ['']
-    dirname, filename = os.path.split(init_cfg.federate.save_to)
-    for pre in prefix:
-        print(os.path.join(dirname, pre + filename))
-        if os.path.exists(os.path.join(dirname, pre + filename)):
-            ckpt_path = os.path.join(dirname, pre + filename)
-            ckpt = torch.load(ckpt_path, map_location='cpu')
-            model.load_state_dict(ckpt['model'])
-            print(f'Model of Round {ckpt["cur_round"]} loads '
-                  f'from the checkpoint {ckpt_path}')
-            break
+    ckpt_path = find_latest_checkpoint(init_cfg.federate.save_to,
+                                       init_cfg.federate.save_freq,
+                                       init_cfg.federate.total_round_num)
+    if ckpt_path is not None:
+        ckpt = load_checkpoint(ckpt_path)
+        model.load_state_dict(ckpt['model'])
+        print(f'Model of Round {ckpt["cur_round"]} loads '
+              f'from the checkpoint {ckpt_path}')
     # model = model.merge_and_unload()
 
     # get the best-of-n results and display them
@@ -475,6 +521,22 @@ def main():
                             num_clients=init_cfg.federate.client_num,
                             output_dir=init_cfg.outdir,
                             print_client_result=True)
+    elif (init_cfg.llm.selector.prefix_cache.use or
+          init_cfg.llm.selector.schedule != 'sequential') and \
+            init_cfg.trainer.type != "llmpporewardtrainer":
+        adapter_names = [
+            f'Adapter_{i}' for i in range(init_cfg.llm.adapter.count)
+        ] if init_cfg.llm.adapter.count > 1 else None
+        results = best_of_n_by_scheduler(
+            model,
+            dataset,
+            tokenizer,
+            n=16,
+            schedule=init_cfg.llm.selector.schedule,
+            adapter_names=adapter_names,
+            batch_size=init_cfg.llm.selector.batch_size,
+            prefix_cache=init_cfg.llm.selector.prefix_cache.use,
+            max_memory=init_cfg.llm.selector.prefix_cache.max_memory)
     elif init_cfg.llm.adapter.count > 1:
         results = best_of_n_multilora(model, dataset, tokenizer, n=16)
     elif init_cfg.trainer.type == "llmpporewardtrainer":
@@ -11,6 +11,8 @@ from federatedscope.core.auxiliaries.utils import setup_seed
 from federatedscope.core.auxiliaries.logging import update_logger
 from federatedscope.core.data.utils import download_url
 from federatedscope.llm.model.model_builder import get_llm
+from federatedscope.llm.model.checkpoint import find_latest_checkpoint, \
+    load_checkpoint
 from federatedscope.llm.dataloader.dataloader import load_jsonl, get_tokenizer
 from federatedscope.llm.dataloader.reddit_tldr import TLDR_PROMPT_DICT
 from federatedscope.llm.misc.fschat import FSChatBot
@@ -40,26 +42,20 @@ def get_selector_tokenizer(selector_cfg):
     # get model and tokenizer
     model_name, _ = selector_cfg.model.type.split('@')
     model = get_llm(selector_cfg, device_map='auto')
-    tokenizer, _ = get_tokenizer(model_name, selector_cfg.data.root,
-                                 selector_cfg.llm.tok_len)
+    tokenizer, _ = get_tokenizer(model_name,
+                                 selector_cfg.data.root,
+                                 selector_cfg.llm.tok_len,
+                                 use_fast=selector_cfg.llm.tok_use_fast)
 
     # load model from checkpoint
-    total_round_num = selector_cfg.federate.total_round_num
-    save_freq = selector_cfg.federate.save_freq
-    num_ckpt = total_round_num // save_freq
-    prefix = ['final_'] + \
-             [str(i*selector_cfg.federate.save_freq) + '_'
-              for i in range(num_ckpt, -1, -1)] + ['']
-    dirname, filename = os.path.split(selector_cfg.federate.save_to)
-    for pre in prefix:
-        print(os.path.join(dirname, pre + filename))
-        if os.path.exists(os.path.join(dirname, pre + filename)):
-            ckpt_path = os.path.join(dirname, pre + filename)
-            ckpt = torch.load(ckpt_path, map_location='cpu')
-            model.load_state_dict(ckpt['model'])
-            print(f'Model of Round {ckpt["cur_round"]} loads '
-                  f'from the checkpoint {ckpt_path}')
-            break
+    ckpt_path = find_latest_checkpoint(selector_cfg.federate.save_to,
+                                       selector_cfg.federate.save_freq,
+                                       selector_cfg.federate.total_round_num)
+    if ckpt_path is not None:
+        ckpt = load_checkpoint(ckpt_path)
+        model.load_state_dict(ckpt['model'])
+        print(f'Model of Round {ckpt["cur_round"]} loads '
+              f'from the checkpoint {ckpt_path}')
 
     return model, tokenizer
 
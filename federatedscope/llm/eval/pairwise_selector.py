@@ -0,0 +1,381 @@
+import logging
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+
+from federatedscope.llm.model.adapter_builder import parallel_lora_branches, \
+    majority_vote
+from federatedscope.llm.dataset.llm_dataset import DefaultToken
+
+logger = logging.getLogger(__name__)
+
+
+def _to_legacy_cache(past_key_values):
+    # ((key, value), ...) with shape [batch, heads, seq_len, head_dim]
+    if isinstance(past_key_values, (tuple, list)):
+        return tuple(tuple(layer) for layer in past_key_values)
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        return past_key_values.to_legacy_cache()
+    return tuple(
+        (layer.keys, layer.values) for layer in past_key_values.layers)
+
+
+def _from_legacy_cache(past_key_values):
+    try:
+        from transformers.cache_utils import DynamicCache
+    except ImportError:
+        # Old versions of transformers only accept tuples
+        return past_key_values
+    if hasattr(DynamicCache, 'from_legacy_cache'):
+        return DynamicCache.from_legacy_cache(past_key_values)
+    return DynamicCache(past_key_values)
+
+
+class PrefixKVCache(object):
+    """
+    LRU cache of prompt prefix ``past_key_values`` whose total size is
+    bounded by ``max_memory`` (in bytes). Least recently used prefixes are
+    evicted first; a prefix larger than the whole budget is never stored.
+    """
+    def __init__(self, max_memory):
+        self.max_memory = max_memory
+        self.memory = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key):
+        if key not in self._cache:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return self._cache[key][0]
+
+    def put(self, key, past_key_values):
+        num_bytes = sum(t.numel() * t.element_size()
+                        for layer in past_key_values for t in layer)
+        if num_bytes > self.max_memory:
+            return
+        if key in self._cache:
+            self.memory -= self._cache.pop(key)[1]
+        while self.memory + num_bytes > self.max_memory:
+            _, (_, freed) = self._cache.popitem(last=False)
+            self.memory -= freed
+            self.evictions += 1
+        self._cache[key] = (past_key_values, num_bytes)
+        self.memory += num_bytes
+
+    def clear(self):
+        self._cache.clear()
+        self.memory = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._cache),
+            'memory_mb': self.memory / 1024**2
+        }
+
+
+class PairwiseSelector(object):
+    """
+    Pairwise selector evaluation: score comparison prompts (e.g.,
+    ``TLDR_PROMPT_DICT['summary_cmp']``) and read the logits of the choice
+    tokens with the selector head (``AdapterModel.choice_forward``). When
+    ``adapter_names`` is given, all the adapters are evaluated in one pass
+    (``AdapterModel.multi_adapter_forward``) and their votes are combined by
+    majority.
+
+    Arguments:
+        model: ``AdapterModel`` of the selector
+        tokenizer: tokenizer of the selector
+        prompt: comparison prompt with ``{output_A}`` and ``{output_B}``
+        choices: token ids of the choices, e.g., ``A`` and ``B``
+        output_tag: field of the (arbitrary) choice text, e.g., `` A``
+        adapter_names: adapters evaluated together, ``None`` means the
+            active one
+        batch_size: number of comparisons per forward pass
+    """
+    def __init__(self,
+                 model,
+                 tokenizer,
+                 prompt,
+                 choices,
+                 output_tag='choice',
+                 adapter_names=None,
+                 batch_size=16,
+                 device='cuda:0'):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prompt = prompt
+        self.choices = choices
+        self.output_tag = output_tag
+        self.adapter_names = adapter_names
+        self.batch_size = batch_size
+        self.device = device
+
+        # Number of forward passes, tokens fed into the model and tokens of
+        # the whole prompts
+        self.num_forward_passes = 0
+        self.encoded_tokens, self.prompt_tokens = 0, 0
+
+    @property
+    def num_adapters(self):
+        return 1 if self.adapter_names is None else len(self.adapter_names)
+
+    def _tokenize(self, text):
+        return self.tokenizer(
+            text,
+            return_tensors="pt",
+            max_length=self.tokenizer.model_max_length,
+            truncation=True,
+        ).input_ids[0]
+
+    def _tokenize_comparison(self, sample):
+        source = self.prompt.format_map(sample)
+        target = f"{sample[self.output_tag]}{self.tokenizer.eos_token}"
+        input_ids = self._tokenize(source + target)
+
+        # Cut before the choice token as the labels of `LLMDataset` do
+        source_len = len(self._tokenize(source))
+        is_choice = torch.isin(input_ids[source_len:],
+                               torch.tensor(self.choices))
+        if is_choice.any():
+            input_ids = input_ids[:source_len + is_choice.nonzero()[0].item()]
+        return input_ids
+
+    def _forward(self, **kwargs):
+        self.num_forward_passes += 1
+        if self.adapter_names is None:
+            return self.model(choices=self.choices, **kwargs)
+        return self.model.multi_adapter_forward(
+            adapter_names=self.adapter_names, choices=self.choices, **kwargs)
+
+    def _pad_with_choice_labels(self, sequences):
+        # One more column to place the dummy choice label after each
+        # sequence, whose position is all that matters
+        lengths = [len(seq) for seq in sequences]
+        input_ids = torch.full((len(sequences), max(lengths) + 1),
+                               self.tokenizer.pad_token_id,
+                               dtype=torch.long)
+        labels = torch.full_like(input_ids, DefaultToken.IGNORE_INDEX.value)
+        for idx, seq in enumerate(sequences):
+            input_ids[idx, :len(seq)] = seq
+            labels[idx, len(seq)] = self.choices[0]
+        return input_ids, labels
+
+    @torch.no_grad()
+    def _score_batch(self, samples):
+        sequences = [self._tokenize_comparison(sample) for sample in samples]
+        input_ids, labels = self._pad_with_choice_labels(sequences)
+        attention_mask = torch.zeros_like(input_ids)
+        for idx, seq in enumerate(sequences):
+            attention_mask[idx, :len(seq)] = 1
+
+        outputs = self._forward(input_ids=input_ids.to(self.device),
+                                labels=labels.to(self.device),
+                                attention_mask=attention_mask.to(self.device))
+
+        num_tokens = sum(len(seq) for seq in sequences)
+        self.encoded_tokens += num_tokens
+        self.prompt_tokens += num_tokens
+        return outputs.logits
+
+    @torch.no_grad()
+    def score(self, samples):
+        """
+        Return the choice logits of the comparisons with shape
+        ``[len(samples), len(choices)]``, or
+        ``[num_adapters, len(samples), len(choices)]`` for multiple adapters.
+        """
+        self.model.eval()
+        logits = []
+        for left in range(0, len(samples), self.batch_size):
+            logits.append(
+                self._score_batch(samples[left:left + self.batch_size]))
+        return torch.cat(logits, dim=-2)
+
+    @torch.no_grad()
+    def predict(self, samples):
+        """
+        Return the index of the choice made for each comparison, which is
+        voted by the adapters when ``adapter_names`` is given.
+        """
+        _, predicted = self.score(samples).max(-1)
+        if self.adapter_names is not None:
+            predicted = majority_vote(predicted, len(self.choices))
+        return predicted.cpu()
+
+    def stats(self):
+        return {
+            'forward_passes': self.num_forward_passes,
+            'encoded_tokens': self.encoded_tokens,
+            'prompt_tokens': self.prompt_tokens,
+            'token_saving': 1 -
+            self.encoded_tokens / max(self.prompt_tokens, 1)
+        }
+
+
+class PrefixCachedSelector(PairwiseSelector):
+    """
+    Pairwise selector evaluation with a shared-prefix KV cache.
+
+    In the comparison prompts everything before ``{output_A}`` (instruction,
+    subreddit, title and post) is identical across the comparisons of a post.
+    The prefix is encoded once and its ``past_key_values`` are kept in a
+    ``PrefixKVCache``; afterwards only the ``SUMMARY A/B`` suffix is fed to
+    the model.
+
+    LoRA adapters on the attention layers change the keys and values, so
+    cache entries are keyed by the adapter(s) in use together with the prefix
+    tokens. A single cache can be shared by several selectors (e.g., one per
+    adapter) built on the same frozen backbone.
+
+    Arguments:
+        split_tag: the first field that differs across comparisons
+        max_memory: memory budget of the cache in MB
+        cache: an existing ``PrefixKVCache`` to share
+        **kwargs: see ``PairwiseSelector``
+    """
+    def __init__(self,
+                 model,
+                 tokenizer,
+                 prompt,
+                 choices,
+                 split_tag='output_A',
+                 max_memory=4096,
+                 cache=None,
+                 **kwargs):
+        super(PrefixCachedSelector, self).__init__(model, tokenizer, prompt,
+                                                   choices, **kwargs)
+        self.prefix_prompt = prompt[:prompt.index('{' + split_tag + '}')]
+        self.cache = cache if cache is not None else \
+            PrefixKVCache(max_memory * 1024**2)
+
+    @property
+    def adapter_key(self):
+        if self.adapter_names is not None:
+            return tuple(self.adapter_names)
+        return getattr(self.model.model, 'active_adapter', None)
+
+    def _split(self, sample):
+        input_ids = self._tokenize_comparison(sample)
+
+        # The shared prefix is the longest common prefix in tokens, which
+        # handles merges at the boundary; keep at least one suffix token
+        prefix = self._tokenize(self.prefix_prompt.format_map(sample))
+        length = min(len(input_ids) - 1, len(prefix))
+        diff = (input_ids[:length] != prefix[:length]).nonzero()
+        length = diff[0].item() if len(diff) else length
+        return input_ids[:length], input_ids[length:]
+
+    @torch.no_grad()
+    def _encode_prefixes(self, prefixes):
+        lengths = [len(prefix) for prefix in prefixes]
+        input_ids = torch.full((len(prefixes), max(lengths)),
+                               self.tokenizer.pad_token_id,
+                               dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        for idx, prefix in enumerate(prefixes):
+            input_ids[idx, :len(prefix)] = prefix
+            attention_mask[idx, :len(prefix)] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+
+        self.num_forward_passes += 1
+        backbone = self.model.causal_lm.base_model
+        if self.adapter_names is None:
+            outputs = backbone(input_ids=input_ids,
+                               attention_mask=attention_mask,
+                               use_cache=True)
+        else:
+            # Rows are adapter-major: [num_adapters * len(prefixes)]
+            with parallel_lora_branches(self.model.model, self.adapter_names):
+                outputs = backbone(
+                    input_ids=input_ids.repeat(self.num_adapters, 1),
+                    attention_mask=attention_mask.repeat(self.num_adapters, 1),
+                    use_cache=True)
+        past_key_values = _to_legacy_cache(outputs.past_key_values)
+
+        results = []
+        for idx, length in enumerate(lengths):
+            # Right padding is never attended by the valid prefix tokens
+            results.append(
+                tuple(
+                    tuple(
+                        t.view(self.num_adapters, len(prefixes), *t.shape[1:])
+                        [:, idx, :, :length].clone() for t in layer)
+                    for layer in past_key_values))
+        self.encoded_tokens += sum(lengths)
+        return results
+
+    def _get_prefix_caches(self, prefixes):
+        keys = [(self.adapter_key, tuple(prefix.tolist()))
+                for prefix in prefixes]
+        caches = {key: self.cache.get(key) for key in set(keys)}
+        missing = [key for key, value in caches.items() if value is None]
+        if len(missing):
+            encoded = self._encode_prefixes(
+                [torch.tensor(key[1], dtype=torch.long) for key in missing])
+            for key, past_key_values in zip(missing, encoded):
+                caches[key] = past_key_values
+                self.cache.put(key, past_key_values)
+        return [caches[key] for key in keys]
+
+    @torch.no_grad()
+    def _score_batch(self, samples):
+        prefixes, suffixes = zip(*[self._split(sample) for sample in samples])
+        caches = self._get_prefix_caches(prefixes)
+
+        prefix_lens = [len(prefix) for prefix in prefixes]
+        suffix_lens = [len(suffix) for suffix in suffixes]
+        max_prefix_len = max(prefix_lens)
+        batch_size = len(samples)
+
+        # Stack the cached prefixes: [num_adapters * batch_size, ...]
+        past_key_values = []
+        for layer in zip(*caches):
+            past_key_values.append(
+                tuple(
+                    torch.stack([
+                        F.pad(t, (0, 0, 0, max_prefix_len - t.size(2)))
+                        for t in tensors
+                    ],
+                                dim=1).flatten(0, 1)
+                    for tensors in zip(*layer)))
+
+        input_ids, labels = self._pad_with_choice_labels(suffixes)
+        attention_mask = torch.zeros(
+            (batch_size, max_prefix_len + input_ids.size(1)), dtype=torch.long)
+        position_ids = torch.arange(input_ids.size(1)).repeat(batch_size, 1)
+        for idx, (suffix, prefix_len) in enumerate(zip(suffixes, prefix_lens)):
+            attention_mask[idx, :prefix_len] = 1
+            attention_mask[idx,
+                           max_prefix_len:max_prefix_len + len(suffix)] = 1
+            position_ids[idx] += prefix_len
+
+        outputs = self._forward(input_ids=input_ids.to(self.device),
+                                labels=labels.to(self.device),
+                                attention_mask=attention_mask.to(self.device),
+                                position_ids=position_ids.to(self.device),
+                                past_key_values=_from_legacy_cache(
+                                    tuple(past_key_values)))
+
+        self.encoded_tokens += sum(suffix_lens)
+        self.prompt_tokens += sum(prefix_lens) + sum(suffix_lens)
+        return outputs.logits
+
+    def stats(self):
+        return {
+            **super(PrefixCachedSelector, self).stats(),
+            **self.cache.stats()
+        }
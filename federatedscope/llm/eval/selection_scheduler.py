@@ -0,0 +1,222 @@
+import logging
+import math
+import time
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class SelectionScheduler(object):
+    """
+    Select the best of the ``n`` candidates of each sample with pairwise
+    comparisons made by a ``PairwiseSelector``.
+
+    Arguments:
+        selector: ``PairwiseSelector`` (or ``PrefixCachedSelector``)
+        build_comparison: function ``(sample, idx_a, idx_b) -> dict`` which
+            returns the comparison of the candidates ``idx_a`` (as ``A``) and
+            ``idx_b`` (as ``B``) formatted for the prompt of the selector
+        chunk_size: number of samples whose comparisons are scheduled
+            together, ``None`` means the whole dataset. Small chunks keep
+            the prefixes of the samples in the cache of
+            ``PrefixCachedSelector``.
+    """
+    def __init__(self, selector, build_comparison, chunk_size=None):
+        self.selector = selector
+        self.build_comparison = build_comparison
+        self.chunk_size = chunk_size
+
+        self.num_comparisons, self.num_rounds = 0, 0
+        self.num_forward_passes, self.wall_time = 0, 0.
+
+    def _compare(self, chunk, matches):
+        """
+        Return the predicted choice (0 for ``A`` and 1 for ``B``) of each
+        match ``(sample_idx, idx_a, idx_b)``.
+        """
+        comparisons = [
+            self.build_comparison(chunk[sample_idx], idx_a, idx_b)
+            for sample_idx, idx_a, idx_b in matches
+        ]
+        self.num_comparisons += len(comparisons)
+        self.num_rounds += 1
+        return self.selector.predict(comparisons).numpy()
+
+    def _select_chunk(self, chunk, n):
+        raise NotImplementedError
+
+    @torch.no_grad()
+    def select(self, dataset, n):
+        """
+        Return the index of the best candidate of each sample.
+        """
+        start_forward_passes = self.selector.num_forward_passes
+        start_time = time.time()
+
+        chunk_size = self.chunk_size or max(len(dataset), 1)
+        best_idx = []
+        for left in range(0, len(dataset), chunk_size):
+            best_idx.append(
+                self._select_chunk(dataset[left:left + chunk_size], n))
+        best_idx = np.concatenate(best_idx) if len(best_idx) else \
+            np.zeros(0, dtype=int)
+
+        self.num_forward_passes += \
+            self.selector.num_forward_passes - start_forward_passes
+        self.wall_time += time.time() - start_time
+        return best_idx
+
+    def stats(self):
+        return {
+            'comparisons': self.num_comparisons,
+            'rounds': self.num_rounds,
+            'forward_passes': self.num_forward_passes,
+            'wall_time': self.wall_time
+        }
+
+
+class SequentialScheduler(SelectionScheduler):
+    """
+    King of the hill: the current best candidate (``A``) is compared with
+    the next one (``B``) for ``n - 1`` sequential rounds.
+    """
+    def _select_chunk(self, chunk, n):
+        best_idx = np.zeros(len(chunk), dtype=int)
+        for i in range(1, n):
+            predicted = self._compare(chunk, [(j, best_idx[j], i)
+                                              for j in range(len(chunk))])
+            best_idx[predicted == 1] = i
+        return best_idx
+
+
+class KnockoutScheduler(SelectionScheduler):
+    """
+    Knockout bracket: the remaining candidates are paired up and the winners
+    go to the next round, i.e., ``ceil(log2(n))`` rounds of ``n - 1``
+    comparisons in total. All the matches of a round are batched together;
+    with an odd number of candidates the last one gets a bye.
+    """
+    def _select_chunk(self, chunk, n):
+        remaining = [list(range(n)) for _ in chunk]
+        for _ in range(math.ceil(math.log2(max(n, 1)))):
+            matches = []
+            for j, cands in enumerate(remaining):
+                matches += list(zip([j] * n, cands[0:-1:2], cands[1::2]))
+            predicted = iter(self._compare(chunk, matches))
+
+            for j, cands in enumerate(remaining):
+                winners = [
+                    idx_b if next(predicted) == 1 else idx_a
+                    for idx_a, idx_b in zip(cands[0:-1:2], cands[1::2])
+                ]
+                if len(cands) % 2 == 1:
+                    winners.append(cands[-1])
+                remaining[j] = winners
+        return np.array([cands[0] for cands in remaining], dtype=int)
+
+
+class BradleyTerryScheduler(SelectionScheduler):
+    """
+    All pairs: the ``n * (n - 1) / 2`` pairs of each sample are scored in one
+    round, and the candidate with the largest Bradley-Terry strength fitted
+    on the (soft) preferences is selected. The preferences are the
+    probabilities of the choices averaged over the adapters of the selector.
+
+    Arguments:
+        max_iters: maximum number of the minorization-maximization updates
+        tol: tolerance on the change of the strengths to stop early
+    """
+    def __init__(self,
+                 selector,
+                 build_comparison,
+                 chunk_size=None,
+                 max_iters=100,
+                 tol=1e-6):
+        super(BradleyTerryScheduler, self).__init__(selector, build_comparison,
+                                                    chunk_size)
+        self.max_iters = max_iters
+        self.tol = tol
+
+    def _compare(self, chunk, matches):
+        comparisons = [
+            self.build_comparison(chunk[sample_idx], idx_a, idx_b)
+            for sample_idx, idx_a, idx_b in matches
+        ]
+        self.num_comparisons += len(comparisons)
+        self.num_rounds += 1
+        logits = self.selector.score(comparisons).float()
+        # Probability that `B` is better
+        prob = torch.softmax(logits, dim=-1)[..., 1]
+        if prob.dim() == 2:
+            prob = prob.mean(0)
+        return prob.cpu().numpy()
+
+    def fit(self, wins):
+        """
+        Fit the strengths from ``wins`` of shape ``[num_samples, n, n]``,
+        where ``wins[:, i, j]`` is the (soft) number of times that ``i``
+        beats ``j``.
+        """
+        games = wins + wins.transpose(0, 2, 1)
+        total_wins = wins.sum(-1)
+        strength = np.ones(wins.shape[:2])
+        for _ in range(self.max_iters):
+            denom = games / (strength[:, :, None] + strength[:, None, :])
+            new_strength = total_wins / np.maximum(denom.sum(-1), 1e-12)
+            new_strength /= np.maximum(new_strength.sum(-1, keepdims=True),
+                                       1e-12)
+            converged = np.abs(new_strength - strength).max() < self.tol
+            strength = new_strength
+            if converged:
+                break
+        return strength
+
+    def _select_chunk(self, chunk, n):
+        if n < 2:
+            return np.zeros(len(chunk), dtype=int)
+        idx_a, idx_b = np.triu_indices(n, k=1)
+        matches = [(j, a, b) for j in range(len(chunk))
+                   for a, b in zip(idx_a, idx_b)]
+        prob = self._compare(chunk, matches).reshape(len(chunk), -1)
+
+        wins = np.zeros((len(chunk), n, n))
+        wins[:, idx_b, idx_a] = prob
+        wins[:, idx_a, idx_b] = 1 - prob
+        return self.fit(wins).argmax(-1)
+
+
+SELECTION_SCHEDULERS = {
+    'sequential': SequentialScheduler,
+    'knockout': KnockoutScheduler,
+    'all_pairs': BradleyTerryScheduler,
+}
+
+
+def get_selection_scheduler(schedule, selector, build_comparison, **kwargs):
+    if schedule not in SELECTION_SCHEDULERS:
+        raise ValueError(f'Unknown selection schedule `{schedule}`, '
+                         f'expected one of {list(SELECTION_SCHEDULERS)}.')
+    return SELECTION_SCHEDULERS[schedule](selector, build_comparison, **kwargs)
+
+
+def benchmark_schedulers(selector,
+                         build_comparison,
+                         dataset,
+                         n,
+                         schedules=None,
+                         **kwargs):
+    """
+    Run best-of-n selection with each schedule and return the selected
+    indices and the statistics (comparisons, rounds, forward passes and wall
+    time) of each one.
+    """
+    results = {}
+    for schedule in schedules or SELECTION_SCHEDULERS:
+        scheduler = get_selection_scheduler(schedule, selector,
+                                            build_comparison, **kwargs)
+        best_idx = scheduler.select(dataset, n)
+        results[schedule] = (best_idx, scheduler.stats())
+        logger.info(f'Selection schedule `{schedule}`: {scheduler.stats()}')
+    return results
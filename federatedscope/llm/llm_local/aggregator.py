@@ -1,7 +1,8 @@
 import os
 import torch
 from federatedscope.core.aggregators import Aggregator
-from federatedscope.core.auxiliaries.utils import param2tensor
+from federatedscope.core.aggregators.flat_buffer import flat_weighted_sum
+from federatedscope.core.aggregators.running_sum import RunningWeightedSum
 
 
 class MultiLoRAAvgAggregator(Aggregator):
@@ -15,6 +16,25 @@ class MultiLoRAAvgAggregator(Aggregator):
         self.model = model
         self.device = device
         self.cfg = config
+        # The layouts of the flattened state dicts, reused across the rounds
+        self._flat_layouts = dict()
+        # The feedbacks folded in as they arrive (for streaming aggregation)
+        self.running_sum = None
+
+    def fold(self, content):
+        """
+        Fold the feedback of a client into the running sum, which is
+        averaged by the next ``aggregate`` or ``aggregate_on_model``
+        (instead of the feedbacks in ``agg_info``).
+
+        Arguments:
+            content (tuple): (sample_size, model_para)
+        """
+        sample_size, model_para = content
+        if self.running_sum is None:
+            self.running_sum = RunningWeightedSum()
+        weight = 1.0 if self.cfg.federate.ignore_weight else sample_size
+        self.running_sum.add(model_para, weight)
 
     def aggregate(self, agg_info):
         """
@@ -31,6 +51,10 @@ class MultiLoRAAvgAggregator(Aggregator):
         recover_fun = agg_info['recover_fun'] if (
             'recover_fun' in agg_info and self.cfg.federate.use_ss) else None
         scaler = agg_info['scaler'] if ('scaler' in agg_info) else 1.0
+        if self.running_sum is not None:
+            avg_model = self.running_sum.average()
+            self.running_sum = None
+            return avg_model
         avg_model = self._para_weighted_avg(models, recover_fun=recover_fun)
 
         return avg_model
@@ -50,6 +74,10 @@ class MultiLoRAAvgAggregator(Aggregator):
         recover_fun = agg_info['recover_fun'] if (
             'recover_fun' in agg_info and self.cfg.federate.use_ss) else None
         scaler = agg_info['scaler'] if ('scaler' in agg_info) else 1.0
+        if self.running_sum is not None:
+            avg_model = self._running_avg_on_model()
+            self.running_sum = None
+            return avg_model
         avg_model = self._para_weighted_avg_on_model(models,
                                                      recover_fun=recover_fun)
 
@@ -73,13 +101,27 @@ class MultiLoRAAvgAggregator(Aggregator):
             }
         else:
             ckpt = {'cur_round': cur_round, 'model': self.model.state_dict()}
-        torch.save(ckpt, path)
+
+        if self.cfg.llm.checkpoint.use:
+            from federatedscope.llm.model.checkpoint import save_checkpoint
+            save_checkpoint(path,
+                            ckpt['model'],
+                            cur_round,
+                            save_to=self.cfg.federate.save_to,
+                            blocking=not self.cfg.llm.checkpoint.async_write)
+        else:
+            torch.save(ckpt, path)
 
     def load_model(self, path):
         assert self.model is not None
 
         if os.path.exists(path):
-            ckpt = torch.load(path, map_location='cpu')
+            if self.cfg.llm.checkpoint.use:
+                from federatedscope.llm.model.checkpoint import \
+                    load_checkpoint
+                ckpt = load_checkpoint(path)
+            else:
+                ckpt = torch.load(path, map_location='cpu')
             self.model.load_state_dict(ckpt['model'])
             return ckpt['cur_round']
         else:
@@ -87,82 +129,78 @@ class MultiLoRAAvgAggregator(Aggregator):
 
     def _para_weighted_avg(self, models, recover_fun=None, scaler=1.0):
         """
-        Calculates the weighted average of models.
+        Calculates the weighted average of models, key by key over the
+        models holding each key.
         """
-        keywise_training_set_size = dict()
-        for i in range(len(models)):
-            sample_size, model = models[i]
-            for key in model.keys():
-                if key not in keywise_training_set_size:
-                    keywise_training_set_size[key] = [sample_size, 1]
-                else:
-                    keywise_training_set_size[key][0] += sample_size
-                    keywise_training_set_size[key][1] += 1
-
-        avg_model = dict()
-        for i in range(len(models)):
-            sample_size, model = models[i]
-
-            for key, param in model.items():
-                if self.cfg.federate.ignore_weight:
-                    weight = 1.0 / keywise_training_set_size[key][1]
-                else:
-                    weight = sample_size / keywise_training_set_size[key][0]
-
-                weight = weight * scaler
-                param = param2tensor(param)
+        if self.cfg.federate.ignore_weight:
+            weights = [1.0] * len(models)
+        else:
+            weights = [sample_size for sample_size, _ in models]
+        avg_model, _ = flat_weighted_sum([model for _, model in models],
+                                         weights,
+                                         layouts=self._flat_layouts)
+        if scaler != 1.0:
+            for param in avg_model.values():
+                param.mul_(scaler)
 
-                if key not in avg_model:
-                    avg_model[key] = param * weight
-                else:
-                    avg_model[key] += param * weight
+        return avg_model
 
+    def _running_avg_on_model(self):
+        """
+        Like ``_para_weighted_avg_on_model``, from the running sum.
+        """
+        running_sum = self.running_sum
+        model_state_dict = self.model.state_dict()
+        avg_model = dict()
+        for key in running_sum.sums:
+            if self.cfg.federate.ignore_weight and \
+                    hasattr(self, 'num_clients'):
+                weight = 1.0 / self.num_clients
+            elif not self.cfg.federate.ignore_weight and \
+                    hasattr(self, 'total_train_size'):
+                weight = 1.0 / self.total_train_size
+            else:
+                weight = 1.0 / running_sum.totals[key]
+            raw_model_scaler = 1 - running_sum.totals[key] * weight
+            avg_model[key] = running_sum.scale(key, weight)
+            if raw_model_scaler != 0:
+                avg_model[key] += raw_model_scaler * model_state_dict[key]
         return avg_model
 
     def _para_weighted_avg_on_model(self,
                                     models,
                                     recover_fun=None,
                                     scaler=1.0):
-        keywise_training_size = dict()
-        for i in range(len(models)):
-            train_size, model = models[i]
-            for key in model.keys():
-                if key not in keywise_training_size:
-                    keywise_training_size[key] = [train_size, 1]
-                else:
-                    keywise_training_size[key][0] += train_size
-                    keywise_training_size[key][1] += 1
-
-        avg_model, raw_model_scaler = dict(), dict()
-
-        for i in range(len(models)):
-            train_size, model = models[i]
-
-            for key, param in model.items():
-                if self.cfg.federate.ignore_weight:
-                    if hasattr(self, 'num_clients'):
-                        weight = 1.0 / self.num_clients
-                    else:
-                        weight = 1.0 / keywise_training_size[key][1]
-                else:
-                    if hasattr(self, 'total_train_size'):
-                        weight = train_size / self.total_train_size
-                    else:
-                        weight = train_size / keywise_training_size[key][0]
-
-                weight = weight * scaler
-                param = param2tensor(param)
-
-                if key not in avg_model:
-                    avg_model[key] = param * weight
-                    raw_model_scaler[key] = 1 - weight
-                else:
-                    avg_model[key] += param * weight
-                    raw_model_scaler[key] -= weight
+        if self.cfg.federate.ignore_weight and hasattr(self, 'num_clients'):
+            weights = [1.0 / self.num_clients] * len(models)
+            normalize = False
+        elif not self.cfg.federate.ignore_weight and \
+                hasattr(self, 'total_train_size'):
+            weights = [
+                train_size / self.total_train_size for train_size, _ in models
+            ]
+            normalize = False
+        else:
+            weights = [
+                1.0 if self.cfg.federate.ignore_weight else train_size
+                for train_size, _ in models
+            ]
+            normalize = True
+        avg_model, total_weights = flat_weighted_sum(
+            [model for _, model in models],
+            [weight * scaler for weight in weights],
+            normalize=normalize,
+            layouts=self._flat_layouts)
+        if normalize and scaler != 1.0:
+            for key in avg_model:
+                avg_model[key].mul_(scaler)
+                total_weights[key] = scaler
 
         # merge with the original model
         model_state_dict = self.model.state_dict()
         for key in avg_model.keys():
-            avg_model[key] += raw_model_scaler[key] * model_state_dict[key]
+            raw_model_scaler = 1 - total_weights[key]
+            if raw_model_scaler != 0:
+                avg_model[key] += raw_model_scaler * model_state_dict[key]
 
         return avg_model
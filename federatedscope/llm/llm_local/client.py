@@ -1,11 +1,13 @@
 import copy
 import logging
+import math
 import torch
 import random
 
 from federatedscope.core.message import Message
 from federatedscope.core.workers.client import Client
 from federatedscope.core.data import ClientData
+from federatedscope.core.auxiliaries.dataloader_builder import get_dataloader
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,58 @@ def reorg_client_data(cdata: ClientData):
     return ClientData(cdata.client_cfg, train_data, val_data, test_data)
 
 
+def successive_halving(evaluate, num_arms, num_samples, init_samples, eta=2):
+    """
+    Rank ``num_arms`` arms (e.g., the adapters) by their average loss on
+    ``num_samples`` samples with successive halving: all the arms are
+    evaluated on the first ``init_samples`` samples, and only the best
+    ``1 / eta`` of them on the next rung, which has ``eta`` times the
+    samples, until one arm is left or the samples run out.
+
+    Arguments:
+        evaluate: ``evaluate(arm, start, end)`` returns the total loss and
+            the number of samples of ``arm`` on the samples ``[start, end)``
+        num_arms: number of arms
+        num_samples: number of samples
+        init_samples: number of samples of the first rung
+        eta: reduction factor of the arms
+
+    Returns:
+        The losses of the arms as ``{arm: loss}`` from the best arm, and the
+        number of samples evaluated over all the arms.
+    """
+    total_loss, num_evaluated = [0.] * num_arms, [0] * num_arms
+
+    def avg_loss(arm):
+        return total_loss[arm] / max(num_evaluated[arm], 1)
+
+    # The arms dropped in a later rung rank before those dropped earlier
+    active, dropped = list(range(num_arms)), []
+    start, rung_size, cost = 0, init_samples, 0
+    while len(active) > 1 and start < num_samples:
+        end = min(start + rung_size, num_samples)
+        for arm in active:
+            loss, num = evaluate(arm, start, end)
+            total_loss[arm] += loss
+            num_evaluated[arm] += num
+        cost += (end - start) * len(active)
+        start, rung_size = end, rung_size * eta
+
+        active.sort(key=avg_loss)
+        if start < num_samples:
+            num_kept = math.ceil(len(active) / eta)
+            active, dropped = active[:num_kept], active[num_kept:] + dropped
+
+    # The losses of the dropped arms are estimated on fewer samples, and are
+    # raised (if needed) to the loss of the arms ranking before them, so that
+    # sorting by the losses keeps the ranking
+    losses, bound = dict(), float('-inf')
+    for arm in active + dropped:
+        bound = max(bound, avg_loss(arm))
+        losses[arm] = bound
+    return losses, cost
+
+
 class LLMMultiLoRAClient(Client):
     """
     Client implementation of
@@ -107,25 +161,18 @@ class LLMMultiLoRAClient(Client):
                     adapter_idx = self.adapter_idx
                 else:
                     # select the adapter with min val loss
-                    with torch.no_grad():
-                        min_loss, adapter_indices = 10.0, []
-                        for i in range(self._cfg.llm.adapter.count):
-                            if len(self.data.val_data) == 0:
-                                adapter_indices.append(i)
-                                continue
-                            self.model.set_active_adapter(f'Adapter_{i}')
-                            self.model.eval()
-                            metrics = self.trainer.evaluate(
-                                target_data_split_name='val')
-                            logger.info(
-                                f'Adapter {i} with the results: {metrics}')
-                            if i == 0 or min_loss > metrics['val_avg_loss']:
-                                min_loss, adapter_indices = metrics[
-                                    'val_avg_loss'], [i]
-                            elif min_loss == metrics['val_avg_loss']:
-                                adapter_indices.append(i)
-                        logger.info(adapter_indices)
-                        adapter_idx = random.choice(adapter_indices)
+                    num_adap = self._cfg.llm.adapter.count
+                    if len(self.data.val_data) == 0:
+                        adapter_indices = list(range(num_adap))
+                    else:
+                        with torch.no_grad():
+                            losses = self._get_adapter_losses()
+                        min_loss = min(losses.values())
+                        adapter_indices = [
+                            i for i in range(num_adap) if losses[i] == min_loss
+                        ]
+                    logger.info(adapter_indices)
+                    adapter_idx = random.choice(adapter_indices)
                 # activate the selected adapter for further training
                 logger.info(
                     f'Activate the adapter {adapter_idx} for training...')
@@ -172,19 +219,19 @@ class LLMMultiLoRAClient(Client):
             self.trainer.update(message.content,
                                 strict=self._cfg.federate.share_local_model)
 
-        metrics = {}
-        with torch.no_grad():
-            for i in range(self._cfg.llm.adapter.count):
-                if len(self.data.val_data) == 0:
-                    metrics[f'adapter_{i}_avg_loss'] = random.random()
-                    continue
-                self.model.set_active_adapter(f'Adapter_{i}')
-                self.model.eval()
-                adap_metrics = self.trainer.evaluate(
-                    target_data_split_name='val')
-                logger.info(f'Client {self.ID} Adapter {i} with '
-                            f'the results: {adap_metrics}')
-                metrics[f'adapter_{i}_avg_loss'] = adap_metrics['val_avg_loss']
+        num_adap = self._cfg.llm.adapter.count
+        if len(self.data.val_data) == 0:
+            metrics = {
+                f'adapter_{i}_avg_loss': random.random()
+                for i in range(num_adap)
+            }
+        else:
+            with torch.no_grad():
+                losses = self._get_adapter_losses()
+            metrics = {
+                f'adapter_{i}_avg_loss': losses[i]
+                for i in range(num_adap)
+            }
 
         self.comm_manager.send(
             Message(msg_type='grouping',
@@ -194,5 +241,70 @@ class LLMMultiLoRAClient(Client):
                     timestamp=timestamp,
                     content=metrics))
 
+    def _evaluate_adapter(self, adapter_idx, indices=None):
+        """
+        Evaluate the adapter ``adapter_idx`` on the samples ``indices`` of
+        the val split, or on the whole split if ``indices`` is ``None``.
+        """
+        from torch.utils.data import Subset
+
+        self.model.set_active_adapter(f'Adapter_{adapter_idx}')
+        self.model.eval()
+        if indices is None:
+            return self.trainer.evaluate(target_data_split_name='val')
+
+        # Evaluate on a loader of the samples instead of the whole split
+        ctx = self.trainer.ctx
+        val_loader, num_val_data = ctx.val_loader, ctx.num_val_data
+        ctx.val_loader = get_dataloader(Subset(self.data.val_data, indices),
+                                        self._cfg, 'val')
+        ctx.num_val_data = len(indices)
+        try:
+            return self.trainer.evaluate(target_data_split_name='val')
+        finally:
+            ctx.val_loader, ctx.num_val_data = val_loader, num_val_data
+
+    def _get_adapter_losses(self):
+        """
+        Return the val losses of the adapters as ``{adapter_idx: loss}``.
+        With ``llm.adapter.adaptive_eval``, the adapters are ranked by
+        successive halving on val mini-batches, where the clearly worse
+        adapters are dropped early with the losses on fewer samples. The
+        rungs draw the samples from a random permutation of the val split,
+        which is shared by all the adapters and seeded by the client and
+        the round, so that an ordered split does not bias the drops.
+        """
+        num_adap = self._cfg.llm.adapter.count
+        num_samples = len(self.data.val_data)
+        adaptive_cfg = self._cfg.llm.adapter.adaptive_eval
+        if not adaptive_cfg.use or num_samples <= adaptive_cfg.init_samples:
+            # Exact mode: every adapter on the whole val split
+            losses = dict()
+            for i in range(num_adap):
+                metrics = self._evaluate_adapter(i)
+                logger.info(f'Client {self.ID} Adapter {i} with '
+                            f'the results: {metrics}')
+                losses[i] = metrics['val_avg_loss']
+            return losses
+
+        order = list(range(num_samples))
+        random.Random(f'{self._cfg.seed}-{self.ID}-{self.state}').shuffle(
+            order)
+
+        def evaluate(adapter_idx, start, end):
+            metrics = self._evaluate_adapter(adapter_idx, order[start:end])
+            return metrics['val_loss'], metrics['val_total']
+
+        losses, num_evaluated = successive_halving(evaluate, num_adap,
+                                                   num_samples,
+                                                   adaptive_cfg.init_samples,
+                                                   adaptive_cfg.eta)
+        num_exact = num_adap * num_samples
+        logger.info(f'Client {self.ID} ranks the adapters {list(losses)} '
+                    f'with the losses {list(losses.values())} on '
+                    f'{num_evaluated} val samples, saving '
+                    f'{num_exact - num_evaluated} of {num_exact} samples.')
+        return losses
+
     def callback_funcs_for_setting_adapter_idx(self, message: Message):
         self.adapter_idx = message.content
@@ -127,9 +127,12 @@ class LLMMultiLoRAServer(Server):
                         (train_data_size, model_para_multiple[model_idx]))
 
             # Trigger the monitor here (for training)
-            self._monitor.calc_model_metric(self.models[0].state_dict(),
-                                            msg_list,
-                                            rnd=self.state)
+            if self._cfg.federate.streaming_aggr:
+                self._monitor.finish_model_metric(rnd=self.state)
+            else:
+                self._monitor.calc_model_metric(self.models[0].state_dict(),
+                                                msg_list,
+                                                rnd=self.state)
 
             # Aggregate
             aggregated_num = len(msg_list)
@@ -5,22 +5,27 @@ import transformers
 from transformers import pipeline, GenerationConfig
 import os
 import gc
+import time
 
 transformers.logging.set_verbosity(40)
 
 from federatedscope.core.configs.config import global_cfg
 from federatedscope.core.cmd_args import parse_args, parse_client_cfg
 from federatedscope.llm.model.model_builder import get_llm
+from federatedscope.llm.model.checkpoint import is_safetensors_file, \
+    list_checkpoints, load_checkpoint
 from federatedscope.llm.dataset.llm_dataset import PROMPT_DICT, DefaultToken
 from federatedscope.core.auxiliaries.utils import setup_seed
 from federatedscope.core.auxiliaries.logging import update_logger
 from federatedscope.llm.offsite_tuning.utils import \
     wrap_offsite_tuning_for_eval
+from federatedscope.llm.misc.generation_engine import \
+    get_generation_engine, generate_by_windows
 
 logger = logging.getLogger(__name__)
 
 
-def get_tokenizer(model_name, cache_dir, tok_len=128):
+def get_tokenizer(model_name, cache_dir, tok_len=128, use_fast=False):
     from transformers import AutoTokenizer
 
     tokenizer = AutoTokenizer.from_pretrained(
@@ -28,7 +33,7 @@ def get_tokenizer(model_name, cache_dir, tok_len=128):
         cache_dir=cache_dir,
         model_max_length=tok_len,
         padding_side="left",
-        use_fast=False,
+        use_fast=use_fast,
     )
 
     special_tokens = dict()
@@ -53,12 +58,16 @@ class FSChatBot(object):
         self.device = f'cuda:{config.device}'
         self.add_special_tokens = True
 
-        num_ckpt = config.federate.total_round_num // config.federate.save_freq
-        self.prefix = ['final_'] + \
-                      [str(i*config.federate.save_freq) + '_'
-                       for i in range(num_ckpt, -1, -1)] + ['']
-        self.dirname, self.filename = os.path.split(config.federate.save_to)
-        print(self.prefix)
+        # Checkpoints to be evaluated, from the most recent one
+        self.ckpt_paths = list_checkpoints(config.federate.save_to,
+                                           config.federate.save_freq,
+                                           config.federate.total_round_num)
+        self.filename = os.path.basename(config.federate.save_to)
+        print(self.ckpt_paths)
+        # The uncompiled model, into which the next adapter-only checkpoint
+        # is loaded without rebuilding the base model
+        self.base_model = None
+        self.num_generated_tokens, self.generation_time = 0, 0.
         if use_raw:
             self.use_raw_model()
         else:
@@ -71,8 +80,11 @@ class FSChatBot(object):
             torch.cuda.empty_cache()
 
         model_name, _ = self.config.model.type.split('@')
-        self.tokenizer, _ = get_tokenizer(model_name, self.config.data.root,
-                                          self.config.llm.tok_len)
+        self.tokenizer, _ = get_tokenizer(
+            model_name,
+            self.config.data.root,
+            self.config.llm.tok_len,
+            use_fast=self.config.llm.tok_use_fast)
 
         self.model = get_llm(self.config, device_map='auto')
 
@@ -89,50 +101,60 @@ class FSChatBot(object):
         self.history = []
 
     def next_model(self):
+        ckpt_path = self.ckpt_paths[0] if self.ckpt_paths else None
+        # Adapter-only checkpoints are loaded into the current model, which
+        # saves loading the base model again
+        reuse = self.base_model is not None and ckpt_path is not None and \
+            not self.config.llm.offsite_tuning.use and \
+            is_safetensors_file(ckpt_path)
         if hasattr(self, 'model'):
             delattr(self, 'model')
+            if not reuse:
+                self.base_model = None
             gc.collect()
 
         model_name, _ = self.config.model.type.split('@')
-        self.tokenizer, _ = get_tokenizer(model_name, self.config.data.root,
-                                          self.config.llm.tok_len)
-
-        self.model = get_llm(self.config, device_map='auto')
+        self.tokenizer, _ = get_tokenizer(
+            model_name,
+            self.config.data.root,
+            self.config.llm.tok_len,
+            use_fast=self.config.llm.tok_use_fast)
+
+        if reuse:
+            self.model = self.base_model
+        else:
+            self.model = get_llm(self.config, device_map='auto')
         self.generation_config = GenerationConfig.from_pretrained(model_name)
         logger.info(f'{model_name} default generation setting: '
                     f'{self.generation_config}')
 
-        self.curpfx = None
-        for pre in self.prefix:
-            if os.path.exists(os.path.join(self.dirname, pre + self.filename)):
-                self.curpfx = pre
-                break
-
         # Load model from the checkpoints
-        if self.curpfx is not None:
-            ckpt_path = os.path.join(self.dirname, self.curpfx + self.filename)
+        if ckpt_path is not None:
+            self.curpfx = os.path.basename(ckpt_path)[:-len(self.filename)]
             if self.config.llm.offsite_tuning.use:
                 self.model = wrap_offsite_tuning_for_eval(
                     self.model, self.config, ckpt_path)
             else:
-                ckpt = torch.load(ckpt_path, map_location='cpu')
-                if 'model' and 'cur_round' in ckpt:
-                    self.model.load_state_dict(ckpt['model'])
+                ckpt = load_checkpoint(ckpt_path)
+                self.model.load_state_dict(ckpt['model'])
+                if ckpt['cur_round'] is not None:
                     logger.info(
                         f"Load with the model of Round {ckpt['cur_round']}")
                     print(f"Load with the model of Round {ckpt['cur_round']}")
-                else:
-                    self.model.load_state_dict(ckpt)
+                # Only adapter-only checkpoints keep the base model intact
+                if is_safetensors_file(ckpt_path):
+                    self.base_model = self.model
             logger.info(f'Model loads from the checkpoint {ckpt_path}')
             print(f'Model loads from the checkpoint {ckpt_path}')
 
-            # remove the prefix up to the current one
-            self.prefix = self.prefix[self.prefix.index(self.curpfx) + 1:]
+            # remove the checkpoints up to the current one
+            self.ckpt_paths = self.ckpt_paths[1:]
 
-        elif len(self.prefix) > 1:
+        elif self.ckpt_paths is not None:
+            self.curpfx = None
             logger.info("will use raw model.")
             print("will use raw model.")
-            self.prefix = []
+            self.ckpt_paths = None
             if self.config.llm.offsite_tuning.use:
                 self.model = wrap_offsite_tuning_for_eval(
                     self.model, self.config)
@@ -189,30 +211,41 @@ class FSChatBot(object):
     def generate(self,
                  input_texts: list[str],
                  generate_kwargs={}) -> list[list[str]]:
-        input_text_tokens = self.tokenizer(
-            input_texts,
-            padding=True,
-            add_special_tokens=True,
-            return_tensors="pt",
-        ).to("cuda:0")
-
-        output_ids = self.model.generate(**input_text_tokens,
-                                         **generate_kwargs)
-        responses = self.tokenizer.batch_decode(output_ids,
-                                                skip_special_tokens=True,
-                                                ignore_tokenization_space=True)
-
-        response_map = [[] for _ in input_texts]
-        for res in responses:
-            for idx, input_text in enumerate(input_texts):
-                if input_text in res:
-                    gen_res = res.replace(input_text, "").strip()
-                    response_map[idx].append(gen_res.replace("</s>", ""))
-                    # response_map[idx].append(
-                    #     " " + gen_res.replace("</s>", ""))
-                    break
-
-        return response_map
+        if isinstance(input_texts, str):
+            input_texts = [input_texts]
+        start_time = time.time()
+
+        engine = None
+        if self.config.llm.generation.continuous_batching:
+            engine = get_generation_engine(
+                self.model, self.tokenizer,
+                self.config.llm.generation.max_batch_size, generate_kwargs)
+        if engine is not None:
+            response_map = engine.generate(
+                input_texts, generate_kwargs.get('num_return_sequences', 1))
+            num_tokens = engine.stats()['generated_tokens']
+        else:
+            # e.g., beam search
+            response_map, num_tokens = generate_by_windows(
+                self.model,
+                self.tokenizer,
+                input_texts,
+                window=len(input_texts),
+                return_num_tokens=True,
+                **generate_kwargs)
+
+        self.num_generated_tokens += num_tokens
+        self.generation_time += time.time() - start_time
+        return [[res.strip() for res in responses]
+                for responses in response_map]
+
+    def generation_stats(self):
+        return {
+            'generated_tokens': self.num_generated_tokens,
+            'wall_time': self.generation_time,
+            'tokens_per_sec': self.num_generated_tokens /
+            max(self.generation_time, 1e-12)
+        }
 
     def clear(self):
         self.history = []
@@ -0,0 +1,455 @@
+import logging
+import time
+from collections import deque
+
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+# The `generate_kwargs` handled by `ContinuousBatchingEngine`, the others
+# (e.g., beam search) fall back to `model.generate`
+ENGINE_GENERATE_KWARGS = {
+    'max_new_tokens', 'do_sample', 'temperature', 'top_p',
+    'num_return_sequences'
+}
+
+
+def _cache_to_tuples(past_key_values):
+    """
+    Return the ``[(keys, values)]`` of each layer in ``past_key_values``,
+    whose tensors are in shape ``[batch_size, num_heads, seq_len, head_dim]``.
+    """
+    if isinstance(past_key_values, (tuple, list)):
+        return [tuple(layer[:2]) for layer in past_key_values]
+    if hasattr(past_key_values, 'layers'):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    if hasattr(past_key_values, 'key_cache'):
+        return list(zip(past_key_values.key_cache,
+                        past_key_values.value_cache))
+    return [tuple(layer[:2]) for layer in past_key_values.to_legacy_cache()]
+
+
+def _tuples_to_cache(tuples, like):
+    """
+    Build the cache of the same type as ``like`` from ``[(keys, values)]``.
+    """
+    if isinstance(like, (tuple, list)):
+        return tuple(tuples)
+    if hasattr(type(like), 'from_legacy_cache'):
+        return type(like).from_legacy_cache(tuple(tuples))
+    return type(like)(tuples)
+
+
+def _get_generation_config(model):
+    """
+    Return the ``generation_config`` of ``model``, which might be wrapped
+    (e.g., by ``AdapterModel``, peft or ``torch.compile``), or ``None``.
+    """
+    while model is not None:
+        generation_config = getattr(model, 'generation_config', None)
+        if generation_config is not None:
+            return generation_config
+        wrapped = getattr(model, 'model', None)
+        model = getattr(model, '_orig_mod', None) if wrapped is None \
+            else wrapped
+    return None
+
+
+class ContinuousBatchingEngine(object):
+    """
+    Generation engine which decodes a rolling batch of sequences with a
+    shared KV cache. Instead of waiting for the longest sequence of a fixed
+    window of prompts, a sequence leaves the batch as soon as it hits EOS
+    (or ``max_new_tokens``), and the queued prompts are admitted into the
+    free slots at the next step. The completions are sliced by tokens and
+    returned by request id.
+
+    The rows of the batch are left-padded, and the cache of the admitted
+    prompts is left-padded to the length of the running one (or the other
+    way around) before they are concatenated. The prompt of a request with
+    several return sequences is encoded once and its cache is repeated.
+
+    Arguments:
+        model: causal LM (or ``AdapterModel``) supporting ``past_key_values``
+            and ``position_ids``
+        tokenizer: tokenizer of the model
+        max_batch_size: maximum number of sequences decoded together
+        max_new_tokens: default maximum number of generated tokens
+        do_sample: sample the tokens, or decode greedily
+        temperature: temperature of the sampling
+        top_p: nucleus sampling probability
+        eos_token_id: token (or list of tokens) which ends a sequence
+
+    The arguments left as ``None`` default to the ``generation_config`` of
+    the model as in ``model.generate``, then to the tokenizer (for the
+    special tokens), then to 60 new tokens and greedy decoding.
+    """
+    def __init__(self,
+                 model,
+                 tokenizer,
+                 max_batch_size=16,
+                 max_new_tokens=None,
+                 do_sample=None,
+                 temperature=None,
+                 top_p=None,
+                 eos_token_id=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+
+        generation_config = _get_generation_config(model)
+
+        def get_default(value, name, default=None):
+            if value is None and generation_config is not None:
+                value = getattr(generation_config, name, None)
+            return default if value is None else value
+
+        self.max_new_tokens = get_default(max_new_tokens, 'max_new_tokens', 60)
+        self.do_sample = get_default(do_sample, 'do_sample', False)
+        self.temperature = get_default(temperature, 'temperature', 1.0)
+        self.top_p = get_default(top_p, 'top_p', 1.0)
+        eos_token_id = get_default(eos_token_id, 'eos_token_id',
+                                   tokenizer.eos_token_id)
+        self.eos_token_ids = set(eos_token_id) if isinstance(
+            eos_token_id, (list, tuple)) else {eos_token_id}
+        self.pad_token_id = get_default(None, 'pad_token_id',
+                                        tokenizer.pad_token_id)
+        if self.pad_token_id is None:
+            self.pad_token_id = 0
+        self.device = next(model.parameters()).device
+
+        self.waiting = deque()
+        self.results = dict()
+        self._next_request_id = 0
+        self._reset_batch()
+
+        self.num_prompt_tokens, self.num_generated_tokens = 0, 0
+        self.num_forward_passes, self.num_decode_steps = 0, 0
+        self.num_decoded_rows, self.wall_time = 0, 0.
+
+    def _reset_batch(self):
+        # Running sequences: (request_id, index, max_new_tokens)
+        self.running = []
+        self.outputs = []
+        self.past_key_values = None
+        self.attention_mask = None
+        self.next_tokens = None
+
+    def add_request(self,
+                    prompt,
+                    num_return_sequences=1,
+                    max_new_tokens=None,
+                    request_id=None):
+        """
+        Queue ``num_return_sequences`` sequences generated from ``prompt``
+        (text or token ids), and return the id of the request.
+        """
+        if request_id is None:
+            request_id = self._next_request_id
+            self._next_request_id += 1
+        if request_id in self.results:
+            raise ValueError(f'Request `{request_id}` already exists.')
+
+        if isinstance(prompt, str):
+            prompt = self.tokenizer(prompt,
+                                    add_special_tokens=True)['input_ids']
+        prompt = list(prompt)
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        self.results[request_id] = [None] * num_return_sequences
+        for index in range(num_return_sequences):
+            self.waiting.append((request_id, index, prompt, max_new_tokens))
+        return request_id
+
+    def has_unfinished(self):
+        return len(self.waiting) > 0 or len(self.running) > 0
+
+    def _forward(self, **kwargs):
+        self.num_forward_passes += 1
+        outputs = self.model(use_cache=True, **kwargs)
+        return outputs.logits[:, -1].float(), outputs.past_key_values
+
+    def _sample(self, logits):
+        if not self.do_sample or self.temperature <= 0:
+            return logits.argmax(-1)
+        probs = torch.softmax(logits / self.temperature, dim=-1)
+        if self.top_p < 1.0:
+            sorted_probs, sorted_idx = probs.sort(-1, descending=True)
+            # Keep the smallest prefix whose probability exceeds `top_p`
+            removed = sorted_probs.cumsum(-1) - sorted_probs > self.top_p
+            sorted_probs[removed] = 0.
+            probs = torch.zeros_like(probs).scatter_(-1, sorted_idx,
+                                                     sorted_probs)
+        return torch.multinomial(probs, 1).squeeze(-1)
+
+    def _admit(self):
+        """
+        Encode the queued prompts that fit into the free slots, and merge
+        them into the running batch.
+        """
+        num_free = self.max_batch_size - len(self.running)
+        if num_free <= 0 or len(self.waiting) == 0:
+            return
+        admitted = [
+            self.waiting.popleft()
+            for _ in range(min(num_free, len(self.waiting)))
+        ]
+
+        # Encode the prompt of each request once
+        request_rows, prompts, rows = {}, [], []
+        for request_id, _, prompt, _ in admitted:
+            if request_id not in request_rows:
+                request_rows[request_id] = len(prompts)
+                prompts.append(prompt)
+            rows.append(request_rows[request_id])
+        max_len = max(len(prompt) for prompt in prompts)
+        input_ids = torch.full((len(prompts), max_len),
+                               self.pad_token_id,
+                               dtype=torch.long)
+        attention_mask = torch.zeros((len(prompts), max_len), dtype=torch.long)
+        for i, prompt in enumerate(prompts):
+            input_ids[i, max_len - len(prompt):] = torch.tensor(prompt)
+            attention_mask[i, max_len - len(prompt):] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        logits, past_key_values = self._forward(input_ids=input_ids,
+                                                attention_mask=attention_mask,
+                                                position_ids=position_ids)
+        self.num_prompt_tokens += sum(len(prompt) for prompt in prompts)
+
+        rows = torch.tensor(rows, device=self.device)
+        new_cache = [(keys.index_select(0, rows), values.index_select(0, rows))
+                     for keys, values in _cache_to_tuples(past_key_values)]
+        new_mask = attention_mask.index_select(0, rows)
+        new_tokens = self._sample(logits.index_select(0, rows))
+
+        if self.past_key_values is None:
+            cache, mask, tokens = new_cache, new_mask, new_tokens
+        else:
+            # Left-pad the shorter cache and concatenate the batches
+            old_cache = _cache_to_tuples(self.past_key_values)
+            old_len, new_len = self.attention_mask.shape[1], max_len
+            length = max(old_len, new_len)
+
+            def pad(x, x_len):
+                if x.dim() == 2:
+                    return F.pad(x, (length - x_len, 0))
+                return F.pad(x, (0, 0, length - x_len, 0))
+
+            cache = [(torch.cat([pad(old_k, old_len),
+                                 pad(new_k, new_len)]),
+                      torch.cat([pad(old_v, old_len),
+                                 pad(new_v, new_len)]))
+                     for (old_k, old_v), (new_k,
+                                          new_v) in zip(old_cache, new_cache)]
+            mask = torch.cat(
+                [pad(self.attention_mask, old_len),
+                 pad(new_mask, new_len)])
+            tokens = torch.cat([self.next_tokens, new_tokens])
+        self.past_key_values = _tuples_to_cache(cache, past_key_values)
+        self.attention_mask = mask
+        self.next_tokens = tokens
+        self.running += [(request_id, index, max_new_tokens)
+                         for request_id, index, _, max_new_tokens in admitted]
+        self.outputs += [[] for _ in admitted]
+
+    def _update(self):
+        """
+        Append the sampled tokens to the outputs, and remove the finished
+        sequences from the batch.
+        """
+        tokens = self.next_tokens.tolist()
+        self.num_generated_tokens += len(tokens)
+        kept = []
+        for row, token in enumerate(tokens):
+            request_id, index, max_new_tokens = self.running[row]
+            self.outputs[row].append(token)
+            if token in self.eos_token_ids or \
+                    len(self.outputs[row]) >= max_new_tokens:
+                self.results[request_id][index] = self.outputs[row]
+            else:
+                kept.append(row)
+        if len(kept) == len(tokens):
+            return
+        if len(kept) == 0:
+            self._reset_batch()
+            return
+
+        self.running = [self.running[row] for row in kept]
+        self.outputs = [self.outputs[row] for row in kept]
+        rows = torch.tensor(kept, device=self.device)
+        mask = self.attention_mask.index_select(0, rows)
+        # Drop the columns which are padding in all the remaining rows
+        start = int((mask.sum(0) == 0).long().cumprod(0).sum().item())
+        cache = [(keys.index_select(0, rows)[:, :, start:],
+                  values.index_select(0, rows)[:, :, start:])
+                 for keys, values in _cache_to_tuples(self.past_key_values)]
+        self.past_key_values = _tuples_to_cache(cache, self.past_key_values)
+        self.attention_mask = mask[:, start:]
+        self.next_tokens = self.next_tokens.index_select(0, rows)
+
+    @torch.no_grad()
+    def step(self):
+        """
+        Admit the queued prompts into the free slots, then decode one token
+        of all the running sequences.
+        """
+        self._admit()
+        # The first tokens come from encoding the prompts
+        self._update()
+        if len(self.running) == 0:
+            return
+
+        attention_mask = F.pad(self.attention_mask, (0, 1), value=1)
+        position_ids = self.attention_mask.sum(-1, keepdim=True)
+        logits, self.past_key_values = self._forward(
+            input_ids=self.next_tokens.unsqueeze(-1),
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self.past_key_values)
+        self.attention_mask = attention_mask
+        self.num_decode_steps += 1
+        self.num_decoded_rows += len(self.running)
+        self.next_tokens = self._sample(logits)
+
+    def run(self):
+        """
+        Generate all the queued requests, and return the generated token
+        ids of each sequence keyed by request id.
+        """
+        start_time = time.time()
+        while self.has_unfinished():
+            self.step()
+        self.wall_time += time.time() - start_time
+        results, self.results = self.results, dict()
+        return results
+
+    def generate(self,
+                 input_texts,
+                 num_return_sequences=1,
+                 max_new_tokens=None,
+                 skip_special_tokens=True):
+        """
+        Return the ``num_return_sequences`` completions (decoded) of each
+        prompt in ``input_texts``.
+        """
+        request_ids = [
+            self.add_request(input_text, num_return_sequences, max_new_tokens)
+            for input_text in input_texts
+        ]
+        results = self.run()
+        return [
+            self.tokenizer.batch_decode(
+                results[request_id], skip_special_tokens=skip_special_tokens)
+            for request_id in request_ids
+        ]
+
+    def stats(self):
+        return {
+            'prompt_tokens': self.num_prompt_tokens,
+            'generated_tokens': self.num_generated_tokens,
+            'forward_passes': self.num_forward_passes,
+            'avg_batch_size': self.num_decoded_rows /
+            max(self.num_decode_steps, 1),
+            'wall_time': self.wall_time,
+            'tokens_per_sec': self.num_generated_tokens /
+            max(self.wall_time, 1e-12)
+        }
+
+
+def get_generation_engine(model, tokenizer, max_batch_size, generate_kwargs):
+    """
+    Return the ``ContinuousBatchingEngine`` set up with ``generate_kwargs``,
+    or ``None`` if some of them are not supported (e.g., beam search).
+    """
+    if not set(generate_kwargs).issubset(ENGINE_GENERATE_KWARGS):
+        return None
+    kwargs = {
+        key: value
+        for key, value in generate_kwargs.items()
+        if key != 'num_return_sequences'
+    }
+    return ContinuousBatchingEngine(model,
+                                    tokenizer,
+                                    max_batch_size=max_batch_size,
+                                    **kwargs)
+
+
+@torch.no_grad()
+def generate_by_windows(model,
+                        tokenizer,
+                        input_texts,
+                        window=10,
+                        return_num_tokens=False,
+                        **kwargs):
+    """
+    Generate the completions of ``input_texts`` with ``model.generate`` in
+    fixed windows of prompts. The completions are sliced after the (padded)
+    prompts and grouped by ``num_return_sequences``. With
+    ``return_num_tokens``, the number of generated tokens (up to the EOS
+    token of each sequence) is returned as well.
+    """
+    num_return_sequences = kwargs.get('num_return_sequences', 1)
+    device = next(model.parameters()).device
+    completions, num_tokens = [], 0
+    for left in range(0, len(input_texts), window):
+        input_text_tokens = tokenizer(
+            input_texts[left:left + window],
+            padding=True,
+            add_special_tokens=True,
+            return_tensors="pt",
+        ).to(device)
+        output_ids = model.generate(
+            **input_text_tokens,
+            **kwargs)[:, input_text_tokens['input_ids'].shape[1]:]
+        responses = tokenizer.batch_decode(output_ids,
+                                           skip_special_tokens=True)
+        completions += [
+            responses[i:i + num_return_sequences]
+            for i in range(0, len(responses), num_return_sequences)
+        ]
+        # The finished sequences are padded up to the longest one
+        is_eos = output_ids.eq(tokenizer.eos_token_id)
+        num_tokens += torch.where(is_eos.any(-1),
+                                  is_eos.int().argmax(-1) + 1,
+                                  output_ids.shape[1]).sum().item()
+    if return_num_tokens:
+        return completions, num_tokens
+    return completions
+
+
+def benchmark_generation(model,
+                         tokenizer,
+                         input_texts,
+                         window=10,
+                         max_batch_size=16,
+                         **generate_kwargs):
+    """
+    Generate the completions of ``input_texts`` with ``model.generate`` in
+    windows of ``window`` prompts and with ``ContinuousBatchingEngine``, and
+    return the generated tokens per second of each.
+    """
+    start_time = time.time()
+    _, num_tokens = generate_by_windows(model,
+                                        tokenizer,
+                                        input_texts,
+                                        window,
+                                        return_num_tokens=True,
+                                        **generate_kwargs)
+    wall_time = time.time() - start_time
+
+    engine = get_generation_engine(model, tokenizer, max_batch_size,
+                                   generate_kwargs)
+    engine.generate(input_texts, generate_kwargs.get('num_return_sequences',
+                                                     1))
+    results = {
+        'window': {
+            'generated_tokens': num_tokens,
+            'wall_time': wall_time,
+            'tokens_per_sec': num_tokens / max(wall_time, 1e-12)
+        },
+        'continuous': engine.stats()
+    }
+    logger.info(f'Generation benchmark: {results}')
+    return results
@@ -1,6 +1,9 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from peft import get_peft_model, TaskType, PeftModel
 
 import accelerate
@@ -8,10 +11,13 @@ from accelerate import dispatch_model, infer_auto_device_map, \
     load_checkpoint_and_dispatch
 from accelerate.utils import get_balanced_memory
 
+from transformers.utils import ModelOutput
 from transformers import (OPTForCausalLM, GPT2LMHeadModel, BloomForCausalLM,
                           LlamaForCausalLM, LlamaForSequenceClassification,
                           Qwen2ForCausalLM, GemmaForCausalLM)
 
+from federatedscope.llm.model.checkpoint import save_checkpoint
+
 MODEL_UNIT = {
     LlamaForCausalLM: ['LlamaDecoderLayer'],
     LlamaForSequenceClassification: ['LlamaDecoderLayer'],
@@ -22,6 +28,9 @@ MODEL_UNIT = {
     GemmaForCausalLM: ['GemmaDecoderLayer']
 }
 
+# Same as `DefaultToken.IGNORE_INDEX` in `llm_dataset`
+IGNORE_INDEX = -100
+
 import logging
 import sys
 
@@ -153,6 +162,97 @@ def enable_adapter(model, package, adapter, **kwargs):
     raise NotImplementedError
 
 
+@contextmanager
+def parallel_lora_branches(model, adapter_names):
+    """
+    Temporarily turn every LoRA ``Linear`` layer of a ``PeftModel`` into
+    ``len(adapter_names)`` parallel low-rank branches. The input batch is
+    expected to be replicated adapter-major along dim 0, i.e., the ``i``-th
+    slice of size ``batch_size`` is routed through ``adapter_names[i]``.
+    Adapters are disabled inside the context, so the frozen base layers run
+    once on the whole stacked batch and each LoRA layer adds all adapter
+    deltas with two batched matmuls.
+    """
+    from peft.tuners.lora import LoraLayer
+
+    num_adapters = len(adapter_names)
+
+    def _hook(module, inputs, output):
+        x = inputs[0]
+        lora_A = [module.lora_A[name].weight for name in adapter_names]
+        lora_B = [module.lora_B[name].weight for name in adapter_names]
+        scaling = [module.scaling[name] for name in adapter_names]
+
+        x = x.to(lora_A[0].dtype)
+        if module.training:
+            x = torch.cat([
+                module.lora_dropout[name](chunk) for name, chunk in zip(
+                    adapter_names, x.chunk(num_adapters, dim=0))
+            ])
+        # [num_adapters, batch_size * seq_len, in_features]
+        x = x.reshape(num_adapters, -1, x.shape[-1])
+
+        if len({weight.shape for weight in lora_A}) == 1:
+            hidden = torch.bmm(x, torch.stack(lora_A).transpose(1, 2))
+            delta = torch.bmm(hidden, torch.stack(lora_B).transpose(1, 2))
+            delta = delta * delta.new_tensor(scaling).view(-1, 1, 1)
+        else:
+            # Adapters with different ranks cannot be stacked
+            delta = torch.stack([
+                F.linear(F.linear(chunk, A), B) * s
+                for chunk, A, B, s in zip(x, lora_A, lora_B, scaling)
+            ])
+        return output + delta.reshape(output.shape).to(output.dtype)
+
+    handles = []
+    for module in model.modules():
+        if not isinstance(module, LoraLayer):
+            continue
+        found = [name in module.lora_A for name in adapter_names]
+        if not any(found):
+            continue
+        if not all(found):
+            raise ValueError(f'Adapters {adapter_names} do not share the '
+                             f'same target modules.')
+        use_dora = getattr(module, 'use_dora', {})
+        if any(use_dora.get(name, False) for name in adapter_names):
+            raise NotImplementedError('DoRA is not supported by the '
+                                      'parallel LoRA branches.')
+        handles.append(module.register_forward_hook(_hook))
+
+    try:
+        with model.disable_adapter():
+            yield
+    finally:
+        for handle in handles:
+            handle.remove()
+
+
+def majority_vote(predictions, num_classes=None):
+    """
+    Vectorized majority voting over the first dim of ``predictions`` with
+    shape ``[num_voters, batch_size]``. Ties are broken towards the smallest
+    label, which is the same as ``np.bincount(...).argmax()`` per column.
+    """
+    predictions = torch.as_tensor(predictions).long()
+    if num_classes is None:
+        num_classes = int(predictions.max().item()) + 1
+    votes = F.one_hot(predictions, num_classes).sum(dim=0)
+    return votes.argmax(dim=-1)
+
+
+@dataclass
+class ChoiceOutput(ModelOutput):
+    """
+    Output of the selector head: ``logits`` with shape ``[N, len(choices)]``
+    at the ``N`` labelled positions of the batch, the index of the labelled
+    choice at each position, and the cross-entropy between them.
+    """
+    loss: torch.FloatTensor = None
+    logits: torch.FloatTensor = None
+    labels: torch.LongTensor = None
+
+
 class AdapterModel(nn.Module):
     def __init__(self, model, use_adapter=False, *args, **kwargs):
         super().__init__()
@@ -186,11 +286,116 @@ class AdapterModel(nn.Module):
         return self.model.get_input_embeddings()
 
     def forward(self, disable_adapter=False, *args, **kwargs):
+        # Passing `choices` (token ids) switches to the selector head
+        if kwargs.get('choices', None) is not None:
+            forward_fn = self.choice_forward
+        else:
+            kwargs.pop('choices', None)
+            forward_fn = self.model.forward
+
         if isinstance(self.model, PeftModel) and disable_adapter:
             with self.model.disable_adapter():
-                return self.model(*args, **kwargs)
+                return forward_fn(*args, **kwargs)
 
-        return self.model.forward(*args, **kwargs)
+        return forward_fn(*args, **kwargs)
+
+    @property
+    def causal_lm(self):
+        # The HuggingFace model underneath the (optional) peft wrapper
+        if isinstance(self.model, PeftModel):
+            return self.model.get_base_model()
+        return self.model
+
+    @property
+    def support_selector_head(self):
+        if isinstance(self.model, PeftModel) and \
+                self.model.active_peft_config.is_prompt_learning:
+            # Virtual tokens are only prepended by `PeftModel.forward`
+            return False
+        return self.model.get_output_embeddings() is not None
+
+    def choice_forward(self,
+                       input_ids,
+                       labels,
+                       choices,
+                       attention_mask=None,
+                       **kwargs):
+        """
+        Selector head: compute the logits of the ``choices`` tokens only at
+        the positions whose next label is one of them. The backbone returns
+        hidden states and only these positions are projected onto the
+        ``choices`` rows of the LM head, so the ``[batch, seq, vocab]``
+        logits are never materialized.
+        """
+        shift_labels = labels[..., 1:]
+        choice_labels = torch.full_like(shift_labels, IGNORE_INDEX)
+        for idx, choice in enumerate(choices):
+            choice_labels[shift_labels == choice] = idx
+        mask = choice_labels != IGNORE_INDEX
+
+        if self.support_selector_head:
+            causal_lm = self.causal_lm
+            hidden_states = causal_lm.base_model(input_ids=input_ids,
+                                                 attention_mask=attention_mask,
+                                                 **kwargs)[0]
+            hidden_states = hidden_states[:, :-1][mask]
+
+            lm_head = causal_lm.get_output_embeddings()
+            weight = lm_head.weight[choices]
+            bias = lm_head.bias[choices] \
+                if getattr(lm_head, 'bias', None) is not None else None
+            logits = F.linear(hidden_states.to(weight.device), weight, bias)
+
+            softcapping = getattr(causal_lm.config, 'final_logit_softcapping',
+                                  None)
+            if softcapping is not None:
+                logits = torch.tanh(logits / softcapping) * softcapping
+        else:
+            logits = self.model(input_ids=input_ids,
+                                attention_mask=attention_mask,
+                                **kwargs).logits
+            logits = logits[:, :-1][mask][:, choices]
+
+        choice_labels = choice_labels[mask].to(logits.device)
+        loss = F.cross_entropy(logits, choice_labels)
+        return ChoiceOutput(loss=loss, logits=logits, labels=choice_labels)
+
+    def multi_adapter_forward(self, adapter_names=None, **kwargs):
+        """
+        Run the batch through several LoRA adapters in one forward call.
+        Every tensor in ``kwargs`` is replicated once per adapter and the
+        backbone sees a single stacked batch (see ``parallel_lora_branches``).
+        The returned logits are reshaped to
+        ``[len(adapter_names), batch_size, ...]``, or to
+        ``[len(adapter_names), N, len(choices)]`` when ``choices`` is given
+        (see ``choice_forward``).
+        """
+        if adapter_names is None:
+            adapter_names = [
+                name for name in self.adapter_names if name != 'default'
+            ] or self.adapter_names
+        num_adapters = len(adapter_names)
+
+        if kwargs.get('choices', None) is not None:
+            forward_fn = self.choice_forward
+        else:
+            # The LM loss over the stacked batch is meaningless here
+            kwargs.pop('choices', None)
+            kwargs.pop('labels', None)
+            forward_fn = self.model.forward
+
+        for key, value in kwargs.items():
+            if isinstance(value, torch.Tensor):
+                kwargs[key] = value.repeat(num_adapters,
+                                           *([1] * (value.dim() - 1)))
+
+        with parallel_lora_branches(self.model, adapter_names):
+            outputs = forward_fn(**kwargs)
+        outputs.logits = outputs.logits.view(num_adapters, -1,
+                                             *outputs.logits.shape[1:])
+        if 'labels' in outputs:
+            outputs.labels = outputs.labels.view(num_adapters, -1)
+        return outputs
 
     def generate(self, disable_adapter=False, *args, **kwargs):
         try:
@@ -245,7 +450,16 @@ class AdapterModel(nn.Module):
                    path,
                    state=0,
                    merge_adapter=False,
-                   return_trainable=True):
+                   return_trainable=True,
+                   use_safetensors=False,
+                   save_to=None,
+                   blocking=False):
+        """
+        Save the trainable (adapter) tensors, or the whole model, at
+        ``path``. With ``use_safetensors``, the checkpoint is written as
+        safetensors (in the background unless ``blocking``) and recorded in
+        the round index of ``save_to``, see ``save_checkpoint``.
+        """
         if merge_adapter and isinstance(self.model, PeftModel):
             merged_model = self.model.merge_and_unload()
             ckpt = {'cur_round': state, 'model': merged_model.state_dict()}
@@ -253,7 +467,15 @@ class AdapterModel(nn.Module):
             ckpt = {'cur_round': state, 'model': self.state_dict()}
         else:
             ckpt = {'cur_round': state, 'model': self.model.state_dict()}
-        torch.save(ckpt, path)
+
+        if use_safetensors:
+            save_checkpoint(path,
+                            ckpt['model'],
+                            state,
+                            save_to=save_to,
+                            blocking=blocking)
+        else:
+            torch.save(ckpt, path)
 
     def sharding(self):
         if hasattr(self, 'device_map') is False:
@@ -387,5 +609,5 @@ class LLMDataParallel(nn.DataParallel):
     def load_state_dict(self, state_dict, strict=False):
         return self.model.load_state_dict(state_dict, strict)
 
-    def save_model(self, path, state=0):
-        self.model.save_model(path, state)
+    def save_model(self, path, state=0, **kwargs):
+        self.model.save_model(path, state, **kwargs)
@@ -0,0 +1,243 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+from collections.abc import Mapping
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+from federatedscope.core.auxiliaries.utils import add_prefix_to_path
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointWriter(object):
+    """
+    Write the checkpoints in a background thread, so that the training does
+    not wait for the disk. The tensors are copied to cpu before they are
+    queued (see ``save_checkpoint``), and the checkpoints are written in
+    order.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception as error:
+                logger.error(f'Failed to write the checkpoint: {error}')
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def submit(self, func, *args):
+        self.queue.put((func, args))
+
+    def wait(self):
+        """
+        Block until all the queued checkpoints are written.
+        """
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+_writer = None
+
+
+def get_checkpoint_writer():
+    global _writer
+    if _writer is None:
+        _writer = CheckpointWriter()
+        atexit.register(wait_for_checkpoints)
+    return _writer
+
+
+def wait_for_checkpoints():
+    if _writer is not None:
+        _writer.wait()
+
+
+def get_index_path(save_to):
+    """
+    The round index of the checkpoints of ``save_to`` (i.e., ``save_to``,
+    ``final_`` + ``save_to`` and ``{round}_`` + ``save_to``).
+    """
+    return f'{save_to}.index.json'
+
+
+def _read_index(save_to):
+    index_path = get_index_path(save_to)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def _update_index(save_to, path, cur_round):
+    index = _read_index(save_to) or dict(final=None, best=None, rounds={})
+    # Relative to the directory of `save_to`, which can be moved
+    entry = dict(path=os.path.relpath(path,
+                                      os.path.dirname(save_to) or '.'),
+                 round=cur_round)
+    if path == save_to:
+        index['best'] = entry
+    elif path == add_prefix_to_path('final_', save_to):
+        index['final'] = entry
+    else:
+        index['rounds'][str(cur_round)] = entry
+
+    index_path = get_index_path(save_to)
+    tmp_path = f'{index_path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def _write_checkpoint(path, tensors, cur_round, save_to):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    save_file(tensors, tmp_path, metadata={'cur_round': str(cur_round)})
+    os.replace(tmp_path, path)
+    if save_to is not None:
+        _update_index(save_to, path, cur_round)
+    logger.info(f'Checkpoint of Round {cur_round} saved to {path}.')
+
+
+def save_checkpoint(path,
+                    state_dict,
+                    cur_round=-1,
+                    save_to=None,
+                    blocking=False):
+    """
+    Save ``state_dict`` (e.g., the adapter tensors) as a safetensors file at
+    ``path``, which is written in the background unless ``blocking``. With
+    ``save_to``, the checkpoint is recorded in the round index of
+    ``save_to``, from which ``list_checkpoints`` finds it without probing.
+    """
+    # Snapshot, as the training goes on in the meantime
+    tensors = {
+        key: value.detach().to('cpu', copy=True).contiguous()
+        for key, value in state_dict.items()
+    }
+    if blocking:
+        _write_checkpoint(path, tensors, cur_round, save_to)
+    else:
+        get_checkpoint_writer().submit(_write_checkpoint, path, tensors,
+                                       cur_round, save_to)
+
+
+def list_checkpoints(save_to, save_freq=-1, total_round_num=0):
+    """
+    Return the existing checkpoints of ``save_to``, from the most recent
+    one: ``final_``, then the rounds in descending order, then the best one
+    (``save_to`` itself). They are read from the round index if any,
+    otherwise the possible paths are probed.
+    """
+    index = _read_index(save_to)
+    if index is not None:
+        entries = [index['final']] + [
+            index['rounds'][key]
+            for key in sorted(index['rounds'], key=int, reverse=True)
+        ] + [index['best']]
+        paths = [
+            os.path.join(os.path.dirname(save_to), entry['path'])
+            for entry in entries if entry is not None
+        ]
+    else:
+        num_ckpt = total_round_num // save_freq if save_freq > 0 else 0
+        prefix = ['final_'] + \
+            [str(i * save_freq) + '_' for i in range(num_ckpt, -1, -1)] + \
+            ['']
+        dirname, filename = os.path.split(save_to)
+        paths = [os.path.join(dirname, pre + filename) for pre in prefix]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def find_latest_checkpoint(save_to, save_freq=-1, total_round_num=0):
+    """
+    Return the most recent checkpoint of ``save_to`` (see
+    ``list_checkpoints``), ``None`` if there is not any.
+    """
+    paths = list_checkpoints(save_to, save_freq, total_round_num)
+    return paths[0] if paths else None
+
+
+def is_safetensors_file(path):
+    with open(path, 'rb') as f:
+        header = f.read(9)
+    if len(header) < 9:
+        return False
+    header_size = struct.unpack('<Q', header[:8])[0]
+    return header[8:9] == b'{' and 8 + header_size <= os.path.getsize(path)
+
+
+def _match_adapters(key, adapter_names):
+    return adapter_names is None or \
+        any(name in key.split('.') for name in adapter_names)
+
+
+class LazyStateDict(Mapping):
+    """
+    State dict of a safetensors checkpoint, whose tensors are read from the
+    memory-mapped file only when accessed. With ``adapter_names``, only the
+    tensors of these adapters (e.g., ``Adapter_0`` of a multi-adapter
+    checkpoint) are in the state dict.
+    """
+    def __init__(self, path, adapter_names=None):
+        self.path = path
+        self.handle = safe_open(path, framework='pt', device='cpu')
+        self._keys = [
+            key for key in self.handle.keys()
+            if _match_adapters(key, adapter_names)
+        ]
+        self._key_set = set(self._keys)
+
+    def __getitem__(self, key):
+        if key not in self._key_set:
+            raise KeyError(key)
+        return self.handle.get_tensor(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def metadata(self):
+        return self.handle.metadata() or {}
+
+
+def load_checkpoint(path, adapter_names=None):
+    """
+    Load the checkpoint at ``path`` as ``{'cur_round': ..., 'model': ...}``,
+    whose ``model`` is a ``LazyStateDict`` for safetensors checkpoints, and
+    the state dict in the pickle otherwise. ``adapter_names`` selects the
+    tensors of some adapters only.
+    """
+    if is_safetensors_file(path):
+        state_dict = LazyStateDict(path, adapter_names)
+        cur_round = state_dict.metadata().get('cur_round', None)
+        return dict(cur_round=None if cur_round is None else int(cur_round),
+                    model=state_dict)
+
+    ckpt = torch.load(path, map_location='cpu')
+    if not ('model' in ckpt and 'cur_round' in ckpt):
+        ckpt = dict(cur_round=None, model=ckpt)
+    if adapter_names is not None:
+        ckpt['model'] = {
+            key: value
+            for key, value in ckpt['model'].items()
+            if _match_adapters(key, adapter_names)
+        }
+    return ckpt
@@ -1,6 +1,6 @@
-import os
-
 from federatedscope.llm.model.adapter_builder import AdapterModel
+from federatedscope.llm.model.checkpoint import find_latest_checkpoint, \
+    load_checkpoint
 from federatedscope.core.configs.config import global_cfg
 import torch
 
@@ -17,7 +17,7 @@ def get_model_from_huggingface(model_name, config, **kwargs):
 
     if config.train.is_enable_half:
         kwargs['torch_dtype'] = torch.float32  # Changed: bf16 -> fp32
-        
+
     if config.model.llm_type == 'SequenceClassification':
         from transformers import AutoModelForSequenceClassification
         if len(config.model.llm_kwargs) > 0:
@@ -53,7 +53,7 @@ def get_llm(config, load_from_prev_ckpt=False, **kwargs):
         pretrained_model = get_llm(pretrained_cfg, **kwargs)
         if config.model.load_from_local_pretrained_model_path != '':
             path = config.model.load_from_local_pretrained_model_path
-            ckpt = torch.load(path, map_location='cpu')
+            ckpt = load_checkpoint(path)
             logger.info('Successfully import the pretrained model '
                         f'from the checkpoint {path}. ')
             pretrained_model.load_state_dict(ckpt['model'])
@@ -73,7 +73,8 @@ def get_llm(config, load_from_prev_ckpt=False, **kwargs):
 
     # Resize LLM model based on settings
     tokenizer, num_new_tokens = \
-        get_tokenizer(model_name, config.data.root, config.llm.tok_len)
+        get_tokenizer(model_name, config.data.root, config.llm.tok_len,
+                      use_fast=config.llm.tok_use_fast)
     if model_config.llm_type == 'SequenceClassification':
         model.config.pad_token_id = tokenizer.pad_token_id
     model.resize_token_embeddings(len(tokenizer))
@@ -104,19 +105,13 @@ def get_llm(config, load_from_prev_ckpt=False, **kwargs):
 
     if load_from_prev_ckpt:
         # Here we load from the most recent one
-        num_ckpt = config.federate.total_round_num // config.federate.save_freq
-        prefix = ['final_'] + \
-            [str(i*config.federate.save_freq) + '_'
-             for i in range(num_ckpt, -1, -1)] + ['']
-        dirname, filename = os.path.split(config.federate.save_to)
-        for pre in prefix:
-            ckpt_path = os.path.join(dirname, pre + filename)
-            logger.info(f'Attempt to load from {ckpt_path}')
-            if os.path.exists(ckpt_path):
-                ckpt = torch.load(ckpt_path, map_location='cpu')
-                model.load_state_dict(ckpt['model'])
-                logger.info(f'Model of Round {ckpt["cur_round"]} loads '
-                            f'from the checkpoint {ckpt_path}')
-                break
+        ckpt_path = find_latest_checkpoint(config.federate.save_to,
+                                           config.federate.save_freq,
+                                           config.federate.total_round_num)
+        if ckpt_path is not None:
+            ckpt = load_checkpoint(ckpt_path)
+            model.load_state_dict(ckpt['model'])
+            logger.info(f'Model of Round {ckpt["cur_round"]} loads '
+                        f'from the checkpoint {ckpt_path}')
 
     return model
@@ -1,10 +1,13 @@
 import gc
 import logging
+import os
 
 from federatedscope.core.message import Message
 from federatedscope.core.workers.client import Client
 from federatedscope.core.auxiliaries.utils import b64deserializer
 from federatedscope.core.auxiliaries.trainer_builder import get_trainer
+from federatedscope.llm.offsite_tuning.shard_store import ShardStore, \
+    array_to_bytes, get_missing_shards, load_model_from_shards
 
 logger = logging.getLogger(__name__)
 
@@ -46,26 +49,129 @@ class OffsiteTuningClient(Client):
             gc.collect()
             self.trainer = None
 
+        # The manifest of the emulator and adapter whose shards are being
+        # fetched, and the messages held until the model is built
+        self.manifest = None
+        self.missing_shards = dict()
+        self.deferred_messages = []
+
     def _register_default_handlers(self):
         super(OffsiteTuningClient, self)._register_default_handlers()
         self.register_handlers('emulator_and_adapter',
                                self.callback_funcs_for_emulator_and_adapter,
                                [None])
 
+        self.register_handlers('emulator_shard_chunk',
+                               self.callback_funcs_for_shard_chunk,
+                               ['emulator_shard_request'])
+
     def callback_funcs_for_emulator_and_adapter(self, message: Message):
         if self._cfg.federate.mode == 'standalone' and \
                 self._cfg.federate.share_local_model:
             logger.info(f'Client {self.ID}: `share_local_model` mode '
                         f'enabled, emulator and adapter built from FedRunner.')
+        elif isinstance(message.content, dict):
+            # The manifest of the shards, see `save_model_shards`
+            self.manifest = dict(message.content)
+            self.manifest['skeleton'] = array_to_bytes(
+                self.manifest['skeleton'])
+            missing_shards = get_missing_shards(self.manifest,
+                                                self._get_shard_stores())
+            self.missing_shards = {
+                shard['digest']: shard
+                for shard in missing_shards
+            }
+            if not self.missing_shards:
+                self._build_emulator_and_adapter()
+                return
+
+            logger.info(f'Client {self.ID}: Fetching '
+                        f'{len(self.missing_shards)}/'
+                        f'{len(self.manifest["shards"])} shards of the '
+                        f'emulator and adapter.')
+            store = self._get_shard_stores()[0]
+            for digest in self.missing_shards:
+                # Resume from the bytes received in earlier runs
+                self._request_shard_chunk(digest, store.num_received(digest))
         else:
             logger.info(f'Client {self.ID}: Emulator and adapter received.')
             adapter_model = b64deserializer(message.content, tool='dill')
+            self._set_emulator_and_adapter(adapter_model)
+
+    def callback_funcs_for_shard_chunk(self, message: Message):
+        """
+        The handling function for receiving a chunk of an emulator shard,
+        which requests the next chunk, or builds the model once all the
+        shards are received.
+
+        Arguments:
+            message: The received message
+        """
+        digest, offset = message.content['digest'], message.content['offset']
+        data = array_to_bytes(message.content['data'])
+        shard = self.missing_shards[digest]
+        store = self._get_shard_stores()[0]
+        if not store.write_chunk(digest, offset, data, shard['size']):
+            self._request_shard_chunk(digest, offset + len(data))
+            return
+
+        del self.missing_shards[digest]
+        if not self.missing_shards:
+            self._build_emulator_and_adapter()
+
+    def callback_funcs_for_model_para(self, message: Message):
+        if self.missing_shards:
+            self.deferred_messages.append(message)
+            return
+        return super(OffsiteTuningClient,
+                     self).callback_funcs_for_model_para(message)
+
+    def callback_funcs_for_evaluate(self, message: Message):
+        if self.missing_shards:
+            self.deferred_messages.append(message)
+            return
+        return super(OffsiteTuningClient,
+                     self).callback_funcs_for_evaluate(message)
+
+    def _get_shard_stores(self):
+        """
+        The local store of the client, into which the missing shards are
+        fetched, and the store of the server if it is reachable (e.g., on a
+        shared file system).
+        """
+        transport_cfg = self._cfg.llm.offsite_tuning.shard_transport
+        stores = [ShardStore(transport_cfg.client_root or transport_cfg.root)]
+        if os.path.isdir(self.manifest['root']):
+            stores.append(ShardStore(self.manifest['root'], create=False))
+        return stores
+
+    def _request_shard_chunk(self, digest, offset):
+        self.comm_manager.send(
+            Message(msg_type='emulator_shard_request',
+                    sender=self.ID,
+                    receiver=[self.server_id],
+                    state=self.state,
+                    timestamp=self.cur_timestamp,
+                    content=dict(digest=digest, offset=offset)))
+
+    def _build_emulator_and_adapter(self):
+        logger.info(f'Client {self.ID}: Emulator and adapter loaded from '
+                    f'{len(self.manifest["shards"])} shards.')
+        adapter_model = load_model_from_shards(self.manifest,
+                                               self._get_shard_stores())
+        self._set_emulator_and_adapter(adapter_model)
+
+        deferred_messages, self.deferred_messages = \
+            self.deferred_messages, []
+        for message in deferred_messages:
+            self.msg_handlers[message.msg_type](message)
 
-            # Define new model upon received
-            self._model = adapter_model
-            self.trainer = get_trainer(model=adapter_model,
-                                       data=self.data,
-                                       device=self.device,
-                                       config=self._cfg,
-                                       is_attacker=self.is_attacker,
-                                       monitor=self._monitor)
+    def _set_emulator_and_adapter(self, adapter_model):
+        # Define new model upon received
+        self._model = adapter_model
+        self.trainer = get_trainer(model=adapter_model,
+                                   data=self.data,
+                                   device=self.device,
+                                   config=self._cfg,
+                                   is_attacker=self.is_attacker,
+                                   monitor=self._monitor)
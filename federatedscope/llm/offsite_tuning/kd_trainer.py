@@ -14,11 +14,21 @@ def l2_norm(output_student_float, output_teacher_float):
     return (output_teacher_float - output_student_float).div(std).pow(2).mean()
 
 
-def get_kd_loss(loss_fn, raw_model, adap_model, layerwise_distill=False):
+def get_kd_loss(loss_fn,
+                raw_model,
+                adap_model,
+                layerwise_distill=False,
+                teacher_outputs=None,
+                attention_mask=None):
     """
     This function is borrowed from offsite-tuning:
     https://github.com/mit-han-lab/offsite-tuning/blob/main/offsite_tuning
     /utils.py
+
+    With ``attention_mask``, the loss is computed at the unpadded tokens
+    only. With ``teacher_outputs`` (read from a ``TeacherActivationCache``,
+    which holds the outputs at the unpadded tokens), the teacher is not
+    run, and the loss is the same as with the teacher.
     """
     layerwise_distill = (layerwise_distill
                          and hasattr(adap_model, 'teacher_model_mapping'))
@@ -29,22 +39,36 @@ def get_kd_loss(loss_fn, raw_model, adap_model, layerwise_distill=False):
     args = list(args[1:])
     args = tuple(args)
 
+    if attention_mask is not None:
+        mask = attention_mask.bool()
+
+        def select(output):
+            return output[mask]
+    else:
+
+        def select(output):
+            return output
+
     kd_loss = 0.0
-    with torch.no_grad():
-        raw_model.teacher.eval()
-
-        if layerwise_distill:
-            student_teacher_map = adap_model.teacher_model_mapping
-            teacher_outputs = [0] * len(student_teacher_map)
-
-        for i, teacher_layer in enumerate(raw_model.teacher):
-            output_teacher = teacher_layer(output_teacher, *args, **kwargs)
-            if isinstance(output_teacher, tuple):
-                output_teacher = output_teacher[0]
-            if layerwise_distill and (i in student_teacher_map):
-                # map with the teacher's model and accumulate kd_loss
-                teacher_outputs[student_teacher_map.index(
-                    i)] = output_teacher.float()
+    if teacher_outputs is None:
+        with torch.no_grad():
+            raw_model.teacher.eval()
+
+            if layerwise_distill:
+                student_teacher_map = adap_model.teacher_model_mapping
+                teacher_outputs = [0] * len(student_teacher_map)
+
+            for i, teacher_layer in enumerate(raw_model.teacher):
+                output_teacher = teacher_layer(output_teacher, *args, **kwargs)
+                if isinstance(output_teacher, tuple):
+                    output_teacher = output_teacher[0]
+                if layerwise_distill and (i in student_teacher_map):
+                    # map with the teacher's model and accumulate kd_loss
+                    teacher_outputs[student_teacher_map.index(i)] = select(
+                        output_teacher).float()
+
+            if not layerwise_distill:
+                teacher_outputs = [select(output_teacher).float()]
 
     if layerwise_distill:
         adap_model_training_state = adap_model.student.training
@@ -55,13 +79,14 @@ def get_kd_loss(loss_fn, raw_model, adap_model, layerwise_distill=False):
             output_student = layer(output_student, *args, **kwargs)
             if isinstance(output_student, tuple):
                 output_student = output_student[0]
-            output_student_float = output_student.float()
+            output_student_float = select(output_student).float()
             kd_loss += loss_fn(output_student_float, output_teacher_float)
 
         adap_model.student.train(mode=adap_model_training_state)
     else:
-        output_student_float = adap_model.student_r.cached_output.float()
-        output_teacher_float = output_teacher.float()
+        output_student_float = select(
+            adap_model.student_r.cached_output).float()
+        output_teacher_float = teacher_outputs[-1]
         kd_loss = loss_fn(output_student_float, output_teacher_float)
 
     return kd_loss
@@ -75,10 +100,14 @@ class KDTrainer(LLMTrainer):
                  device,
                  config,
                  only_for_eval=False,
-                 monitor=None):
+                 monitor=None,
+                 teacher_cache=None):
         super(KDTrainer, self).__init__(adapter_model, data, device, config,
                                         only_for_eval, monitor)
-        self.ctx.raw_model = raw_model.to(device)
+        # With the cached teacher outputs, the raw model stays on cpu
+        self.teacher_cache = teacher_cache
+        self.ctx.raw_model = raw_model if teacher_cache is not None else \
+            raw_model.to(device)
         self.lm_loss_weight = \
             config.llm.offsite_tuning.emu_align.train.lm_loss_weight
         self.kd_loss_weight = \
@@ -106,8 +135,17 @@ class KDTrainer(LLMTrainer):
                             attention_mask=attention_mask)
 
         logits = outputs.logits
-        kd_loss = self.kd_loss_weight * get_kd_loss(l2_norm, ctx.raw_model,
-                                                    ctx.model)
+        if self.teacher_cache is not None:
+            teacher_outputs = self.teacher_cache.lookup(
+                input_ids, attention_mask, ctx.device)
+        else:
+            teacher_outputs = None
+        kd_loss = self.kd_loss_weight * get_kd_loss(
+            l2_norm,
+            ctx.raw_model,
+            ctx.model,
+            teacher_outputs=teacher_outputs,
+            attention_mask=attention_mask)
         lm_loss = self.lm_loss_weight * outputs.loss
         loss = kd_loss + lm_loss
 
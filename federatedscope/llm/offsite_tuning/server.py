@@ -8,8 +8,11 @@ from federatedscope.core.monitors.monitor import Monitor
 from federatedscope.core.auxiliaries.trainer_builder import get_trainer
 from federatedscope.core.workers.server import Server
 
+from federatedscope.llm.model.checkpoint import wait_for_checkpoints
 from federatedscope.llm.offsite_tuning.utils import \
     generate_adap_model, align_student_with_teacher
+from federatedscope.llm.offsite_tuning.shard_store import ShardStore, \
+    bytes_to_array, save_model_shards
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +46,8 @@ class OffsiteTuningServer(Server):
                                                         config,
                                                         monitored_object=self))
             if config.llm.offsite_tuning.emu_align.exit_after_align:
+                # `os._exit` skips the exit handlers
+                wait_for_checkpoints()
                 os._exit(0)
         # No need for this attr
         if hasattr(adap_model, 'teacher'):
@@ -66,6 +71,36 @@ class OffsiteTuningServer(Server):
                                                      self._cfg,
                                                      monitored_object=self))
 
+    def _register_default_handlers(self):
+        super(OffsiteTuningServer, self)._register_default_handlers()
+        self.register_handlers('emulator_shard_request',
+                               self.callback_funcs_for_shard_request,
+                               ['emulator_shard_chunk'])
+
+    def callback_funcs_for_shard_request(self, message: Message):
+        """
+        The handling function for the request of a chunk of an emulator
+        shard, which is read from the shard store and sent back.
+
+        Arguments:
+            message: The received message, whose content is the digest of
+                the shard and the offset of the chunk
+        """
+        digest, offset = message.content['digest'], message.content['offset']
+        chunk_size = \
+            self._cfg.llm.offsite_tuning.shard_transport.chunk_size * 1024**2
+        self.comm_manager.send(
+            Message(msg_type='emulator_shard_chunk',
+                    sender=self.ID,
+                    receiver=[message.sender],
+                    state=self.state,
+                    timestamp=self.cur_timestamp,
+                    content=dict(digest=digest,
+                                 offset=offset,
+                                 data=bytes_to_array(
+                                     self.shard_store.read_chunk(
+                                         digest, offset, chunk_size)))))
+
     def trigger_for_feat_engr(self,
                               trigger_train_func,
                               kwargs_for_trigger_train_func={}):
@@ -81,6 +116,23 @@ class OffsiteTuningServer(Server):
                             self.comm_manager.get_neighbors().keys()),
                         timestamp=self.cur_timestamp,
                         content=None))
+        elif self._cfg.llm.offsite_tuning.shard_transport.use:
+            transport_cfg = self._cfg.llm.offsite_tuning.shard_transport
+            self.shard_store = ShardStore(transport_cfg.root)
+            shard_size = transport_cfg.shard_size * 1024**2
+            manifest = save_model_shards(self._model,
+                                         self.shard_store,
+                                         shard_size=shard_size)
+            # The pickled skeleton is not valid UTF-8 for gRPC
+            manifest['skeleton'] = bytes_to_array(manifest['skeleton'])
+
+            self.comm_manager.send(
+                Message(msg_type='emulator_and_adapter',
+                        sender=self.ID,
+                        receiver=list(
+                            self.comm_manager.get_neighbors().keys()),
+                        timestamp=self.cur_timestamp,
+                        content=manifest))
         else:
             emulator_and_adapter = b64serializer(self._model, tool='dill')
 
@@ -0,0 +1,236 @@
+import hashlib
+import io
+import logging
+import os
+from contextlib import ExitStack
+
+import dill
+import numpy as np
+import torch
+import torch.nn as nn
+from safetensors import safe_open
+from safetensors.torch import save as save_safetensors
+
+logger = logging.getLogger(__name__)
+
+SHARD_SUFFIX = '.safetensors'
+
+
+class ShardStore(object):
+    """
+    Content-addressed store of safetensors shards, each of which is named by
+    the sha256 of its bytes. Shards are written (or received) into a
+    temporary file and renamed, so a store can be shared by the processes
+    (e.g., the server and the clients on a shared file system) and across
+    runs, and a shard is never written or fetched twice.
+
+    Arguments:
+        root: directory of the store
+        create: create ``root`` if it does not exist
+    """
+    def __init__(self, root, create=True):
+        self.root = root
+        if create:
+            os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, f'{digest}{SHARD_SUFFIX}')
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """
+        Store the bytes ``data`` of a shard, and return its digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.has(digest):
+            tmp_path = f'{self.path(digest)}.tmp{os.getpid()}'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(digest))
+        return digest
+
+    def read_chunk(self, digest, offset, size):
+        with open(self.path(digest), 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def _part_path(self, digest):
+        return f'{self.path(digest)}.part'
+
+    def num_received(self, digest):
+        """
+        Number of bytes of the shard received so far, from which the
+        transfer resumes.
+        """
+        part_path = self._part_path(digest)
+        return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    def write_chunk(self, digest, offset, data, size):
+        """
+        Write a received chunk of the shard with ``size`` bytes in total, and
+        return whether the shard is complete (and verified).
+        """
+        part_path = self._part_path(digest)
+        with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') \
+                as f:
+            f.seek(offset)
+            f.write(data)
+        if offset + len(data) < size:
+            return False
+
+        sha256 = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 24), b''):
+                sha256.update(block)
+        if sha256.hexdigest() != digest:
+            os.remove(part_path)
+            raise ValueError(f'The received shard {digest} is corrupted.')
+        os.replace(part_path, self.path(digest))
+        return True
+
+
+def bytes_to_array(data):
+    """
+    View the bytes ``data`` (e.g., a chunk of a shard) as an uint8 array to
+    be sent in a message, which is carried in the tensor frame over gRPC,
+    as the string fields of the messages must be valid UTF-8.
+    """
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def array_to_bytes(array):
+    """
+    The bytes of a received ``bytes_to_array`` array, which is a nested
+    list if the tensor frame is not supported by the sender.
+    """
+    return np.asarray(array, dtype=np.uint8).tobytes()
+
+
+class _SkeletonPickler(dill.Pickler):
+    # Tensors of the model are referred to by name, instead of pickled
+    def __init__(self, file, tensor_ids):
+        super(_SkeletonPickler, self).__init__(file)
+        self.tensor_ids = tensor_ids
+
+    def persistent_id(self, obj):
+        if isinstance(obj, torch.Tensor):
+            return self.tensor_ids.get(id(obj), None)
+        return None
+
+
+class _SkeletonUnpickler(dill.Unpickler):
+    def __init__(self, file, load_tensor):
+        super(_SkeletonUnpickler, self).__init__(file)
+        self.load_tensor = load_tensor
+
+    def persistent_load(self, pid):
+        return self.load_tensor(pid)
+
+
+def save_model_shards(model, store, shard_size=512 * 1024**2):
+    """
+    Write the parameters and buffers of ``model`` into safetensors shards of
+    at most ``shard_size`` bytes in ``store``, and return the manifest with
+    which ``load_model_from_shards`` rebuilds the model: the digests of the
+    shards and the skeleton of the model, i.e., the model pickled with its
+    tensors referred to by name.
+
+    The frozen tensors (e.g., the emulator) and the trainable ones (e.g.,
+    the adapter) are sharded apart, so that the shards of the former are
+    unchanged and deduplicated across rounds and runs.
+    """
+    tensors = dict()
+    for name, param in model.named_parameters():
+        tensors[id(param)] = (name, param, param.requires_grad)
+    for name, buffer in model.named_buffers():
+        if id(buffer) not in tensors:
+            # `None` marks a buffer
+            tensors[id(buffer)] = (name, buffer, None)
+
+    shards = []
+
+    def flush(names, data):
+        if names:
+            serialized = save_safetensors(data)
+            shards.append(
+                dict(digest=store.put(serialized),
+                     size=len(serialized),
+                     names=names))
+
+    for trainable in [False, True]:
+        names, data, num_bytes = [], dict(), 0
+        for name, tensor, requires_grad in tensors.values():
+            if bool(requires_grad) != trainable:
+                continue
+            tensor_bytes = tensor.numel() * tensor.element_size()
+            if names and num_bytes + tensor_bytes > shard_size:
+                flush(names, data)
+                names, data, num_bytes = [], dict(), 0
+            names.append(name)
+            data[name] = tensor.detach().cpu().contiguous()
+            num_bytes += tensor_bytes
+        flush(names, data)
+
+    skeleton = io.BytesIO()
+    persistent_ids = {
+        tensor_id: (name, requires_grad)
+        for tensor_id, (name, _, requires_grad) in tensors.items()
+    }
+    _SkeletonPickler(skeleton, persistent_ids).dump(model)
+    logger.info(f'Model saved into {len(shards)} shards '
+                f'({sum(shard["size"] for shard in shards)} bytes) in '
+                f'{store.root}.')
+    return dict(root=os.path.abspath(store.root),
+                skeleton=skeleton.getvalue(),
+                shards=shards)
+
+
+def get_missing_shards(manifest, stores):
+    """
+    Return the shards of ``manifest`` which are in none of ``stores``.
+    """
+    return [
+        shard for shard in manifest['shards']
+        if not any(store.has(shard['digest']) for store in stores)
+    ]
+
+
+def load_model_from_shards(manifest, stores):
+    """
+    Rebuild the model of ``manifest`` (see ``save_model_shards``), whose
+    tensors are read from the memory-mapped shards in ``stores``.
+    """
+    with ExitStack() as stack:
+        files = dict()
+        for shard in manifest['shards']:
+            store = next(
+                (store for store in stores if store.has(shard['digest'])),
+                None)
+            if store is None:
+                raise FileNotFoundError(
+                    f'Shard {shard["digest"]} is not in any of the stores.')
+            f = stack.enter_context(
+                safe_open(store.path(shard['digest']),
+                          framework='pt',
+                          device='cpu'))
+            for name in shard['names']:
+                files[name] = f
+
+        # The references to a shared tensor (e.g., tied weights) resolve to
+        # the same object
+        loaded = dict()
+
+        def load_tensor(pid):
+            pid = tuple(pid)
+            if pid not in loaded:
+                name, requires_grad = pid
+                tensor = files[name].get_tensor(name)
+                if requires_grad is not None:
+                    tensor = nn.Parameter(tensor, requires_grad=requires_grad)
+                loaded[pid] = tensor
+            return loaded[pid]
+
+        return _SkeletonUnpickler(io.BytesIO(manifest['skeleton']),
+                                  load_tensor).load()
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Bump it when the layout of the files changes
+TEACHER_CACHE_VERSION = 1
+
+DIGEST_SIZE = 20
+
+
+class _StopForward(Exception):
+    pass
+
+
+def _stop_forward(x):
+    # Used as the prologue of the emulator, whose inputs are recorded by then
+    raise _StopForward
+
+
+def sample_digest(input_ids):
+    """
+    Id of a sample in the cache: the digest of its (unpadded) tokens, which
+    does not depend on the order or the batching of the dataloader.
+    """
+    return hashlib.sha1(input_ids.cpu().long().numpy().tobytes()).digest()
+
+
+def get_checkpoint_hash(raw_model, adap_model):
+    """
+    Fingerprint of the weights behind the cached activations: the revision
+    and dtype of the pretrained checkpoint, and the trainable (e.g., LoRA)
+    parameters of the adapter, whose layers before the emulator produce the
+    inputs of the teacher.
+    """
+    config = getattr(raw_model.model, 'config', None)
+    digest = hashlib.sha1(
+        json.dumps(dict(name=getattr(config, '_name_or_path', None),
+                        revision=getattr(config, '_commit_hash', None),
+                        dtype=str(next(raw_model.teacher.parameters()).dtype)),
+                   sort_keys=True).encode('utf-8'))
+    pattern = adap_model.trainable_param_name_pattern
+    for name, param in adap_model.adapter.named_parameters():
+        if pattern is None or pattern in name:
+            digest.update(name.encode('utf-8'))
+            digest.update(param.detach().float().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def get_teacher_cache_path(root, **kwargs):
+    """
+    Return the directory of a teacher cache, whose key covers ``kwargs``
+    (e.g., the ``emu_l``/``emu_r`` range, the compression strategy, the
+    checkpoint hash and the alignment data).
+    """
+    key = dict(version=TEACHER_CACHE_VERSION, **kwargs)
+    digest = hashlib.sha1(
+        json.dumps(key, sort_keys=True,
+                   default=str).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(root, 'teacher_cache', digest)
+
+
+def exists_teacher_cache(path):
+    return os.path.exists(os.path.join(path, 'meta.json'))
+
+
+def get_cached_teacher_layers(adap_model, layerwise_distill=False):
+    """
+    Indices (in ``raw_model.teacher``) of the layers whose outputs are
+    distilled: the ones mapped to the emulator layers with
+    ``layerwise_distill``, otherwise the last one.
+    """
+    if layerwise_distill and hasattr(adap_model, 'teacher_model_mapping'):
+        return list(adap_model.teacher_model_mapping)
+    return [-1]
+
+
+def get_teacher_inputs(adap_model, input_ids, attention_mask):
+    """
+    Run the layers before the emulator only, and return the positional and
+    keyword inputs of the emulator, which are the ones of the teacher.
+    """
+    adap_model.student_l.prologue = _stop_forward
+    try:
+        adap_model(input_ids=input_ids,
+                   attention_mask=attention_mask,
+                   use_cache=False)
+        raise RuntimeError('The emulator is not reached in the forward.')
+    except _StopForward:
+        pass
+    finally:
+        adap_model.student_l.prologue = None
+    return adap_model.student_l.input_args, adap_model.student_l.input_kwargs
+
+
+def run_teacher(teacher, args, kwargs, layer_ids):
+    """
+    Run the inputs of the emulator through the teacher layers, and return
+    the outputs of the layers in ``layer_ids`` (in that order).
+    """
+    layer_ids = [idx % len(teacher) for idx in layer_ids]
+    outputs = [None] * len(layer_ids)
+    output = args[0]
+    for i, layer in enumerate(teacher):
+        output = layer(output, *args[1:], **kwargs)
+        if isinstance(output, tuple):
+            output = output[0]
+        if i in layer_ids:
+            outputs[layer_ids.index(i)] = output
+        if i >= max(layer_ids):
+            break
+    return outputs
+
+
+@torch.no_grad()
+def build_teacher_cache(path,
+                        raw_model,
+                        adap_model,
+                        loader,
+                        device,
+                        layerwise_distill=False,
+                        fp16=True):
+    """
+    Precompute the outputs of the teacher layers distilled into the emulator
+    for the samples of ``loader``, and write them into the cache at
+    ``path``. The files are written to a temporary directory first, so that
+    concurrent processes never see a partial cache.
+
+    Layout of the directory ``path``::
+
+        meta.json       number of samples and tokens, hidden size, layers
+        digests.bin     ``sample_digest`` of each sample
+        offsets.bin     where the tokens of each sample start and end
+        layer_XXX.bin   ``[num_tokens, hidden_size]`` outputs of teacher
+                        layer ``XXX`` at the (unpadded) tokens
+    """
+    layer_ids = [
+        idx % len(raw_model.teacher)
+        for idx in get_cached_teacher_layers(adap_model, layerwise_distill)
+    ]
+    dtype = np.float16 if fp16 else np.float32
+
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    os.makedirs(tmp_path, exist_ok=True)
+    files = [
+        open(os.path.join(tmp_path, f'layer_{idx:03d}.bin'), 'wb')
+        for idx in layer_ids
+    ]
+
+    raw_model.teacher.to(device).eval()
+    adap_model_training_state = adap_model.training
+    adap_model.to(device).eval()
+
+    seen, digests, lengths = set(), [], []
+    hidden_size = None
+    for batch in loader:
+        input_ids = batch['input_ids'].to(device)
+        attention_mask = batch['attention_mask'].to(device)
+        args, kwargs = get_teacher_inputs(adap_model, input_ids,
+                                          attention_mask)
+        outputs = run_teacher(raw_model.teacher, args, kwargs, layer_ids)
+        hidden_size = outputs[0].shape[-1]
+
+        for row in range(len(input_ids)):
+            mask = attention_mask[row].bool()
+            digest = sample_digest(input_ids[row][mask])
+            if digest in seen:
+                continue
+            seen.add(digest)
+            digests.append(digest)
+            lengths.append(int(mask.sum().item()))
+            for f, output in zip(files, outputs):
+                f.write(output[row][mask].float().cpu().numpy().astype(
+                    dtype).tobytes())
+
+    for f in files:
+        f.close()
+    raw_model.teacher.cpu()
+    adap_model.train(mode=adap_model_training_state)
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    offsets.tofile(os.path.join(tmp_path, 'offsets.bin'))
+    np.array(digests, dtype=f'S{DIGEST_SIZE}').tofile(
+        os.path.join(tmp_path, 'digests.bin'))
+    meta = dict(num=len(digests),
+                num_tokens=int(offsets[-1]),
+                hidden_size=hidden_size,
+                layers=layer_ids,
+                dtype=np.dtype(dtype).name)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Written by another process in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    logger.info(f'Teacher cache of {meta["num"]} samples '
+                f'({meta["num_tokens"]} tokens, layers {layer_ids}) '
+                f'saved to {path}.')
+
+
+class TeacherActivationCache(object):
+    """
+    Read-only view of a cache written by ``build_teacher_cache``, which
+    replaces the teacher in the emulator alignment. The outputs are read
+    from memory-mapped files, so only the ones of the current batch are in
+    memory.
+
+    Arguments:
+        path: directory of the cache
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        num, num_tokens = self.meta['num'], self.meta['num_tokens']
+
+        digests = np.fromfile(os.path.join(path, 'digests.bin'),
+                              dtype=f'S{DIGEST_SIZE}')
+        self.index = {digest: idx for idx, digest in enumerate(digests)}
+        self.offsets = np.memmap(os.path.join(path, 'offsets.bin'),
+                                 dtype=np.int64,
+                                 mode='r',
+                                 shape=(num + 1, ))
+        self.outputs = [
+            np.memmap(os.path.join(path, f'layer_{idx:03d}.bin'),
+                      dtype=self.meta['dtype'],
+                      mode='r',
+                      shape=(max(num_tokens, 1), self.meta['hidden_size']))
+            for idx in self.layers
+        ]
+
+    @property
+    def layers(self):
+        return self.meta['layers']
+
+    def __len__(self):
+        return self.meta['num']
+
+    def lookup(self, input_ids, attention_mask, device='cpu'):
+        """
+        Return the cached outputs of each layer for the batch, as
+        ``[num_tokens, hidden_size]`` float tensors whose rows are the
+        unpadded tokens of the batch, i.e., aligned with
+        ``hidden_states[attention_mask.bool()]``.
+        """
+        attention_mask = attention_mask.bool()
+        spans = []
+        for ids, mask in zip(input_ids, attention_mask):
+            digest = sample_digest(ids[mask])
+            if digest not in self.index:
+                raise KeyError(f'The sample is not in the teacher cache '
+                               f'{self.path}, which should be rebuilt.')
+            idx = self.index[digest]
+            spans.append((self.offsets[idx], self.offsets[idx + 1]))
+        return [
+            torch.from_numpy(
+                np.concatenate([output[start:end] for start, end in spans
+                                ])).to(device=device, dtype=torch.float32)
+            for output in self.outputs
+        ]
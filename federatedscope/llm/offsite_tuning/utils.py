@@ -8,8 +8,14 @@ import torch.nn as nn
 from transformers import (OPTForCausalLM, GPT2LMHeadModel, BloomForCausalLM,
                           LlamaForCausalLM)
 from federatedscope.llm.model.adapter_builder import AdapterModel
+from federatedscope.llm.model.checkpoint import load_checkpoint
 from federatedscope.llm.offsite_tuning.kd_trainer import KDTrainer
+from federatedscope.llm.offsite_tuning.teacher_cache import \
+    TeacherActivationCache, build_teacher_cache, exists_teacher_cache, \
+    get_checkpoint_hash, get_teacher_cache_path
 from federatedscope.core.auxiliaries.data_builder import get_data
+from federatedscope.core.auxiliaries.dataloader_builder import get_dataloader
+from federatedscope.core.data.wrap_dataset import WrapDataset
 
 logger = logging.getLogger(__name__)
 
@@ -193,12 +199,60 @@ def generate_adap_model(model: AdapterModel, offsite_tuning_cfg):
     return adap_model
 
 
+def get_peak_rss():
+    """
+    Peak resident set size of the process in MB, ``None`` if unknown.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # In KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def clone_module(module):
+    """
+    Deep copy of ``module`` whose parameters and buffers are cloned, i.e.,
+    detached from those of ``module``.
+    """
+    memo = {}
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        new_tensor = tensor.detach().clone()
+        if isinstance(tensor, nn.Parameter):
+            new_tensor = nn.Parameter(new_tensor,
+                                      requires_grad=tensor.requires_grad)
+        memo[id(tensor)] = new_tensor
+    return copy.deepcopy(module, memo)
+
+
+def share_module(module, shared_modules=()):
+    """
+    Copy of the module tree of ``module``, which shares all its parameters
+    and buffers, and the ``shared_modules`` as a whole, by reference. Only
+    the (light) module objects around them are new.
+    """
+    memo = {
+        id(obj): obj
+        for obj in list(module.parameters()) + list(module.buffers()) +
+        list(shared_modules)
+    }
+    return copy.deepcopy(module, memo)
+
+
 def generate_emulator_and_adapter(model: AdapterModel,
                                   strategy='drop_layer',
                                   emulator_l=0,
                                   emulator_r=1000,
                                   emulator_alignment=False,
                                   **kwargs):
+    """
+    Build the emulator and adapter model of ``model``. Only the emulator
+    layers, which are compressed from the teacher (and aligned with it), are
+    materialized; the adapter layers and the rest of the model (e.g., the
+    embeddings and the head) are shared with ``model`` by reference.
+    """
+    peak_rss = get_peak_rss()
     layers = get_layers(model)
     l, r = max(emulator_l, 0), min(emulator_r, len(layers) - 1)
 
@@ -206,6 +260,11 @@ def generate_emulator_and_adapter(model: AdapterModel,
     for module in model.modules():
         module.requires_grad_(False)
 
+    # The layers of `new_model` are replaced below
+    new_model = share_module(model, shared_modules=layers)
+    if hasattr(new_model, 'teacher'):
+        del new_model.teacher
+
     # Set teacher model
     model.teacher = layers[l:r]  # Ref for old model
     model.adapter = layers[:l] + layers[r:]
@@ -220,19 +279,17 @@ def generate_emulator_and_adapter(model: AdapterModel,
         emulator_and_adapter.append(layers[idx])
     emu_l = l
 
-    # Emulator
+    # Emulator, which is detached from the teacher
     for idx in range(len(emulator)):
-        emulator_and_adapter.append(emulator[idx])
+        emulator_and_adapter.append(clone_module(emulator[idx]))
     emu_r = l + len(emulator)
 
     # Adapter after Emulator, make it trainable
     for idx in range(r, len(layers)):
         emulator_and_adapter.append(layers[idx])
 
-    new_model = copy.deepcopy(model)
-    new_emulator_and_adapter = copy.deepcopy(emulator_and_adapter)
     # Set student model
-    new_model = set_layers(new_model, new_emulator_and_adapter, emu_l, emu_r)
+    new_model = set_layers(new_model, emulator_and_adapter, emu_l, emu_r)
     new_model.teacher_model_mapping = emulator_maps
     # make the adapter trainable on clients' models
     convert_layers_train_state(
@@ -245,6 +302,10 @@ def generate_emulator_and_adapter(model: AdapterModel,
     gc.collect()
     torch.cuda.empty_cache()
 
+    if peak_rss is not None:
+        logger.info(f'Peak RSS before/after generating the emulator and '
+                    f'adapter: {peak_rss:.0f}MB/{get_peak_rss():.0f}MB.')
+
     return new_model
 
 
@@ -293,6 +354,44 @@ def build_cfg_for_alignment(config):
     return new_cfg
 
 
+def load_or_build_teacher_cache(raw_model, adap_model, dataset, cfg, device):
+    """
+    Open the teacher cache of the alignment data, which is (re)built when
+    the range of the emulator, the compression, the checkpoint or the data
+    changes. Only the outputs of the last teacher layer are cached, as
+    ``KDTrainer`` distills the emulator from them.
+    """
+    ot_cfg = cfg.llm.offsite_tuning
+    cache_cfg = ot_cfg.emu_align.teacher_cache
+    path = get_teacher_cache_path(
+        cache_cfg.root or ot_cfg.emu_align.data.root,
+        emu_l=ot_cfg.emu_l,
+        emu_r=ot_cfg.emu_r,
+        strategy=ot_cfg.strategy,
+        kwargs=ot_cfg.kwargs[0],
+        teacher_model_mapping=adap_model.teacher_model_mapping,
+        fp16=cache_cfg.fp16,
+        checkpoint=get_checkpoint_hash(raw_model, adap_model),
+        model=cfg.model.type,
+        data=dict(type=ot_cfg.emu_align.data.type,
+                  splits=ot_cfg.emu_align.data.splits,
+                  tok_len=cfg.llm.tok_len,
+                  num=len(dataset)))
+    if not exists_teacher_cache(path):
+        logger.info(f'Precomputing the outputs of the teacher into {path}...')
+        # The order of the samples does not matter
+        loader = get_dataloader(WrapDataset(dataset), cfg, 'test')
+        build_teacher_cache(path,
+                            raw_model,
+                            adap_model,
+                            loader,
+                            device,
+                            fp16=cache_cfg.fp16)
+    else:
+        logger.info(f'Loading the outputs of the teacher from {path}.')
+    return TeacherActivationCache(path)
+
+
 def align_student_with_teacher(raw_model, adap_model, cfg, device, monitor):
     does_train_emulator = True
     if cfg.llm.offsite_tuning.emu_align.restore_from != '':
@@ -304,9 +403,8 @@ def align_student_with_teacher(raw_model, adap_model, cfg, device, monitor):
                     f' {cfg.llm.offsite_tuning.emu_align.restore_from}.')
             else:
                 assert adap_model is not None
-                ckpt = torch.load(
-                    cfg.llm.offsite_tuning.emu_align.restore_from,
-                    map_location='cpu')
+                ckpt = load_checkpoint(
+                    cfg.llm.offsite_tuning.emu_align.restore_from)
                 adap_model.load_state_dict(ckpt['model'], strict=False)
                 logger.info("Restored the adapter and emulator from ckpt")
                 logger.warning(
@@ -339,6 +437,12 @@ def align_student_with_teacher(raw_model, adap_model, cfg, device, monitor):
     data, modified_cfg = get_data(new_cfg.clone())
     new_cfg.merge_from_other_cfg(modified_cfg)
 
+    teacher_cache = None
+    if cfg.llm.offsite_tuning.emu_align.teacher_cache.use:
+        teacher_cache = load_or_build_teacher_cache(raw_model, adap_model,
+                                                    data[1].train_data,
+                                                    new_cfg, device)
+
     # Create `KDTrainer` and train
     kd_trainer = KDTrainer(raw_model,
                            adap_model,
@@ -346,15 +450,19 @@ def align_student_with_teacher(raw_model, adap_model, cfg, device, monitor):
                            device,
                            new_cfg,
                            only_for_eval=False,
-                           monitor=monitor)
+                           monitor=monitor,
+                           teacher_cache=teacher_cache)
     logger.info('Start to align student model with teacher model...')
     kd_trainer.train()
     logger.info('Alignment finished!')
 
     # Save aligned model
-    del adap_model.teacher
+    if hasattr(adap_model, 'teacher'):
+        del adap_model.teacher
     if cfg.llm.offsite_tuning.emu_align.save_to != '':
-        adap_model.save_model(cfg.llm.offsite_tuning.emu_align.save_to)
+        adap_model.save_model(cfg.llm.offsite_tuning.emu_align.save_to,
+                              use_safetensors=cfg.llm.checkpoint.use,
+                              blocking=True)
 
     # Make adapter trainable
     convert_layers_train_state(
@@ -392,7 +500,7 @@ def wrap_offsite_tuning_for_eval(model, config, ckpt_path=None):
     try:
         if ckpt_path is None:
             ckpt_path = config.federate.save_to
-        ckpt = torch.load(ckpt_path, map_location='cpu')
+        ckpt = load_checkpoint(ckpt_path)
         # # Sanity check
         # print('key for the loading model:')
         # print(ckpt['model'].keys())
@@ -402,11 +510,9 @@ def wrap_offsite_tuning_for_eval(model, config, ckpt_path=None):
         # for key, value in ckpt['model'].items():
         #     print(key, torch.equal(value, adap_model_state_dict[key]))
         # exit()
-        if 'model' in ckpt and 'cur_round' in ckpt:
-            adap_model.load_state_dict(ckpt['model'])
+        adap_model.load_state_dict(ckpt['model'])
+        if ckpt['cur_round'] is not None:
             logger.info(f"Load with the model of Round {ckpt['cur_round']}")
-        else:
-            adap_model.load_state_dict(ckpt)
     except Exception as error:
         logger.warning(f"{error}, will use raw model.")
 
@@ -81,8 +81,10 @@ class RewardServer(Server):
 
         # Load the tokenizer of the reward model
         model_name, _ = self._cfg.model.type.split('@')
-        self.tokenizer, _ = get_tokenizer(model_name, self._cfg.data.root,
-                                          self._cfg.llm.tok_len)
+        self.tokenizer, _ = get_tokenizer(model_name,
+                                          self._cfg.data.root,
+                                          self._cfg.llm.tok_len,
+                                          use_fast=self._cfg.llm.tok_use_fast)
         _, save_to = os.path.split(self._cfg.federate.save_to)
         self.save_to_prefix = save_to.replace('.ckpt', '')
 
@@ -96,12 +98,17 @@ class RewardServer(Server):
                                device_map='auto',
                                load_from_prev_ckpt=True)
         logger.info('Successfully load the policy model...')
-        policy_tokenizer, _ = get_tokenizer(policy_model_name,
-                                            policy_config.data.root,
-                                            policy_config.llm.tok_len)
-        self.policy_trainer = RLHF_finetuning(policy_model, policy_tokenizer,
-                                              policy_config, self.model,
-                                              self.tokenizer)
+        policy_tokenizer, _ = get_tokenizer(
+            policy_model_name,
+            policy_config.data.root,
+            policy_config.llm.tok_len,
+            use_fast=policy_config.llm.tok_use_fast)
+        self.policy_trainer = RLHF_finetuning(policy_model,
+                                              policy_tokenizer,
+                                              policy_config,
+                                              self.model,
+                                              self.tokenizer,
+                                              device=self.device)
 
         if self._cfg.llm.fedrlhf.pretrained:
             logger.info(
@@ -67,19 +67,24 @@ if __name__ == '__main__':
     selector_model = get_llm(selector_cfg,
                              load_from_prev_ckpt=True,
                              device_map='auto')
-    selector_tokenizer, _ = get_tokenizer(selector_backbone_name,
-                                          selector_cfg.data.root,
-                                          selector_cfg.llm.tok_len)
+    selector_tokenizer, _ = get_tokenizer(
+        selector_backbone_name,
+        selector_cfg.data.root,
+        selector_cfg.llm.tok_len,
+        use_fast=selector_cfg.llm.tok_use_fast)
 
     # load llm
     model_name, _ = init_cfg.model.type.split('@')
     model = get_llm(init_cfg, device_map='auto')
-    tokenizer, _ = get_tokenizer(model_name, init_cfg.data.root,
-                                 init_cfg.llm.tok_len)
+    tokenizer, _ = get_tokenizer(model_name,
+                                 init_cfg.data.root,
+                                 init_cfg.llm.tok_len,
+                                 use_fast=init_cfg.llm.tok_use_fast)
     generator_tokenizer, _ = get_tokenizer(model_name,
                                            init_cfg.data.root,
                                            init_cfg.llm.tok_len,
-                                           padding_side="left")
+                                           padding_side="left",
+                                           use_fast=init_cfg.llm.tok_use_fast)
 
     # start rlhf training
     gpu_manager = GPUManager(gpu_available=init_cfg.use_gpu,
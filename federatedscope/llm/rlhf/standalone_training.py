@@ -13,17 +13,24 @@ from torch.utils.data import DataLoader
 
 from federatedscope.core.monitors.monitor import Monitor
 from federatedscope.core.data import ClientData
-from federatedscope.llm.dataloader import LLMDataCollator
+from federatedscope.llm.dataloader import LLMDataCollator, LLMRewardCollator
 from federatedscope.llm.dataloader.dataloader import load_jsonl
+from federatedscope.llm.model.adapter_builder import majority_vote
+from federatedscope.llm.misc.generation_engine import \
+    get_generation_engine, generate_by_windows
 from federatedscope.llm.dataset.llm_dataset import (
     DefaultToken,
     LLMDataset,
     LLMComparisonDataset,
 )
+from federatedscope.llm.dataset.artifact_store import (
+    ChunkedArtifactStore,
+    run_chunked_pipeline,
+)
 from federatedscope.llm.trainer.reward_trainer import (
     DPORewardTrainer,
-    _get_batch_logps,
-    dpo_loss,
+    ReferenceLogpCache,
+    dpo_rewards,
 )
 from federatedscope.core.auxiliaries.utils import add_prefix_to_path
 
@@ -31,20 +38,10 @@ logger = logging.getLogger(__name__)
 
 
 @torch.no_grad()
-def cal_acc(logits, labels, choices):
-    shift_logits = logits[..., :-1, :].contiguous()
-    shift_labels = labels[..., 1:].contiguous()
-
-    new_labels = torch.full_like(shift_labels, DefaultToken.IGNORE_INDEX.value)
-    for idx, choice in enumerate(choices):
-        new_labels[shift_labels == choice] = idx
-
-    new_labels = new_labels.view(-1)
-    new_logits = shift_logits[..., choices].view(-1, len(choices))
-    new_logits = new_logits[(new_labels != DefaultToken.IGNORE_INDEX.value), :]
-    # print(new_logits)
-    new_labels = new_labels[(new_labels != DefaultToken.IGNORE_INDEX.value)]
-    _, predicted = new_logits.max(1)
+def cal_acc(outputs):
+    # `outputs` comes from the selector head (`AdapterModel.choice_forward`)
+    new_labels, new_logits = outputs.labels, outputs.logits
+    _, predicted = new_logits.max(-1)
 
     return new_labels, new_logits, predicted, predicted.eq(
         new_labels).sum().item()
@@ -128,74 +125,91 @@ class RLHF_finetuning:
         self.generator_tokenizer = generator_tokenizer
         self.device = device
         self._monitor = Monitor(config, monitored_object=self)
-
-    def load_pairwise_data(self):
-        # Name of a file saving the generated texts of original model
+        # Reference log-probs of DPO, shared by the scoring and the training
+        self.ref_logp_cache = ReferenceLogpCache() \
+            if config.llm.dpo_ref_cache else None
+
+    def _artifact_store(self, path):
+        store = ChunkedArtifactStore(path, self.config.llm.artifact_chunk_size)
+        if not store.is_finished() and os.path.exists(f"{path}.json"):
+            # Convert the JSON file saved by old versions
+            store.write_records(json.load(open(f"{path}.json", "r")))
+            logger.info(f"Converted {path}.json into the store {path}")
+        return store
+
+    def _pairwise_data_store(self):
+        # Name of a store saving the generated texts of original model
         _, model_name = self.config.model.type.split("@")[0].split('/', 1)
         dataset_name, _ = self.config.data.type.split("@")
         num_comp = max(2, self.config.llm.num_completions)
-        gen_fp = os.path.join(
-            self.data_root,
-            f"rlhf_pair_data_{model_name}_{dataset_name}_{num_comp}.json")
+        return self._artifact_store(
+            os.path.join(
+                self.data_root,
+                f"rlhf_pair_data_{model_name}_{dataset_name}_{num_comp}"))
 
-        if os.path.exists(gen_fp):
-            # load the file with generated responses
-            list_pairwise_data = json.load(open(gen_fp, "r"))
+    def _generate_pairwise_chunk(self, list_data_dict):
+        return self._generate_pairwise_data(
+            list_data_dict,
+            self.model,
+            self.generator_tokenizer,
+            self.generation_prompt,
+            max_new_tokens=self.config.llm.max_new_token,
+            num_completions=self.config.llm.num_completions)
+
+    def load_pairwise_data(self):
+        """
+        Return the store of the generated pairs, which are generated (or
+        resumed) chunk by chunk if not finished.
+        """
+        store = self._pairwise_data_store()
+        if store.is_finished():
             logger.info("Successfully loaded the generated text "
-                        f"from {gen_fp}")
+                        f"from {store.path}")
         else:
-            # generate the output
-            logger.info("The generated text file does not exist. "
-                        "Create a new one.")
-            list_pairwise_data = self._generate_pairwise_data(
-                self.list_train_prompts,
-                self.model,
-                self.generator_tokenizer,
-                self.generation_prompt,
-                max_new_tokens=self.config.llm.max_new_token,
-                num_completions=self.config.llm.num_completions)
-
-            # save the data to a file
-            json.dump(list_pairwise_data, open(gen_fp, "w"))
+            logger.info("The generated text is not finished. "
+                        f"Generate the rest into {store.path}.")
+            run_chunked_pipeline(self.list_train_prompts,
+                                 [(store, self._generate_pairwise_chunk)])
             logger.info("The generation process is done, and save "
-                        f"to {gen_fp}.")
-
-        return list_pairwise_data
+                        f"to {store.path}.")
+        return store
 
     def load_selector_preference_data(self, saveto, early_exiting=False):
-        # This file save selector's choices
-        fp = os.path.join(self.data_root, f"generated_choose_{saveto}.json")
-
-        if os.path.exists(fp):
-            list_preference_data = json.load(open(fp, "r"))
-
-        else:
-            list_pairwise_data = self.load_pairwise_data()
-
+        """
+        Return the store of the selector's choices. The missing chunks of
+        the generated pairs and of the choices are produced chunk by chunk,
+        so a restart resumes both stages from the last finished chunk.
+        """
+        # This store saves selector's choices
+        store = self._artifact_store(
+            os.path.join(self.data_root, f"generated_choose_{saveto}"))
+
+        if not store.is_finished():
             # choose the better one based on the given output
-            logger.info("Select the better response.")
-            list_preference_data = self._choose_better_response(
-                list_pairwise_data,
-                self.selector_model,
-                self.selector_tokenizer,
-                self.selector_prompt,
-            )
-            logger.info(list_preference_data[0])
-            # save the choice to a file
-            json.dump(list_preference_data, open(fp, "w"))
-            logger.info(f"Save the selection results to file {fp}")
+            logger.info("Generate the responses and select the better one.")
+            run_chunked_pipeline(
+                self.list_train_prompts,
+                [(self._pairwise_data_store(), self._generate_pairwise_chunk),
+                 (store,
+                  lambda list_pairwise_data: self._choose_better_response(
+                      list_pairwise_data,
+                      self.selector_model,
+                      self.selector_tokenizer,
+                      self.selector_prompt,
+                  ))])
+            logger.info(f"Save the selection results to {store.path}")
 
             if early_exiting:
                 # For choosing the answer
                 exit(0)
 
-        return list_preference_data
+        return store
 
     def train(self, saveto=None, early_exiting=False):
         if saveto is None:
             _, saveto = os.path.split(self.config.federate.save_to)
         # The training data should be selector's preference data
-        list_train_dict = self.load_selector_preference_data(
+        preference_store = self.load_selector_preference_data(
             saveto, early_exiting)
 
         # move selector model to cpu
@@ -203,9 +217,9 @@ class RLHF_finetuning:
         gc.collect()
         torch.cuda.empty_cache()
 
-        # load comparison dataset
-        train_dataset = LLMComparisonDataset(
-            list_train_dict,
+        # load comparison dataset, tokenized chunk by chunk
+        train_dataset = LLMComparisonDataset.from_chunks(
+            preference_store.iter_chunks(),
             self.tokenizer,
             prompt_input=self.generation_prompt,
             prompt_no_input=self.generation_prompt,
@@ -223,6 +237,7 @@ class RLHF_finetuning:
             self.config,
             only_for_eval=False,
             monitor=self._monitor,
+            ref_logp_cache=self.ref_logp_cache,
         )
 
         # start training
@@ -237,13 +252,21 @@ class RLHF_finetuning:
             logger.info(train_log_res)
             # Save the checkpoint
             if (r + 1) % self.config.federate.save_freq == 0:
+                # Only the checkpoints of `save_to` are in its round index
+                save_to = None
                 if saveto in self.config.federate.save_to:
                     path = add_prefix_to_path(f"{r + 1}_",
                                               self.config.federate.save_to)
+                    save_to = self.config.federate.save_to
                 else:
                     path = add_prefix_to_path(f"{r + 1}_{saveto}_",
                                               self.config.federate.save_to)
-                self.model.save_model(path=path, state=r)
+                self.model.save_model(
+                    path=path,
+                    state=r,
+                    use_safetensors=self.config.llm.checkpoint.use,
+                    save_to=save_to,
+                    blocking=not self.config.llm.checkpoint.async_write)
 
     def _generate_pairwise_data(self,
                                 list_data_dict,
@@ -261,30 +284,28 @@ class RLHF_finetuning:
             num_return_sequences=max(2, num_completions),
         )
 
+        engine = None
+        if self.config.llm.generation.continuous_batching:
+            engine = get_generation_engine(
+                model, tokenizer, self.config.llm.generation.max_batch_size,
+                generate_kwargs)
+
         new_list_data_dict = []
-        for input_data in get_input_data(list_data_dict):
+        # More prompts at a time keep the rolling batch of the engine full
+        window = 10 if engine is None else 64
+        for input_data in get_input_data(list_data_dict, window):
             input_texts = [prompt.format_map(data) for data in input_data]
-            input_text_tokens = tokenizer(
-                input_texts,
-                padding=True,
-                add_special_tokens=True,
-                return_tensors="pt",
-            ).to("cuda:0")
-
-            output_ids = model.generate(**input_text_tokens, **generate_kwargs)
-            responses = tokenizer.batch_decode(output_ids,
-                                               skip_special_tokens=True,
-                                               ignore_tokenization_space=True)
-
-            response_map = [[] for _ in input_data]
-            for res in responses:
-                for idx, input_text in enumerate(input_texts):
-                    if input_text in res:
-                        gen_res = res.replace(input_text, "").strip()
-                        response_map[idx].append(gen_res.replace("</s>", ""))
-                        # response_map[idx].append(
-                        #     " " + gen_res.replace("</s>", ""))
-                        break
+            if engine is not None:
+                response_map = engine.generate(
+                    input_texts, generate_kwargs['num_return_sequences'])
+            else:
+                response_map = generate_by_windows(model,
+                                                   tokenizer,
+                                                   input_texts,
+                                                   window=len(input_texts),
+                                                   **generate_kwargs)
+            response_map = [[res.strip() for res in responses]
+                            for responses in response_map]
 
             for i, data in enumerate(input_data):
                 logger.info(data)
@@ -297,6 +318,8 @@ class RLHF_finetuning:
                     new_data["output_B"] = output_B
                     new_list_data_dict.append(new_data)
 
+        if engine is not None:
+            logger.info(f'Generation of the pairwise data: {engine.stats()}')
         return new_list_data_dict
 
     @torch.no_grad()
@@ -331,31 +354,27 @@ class RLHF_finetuning:
                 labels = data_batch["labels"].to("cuda:0")
                 attention_mask = data_batch["attention_mask"].to("cuda:0")
                 outputs = model(input_ids=input_ids,
-                                attention_mask=attention_mask)
-                _, _, predicted, _ = cal_acc(outputs.logits, labels, choices)
+                                attention_mask=attention_mask,
+                                labels=labels,
+                                choices=choices)
+                _, _, predicted, _ = cal_acc(outputs)
                 predicted_indices += predicted.tolist()
         else:
             # More than one adapters (exclude "default" one)
+            model.eval()
             for idx, data_batch in enumerate(tqdm(dataloader)):
                 input_ids = data_batch["input_ids"].to("cuda:0")
                 labels = data_batch["labels"].to("cuda:0")
                 attention_mask = data_batch["attention_mask"].to("cuda:0")
-                collective_choices = []
-                for name in model.adapter_names:
-                    if name == "default":
-                        continue
-                    model.set_active_adapter(name)
-                    model.eval()
-                    outputs = model(input_ids=input_ids,
-                                    attention_mask=attention_mask)
-                    _, _, predicted, _ = cal_acc(outputs.logits, labels,
-                                                 choices)
-                    collective_choices.append(predicted.tolist())
-                array = np.array(collective_choices).T
-                predicted_indices += [
-                    np.bincount(array[i]).argmax().item()
-                    for i in range(len(array))
-                ]
+                outputs = model.multi_adapter_forward(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    labels=labels,
+                    choices=choices)
+                # predicted: [num_adapters, batch_size]
+                _, _, predicted, _ = cal_acc(outputs)
+                predicted_indices += majority_vote(predicted,
+                                                   len(choices)).tolist()
 
         for choice, sample in zip(predicted_indices, list_data_dict):
             sample["choice"] = choice
@@ -379,11 +398,10 @@ class RLHF_finetuning:
 
     @torch.no_grad()
     def _dpo_better_response(self, list_data_dict, model, tokenizer, prompt):
-        for sample in list_data_dict:
-            sample["fake_choice"] = random.choice([0, 1])
-
+        # With the choice of every pair set to 1, no pair is dropped, and the
+        # win and lose sequences are output_B and output_A respectively
         dataset = LLMComparisonDataset(
-            list_data_dict,
+            [dict(sample, fake_choice=1) for sample in list_data_dict],
             tokenizer,
             prompt_input=prompt,
             prompt_no_input=prompt,
@@ -391,74 +409,27 @@ class RLHF_finetuning:
             output_B="output_B",
             choice="fake_choice",
         )
+        dataloader = DataLoader(
+            dataset=dataset,
+            batch_size=self.config.dataloader.batch_size,
+            shuffle=False,
+            collate_fn=LLMRewardCollator(tokenizer=tokenizer),
+        )
 
-        dataloader = DataLoader(dataset)
-
-        predicted_indices = []
-        for idx, data_batch in enumerate(tqdm(dataloader)):
-            win_input_ids = data_batch["win_input_ids"].to("cuda:0")
-            win_labels = data_batch["win_labels"].to("cuda:0")
-            win_attention_mask = data_batch["win_attention_mask"].to("cuda:0")
-            ref_win_outputs = model(
-                disable_adapter=True,
-                input_ids=win_input_ids,
-                labels=win_labels,
-                attention_mask=win_attention_mask,
-            )
-            ref_win_logps = _get_batch_logps(ref_win_outputs.logits,
-                                             win_labels,
-                                             average_log_prob=False)
-            policy_win_outputs = model(
-                disable_adapter=False,
-                input_ids=win_input_ids,
-                labels=win_labels,
-                attention_mask=win_attention_mask,
-            )
-            policy_win_logps = _get_batch_logps(policy_win_outputs.logits,
-                                                win_labels,
-                                                average_log_prob=False)
-
-            lose_input_ids = data_batch["lose_input_ids"].to("cuda:0")
-            lose_labels = data_batch["lose_labels"].to("cuda:0")
-            lose_attention_mask = data_batch["lose_attention_mask"].to(
-                "cuda:0")
-            ref_lose_outputs = model(
-                disable_adapter=True,
-                input_ids=lose_input_ids,
-                labels=lose_labels,
-                attention_mask=lose_attention_mask,
-            )
-            ref_lose_logps = _get_batch_logps(ref_lose_outputs.logits,
-                                              lose_labels,
-                                              average_log_prob=False)
-            policy_lose_outputs = model(
-                disable_adapter=False,
-                input_ids=lose_input_ids,
-                labels=lose_labels,
-                attention_mask=lose_attention_mask,
-            )
-            policy_lose_logps = _get_batch_logps(policy_lose_outputs.logits,
-                                                 lose_labels,
-                                                 average_log_prob=False)
-
-            # DPO for reward calculation
-            _, win_rewards, lose_rewards = dpo_loss(
-                policy_win_logps,
-                policy_lose_logps,
-                ref_win_logps,
-                ref_lose_logps,
-                beta=1.0,
-            )
-
-            predicted = torch.where(
-                win_rewards.cpu() > lose_rewards.cpu(),
-                torch.zeros(len(win_input_ids)),
-                torch.ones(len(win_input_ids)),
-            )
-            predicted_indices += predicted.tolist()
-
-        for choice, sample in zip(predicted_indices, list_data_dict):
-            sample["choice"] = choice
-            sample.pop("fake_choice", None)
+        model.eval()
+        # DPO for reward calculation
+        b_rewards, a_rewards = dpo_rewards(model,
+                                           dataloader,
+                                           self.device,
+                                           beta=1.0,
+                                           ref_logp_cache=self.ref_logp_cache)
+        if self.ref_logp_cache is not None:
+            logger.info(f'Reference log-probs cached for '
+                        f'{len(self.ref_logp_cache)} sequences '
+                        f'({self.ref_logp_cache.hits} hits).')
+
+        for sample, a_reward, b_reward in zip(list_data_dict, a_rewards,
+                                              b_rewards):
+            sample["choice"] = int(b_reward > a_reward)
 
         return list_data_dict
@@ -13,7 +13,7 @@ from torch.utils.data import DataLoader
 
 from federatedscope.core.monitors.monitor import Monitor
 from federatedscope.core.data import ClientData
-from federatedscope.llm.dataloader import LLMDataCollator
+from federatedscope.llm.dataloader import LLMDataCollator, LLMRewardCollator
 from federatedscope.llm.dataloader.dataloader import load_jsonl
 from federatedscope.llm.dataset.llm_dataset import (
     DefaultToken,
@@ -22,8 +22,8 @@ from federatedscope.llm.dataset.llm_dataset import (
 )
 from federatedscope.llm.trainer.reward_trainer import (
     DPORewardTrainer,
-    _get_batch_logps,
-    dpo_loss,
+    ReferenceLogpCache,
+    dpo_rewards,
 )
 from federatedscope.core.auxiliaries.utils import add_prefix_to_path
 
@@ -111,6 +111,9 @@ class RLHF_finetuning:
         self.selector_tokenizer = selector_tokenizer
         self.device = device
         self._monitor = Monitor(config, monitored_object=self)
+        # Reference log-probs of DPO, shared by the scoring and the training
+        self.ref_logp_cache = ReferenceLogpCache() \
+            if config.llm.dpo_ref_cache else None
 
     def train(self, saveto=None):
         if saveto is None:
@@ -197,6 +200,7 @@ class RLHF_finetuning:
             self.config,
             only_for_eval=False,
             monitor=self._monitor,
+            ref_logp_cache=self.ref_logp_cache,
         )
 
         # start training
@@ -211,13 +215,21 @@ class RLHF_finetuning:
             logger.info(train_log_res)
             # Save the checkpoint
             if (r + 1) % self.config.federate.save_freq == 0:
+                # Only the checkpoints of `save_to` are in its round index
+                save_to = None
                 if saveto in self.config.federate.save_to:
                     path = add_prefix_to_path(f"{r + 1}_",
                                               self.config.federate.save_to)
+                    save_to = self.config.federate.save_to
                 else:
                     path = add_prefix_to_path(f"{r + 1}_{saveto}_",
                                               self.config.federate.save_to)
-                self.model.save_model(path=path, state=r)
+                self.model.save_model(
+                    path=path,
+                    state=r,
+                    use_safetensors=self.config.llm.checkpoint.use,
+                    save_to=save_to,
+                    blocking=not self.config.llm.checkpoint.async_write)
 
     def _generate_pairwise_data(self,
                                 list_data_dict,
@@ -359,11 +371,10 @@ class RLHF_finetuning:
 
     @torch.no_grad()
     def _dpo_better_response(self, list_data_dict, model, tokenizer, prompt):
-        for sample in list_data_dict:
-            sample["fake_choice"] = random.choice([0, 1])
-
+        # With the choice of every pair set to 1, no pair is dropped, and the
+        # win and lose sequences are output_B and output_A respectively
         dataset = LLMComparisonDataset(
-            list_data_dict,
+            [dict(sample, fake_choice=1) for sample in list_data_dict],
             tokenizer,
             prompt_input=prompt,
             prompt_no_input=prompt,
@@ -371,74 +382,27 @@ class RLHF_finetuning:
             output_B="output_B",
             choice="fake_choice",
         )
+        dataloader = DataLoader(
+            dataset=dataset,
+            batch_size=self.config.dataloader.batch_size,
+            shuffle=False,
+            collate_fn=LLMRewardCollator(tokenizer=tokenizer),
+        )
 
-        dataloader = DataLoader(dataset)
-
-        predicted_indices = []
-        for idx, data_batch in enumerate(tqdm(dataloader)):
-            win_input_ids = data_batch["win_input_ids"].to("cuda:0")
-            win_labels = data_batch["win_labels"].to("cuda:0")
-            win_attention_mask = data_batch["win_attention_mask"].to("cuda:0")
-            ref_win_outputs = model(
-                disable_adapter=True,
-                input_ids=win_input_ids,
-                labels=win_labels,
-                attention_mask=win_attention_mask,
-            )
-            ref_win_logps = _get_batch_logps(ref_win_outputs.logits,
-                                             win_labels,
-                                             average_log_prob=False)
-            policy_win_outputs = model(
-                disable_adapter=False,
-                input_ids=win_input_ids,
-                labels=win_labels,
-                attention_mask=win_attention_mask,
-            )
-            policy_win_logps = _get_batch_logps(policy_win_outputs.logits,
-                                                win_labels,
-                                                average_log_prob=False)
-
-            lose_input_ids = data_batch["lose_input_ids"].to("cuda:0")
-            lose_labels = data_batch["lose_labels"].to("cuda:0")
-            lose_attention_mask = data_batch["lose_attention_mask"].to(
-                "cuda:0")
-            ref_lose_outputs = model(
-                disable_adapter=True,
-                input_ids=lose_input_ids,
-                labels=lose_labels,
-                attention_mask=lose_attention_mask,
-            )
-            ref_lose_logps = _get_batch_logps(ref_lose_outputs.logits,
-                                              lose_labels,
-                                              average_log_prob=False)
-            policy_lose_outputs = model(
-                disable_adapter=False,
-                input_ids=lose_input_ids,
-                labels=lose_labels,
-                attention_mask=lose_attention_mask,
-            )
-            policy_lose_logps = _get_batch_logps(policy_lose_outputs.logits,
-                                                 lose_labels,
-                                                 average_log_prob=False)
-
-            # DPO for reward calculation
-            _, win_rewards, lose_rewards = dpo_loss(
-                policy_win_logps,
-                policy_lose_logps,
-                ref_win_logps,
-                ref_lose_logps,
-                beta=1.0,
-            )
-
-            predicted = torch.where(
-                win_rewards.cpu() > lose_rewards.cpu(),
-                torch.zeros(len(win_input_ids)),
-                torch.ones(len(win_input_ids)),
-            )
-            predicted_indices += predicted.tolist()
-
-        for choice, sample in zip(predicted_indices, list_data_dict):
-            sample["choice"] = choice
-            sample.pop("fake_choice", None)
+        model.eval()
+        # DPO for reward calculation
+        b_rewards, a_rewards = dpo_rewards(model,
+                                           dataloader,
+                                           self.device,
+                                           beta=1.0,
+                                           ref_logp_cache=self.ref_logp_cache)
+        if self.ref_logp_cache is not None:
+            logger.info(f'Reference log-probs cached for '
+                        f'{len(self.ref_logp_cache)} sequences '
+                        f'({self.ref_logp_cache.hits} hits).')
+
+        for sample, a_reward, b_reward in zip(list_data_dict, a_rewards,
+                                              b_rewards):
+            sample["choice"] = int(b_reward > a_reward)
 
         return list_data_dict
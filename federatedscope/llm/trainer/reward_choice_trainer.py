@@ -10,7 +10,6 @@ from federatedscope.core.trainers.context import CtxVar
 from federatedscope.core.trainers.enums import MODE, LIFECYCLE
 from federatedscope.core.monitors.monitor import Monitor
 from federatedscope.llm.model.adapter_builder import AdapterModel
-from federatedscope.llm.dataset.llm_dataset import DefaultToken
 
 import sys
 
@@ -19,25 +18,6 @@ sys.setrecursionlimit(100000)
 logger = logging.getLogger(__name__)
 
 
-def cal_loss(logits, labels, choices):
-    shift_logits = logits[..., :-1, :].contiguous()
-    shift_labels = labels[..., 1:].contiguous()
-
-    new_labels = torch.full_like(shift_labels, DefaultToken.IGNORE_INDEX.value)
-    for idx, choice in enumerate(choices):
-        new_labels[shift_labels == choice] = idx
-
-    # new_logits = logits * mask.unsqueeze(-1)
-    # new_logits = torch.sum(new_logits, dim=1)[:, choices]
-    # new_labels = torch.sum(new_labels, dim=1)
-
-    new_logits = shift_logits[..., choices]
-    loss_fn = torch.nn.CrossEntropyLoss()
-    loss = loss_fn(new_logits.view(-1, len(choices)), new_labels.view(-1))
-    # return new_logits.view(-1, len(choices)), new_labels.view(-1), loss
-    return new_logits, new_labels, loss
-
-
 class RewardChoiceTrainer(LLMTrainer):
     def __init__(self,
                  model,
@@ -71,7 +51,8 @@ class RewardChoiceTrainer(LLMTrainer):
             attention_mask = ctx.data_batch['attention_mask']
             outputs = ctx.model(input_ids=input_ids,
                                 labels=labels,
-                                attention_mask=attention_mask)
+                                attention_mask=attention_mask,
+                                choices=self.choices)
 
         elif ctx.cfg.llm.deepspeed.use:
             input_ids = ctx.data_batch['input_ids'].to(ctx.device)
@@ -79,7 +60,8 @@ class RewardChoiceTrainer(LLMTrainer):
             attention_mask = ctx.data_batch['attention_mask'].to(ctx.device)
             outputs = ctx.model_engine(input_ids=input_ids,
                                        labels=labels,
-                                       attention_mask=attention_mask)
+                                       attention_mask=attention_mask,
+                                       choices=self.choices)
 
         else:
             input_ids = ctx.data_batch['input_ids'].to(ctx.device)
@@ -87,10 +69,13 @@ class RewardChoiceTrainer(LLMTrainer):
             attention_mask = ctx.data_batch['attention_mask'].to(ctx.device)
             outputs = ctx.model(input_ids=input_ids,
                                 labels=labels,
-                                attention_mask=attention_mask)
+                                attention_mask=attention_mask,
+                                choices=self.choices)
 
-        logits = outputs.logits
-        new_logits, new_labels, loss = cal_loss(logits, labels, self.choices)
+        # The selector head only returns the logits of `self.choices` at
+        # the labelled positions, see `AdapterModel.choice_forward`
+        new_logits, new_labels, loss = \
+            outputs.logits, outputs.labels, outputs.loss
 
         if torch.isnan(loss):
             ctx.skip_this_batch = CtxVar(True, LIFECYCLE.BATCH)
@@ -103,12 +88,6 @@ class RewardChoiceTrainer(LLMTrainer):
         # logger.info(f'{input_ids}')
         # logger.info(f'{labels}')
 
-        new_labels = new_labels.view(-1)
-        new_logits = new_logits.view(-1, len(self.choices))
-        new_logits = new_logits[(
-            new_labels != DefaultToken.IGNORE_INDEX.value), :]
-        new_labels = new_labels[(new_labels !=
-                                 DefaultToken.IGNORE_INDEX.value)]
         _, predicted = new_logits.max(1)
         # logger.info(f'{predicted}, {new_labels}, {new_logits}')
 
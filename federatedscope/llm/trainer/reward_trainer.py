@@ -1,8 +1,10 @@
+import hashlib
 import torch
 import torch.nn.functional as F
 import logging
 import copy
 import numpy as np
+from tqdm import tqdm
 
 from federatedscope.register import register_trainer
 from federatedscope.llm.trainer.trainer import LLMTrainer
@@ -42,21 +44,26 @@ def _get_batch_logps(logits, labels, average_log_prob=False):
     """
     assert logits.shape[:-1] == labels.shape
 
-    labels = labels[:, 1:].clone()
+    labels = labels[:, 1:]
     logits = logits[:, :-1, :]
     loss_mask = (labels != DefaultToken.IGNORE_INDEX.value)
 
-    # dummy token; we'll ignore the losses on these tokens later
-    labels[labels == DefaultToken.IGNORE_INDEX.value] = 0
-
-    per_token_logps = torch.gather(logits.log_softmax(-1),
-                                   dim=2,
-                                   index=labels.unsqueeze(2)).squeeze(2)
+    # Only the logits of the labeled tokens are normalized (by their
+    # logsumexp), so the log-softmax over the whole batch is never
+    # materialized
+    rows = loss_mask.nonzero(as_tuple=True)[0]
+    token_logits = logits[loss_mask].float()
+    token_labels = labels[loss_mask]
+    per_token_logps = token_logits.gather(
+        -1,
+        token_labels.unsqueeze(-1)).squeeze(-1) - token_logits.logsumexp(-1)
+    logps = per_token_logps.new_zeros(len(labels)).index_add(
+        0, rows, per_token_logps)
 
     if average_log_prob:
-        return (per_token_logps * loss_mask).sum(-1) / loss_mask.sum(-1)
+        return logps / loss_mask.sum(-1)
     else:
-        return (per_token_logps * loss_mask).sum(-1)
+        return logps
 
 
 def dpo_loss(policy_chosen_logps,
@@ -111,6 +118,128 @@ def dpo_loss(policy_chosen_logps,
     return losses.mean(), chosen_rewards, rejected_rewards
 
 
+class ReferenceLogpCache(object):
+    """
+    Cache of the log-probs of the sequences under the reference model of
+    DPO, i.e., the base model with the adapters disabled. As the base model
+    is frozen, they are fixed across batches, epochs and rounds, and the
+    reference forward pass only runs for the sequences missing here. A
+    sequence is keyed by the digest of its (unpadded) tokens and labels.
+    """
+    def __init__(self):
+        self._logps = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._logps)
+
+    @staticmethod
+    def get_keys(input_ids, labels, attention_mask):
+        keys = []
+        for ids, lbls, mask in zip(input_ids.cpu(), labels.cpu(),
+                                   attention_mask.cpu().bool()):
+            digest = hashlib.sha1(ids[mask].numpy().tobytes())
+            digest.update(lbls[mask].numpy().tobytes())
+            keys.append(digest.digest())
+        return keys
+
+    def get(self, keys):
+        logps = [self._logps.get(key) for key in keys]
+        num_misses = sum(logp is None for logp in logps)
+        self.misses += num_misses
+        self.hits += len(logps) - num_misses
+        return logps
+
+    def update(self, keys, logps):
+        self._logps.update(zip(keys, logps.tolist()))
+
+
+def concat_comparison_batch(data_batch, device):
+    """
+    Concatenate the win and lose sequences of a batch collated by
+    ``LLMRewardCollator`` (which pads them to the same length), so that
+    both go through the model in a single forward pass.
+    """
+    return tuple(
+        torch.cat([data_batch[f'win_{key}'], data_batch[f'lose_{key}']]).to(
+            device) for key in ['input_ids', 'labels', 'attention_mask'])
+
+
+def get_batch_logps(model,
+                    input_ids,
+                    labels,
+                    attention_mask,
+                    disable_adapter=False):
+    outputs = model(disable_adapter=disable_adapter,
+                    input_ids=input_ids,
+                    attention_mask=attention_mask)
+    return _get_batch_logps(outputs.logits, labels, average_log_prob=False)
+
+
+@torch.no_grad()
+def get_reference_logps(model,
+                        input_ids,
+                        labels,
+                        attention_mask,
+                        ref_logp_cache=None):
+    """
+    Return the log-probs of the sequences under the reference model, which
+    are only computed for the sequences missing in ``ref_logp_cache``.
+    """
+    if ref_logp_cache is None:
+        return get_batch_logps(model,
+                               input_ids,
+                               labels,
+                               attention_mask,
+                               disable_adapter=True)
+
+    keys = ref_logp_cache.get_keys(input_ids, labels, attention_mask)
+    logps = ref_logp_cache.get(keys)
+    missing = [idx for idx, logp in enumerate(logps) if logp is None]
+    if len(missing) > 0:
+        index = torch.tensor(missing, device=input_ids.device)
+        missing_logps = get_batch_logps(model,
+                                        input_ids[index],
+                                        labels[index],
+                                        attention_mask[index],
+                                        disable_adapter=True)
+        ref_logp_cache.update([keys[idx] for idx in missing], missing_logps)
+        for idx, logp in zip(missing, missing_logps.tolist()):
+            logps[idx] = logp
+    return torch.tensor(logps, device=input_ids.device)
+
+
+@torch.no_grad()
+def dpo_rewards(model, dataloader, device, beta=1.0, ref_logp_cache=None):
+    """
+    Score the pairs of a ``LLMComparisonDataset`` by the implicit reward of
+    DPO, with one fused forward pass of the win and lose sequences for the
+    policy model, and one for the reference model (skipped for the
+    sequences in ``ref_logp_cache``).
+
+    Returns:
+        The lists of the rewards of the win and lose sequences.
+    """
+    win_rewards, lose_rewards = [], []
+    for data_batch in tqdm(dataloader):
+        input_ids, labels, attention_mask = concat_comparison_batch(
+            data_batch, device)
+        num = len(input_ids) // 2
+        ref_logps = get_reference_logps(model, input_ids, labels,
+                                        attention_mask, ref_logp_cache)
+        policy_logps = get_batch_logps(model, input_ids, labels,
+                                       attention_mask)
+        _, win, lose = dpo_loss(policy_logps[:num],
+                                policy_logps[num:],
+                                ref_logps[:num],
+                                ref_logps[num:],
+                                beta=beta)
+        win_rewards += win.tolist()
+        lose_rewards += lose.tolist()
+    return win_rewards, lose_rewards
+
+
 class DPORewardTrainer(LLMTrainer):
     def __init__(self,
                  model,
@@ -118,9 +247,15 @@ class DPORewardTrainer(LLMTrainer):
                  device,
                  config,
                  only_for_eval=False,
-                 monitor=None):
+                 monitor=None,
+                 ref_logp_cache=None):
         super().__init__(model, data, device, config, only_for_eval, monitor)
         self.reward_coeff = config.llm.reward_coeff
+        # The cache can be shared with the scoring of the pairs (e.g., in
+        # RLHF)
+        if ref_logp_cache is None and config.llm.dpo_ref_cache:
+            ref_logp_cache = ReferenceLogpCache()
+        self.ref_logp_cache = ref_logp_cache
 
     def _hook_on_fit_start_init(self, ctx):
         super()._hook_on_fit_start_init(ctx)
@@ -128,81 +263,30 @@ class DPORewardTrainer(LLMTrainer):
         ctx.ys_pred = CtxVar([], LIFECYCLE.ROUTINE)
 
     def _hook_on_batch_forward(self, ctx):
-        if ctx.cfg.llm.accelerator.use:
-            win_input_ids = ctx.data_batch['win_input_ids'].to(ctx.device)
-            win_labels = ctx.data_batch['win_labels'].to(ctx.device)
-            win_attention_mask = ctx.data_batch['win_attention_mask'].to(
-                ctx.device)
-            lose_input_ids = ctx.data_batch['lose_input_ids'].to(ctx.device)
-            lose_labels = ctx.data_batch['lose_labels'].to(ctx.device)
-            lose_attention_mask = ctx.data_batch['lose_attention_mask'].to(
-                ctx.device)
-
-            with torch.no_grad():
-                ref_win_logps, ref_lose_logps = \
-                    self._batch_forward(ctx, win_input_ids, win_labels,
-                                        win_attention_mask, lose_input_ids,
-                                        lose_labels, lose_attention_mask,
-                                        disable_adapter=True)
-
-            adap_win_logps, adap_lose_logps = \
-                self._batch_forward(ctx, win_input_ids, win_labels,
-                                    win_attention_mask, lose_input_ids,
-                                    lose_labels, lose_attention_mask,
-                                    disable_adapter=False)
-
-        elif ctx.cfg.llm.deepspeed.use:
-            win_input_ids = ctx.data_batch['win_input_ids'].to(ctx.device)
-            win_labels = ctx.data_batch['win_labels'].to(ctx.device)
-            win_attention_mask = ctx.data_batch['win_attention_mask'].to(
-                ctx.device)
-            lose_input_ids = ctx.data_batch['lose_input_ids'].to(ctx.device)
-            lose_labels = ctx.data_batch['lose_labels'].to(ctx.device)
-            lose_attention_mask = ctx.data_batch['lose_attention_mask'].to(
-                ctx.device)
-
-            with torch.no_grad():
-                ref_win_logps, ref_lose_logps = \
-                    self._batch_forward_deepspeed(
-                        ctx, win_input_ids, win_labels, win_attention_mask,
-                        lose_input_ids, lose_labels, lose_attention_mask,
-                        disable_adapter=True)
-
-            adap_win_logps, adap_lose_logps = \
-                self._batch_forward_deepspeed(
-                    ctx, win_input_ids, win_labels, win_attention_mask,
-                    lose_input_ids, lose_labels, lose_attention_mask,
-                    disable_adapter=False)
-
+        if ctx.cfg.llm.deepspeed.use:
+            model = ctx.model_engine
         else:
-            win_input_ids = ctx.data_batch['win_input_ids'].to(ctx.device)
-            win_labels = ctx.data_batch['win_labels'].to(ctx.device)
-            win_attention_mask = ctx.data_batch['win_attention_mask'].to(
-                ctx.device)
-            lose_input_ids = ctx.data_batch['lose_input_ids'].to(ctx.device)
-            lose_labels = ctx.data_batch['lose_labels'].to(ctx.device)
-            lose_attention_mask = ctx.data_batch['lose_attention_mask'].to(
-                ctx.device)
-
-            with torch.no_grad():
-                ref_win_logps, ref_lose_logps = \
-                    self._batch_forward(ctx, win_input_ids, win_labels,
-                                        win_attention_mask, lose_input_ids,
-                                        lose_labels, lose_attention_mask,
-                                        disable_adapter=True)
+            model = ctx.model
+
+        # The win and lose sequences go through the model together
+        input_ids, labels, attention_mask = concat_comparison_batch(
+            ctx.data_batch, ctx.device)
+        num = len(input_ids) // 2
 
-            adap_win_logps, adap_lose_logps = \
-                self._batch_forward(ctx, win_input_ids, win_labels,
-                                    win_attention_mask, lose_input_ids,
-                                    lose_labels, lose_attention_mask,
-                                    disable_adapter=False)
+        ref_logps = get_reference_logps(model, input_ids, labels,
+                                        attention_mask, self.ref_logp_cache)
+        adap_logps = get_batch_logps(model,
+                                     input_ids,
+                                     labels,
+                                     attention_mask,
+                                     disable_adapter=False)
 
         # loss follows using Equation (7) of Direct Preference Optimization:
         # Your Language Model is Secretly a Reward Model
-        loss, win_rewards, lose_rewards = dpo_loss(adap_win_logps,
-                                                   adap_lose_logps,
-                                                   ref_win_logps,
-                                                   ref_lose_logps,
+        loss, win_rewards, lose_rewards = dpo_loss(adap_logps[:num],
+                                                   adap_logps[num:],
+                                                   ref_logps[:num],
+                                                   ref_logps[num:],
                                                    beta=self.reward_coeff)
 
         if torch.isnan(loss):
@@ -213,68 +297,13 @@ class DPORewardTrainer(LLMTrainer):
         else:
             ctx.skip_this_batch = CtxVar(False, LIFECYCLE.BATCH)
 
-        ctx.y_true = CtxVar(torch.zeros(len(win_input_ids)), LIFECYCLE.BATCH)
+        ctx.y_true = CtxVar(torch.zeros(num), LIFECYCLE.BATCH)
         ctx.y_pred = CtxVar(
             torch.where(win_rewards.cpu() > lose_rewards.cpu(),
-                        torch.zeros(len(win_input_ids)),
-                        torch.ones(len(win_input_ids))), LIFECYCLE.BATCH)
+                        torch.zeros(num), torch.ones(num)), LIFECYCLE.BATCH)
 
         ctx.loss_batch = CtxVar(loss, LIFECYCLE.BATCH)
-        ctx.batch_size = CtxVar(len(win_input_ids), LIFECYCLE.BATCH)
-
-    def _batch_forward(self,
-                       ctx,
-                       win_input_ids,
-                       win_labels,
-                       win_attention_mask,
-                       lose_input_ids,
-                       lose_labels,
-                       lose_attention_mask,
-                       disable_adapter=False):
-        win_outputs = ctx.model(disable_adapter=disable_adapter,
-                                input_ids=win_input_ids,
-                                labels=win_labels,
-                                attention_mask=win_attention_mask)
-        win_logps = _get_batch_logps(win_outputs.logits,
-                                     win_labels,
-                                     average_log_prob=False)
-
-        lose_outputs = ctx.model(disable_adapter=disable_adapter,
-                                 input_ids=lose_input_ids,
-                                 labels=lose_labels,
-                                 attention_mask=lose_attention_mask)
-        lose_logps = _get_batch_logps(lose_outputs.logits,
-                                      lose_labels,
-                                      average_log_prob=False)
-
-        return win_logps, lose_logps
-
-    def _batch_forward_deepspeed(self,
-                                 ctx,
-                                 win_input_ids,
-                                 win_labels,
-                                 win_attention_mask,
-                                 lose_input_ids,
-                                 lose_labels,
-                                 lose_attention_mask,
-                                 disable_adapter=False):
-        win_outputs = ctx.model_engine(disable_adapter=disable_adapter,
-                                       input_ids=win_input_ids,
-                                       labels=win_labels,
-                                       attention_mask=win_attention_mask)
-        win_logps = _get_batch_logps(win_outputs.logits,
-                                     win_labels,
-                                     average_log_prob=False)
-
-        lose_outputs = ctx.model_engine(disable_adapter=disable_adapter,
-                                        input_ids=lose_input_ids,
-                                        labels=lose_labels,
-                                        attention_mask=lose_attention_mask)
-        lose_logps = _get_batch_logps(lose_outputs.logits,
-                                      lose_labels,
-                                      average_log_prob=False)
-
-        return win_logps, lose_logps
+        ctx.batch_size = CtxVar(num, LIFECYCLE.BATCH)
 
     def _hook_on_batch_backward(self, ctx):
         if ctx.skip_this_batch:
@@ -56,17 +56,23 @@ class LLMTrainer(GeneralTorchTrainer):
 
         super().__init__(model, data, device, config, only_for_eval, monitor)
         model_name, _ = config.model.type.split('@')
-        self.tokenizer, _ = get_tokenizer(model_name, config.data.root,
-                                          config.llm.tok_len)
+        self.tokenizer, _ = get_tokenizer(model_name,
+                                          config.data.root,
+                                          config.llm.tok_len,
+                                          use_fast=config.llm.tok_use_fast)
         self.eval_metrics = config.eval.metrics
 
     def register_default_hooks_train(self):
         super().register_default_hooks_train()
+        self.register_hook_in_train(self._hook_on_batch_forward_padding_count,
+                                    "on_batch_forward")
         self.register_hook_in_train(self._hook_on_fit_end_free_space,
                                     "on_fit_end")
 
     def register_default_hooks_ft(self):
         super().register_default_hooks_ft()
+        self.register_hook_in_ft(self._hook_on_batch_forward_padding_count,
+                                 "on_batch_forward")
         self.register_hook_in_ft(self._hook_on_fit_end_free_space,
                                  "on_fit_end")
 
@@ -402,6 +408,30 @@ class LLMTrainer(GeneralTorchTrainer):
         ctx.monitor.total_flops += ctx.monitor.flops_per_sample * \
             ctx.batch_size
 
+    def _hook_on_batch_forward_padding_count(self, ctx):
+        """
+        The monitoring hook to count the padding tokens in the batches, \
+        whose ratio is reduced by ``cfg.dataloader.max_tokens``
+
+        Note:
+          The modified attributes and according operations are shown below:
+            ==================================  ===========================
+            Attribute                           Operation
+            ==================================  ===========================
+            ``ctx.monitor``                     Track padding tokens
+            ==================================  ===========================
+        """
+        if not isinstance(ctx.monitor, Monitor):
+            return
+
+        masks = [
+            value for key, value in ctx.data_batch.items()
+            if key.endswith('attention_mask')
+        ]
+        ctx.monitor.track_padding(
+            sum(int(mask.sum().item()) for mask in masks),
+            sum(mask.numel() for mask in masks))
+
 
 def call_llm_trainer(trainer_type):
     if trainer_type == 'llmtrainer':
@@ -19,7 +19,6 @@ minimal_requires = [
     'wandb',
     'tensorboard',
     'tensorboardX',
-    'pympler',
     'protobuf==3.20.3',
     'matplotlib',
 ]
@@ -0,0 +1,198 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import random
+import unittest
+from types import SimpleNamespace
+
+import torch
+from torch.utils.data import TensorDataset
+
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.llm.llm_local.client import LLMMultiLoRAClient, \
+    successive_halving
+
+
+class ToyModel(object):
+    def __init__(self):
+        self.active_adapter = None
+
+    def set_active_adapter(self, name):
+        self.active_adapter = int(name.split('_')[-1])
+
+    def eval(self):
+        pass
+
+
+class ToyTrainer(object):
+    """
+    Trainer whose val loss of each sample is ``sample_losses[adapter][idx]``
+    for the active adapter, evaluated on ``ctx.val_loader``.
+    """
+    def __init__(self, model, val_data, sample_losses):
+        self.model = model
+        self.sample_losses = sample_losses
+        self.ctx = SimpleNamespace(val_loader=[val_data.tensors],
+                                   num_val_data=len(val_data))
+        # The indices of the samples of each evaluation
+        self.evaluated = []
+
+    def evaluate(self, target_data_split_name='test'):
+        assert target_data_split_name == 'val'
+        indices = torch.cat([batch[0]
+                             for batch in self.ctx.val_loader]).tolist()
+        assert len(indices) == self.ctx.num_val_data
+        self.evaluated.append((self.model.active_adapter, indices))
+        total_loss = sum(self.sample_losses[self.model.active_adapter][idx]
+                         for idx in indices)
+        return {
+            'val_loss': total_loss,
+            'val_total': len(indices),
+            'val_avg_loss': total_loss / len(indices)
+        }
+
+
+class SuccessiveHalvingTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        random.seed(0)
+
+    def build_evaluate(self, sample_losses):
+        def evaluate(arm, start, end):
+            return sum(sample_losses[arm][start:end]), end - start
+
+        return evaluate
+
+    def test_ranking(self):
+        means = [1.0, 0.5, 0.55, 2.0, 1.5]
+        sample_losses = [[mean + random.gauss(0, 0.05) for _ in range(200)]
+                         for mean in means]
+        losses, num_evaluated = successive_halving(
+            self.build_evaluate(sample_losses),
+            num_arms=len(means),
+            num_samples=200,
+            init_samples=16,
+            eta=2)
+
+        # The same ranking as the exact one, with much fewer samples
+        self.assertEqual(sorted(losses, key=losses.get), [1, 2, 0, 4, 3])
+        self.assertEqual(list(losses), [1, 2, 0, 4, 3])
+        # 5 arms x 16 + 3 arms x 32 + 2 arms x 64
+        self.assertEqual(num_evaluated, 304)
+        self.assertLess(num_evaluated, len(means) * 200)
+        # The best arm is evaluated on all the samples it has seen
+        self.assertAlmostEqual(losses[1], sum(sample_losses[1][:112]) / 112)
+
+    def test_consistent_losses(self):
+        # Arm 2 is dropped after the first samples, on which its loss is
+        # lower than those of the other arms on all the samples
+        sample_losses = [[1.0] * 4 + [3.0] * 8, [1.5] * 4 + [3.0] * 8,
+                         [2.0] * 12]
+        losses, num_evaluated = successive_halving(
+            self.build_evaluate(sample_losses),
+            num_arms=3,
+            num_samples=12,
+            init_samples=4,
+            eta=2)
+        self.assertEqual(list(losses), [0, 1, 2])
+        self.assertAlmostEqual(losses[0], 28 / 12)
+        self.assertAlmostEqual(losses[1], 30 / 12)
+        # Raised from 2.0 to keep the ranking
+        self.assertAlmostEqual(losses[2], 30 / 12)
+        self.assertEqual(num_evaluated, 3 * 4 + 2 * 8)
+
+    def test_single_rung(self):
+        # With fewer samples than a rung, all the arms see all the samples
+        sample_losses = [[0.5] * 10, [0.25] * 10, [0.25] * 10]
+        losses, num_evaluated = successive_halving(
+            self.build_evaluate(sample_losses),
+            num_arms=3,
+            num_samples=10,
+            init_samples=16)
+        self.assertEqual(losses, {1: 0.25, 2: 0.25, 0: 0.5})
+        self.assertEqual(num_evaluated, 30)
+
+
+class AdapterLossesTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        random.seed(0)
+        means = [1.0, 0.5, 0.55, 2.0, 1.5]
+        self.sample_losses = [[
+            mean + random.gauss(0, 0.05) for _ in range(200)
+        ] for mean in means]
+
+        cfg = global_cfg.clone()
+        cfg.dataloader.batch_size = 7
+        cfg.llm.adapter.count = len(means)
+        cfg.llm.adapter.adaptive_eval.init_samples = 16
+        # The client is not built, so that no data or model is needed
+        self.client = LLMMultiLoRAClient.__new__(LLMMultiLoRAClient)
+        self.client._cfg = cfg
+        self.client.ID, self.client.state = 1, 3
+        self.client.data = SimpleNamespace(
+            val_data=TensorDataset(torch.arange(200)))
+        self.client.model = ToyModel()
+        self.client.trainer = ToyTrainer(self.client.model,
+                                         self.client.data.val_data,
+                                         self.sample_losses)
+
+    def test_exact(self):
+        val_loader = self.client.trainer.ctx.val_loader
+        losses = self.client._get_adapter_losses()
+        # The same as evaluating each adapter on the whole val split
+        for adapter_idx, sample_losses in enumerate(self.sample_losses):
+            self.client.model.set_active_adapter(f'Adapter_{adapter_idx}')
+            self.assertAlmostEqual(
+                losses[adapter_idx],
+                self.client.trainer.evaluate('val')['val_avg_loss'])
+            self.assertAlmostEqual(losses[adapter_idx],
+                                   sum(sample_losses) / 200)
+        self.assertIs(self.client.trainer.ctx.val_loader, val_loader)
+
+    def test_adaptive(self):
+        self.client._cfg.llm.adapter.adaptive_eval.use = True
+        ctx = self.client.trainer.ctx
+        val_loader = ctx.val_loader
+        losses = self.client._get_adapter_losses()
+        self.assertEqual(list(losses), [1, 2, 0, 4, 3])
+        # The val loader is restored after the evaluations on the rungs
+        self.assertIs(ctx.val_loader, val_loader)
+        self.assertEqual(ctx.num_val_data, 200)
+
+        # The rungs of all the adapters are drawn from the same random
+        # permutation of the val samples
+        rungs = dict()
+        for adapter_idx, indices in self.client.trainer.evaluated:
+            rungs.setdefault(adapter_idx, []).append(indices)
+        self.assertEqual([len(indices) for indices in rungs[1]], [16, 32, 64])
+        for adapter_idx in [0, 2, 3, 4]:
+            self.assertEqual(rungs[adapter_idx],
+                             rungs[1][:len(rungs[adapter_idx])])
+        seen = sum(rungs[1], [])
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertNotEqual(seen, list(range(len(seen))))
+        self.assertAlmostEqual(
+            losses[1],
+            sum(self.sample_losses[1][idx] for idx in seen) / len(seen))
+
+        # The same permutation in the same round
+        self.client.trainer.evaluated = []
+        self.client._get_adapter_losses()
+        self.assertEqual(self.client.trainer.evaluated[0][1], rungs[0][0])
+
+    def test_restore_on_error(self):
+        self.client._cfg.llm.adapter.adaptive_eval.use = True
+        ctx = self.client.trainer.ctx
+        val_loader = ctx.val_loader
+
+        def evaluate(target_data_split_name='test'):
+            raise RuntimeError('Out of memory')
+
+        self.client.trainer.evaluate = evaluate
+        with self.assertRaises(RuntimeError):
+            self.client._get_adapter_losses()
+        self.assertIs(ctx.val_loader, val_loader)
+        self.assertEqual(ctx.num_val_data, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
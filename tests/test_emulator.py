@@ -0,0 +1,86 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import copy
+import unittest
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from federatedscope.llm.model.adapter_builder import AdapterModel
+from federatedscope.llm.offsite_tuning.utils import \
+    generate_emulator_and_adapter
+
+VOCAB_SIZE = 50
+
+
+def build_model():
+    config = GPT2Config(vocab_size=VOCAB_SIZE,
+                        n_positions=32,
+                        n_embd=16,
+                        n_layer=6,
+                        n_head=2)
+    return AdapterModel(GPT2LMHeadModel(config).eval(),
+                        use_adapter=True,
+                        adapter_package='peft',
+                        adapter_method='lora',
+                        r=4,
+                        target_modules=['c_attn'])
+
+
+def data_ptrs(module):
+    return {param.data_ptr() for param in module.parameters()}
+
+
+class EmulatorTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.input_ids = torch.randint(VOCAB_SIZE, (2, 10))
+
+    def generate(self, model, **kwargs):
+        return generate_emulator_and_adapter(model,
+                                             emulator_l=1,
+                                             emulator_r=5,
+                                             drop_ratio=0.5,
+                                             **kwargs)
+
+    def reference_logits(self, model, layer_ids):
+        # A copy of the raw model with the layers of the emulator and adapter
+        reference = copy.deepcopy(model)
+        h = reference.model.get_base_model().transformer.h
+        h._modules = torch.nn.ModuleList([h[idx]
+                                          for idx in layer_ids])._modules
+        reference.model.get_base_model().config.n_layer = len(layer_ids)
+        # The blocks keep their `layer_idx` in the raw model, so the cache
+        # (indexed by the renumbered layers) is not used
+        return reference(input_ids=self.input_ids, use_cache=False).logits
+
+    def test_shared_layers(self):
+        model = build_model()
+        raw_logits = model(input_ids=self.input_ids).logits
+        adap_model = self.generate(model)
+
+        # Layers 1, 2, 3, 4 are the teacher, and 1, 4 the emulator
+        self.assertEqual(adap_model.teacher_model_mapping, [0, 3])
+        self.assertFalse(hasattr(adap_model, 'teacher'))
+        for layer, raw_layer in zip(adap_model.adapter, model.adapter):
+            self.assertIs(layer, raw_layer)
+        self.assertFalse(data_ptrs(adap_model.student) & data_ptrs(model))
+        self.assertIs(adap_model.get_input_embeddings().weight,
+                      model.get_input_embeddings().weight)
+
+        with torch.no_grad():
+            logits = adap_model(input_ids=self.input_ids).logits
+            self.assertTrue(
+                torch.allclose(logits,
+                               self.reference_logits(model, [0, 1, 4, 5])))
+
+            # The raw model is intact, and detached from the emulator
+            for param in adap_model.student.parameters():
+                param.add_(1.)
+            self.assertTrue(
+                torch.equal(
+                    model(input_ids=self.input_ids).logits, raw_logits))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import torch
+
+from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.aggregators.flat_buffer import \
+    benchmark_flat_aggregation, flat_weighted_sum
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.llm.llm_local.aggregator import MultiLoRAAvgAggregator
+
+
+def random_state_dict(keys):
+    return {
+        key: torch.randn(4, 3)
+        if key != 'bias' else torch.randn(3).to(torch.bfloat16)
+        for key in keys
+    }
+
+
+class FlatAggregationTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.cfg = global_cfg.clone()
+
+    def test_flat_weighted_sum(self):
+        key_sets = [['a', 'bias'], ['a', 'b'], ['a', 'bias'], ['a', 'b']]
+        state_dicts = [random_state_dict(keys) for keys in key_sets]
+        weights = [1., 2., 3., 4.]
+        layouts = dict()
+        for max_block_bytes in [1, 2**20]:
+            avg_model, totals = flat_weighted_sum(
+                state_dicts,
+                weights,
+                layouts=layouts,
+                max_block_bytes=max_block_bytes)
+            self.assertEqual(totals, {'a': 1.0, 'bias': 1.0, 'b': 1.0})
+            for key, holders in [('a', [0, 1, 2, 3]), ('bias', [0, 2]),
+                                 ('b', [1, 3])]:
+                expected = sum(weights[i] * state_dicts[i][key].float()
+                               for i in holders) / sum(weights[i]
+                                                       for i in holders)
+                self.assertEqual(avg_model[key].dtype,
+                                 state_dicts[holders[0]][key].dtype)
+                self.assertTrue(
+                    torch.allclose(avg_model[key].float(),
+                                   expected,
+                                   atol=1e-2 if key == 'bias' else 1e-6))
+        self.assertEqual(len(layouts), 1)
+
+        _, totals = flat_weighted_sum(state_dicts, weights, normalize=False)
+        self.assertEqual(totals, {'a': 10.0, 'bias': 4.0, 'b': 6.0})
+
+    def test_clients_avg(self):
+        aggregator = ClientsAvgAggregator(config=self.cfg)
+        models = [(size, random_state_dict(['a', 'b']))
+                  for size in [10, 30, 60]]
+        expected = {
+            key: sum(size * model[key] for size, model in models) / 100
+            for key in ['a', 'b']
+        }
+        avg_model = aggregator.aggregate({'client_feedback': models})
+        for key in expected:
+            self.assertTrue(torch.allclose(avg_model[key], expected[key]))
+
+    def test_multi_lora_on_model(self):
+        model = torch.nn.Linear(3, 4)
+        aggregator = MultiLoRAAvgAggregator(model=model, config=self.cfg)
+        models = [(10, {
+            'weight': torch.randn(4, 3)
+        }), (30, {
+            'weight': torch.randn(4, 3),
+            'bias': torch.randn(4)
+        })]
+        aggregator.total_train_size = 80
+        avg_model = aggregator.aggregate_on_model({'client_feedback': models})
+        raw = model.state_dict()
+        self.assertTrue(
+            torch.allclose(avg_model['weight'],
+                           (10 * models[0][1]['weight'] +
+                            30 * models[1][1]['weight'] + 40 * raw['weight']) /
+                           80))
+        self.assertTrue(
+            torch.allclose(avg_model['bias'],
+                           (30 * models[1][1]['bias'] + 50 * raw['bias']) /
+                           80))
+
+    def test_benchmark(self):
+        results = benchmark_flat_aggregation(num_clients=[4],
+                                             num_keys=8,
+                                             repeat=1)
+        self.assertEqual(results[0]['num_clients'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
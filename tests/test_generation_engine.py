@@ -0,0 +1,181 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import random
+import unittest
+
+import torch
+
+from federatedscope.llm.misc.generation_engine import \
+    ContinuousBatchingEngine, benchmark_generation, generate_by_windows
+
+WORDS = ['post', 'summary', 'the', 'cat', 'dog', 'is', 'good', 'bad', '\n']
+
+
+def build_tokenizer():
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, \
+        trainers
+    from transformers import PreTrainedTokenizerFast
+
+    random.seed(0)
+    corpus = [
+        ' '.join(random.choice(WORDS) for _ in range(30)) for _ in range(100)
+    ]
+    tokenizer = Tokenizer(models.BPE(unk_token='<unk>'))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=280,
+        special_tokens=['<unk>', '<s>', '</s>', '<pad>'],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(corpus, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer,
+                                   bos_token='<s>',
+                                   eos_token='</s>',
+                                   pad_token='<pad>',
+                                   unk_token='<unk>',
+                                   padding_side='left')
+
+
+def build_model(tokenizer):
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(0)
+    # Eager attention, as the sdpa masks of some versions of transformers
+    # overflow in double precision
+    config = GPT2Config(vocab_size=len(tokenizer),
+                        n_positions=256,
+                        n_embd=32,
+                        n_layer=2,
+                        n_head=2,
+                        bos_token_id=tokenizer.bos_token_id,
+                        eos_token_id=tokenizer.eos_token_id,
+                        pad_token_id=tokenizer.pad_token_id,
+                        attn_implementation='eager')
+    # Double precision to keep the greedy decoding free of ties
+    return GPT2LMHeadModel(config).double().eval()
+
+
+class GenerationEngineTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        self.tokenizer = build_tokenizer()
+        self.model = build_model(self.tokenizer)
+        random.seed(1)
+        self.prompts = [
+            ' '.join(random.choices(WORDS, k=random.randint(1, 30)))
+            for _ in range(12)
+        ]
+
+    @torch.no_grad()
+    def reference(self, prompt, max_new_tokens, eos_token_id):
+        # Greedy decoding by argmax over the full forward at each step, which
+        # is independent of `model.generate` (and the transformers version)
+        input_ids = self.tokenizer(prompt)['input_ids']
+        output_ids = []
+        for _ in range(max_new_tokens):
+            sequence = torch.tensor([input_ids + output_ids])
+            logits = self.model(input_ids=sequence, use_cache=False).logits
+            output_ids.append(int(logits[0, -1].argmax()))
+            if output_ids[-1] == eos_token_id:
+                break
+        return output_ids
+
+    def test_greedy(self):
+        max_new_tokens = [random.randint(1, 20) for _ in self.prompts]
+        # A token generated by the first prompt, which ends some sequences
+        eos_token_id = self.reference(self.prompts[0], 20, None)[3]
+
+        engine = ContinuousBatchingEngine(self.model,
+                                          self.tokenizer,
+                                          max_batch_size=5,
+                                          eos_token_id=eos_token_id)
+        request_ids = [
+            engine.add_request(prompt, max_new_tokens=num)
+            for prompt, num in zip(self.prompts, max_new_tokens)
+        ]
+        results = engine.run()
+        for prompt, num, request_id in zip(self.prompts, max_new_tokens,
+                                           request_ids):
+            self.assertEqual(results[request_id],
+                             [self.reference(prompt, num, eos_token_id)])
+        self.assertTrue(
+            any(result[0][-1] == eos_token_id for result in results.values()))
+
+        stats = engine.stats()
+        self.assertEqual(stats['generated_tokens'],
+                         sum(len(result[0]) for result in results.values()))
+        self.assertLessEqual(stats['avg_batch_size'], 5)
+        self.assertFalse(engine.has_unfinished())
+
+    def test_generation_config(self):
+        # The defaults of the engine are read from the generation config
+        eos_token_id = self.reference(self.prompts[0], 20, None)[3]
+        self.model.generation_config.eos_token_id = [eos_token_id]
+        self.model.generation_config.max_new_tokens = 6
+        engine = ContinuousBatchingEngine(self.model,
+                                          self.tokenizer,
+                                          max_batch_size=5)
+        self.assertEqual(engine.max_new_tokens, 6)
+        self.assertFalse(engine.do_sample)
+
+        request_ids = [engine.add_request(prompt) for prompt in self.prompts]
+        results = engine.run()
+        for prompt, request_id in zip(self.prompts, request_ids):
+            self.assertEqual(results[request_id],
+                             [self.reference(prompt, 6, eos_token_id)])
+
+    def test_sampling(self):
+        engine = ContinuousBatchingEngine(self.model,
+                                          self.tokenizer,
+                                          max_batch_size=20,
+                                          max_new_tokens=10,
+                                          do_sample=True,
+                                          temperature=0.7,
+                                          top_p=0.9)
+        completions = engine.generate(self.prompts[:5], num_return_sequences=4)
+        self.assertEqual([len(completion) for completion in completions],
+                         [4] * 5)
+        # Each prompt is encoded once for all its return sequences admitted
+        # together
+        self.assertEqual(
+            engine.stats()['prompt_tokens'],
+            sum(
+                len(self.tokenizer(prompt)['input_ids'])
+                for prompt in self.prompts[:5]))
+
+    def test_generate_by_windows(self):
+        completions = generate_by_windows(
+            self.model,
+            self.tokenizer,
+            self.prompts,
+            window=5,
+            max_new_tokens=8,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id)
+        self.assertEqual([len(completion) for completion in completions],
+                         [1] * len(self.prompts))
+
+        engine = ContinuousBatchingEngine(self.model,
+                                          self.tokenizer,
+                                          max_batch_size=5,
+                                          max_new_tokens=8)
+        eos_token_id = self.tokenizer.eos_token_id
+        expected = [[
+            self.tokenizer.decode(self.reference(prompt, 8, eos_token_id),
+                                  skip_special_tokens=True)
+        ] for prompt in self.prompts]
+        self.assertEqual(engine.generate(self.prompts), expected)
+
+        results = benchmark_generation(self.model,
+                                       self.tokenizer,
+                                       self.prompts,
+                                       window=5,
+                                       max_batch_size=5,
+                                       max_new_tokens=8,
+                                       num_return_sequences=2,
+                                       do_sample=True)
+        for name in ['window', 'continuous']:
+            self.assertGreater(results[name]['tokens_per_sec'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
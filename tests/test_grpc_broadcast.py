@@ -0,0 +1,99 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import queue
+import time
+import unittest
+
+import torch
+
+from federatedscope.core.communication import gRPCCommManager
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.message import Message
+
+
+class SlowQueue(queue.Queue):
+    """
+    Message queue of a receiver which takes ``delay`` seconds to accept a
+    message.
+    """
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def put(self, item, block=True, timeout=None):
+        time.sleep(self.delay)
+        super().put(item, block, timeout)
+
+
+class LatencyRecorder(object):
+    def __init__(self):
+        self.latencies = dict()
+
+    def track_send_latency(self, receiver, latency):
+        self.latencies.setdefault(receiver, []).append(latency)
+
+
+class BroadcastTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        self.cfg = global_cfg.clone().distribute
+        self.cfg.grpc_send_retries = 1
+
+    def build(self, base_port, num_clients):
+        server = gRPCCommManager(host='127.0.0.1',
+                                 port=str(base_port),
+                                 client_num=num_clients,
+                                 cfg=self.cfg,
+                                 monitor=LatencyRecorder())
+        clients = []
+        for idx in range(1, num_clients + 1):
+            clients.append(
+                gRPCCommManager(host='127.0.0.1',
+                                port=str(base_port + idx),
+                                client_num=1,
+                                cfg=self.cfg))
+            server.add_neighbors(idx, f'127.0.0.1:{base_port + idx}')
+        return server, clients
+
+    def broadcast(self, server, num_clients):
+        server.send(
+            Message(msg_type='model_para',
+                    sender=0,
+                    receiver=list(range(1, num_clients + 1)),
+                    content={'weight': torch.ones(3)}))
+
+    def test_concurrent(self):
+        server, clients = self.build(50111, 4)
+        for client in clients:
+            client.server_funcs.msg_queue = SlowQueue(0.5)
+
+        start = time.time()
+        self.broadcast(server, 4)
+        # The receivers are served concurrently rather than one by one
+        self.assertLess(time.time() - start, 1.5)
+        for client in clients:
+            self.assertEqual(client.receive().msg_type, 'model_para')
+        self.assertEqual(set(server.monitor.latencies), {1, 2, 3, 4})
+        for latencies in server.monitor.latencies.values():
+            self.assertGreaterEqual(latencies[0], 0.5)
+
+        for comm_manager in [server] + clients:
+            comm_manager.close()
+
+    def test_timeout(self):
+        self.cfg.grpc_send_timeout = 0.3
+        server, clients = self.build(50121, 2)
+        clients[1].server_funcs.msg_queue = SlowQueue(1.)
+
+        self.broadcast(server, 2)
+        # The slow receiver does not hold back the other one, and its
+        # failed sends are not tracked
+        self.assertEqual(set(server.monitor.latencies), {1})
+        self.assertLess(server.monitor.latencies[1][0], 0.3)
+        clients[0].receive()
+
+        for comm_manager in [server] + clients:
+            comm_manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import time
+import unittest
+
+import torch
+
+from federatedscope.core.communication import gRPCCommManager, \
+    benchmark_grpc_comm
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.message import Message
+
+
+class ChannelPoolTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+
+    def test_channel_pool(self):
+        cfg = global_cfg.clone().distribute
+        server = gRPCCommManager(host='127.0.0.1',
+                                 port='50091',
+                                 client_num=2,
+                                 cfg=cfg)
+        clients = [
+            gRPCCommManager(host='127.0.0.1',
+                            port=str(50092 + idx),
+                            client_num=1,
+                            cfg=cfg) for idx in range(2)
+        ]
+        for idx in range(2):
+            server.add_neighbors(idx + 1, f'127.0.0.1:{50092 + idx}')
+
+        channels = None
+        for state in range(3):
+            server.send(
+                Message(msg_type='model_para',
+                        sender=0,
+                        receiver=[1, 2],
+                        state=state,
+                        content={'weight': torch.ones(3)}))
+            for client in clients:
+                self.assertEqual(client.receive().state, state)
+            # A channel for each neighbor, reused across the messages
+            if channels is None:
+                channels = {
+                    address: channel
+                    for address, (_, channel) in server.channels.items()
+                }
+            self.assertEqual(len(server.channels), 2)
+            for address, (_, channel) in server.channels.items():
+                self.assertIs(channel, channels[address])
+
+        # The receive blocks until the timeout
+        start = time.time()
+        with self.assertRaises(TimeoutError):
+            server.receive(timeout=0.2)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+        for comm_manager in [server] + clients:
+            comm_manager.close()
+        self.assertEqual(len(server.channels), 0)
+
+    def test_benchmark(self):
+        results = benchmark_grpc_comm(num_clients=4,
+                                      num_rounds=3,
+                                      idle_time=0.5,
+                                      base_port=50095)
+        self.assertGreater(results['pooled_msgs_per_sec'], 0)
+        self.assertGreater(results['unpooled_msgs_per_sec'], 0)
+        # No spinning when idle
+        self.assertLess(results['idle_cpu_per_sec'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import shutil
+import tempfile
+import unittest
+
+import torch
+
+from federatedscope.core.auxiliaries.utils import add_prefix_to_path
+from federatedscope.llm.model.checkpoint import LazyStateDict, \
+    find_latest_checkpoint, get_index_path, list_checkpoints, \
+    load_checkpoint, save_checkpoint, wait_for_checkpoints
+
+
+def adapter_state_dict(value):
+    return {
+        f'base_model.h.{i}.attn.lora_A.{name}.weight': torch.full((4, 8),
+                                                                  value + i)
+        for i in range(2) for name in ['Adapter_0', 'Adapter_1']
+    }
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        self.root = tempfile.mkdtemp()
+        self.save_to = os.path.join(self.root, 'model.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_async_save_and_load(self):
+        state_dict = adapter_state_dict(1.)
+        save_checkpoint(self.save_to, state_dict, cur_round=3)
+        # The snapshot is saved, not the tensors updated in the meantime
+        for value in state_dict.values():
+            value.add_(1.)
+        wait_for_checkpoints()
+
+        ckpt = load_checkpoint(self.save_to)
+        self.assertEqual(ckpt['cur_round'], 3)
+        self.assertIsInstance(ckpt['model'], LazyStateDict)
+        self.assertEqual(set(ckpt['model']), set(state_dict))
+        for key, value in adapter_state_dict(1.).items():
+            self.assertTrue(torch.equal(ckpt['model'][key], value))
+
+        # The tensors of a single adapter
+        ckpt = load_checkpoint(self.save_to, adapter_names=['Adapter_1'])
+        self.assertEqual(len(ckpt['model']), 2)
+        self.assertTrue(all('Adapter_1' in key for key in ckpt['model']))
+
+    def test_round_index(self):
+        for cur_round in [2, 4, 6]:
+            save_checkpoint(add_prefix_to_path(f'{cur_round}_', self.save_to),
+                            adapter_state_dict(cur_round),
+                            cur_round,
+                            save_to=self.save_to)
+        save_checkpoint(self.save_to,
+                        adapter_state_dict(4.),
+                        4,
+                        save_to=self.save_to)
+        wait_for_checkpoints()
+        self.assertTrue(os.path.exists(get_index_path(self.save_to)))
+        # Probing would not find the checkpoints without the right save_freq
+        self.assertEqual(list_checkpoints(self.save_to), [
+            add_prefix_to_path(f'{cur_round}_', self.save_to)
+            for cur_round in [6, 4, 2]
+        ] + [self.save_to])
+
+        final_path = add_prefix_to_path('final_', self.save_to)
+        save_checkpoint(final_path,
+                        adapter_state_dict(7.),
+                        7,
+                        save_to=self.save_to,
+                        blocking=True)
+        self.assertEqual(find_latest_checkpoint(self.save_to), final_path)
+
+    def test_legacy_checkpoint(self):
+        state_dict = adapter_state_dict(1.)
+        path = add_prefix_to_path('final_', self.save_to)
+        torch.save({'cur_round': 5, 'model': state_dict}, path)
+        self.assertEqual(
+            find_latest_checkpoint(self.save_to,
+                                   save_freq=1,
+                                   total_round_num=5), path)
+        ckpt = load_checkpoint(path)
+        self.assertEqual(ckpt['cur_round'], 5)
+        self.assertEqual(set(ckpt['model']), set(state_dict))
+
+        # A raw state dict
+        torch.save(state_dict, self.save_to)
+        ckpt = load_checkpoint(self.save_to, adapter_names=['Adapter_0'])
+        self.assertIsNone(ckpt['cur_round'])
+        self.assertEqual(len(ckpt['model']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
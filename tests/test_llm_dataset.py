@@ -0,0 +1,319 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from federatedscope.llm.dataloader import LLMDataCollator
+from federatedscope.llm.dataloader.sampler import TokenBudgetBatchSampler, \
+    get_sequence_lengths
+from federatedscope.llm.dataset.llm_dataset import LLMDataset, \
+    LLMComparisonDataset, check_preprocess, preprocess_batched
+from federatedscope.llm.dataset.token_store import get_token_store_path, \
+    load_or_build_token_stores
+from federatedscope.llm.dataset.artifact_store import \
+    ChunkedArtifactStore, run_chunked_pipeline
+
+WORDS = [
+    'post', 'summary', 'the', 'cat', 'dog', 'A', 'B', ':', '###', 'SUMMARY',
+    'CHOICE', '\n', 'a', 'is', 'good', 'bad', 'TITLE', 'r/', 'POST'
+]
+
+
+def build_tokenizer(pre_tokenizer='byte_level', model_max_length=512):
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, \
+        processors, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    random.seed(0)
+    corpus = [
+        ' '.join(random.choice(WORDS) for _ in range(30)) for _ in range(200)
+    ]
+    tokenizer = Tokenizer(models.BPE(unk_token='<unk>'))
+    if pre_tokenizer == 'byte_level':
+        tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(
+            add_prefix_space=False)
+        tokenizer.decoder = decoders.ByteLevel()
+        alphabet = pre_tokenizers.ByteLevel.alphabet()
+    else:
+        # SentencePiece-like
+        tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+        tokenizer.decoder = decoders.Metaspace()
+        alphabet = []
+    trainer = trainers.BpeTrainer(
+        vocab_size=300,
+        special_tokens=['<unk>', '<s>', '</s>', '<pad>'],
+        initial_alphabet=alphabet)
+    tokenizer.train_from_iterator(corpus, trainer)
+    tokenizer.post_processor = processors.TemplateProcessing(single='<s> $A',
+                                                             special_tokens=[
+                                                                 ('<s>', 1)
+                                                             ])
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer,
+                                   bos_token='<s>',
+                                   eos_token='</s>',
+                                   pad_token='<pad>',
+                                   unk_token='<unk>',
+                                   model_max_length=model_max_length)
+
+
+def random_text(min_len, max_len):
+    return ' '.join(random.choices(WORDS, k=random.randint(min_len, max_len)))
+
+
+class LLMDatasetTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        random.seed(1)
+        # Targets either start with a space or merge with the end of the
+        # source (e.g., ':' + ':' or '\n' + '\n')
+        self.list_data_dict = [{
+            'instruction': random_text(1, 60),
+            'input': random.choice(['', random_text(1, 10)]),
+            'output': random.choice(['', ' ', ':', '\n']) + random_text(0, 20),
+            'output_B': ' ' + random_text(1, 20),
+            'choice': random.choice([0, 1]),
+        } for _ in range(300)]
+
+    def test_preprocess(self):
+        for pre_tokenizer in ['byte_level', 'metaspace']:
+            for model_max_length in [512, 32]:
+                tokenizer = build_tokenizer(pre_tokenizer, model_max_length)
+                sources = [
+                    data['instruction'] + data['input']
+                    for data in self.list_data_dict
+                ]
+                targets = [
+                    data['output'] + tokenizer.eos_token
+                    for data in self.list_data_dict
+                ]
+                self.assertEqual(check_preprocess(sources, targets, tokenizer),
+                                 [])
+
+                # Identical with more workers than chunks
+                data_dict = preprocess_batched(sources,
+                                               targets,
+                                               tokenizer,
+                                               num_workers=4)
+                reference = preprocess_batched(sources,
+                                               targets,
+                                               tokenizer,
+                                               num_workers=1)
+                for key in ['input_ids', 'labels']:
+                    self.assertTrue(
+                        all(
+                            torch.equal(x, y)
+                            for x, y in zip(data_dict[key], reference[key])))
+
+    def test_comparison_dataset(self):
+        tokenizer = build_tokenizer()
+        dataset = LLMComparisonDataset(
+            [dict(data) for data in self.list_data_dict],
+            tokenizer,
+            output_A='output')
+        list_data_dict = [
+            dict(data) for data in self.list_data_dict
+            if int(data['choice']) == 1
+        ]
+        for output_tag, subset in [('output_B', dataset.win_dataset),
+                                   ('output', dataset.lose_dataset)]:
+            reference = LLMDataset(list_data_dict,
+                                   tokenizer,
+                                   output_tag=output_tag)
+            self.assertEqual(len(subset), len(reference))
+            for idx in range(len(reference)):
+                self.assertTrue(
+                    torch.equal(subset[idx]['input_ids'],
+                                reference[idx]['input_ids']))
+                self.assertTrue(
+                    torch.equal(subset[idx]['labels'],
+                                reference[idx]['labels']))
+
+    def test_token_store(self):
+        tokenizer = build_tokenizer(model_max_length=32)
+        data_root = tempfile.mkdtemp()
+        try:
+            paths = [
+                get_token_store_path(data_root, name, tokenizer, num_clients=3)
+                for name in ['llm', 'comparison']
+            ]
+            self.assertNotEqual(
+                paths[0],
+                get_token_store_path(data_root,
+                                     'llm',
+                                     tokenizer,
+                                     num_clients=4))
+
+            def build_datasets():
+                return (LLMDataset(self.list_data_dict, tokenizer),
+                        LLMComparisonDataset(
+                            [dict(data) for data in self.list_data_dict],
+                            tokenizer,
+                            output_A='output'))
+
+            references = build_datasets()
+            for _ in range(2):
+                # Built and saved first, then loaded from the store
+                datasets = load_or_build_token_stores(paths, build_datasets,
+                                                      tokenizer)
+                for dataset, reference in [
+                    (datasets[0], references[0]),
+                    (datasets[1].win_dataset, references[1].win_dataset),
+                    (datasets[1].lose_dataset, references[1].lose_dataset)
+                ]:
+                    self.assertEqual(len(dataset.input_ids),
+                                     len(reference.input_ids))
+                    for idx in range(len(reference.input_ids)):
+                        self.assertTrue(
+                            torch.equal(dataset[idx]['input_ids'],
+                                        reference[idx]['input_ids']))
+                        self.assertTrue(
+                            torch.equal(dataset[idx]['labels'],
+                                        reference[idx]['labels']))
+                        self.assertEqual(dataset[idx]['categories'],
+                                         reference[idx]['categories'])
+
+                self.assertEqual(
+                    get_sequence_lengths(datasets[0])[0].tolist(),
+                    get_sequence_lengths(references[0])[0].tolist())
+
+                # Shrink the dataset by slicing
+                dataset = datasets[0]
+                dataset.input_ids = dataset.input_ids[:10]
+                self.assertEqual(len(dataset), 10)
+                self.assertTrue(
+                    torch.equal(dataset[9]['input_ids'],
+                                references[0][9]['input_ids']))
+        finally:
+            shutil.rmtree(data_root)
+
+    def test_token_budget_sampler(self):
+        tokenizer = build_tokenizer()
+        dataset = Subset(LLMDataset(self.list_data_dict, tokenizer),
+                         list(range(0, 300, 2)))
+        lengths, rows_per_sample = get_sequence_lengths(dataset)
+        self.assertEqual(rows_per_sample, 1)
+        self.assertEqual(lengths.tolist(),
+                         [len(sample['input_ids']) for sample in dataset])
+
+        max_tokens = 256
+        sampler = TokenBudgetBatchSampler(lengths,
+                                          max_tokens,
+                                          bucket_size=32,
+                                          seed=0)
+        loader = DataLoader(dataset,
+                            batch_sampler=sampler,
+                            collate_fn=LLMDataCollator(tokenizer=tokenizer))
+        epochs = []
+        for _ in range(2):
+            num_tokens, num_padded_tokens, indices = 0, 0, []
+            for batch_indices in sampler:
+                batch = loader.collate_fn([dataset[i] for i in batch_indices])
+                mask = batch['attention_mask']
+                self.assertTrue(mask.numel() <= max_tokens or len(mask) == 1)
+                num_tokens += mask.sum().item()
+                num_padded_tokens += mask.numel()
+                indices += batch_indices
+            self.assertEqual(sorted(indices), list(range(len(dataset))))
+            self.assertEqual(len(loader), len(sampler))
+            self.assertEqual(len(list(loader)), len(sampler))
+            epochs.append(indices)
+            # Padded at most to the longest sample of the bucket
+            self.assertGreaterEqual(num_tokens / num_padded_tokens,
+                                    sampler.padding_efficiency() - 1e-6)
+            self.assertGreater(sampler.padding_efficiency(), 0.8)
+        self.assertNotEqual(epochs[0], epochs[1])
+
+        # The win/lose pairs are padded together
+        dataset = LLMComparisonDataset(
+            [dict(data) for data in self.list_data_dict],
+            tokenizer,
+            output_A='output')
+        lengths, rows_per_sample = get_sequence_lengths(dataset)
+        self.assertEqual(rows_per_sample, 2)
+        self.assertEqual(lengths.tolist(), [
+            max(len(sample['win_data']['input_ids']),
+                len(sample['lose_data']['input_ids'])) for sample in dataset
+        ])
+
+    def test_artifact_store(self):
+        tokenizer = build_tokenizer()
+        data_root = tempfile.mkdtemp()
+        try:
+            prompts = [{
+                'instruction': data['instruction'],
+                'category': data['choice']
+            } for data in self.list_data_dict[:95]]
+            calls, crash = [], dict(at_call=3)
+
+            def generate(chunk):
+                calls.append(('generate', len(chunk)))
+                if len(calls) == crash.get('at_call'):
+                    del crash['at_call']
+                    raise RuntimeError('Crash')
+                return [
+                    dict(data, output_A=' a', output_B=' b ' + str(idx))
+                    for idx, data in enumerate(chunk)
+                ]
+
+            def select(chunk):
+                calls.append(('select', len(chunk)))
+                return [
+                    dict(data, choice=len(data['instruction']) % 2)
+                    for data in chunk
+                ]
+
+            def build_stages():
+                return [(ChunkedArtifactStore(f'{data_root}/{name}',
+                                              chunk_size=20), process_fn)
+                        for name, process_fn in [('pairs',
+                                                  generate), ('choices',
+                                                              select)]]
+
+            with self.assertRaises(RuntimeError):
+                run_chunked_pipeline(prompts, build_stages())
+            self.assertEqual(calls, [('generate', 20), ('select', 20),
+                                     ('generate', 20)])
+            self.assertFalse(build_stages()[1][0].is_finished())
+            self.assertEqual(len(list(build_stages()[1][0].iter_chunks())), 1)
+
+            # Resumed from the second chunk
+            calls.clear()
+            _, store = run_chunked_pipeline(prompts, build_stages())
+            self.assertEqual(calls, [('generate', 20),
+                                     ('select', 20)] * 3 + [('generate', 15),
+                                                            ('select', 15)])
+            self.assertEqual(store.num_chunks, 5)
+            records = list(store.iter_records())
+            self.assertEqual([data['instruction'] for data in records],
+                             [data['instruction'] for data in prompts])
+
+            calls.clear()
+            run_chunked_pipeline(prompts, build_stages())
+            self.assertEqual(calls, [])
+            with self.assertRaises(ValueError):
+                ChunkedArtifactStore(f'{data_root}/unfinished', chunk_size=20)
+                ChunkedArtifactStore(f'{data_root}/unfinished', chunk_size=10)
+
+            # Tokenized chunk by chunk
+            dataset = LLMComparisonDataset.from_chunks(store.iter_chunks(),
+                                                       tokenizer)
+            reference = LLMComparisonDataset(records, tokenizer)
+            self.assertEqual(len(dataset), len(reference))
+            self.assertEqual(list(dataset.categories),
+                             list(reference.categories))
+            for idx in range(len(reference)):
+                for key in ['win_data', 'lose_data']:
+                    self.assertTrue(
+                        torch.equal(dataset[idx][key]['labels'],
+                                    reference[idx][key]['labels']))
+        finally:
+            shutil.rmtree(data_root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import numpy as np
+import torch
+
+from federatedscope.core.message import Message, estimate_bytes
+
+
+class MessageBytesTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+
+    def test_estimate_bytes(self):
+        state_dict = {
+            f'layer.{idx}.lora_A': torch.zeros(8, 64, dtype=torch.bfloat16)
+            for idx in range(100)
+        }
+        state_dict['bias'] = np.zeros(16, dtype=np.float32)
+        num_bytes = estimate_bytes((10, state_dict))
+        expected = 100 * 8 * 64 * 2 + 16 * 4 + 8 + \
+            sum(len(key) for key in state_dict)
+        self.assertEqual(num_bytes, expected)
+
+    def test_count_bytes(self):
+        content = {'weight': torch.zeros(1000), 'step': 3}
+        message = Message(msg_type='model_para',
+                          sender=0,
+                          receiver=[1, 2, 3],
+                          content=content)
+        download_bytes, upload_bytes = message.count_bytes()
+        self.assertEqual(download_bytes, 4000 + len('weight') + 4 + 8)
+        self.assertEqual(upload_bytes, 3 * download_bytes)
+
+        # The changes of the content in place are counted
+        content['weight'] = torch.zeros(10)
+        self.assertEqual(message.count_bytes()[0], 40 + len('weight') + 4 + 8)
+
+        # The exact size of the serialized message
+        message.content = {'weight': torch.zeros(1000)}
+        exact_bytes, _ = message.count_bytes(exact=True)
+        self.assertGreater(exact_bytes, 4000)
+        self.assertLess(exact_bytes, 4000 + 1024)
+        self.assertTrue(torch.is_tensor(message.content['weight']))
+        self.assertEqual(message.count_bytes(exact=True)[0], exact_bytes)
+        message.content['bias'] = torch.zeros(1000)
+        self.assertGreater(
+            message.count_bytes(exact=True)[0], exact_bytes + 4000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import itertools
+import unittest
+
+import grpc
+import torch
+
+from federatedscope.core.communication import gRPCCommManager
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.gRPC_server import PartialMessage, WIRE_VERSION
+from federatedscope.core.message import Message
+
+
+class ConnectionLost(grpc.RpcError):
+    def __init__(self, code):
+        super().__init__(f'Connection lost ({code})')
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+class FlakyStub(object):
+    """
+    Stub whose stream fails with the status ``code`` after a few chunks.
+    """
+    def __init__(self, stub, break_after, code):
+        self.stub = stub
+        self.break_after = break_after
+        self.code = code
+
+    def __getattr__(self, name):
+        return getattr(self.stub, name)
+
+    def sendMessageStream(self, request_iterator, timeout=None):
+        self.stub.sendMessageStream(itertools.islice(request_iterator,
+                                                     self.break_after),
+                                    timeout=timeout)
+        raise ConnectionLost(self.code)
+
+
+class FlakyCommManager(gRPCCommManager):
+    """
+    Communicator whose first stream of a message breaks after a few chunks.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.break_after = None
+        self.break_code = grpc.StatusCode.UNAVAILABLE
+        self.sent_seqs = []
+
+    def _get_stub(self, receiver_address):
+        stub = super()._get_stub(receiver_address)
+        if self.break_after is not None:
+            stub = FlakyStub(stub, self.break_after, self.break_code)
+            self.break_after = None
+        return stub
+
+    def _iter_chunks(self, msg_id, data, start_seq=0):
+        for chunk in super()._iter_chunks(msg_id, data, start_seq):
+            self.sent_seqs.append(chunk.seq)
+            yield chunk
+
+
+class MessageStreamTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        cfg = global_cfg.clone().distribute
+        cfg.grpc_chunk_size = 4096
+        cfg.grpc_send_retries = 2
+        # No message larger than a chunk can be received in one piece
+        cfg.grpc_max_receive_message_length = 8192
+        self.server = gRPCCommManager(host='127.0.0.1',
+                                      port='50081',
+                                      client_num=1,
+                                      cfg=cfg)
+        self.client = FlakyCommManager(host='127.0.0.1',
+                                       port='50082',
+                                       client_num=1,
+                                       cfg=cfg)
+        self.client.add_neighbors(0, '127.0.0.1:50081')
+        self.server.add_neighbors(1, '127.0.0.1:50082')
+        # Negotiate the version of the wire format
+        self.client.send(Message(msg_type='join_in', sender=1, receiver=[0]))
+        self.server.receive()
+        self.assertEqual(self.client.peer_versions['127.0.0.1:50081'],
+                         WIRE_VERSION)
+
+    def tearDown(self):
+        for comm_manager in [self.server, self.client]:
+            comm_manager.close()
+
+    def send_model_para(self):
+        torch.manual_seed(0)
+        model_para = {'weight': torch.randn(64, 64), 'bias': torch.randn(64)}
+        self.client.send(
+            Message(msg_type='model_para',
+                    sender=1,
+                    receiver=[0],
+                    content=(10, dict(model_para))))
+        message = self.server.receive(timeout=10)
+        self.assertEqual(message.content[0], 10)
+        for key, value in model_para.items():
+            self.assertTrue(torch.equal(message.content[1][key], value))
+
+    def test_stream(self):
+        self.send_model_para()
+        num_chunks = len(self.client.sent_seqs)
+        self.assertGreater(num_chunks, 4)
+        self.assertEqual(self.client.sent_seqs, list(range(num_chunks)))
+        self.assertEqual(len(self.server.server_funcs.partial_msgs), 0)
+
+    def test_resume(self):
+        self.client.break_after = 3
+        self.send_model_para()
+        # The chunks delivered before the failure are not sent again
+        self.assertEqual(self.client.sent_seqs,
+                         list(range(len(self.client.sent_seqs))))
+        self.assertEqual(self.server.server_funcs.msg_queue.qsize(), 0)
+
+    def test_not_retryable(self):
+        self.client.break_after = 3
+        self.client.break_code = grpc.StatusCode.INVALID_ARGUMENT
+        self.client.send(
+            Message(msg_type='model_para',
+                    sender=1,
+                    receiver=[0],
+                    content=(10, {
+                        'weight': torch.randn(64, 64)
+                    })))
+        # Given up without resuming
+        self.assertEqual(self.client.sent_seqs, [0, 1, 2])
+        with self.assertRaises(TimeoutError):
+            self.server.receive(timeout=1)
+
+    def test_invalid_chunks(self):
+        for total_size, chunk_size in [(100, 0), (100, -4), (-1, 4)]:
+            with self.assertRaises(ValueError):
+                PartialMessage(total_size, chunk_size)
+
+        partial_msg = PartialMessage(10, 4)
+        for seq, data in [(3, b''), (-1, b'1234'), (0, b'12345'), (1, b'12'),
+                          (2, b'1234')]:
+            with self.assertRaises(ValueError):
+                partial_msg.write(seq, data)
+        for seq, data in [(2, b'12'), (0, b'1234'), (1, b'5678')]:
+            partial_msg.write(seq, data)
+        self.assertTrue(partial_msg.is_complete())
+        self.assertEqual(bytes(partial_msg.buffer), b'1234567812')
+
+
+if __name__ == '__main__':
+    unittest.main()
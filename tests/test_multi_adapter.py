@@ -0,0 +1,124 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import copy
+import unittest
+
+import numpy as np
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from federatedscope.llm.dataset.llm_dataset import DefaultToken
+from federatedscope.llm.model.adapter_builder import AdapterModel, \
+    majority_vote
+
+VOCAB_SIZE = 50
+CHOICES = [5, 7]
+
+
+def build_model(adapter_names):
+    config = GPT2Config(vocab_size=VOCAB_SIZE,
+                        n_positions=32,
+                        n_embd=16,
+                        n_layer=2,
+                        n_head=2)
+    model = AdapterModel(GPT2LMHeadModel(config),
+                         use_adapter=True,
+                         adapter_package='peft',
+                         adapter_method='lora',
+                         r=4,
+                         target_modules=['c_attn'])
+    peft_config = copy.deepcopy(model.peft_config)
+    model.append_adapters(adapter_names[:-1])
+    # The last adapter has another rank, which cannot be stacked
+    peft_config.r = 2
+    model.append_adapters(adapter_names[-1:], peft_config)
+    # The LoRA B matrices are initialized with zeros
+    for name, param in model.named_parameters():
+        if 'lora_' in name:
+            torch.nn.init.normal_(param, std=0.5)
+    return model.eval()
+
+
+class MultiAdapterTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.input_ids = torch.randint(VOCAB_SIZE, (3, 10))
+        # The choice label is right after the padded prompt
+        self.attention_mask = torch.ones_like(self.input_ids)
+        self.attention_mask[1, 7:] = 0
+        self.labels = torch.full_like(self.input_ids,
+                                      DefaultToken.IGNORE_INDEX.value)
+        self.labels[:, -1] = torch.tensor(CHOICES + CHOICES[:1])
+        self.labels[1, -1] = DefaultToken.IGNORE_INDEX.value
+        self.labels[1, 7] = CHOICES[1]
+
+    def check_adapters(self, adapter_names, **kwargs):
+        model = build_model(['Adapter_0', 'Adapter_1', 'Adapter_2'])
+        with torch.no_grad():
+            outputs = model.multi_adapter_forward(
+                adapter_names=adapter_names,
+                input_ids=self.input_ids,
+                attention_mask=self.attention_mask,
+                **kwargs)
+            self.assertEqual(outputs.logits.size(0), len(adapter_names))
+            for idx, name in enumerate(adapter_names):
+                model.set_active_adapter(name)
+                expected = model(input_ids=self.input_ids,
+                                 attention_mask=self.attention_mask,
+                                 **kwargs)
+                if 'choices' not in kwargs:
+                    # Right padding, whose logits are not used
+                    mask = self.attention_mask.bool()
+                    self.assertTrue(
+                        torch.allclose(outputs.logits[idx][mask],
+                                       expected.logits[mask],
+                                       atol=1e-5))
+                else:
+                    self.assertTrue(
+                        torch.allclose(outputs.logits[idx],
+                                       expected.logits,
+                                       atol=1e-5))
+                    self.assertTrue(
+                        torch.equal(outputs.labels[idx], expected.labels))
+        return outputs
+
+    def test_lm_logits(self):
+        outputs = self.check_adapters(['Adapter_0', 'Adapter_1'])
+        self.assertEqual(list(outputs.logits.shape), [2, 3, 10, VOCAB_SIZE])
+        # The adapters are different
+        self.assertFalse(
+            torch.allclose(outputs.logits[0], outputs.logits[1], atol=1e-2))
+
+    def test_choice_logits(self):
+        outputs = self.check_adapters(['Adapter_0', 'Adapter_1'],
+                                      labels=self.labels,
+                                      choices=CHOICES)
+        self.assertEqual(list(outputs.logits.shape), [2, 3, len(CHOICES)])
+        self.assertEqual(outputs.labels.tolist(), [[0, 1, 0], [0, 1, 0]])
+
+    def test_different_ranks(self):
+        self.check_adapters(['Adapter_0', 'Adapter_2', 'Adapter_1'],
+                            labels=self.labels,
+                            choices=CHOICES)
+
+    def test_majority_vote(self):
+        rng = np.random.RandomState(0)
+        # With an even number of voters, many columns are ties
+        for num_voters in [4, 5]:
+            predictions = rng.randint(3, size=(num_voters, 200))
+            expected = [
+                np.bincount(column).argmax() for column in predictions.T
+            ]
+            self.assertEqual(majority_vote(predictions).tolist(), expected)
+            self.assertEqual(
+                majority_vote(torch.tensor(predictions), 3).tolist(), expected)
+
+        # Ties are broken towards the smallest label
+        predictions = [[0, 1, 2, 2], [1, 0, 1, 2], [2, 2, 1, 0]]
+        self.assertEqual(majority_vote(predictions).tolist(), [0, 0, 1, 2])
+        # Labels not voted by anyone
+        self.assertEqual(majority_vote([[1], [1]], 4).tolist(), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import numpy as np
+import torch
+
+from federatedscope.core.auxiliaries.data_builder import get_data
+from federatedscope.core.auxiliaries.logging import update_logger
+from federatedscope.core.auxiliaries.runner_builder import get_runner
+from federatedscope.core.auxiliaries.utils import setup_seed
+from federatedscope.core.auxiliaries.worker_builder import get_client_cls, \
+    get_server_cls
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.secret_sharing import PairwiseMaskSecretSharing, \
+    ShamirSecretSharing
+
+
+class PairwiseMaskTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+
+    def test_shamir(self):
+        ss_manager = ShamirSecretSharing(shared_party_num=5,
+                                         threshold=3,
+                                         seed=0)
+        secret = 2**200 + 12345
+        frames = ss_manager.secret_split(secret)
+        self.assertEqual([x for x, _ in frames], [1, 2, 3, 4, 5])
+        for subset in [
+                frames[:3], frames[2:], [frames[4], frames[0], frames[2]]
+        ]:
+            self.assertEqual(ss_manager.secret_reconstruct(subset), secret)
+        with self.assertRaises(AssertionError):
+            ss_manager.secret_reconstruct(frames[:2])
+
+    def test_dropout(self):
+        client_num = 6
+        managers = {
+            client_id: PairwiseMaskSecretSharing(shared_party_num=client_num,
+                                                 threshold=3)
+            for client_id in range(1, client_num + 1)
+        }
+        contents = {
+            client_id: manager.setup_round(0, client_id)
+            for client_id, manager in managers.items()
+        }
+        for sender, content in contents.items():
+            for receiver, frames in content.items():
+                managers[receiver].receive_frames(0, sender, frames)
+        self.assertTrue(all(manager.ready(0) for manager in managers.values()))
+
+        models = {
+            client_id: {
+                'weight': torch.randn(4, 3),
+                'bias': torch.randn(3)
+            }
+            for client_id in managers
+        }
+        # Clients #2 and #5 drop out after the exchange of the seeds
+        survivors, dropped = [1, 3, 4, 6], [2, 5]
+        masked = {
+            client_id: managers[client_id].mask(0, models[client_id])
+            for client_id in survivors
+        }
+        # A masked model tells nothing about the model
+        self.assertFalse(
+            np.allclose(managers[1].fixedpoint2float(masked[1]['bias']),
+                        models[1]['bias'].numpy(),
+                        atol=1.))
+
+        server = PairwiseMaskSecretSharing(shared_party_num=client_num,
+                                           threshold=3)
+        replies = {
+            client_id:
+            managers[client_id].unmask_frames(0, survivors, dropped)
+            for client_id in [6, 1, 4]
+        }
+        server.remove_masks(masked, replies)
+        for key in ['weight', 'bias']:
+            total = np.sum([masked[client_id][key] for client_id in survivors],
+                           axis=0)
+            expected = sum(models[client_id][key] for client_id in survivors)
+            np.testing.assert_allclose(server.fixedpoint2float(total),
+                                       expected.numpy(),
+                                       atol=1e-6)
+
+        # The frames of a round are revealed only once
+        with self.assertRaises(KeyError):
+            managers[6].unmask_frames(0, survivors, dropped)
+
+    def test_sampling_cfg(self):
+        init_cfg = global_cfg.clone()
+        init_cfg.federate.client_num = 5
+        init_cfg.federate.use_ss = True
+        init_cfg.federate.ss_type = 'pairwise_mask'
+        cfg = init_cfg.clone()
+        cfg.assert_cfg()
+        self.assertEqual(cfg.federate.sample_client_num, 5)
+
+        # The sampled clients would wait forever for the masks of the others
+        for key, value in [('federate.sample_client_num', 3),
+                           ('federate.sample_client_rate', 0.6),
+                           ('asyn.use', True)]:
+            cfg = init_cfg.clone()
+            with self.assertRaises(AssertionError):
+                cfg.merge_from_list([key, value])
+
+    def test_toy_standalone(self):
+        results = []
+        for use_ss in [False, True]:
+            init_cfg = global_cfg.clone()
+            init_cfg.federate.mode = 'standalone'
+            init_cfg.federate.total_round_num = 5
+            init_cfg.federate.client_num = 5
+            init_cfg.federate.use_ss = use_ss
+            init_cfg.federate.ss_type = 'pairwise_mask'
+            init_cfg.eval.freq = 10
+            init_cfg.data.type = 'toy'
+            init_cfg.model.type = 'lr'
+            setup_seed(init_cfg.seed)
+            update_logger(init_cfg, True)
+
+            data, modified_config = get_data(init_cfg.clone())
+            init_cfg.merge_from_other_cfg(modified_config)
+            Fed_runner = get_runner(data=data,
+                                    server_class=get_server_cls(init_cfg),
+                                    client_class=get_client_cls(init_cfg),
+                                    config=init_cfg.clone())
+            Fed_runner.run()
+            results.append(Fed_runner.server.models[0].state_dict())
+
+        for key in results[0]:
+            self.assertTrue(
+                torch.allclose(results[0][key], results[1][key], atol=1e-5))
+
+    def test_dropout_standalone(self):
+        for ss_timeout in [0, 10]:
+            init_cfg = global_cfg.clone()
+            init_cfg.federate.mode = 'standalone'
+            init_cfg.federate.total_round_num = 3
+            init_cfg.federate.client_num = 5
+            init_cfg.federate.use_ss = True
+            init_cfg.federate.ss_type = 'pairwise_mask'
+            init_cfg.federate.ss_timeout = ss_timeout
+            init_cfg.eval.freq = 10
+            init_cfg.data.type = 'toy'
+            init_cfg.model.type = 'lr'
+            setup_seed(init_cfg.seed)
+            update_logger(init_cfg, True)
+
+            data, modified_config = get_data(init_cfg.clone())
+            init_cfg.merge_from_other_cfg(modified_config)
+            Fed_runner = get_runner(data=data,
+                                    server_class=get_server_cls(init_cfg),
+                                    client_class=get_client_cls(init_cfg),
+                                    config=init_cfg.clone())
+
+            # Client #3 drops out during the local training of each round,
+            # after the exchange of the seeds
+            Fed_runner.client[3]._upload_masked_model_para = \
+                lambda round: None
+            trained = dict()
+
+            def record(client):
+                train = client.trainer.train
+
+                def train_and_record(*args, **kwargs):
+                    sample_size, model_para, results = train(*args, **kwargs)
+                    trained[client.ID] = (sample_size, {
+                        key: value.clone()
+                        for key, value in model_para.items()
+                    })
+                    return sample_size, model_para, results
+
+                client.trainer.train = train_and_record
+
+            for client_id in [1, 2, 4, 5]:
+                record(Fed_runner.client[client_id])
+            Fed_runner.run()
+
+            server = Fed_runner.server
+            if not ss_timeout:
+                # The server waits forever for the masked model of #3
+                self.assertFalse(server.is_finish)
+                self.assertEqual(server.state, 0)
+                continue
+
+            self.assertTrue(server.is_finish)
+            # The global model is the average of those of the survivors in
+            # the last round
+            total = sum(sample_size for sample_size, _ in trained.values())
+            for key, value in server.models[0].state_dict().items():
+                expected = sum(
+                    sample_size * model_para[key]
+                    for sample_size, model_para in trained.values()) / total
+                self.assertTrue(torch.allclose(value, expected, atol=1e-5))
+
+        # Fewer survivors than the threshold (3) cannot remove the masks
+        server.msg_buffer['train'][server.state] = {1: None, 2: None}
+        server.is_finish = False
+        self.assertFalse(server.trigger_for_ss_time_up())
+        self.assertIsNone(server.ss_survivors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+from types import SimpleNamespace
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from federatedscope.llm.eval.pairwise_selector import PairwiseSelector, \
+    PrefixCachedSelector, PrefixKVCache
+from federatedscope.llm.model.adapter_builder import AdapterModel
+
+PROMPT = 'POST: {post}\nSUMMARY A: {output_A}\nSUMMARY B: {output_B}\n' \
+         'The better summary is'
+
+
+class CharTokenizer(object):
+    """
+    Character-level tokenizer, whose ids are the ASCII codes.
+    """
+    model_max_length = 256
+    eos_token = '\n'
+    pad_token_id = 0
+
+    def __call__(self, text, return_tensors=None, **kwargs):
+        return SimpleNamespace(input_ids=torch.tensor([[ord(c)
+                                                        for c in text]]))
+
+
+def build_model():
+    config = GPT2Config(vocab_size=128,
+                        n_positions=256,
+                        n_embd=16,
+                        n_layer=2,
+                        n_head=2)
+    model = AdapterModel(GPT2LMHeadModel(config),
+                         use_adapter=True,
+                         adapter_package='peft',
+                         adapter_method='lora',
+                         r=4,
+                         target_modules=['c_attn'])
+    model.append_adapters(['Adapter_0', 'Adapter_1'])
+    # The LoRA B matrices are initialized with zeros
+    for name, param in model.named_parameters():
+        if 'lora_' in name:
+            torch.nn.init.normal_(param, std=0.5)
+    return model.eval()
+
+
+def kv_size(past_key_values):
+    return sum(t.numel() * t.element_size() for layer in past_key_values
+               for t in layer)
+
+
+class PairwiseSelectorTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.model = build_model()
+        self.tokenizer = CharTokenizer()
+        # The comparisons of a post share the prefix before `output_A`
+        posts = [
+            'My cat sleeps all day long on the sofa, what should I do?',
+            'I moved to a new city last month and I have no friends there '
+            'yet, any advice on meeting new people?'
+        ]
+        outputs = [('cat', 'dog'), ('a cat', 'the dog'),
+                   ('no', 'summary at all')]
+        self.samples = [{
+            'post': post,
+            'output_A': output_A,
+            'output_B': output_B,
+            'choice': ' A'
+        } for post in posts for output_A, output_B in outputs]
+
+    def build_selectors(self, **kwargs):
+        kwargs.update(choices=[ord('A'), ord('B')], device='cpu')
+        return PairwiseSelector(self.model, self.tokenizer, PROMPT,
+                                **kwargs), \
+            PrefixCachedSelector(self.model, self.tokenizer, PROMPT,
+                                 **kwargs)
+
+    def check_scores(self, selector, cached_selector):
+        expected = selector.score(self.samples)
+        for _ in range(2):
+            self.assertTrue(
+                torch.allclose(cached_selector.score(self.samples),
+                               expected,
+                               atol=1e-5))
+        self.assertTrue(
+            torch.equal(cached_selector.predict(self.samples),
+                        selector.predict(self.samples)))
+        return expected
+
+    def test_cached_scores(self):
+        self.model.set_active_adapter('Adapter_0')
+        selector, cached_selector = self.build_selectors(batch_size=4)
+        scores = self.check_scores(selector, cached_selector)
+        self.assertEqual(list(scores.shape), [6, 2])
+
+        # 2 batches, the first of which has both posts: the prefixes are
+        # encoded together in one pass, and then read from the cache in the
+        # 3 calls of `score`
+        stats = cached_selector.stats()
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['forward_passes'], 1 + 3 * 2)
+        self.assertGreater(stats['token_saving'], 0.5)
+
+        # The cache entries are keyed by the active adapter
+        self.model.set_active_adapter('Adapter_1')
+        other_scores = self.check_scores(selector, cached_selector)
+        self.assertFalse(torch.allclose(other_scores, scores, atol=1e-3))
+        self.assertEqual(cached_selector.cache.stats()['entries'], 4)
+
+    def test_cached_scores_of_adapters(self):
+        selector, cached_selector = self.build_selectors(
+            adapter_names=['Adapter_0', 'Adapter_1'], batch_size=6)
+        scores = self.check_scores(selector, cached_selector)
+        self.assertEqual(list(scores.shape), [2, 6, 2])
+        self.assertEqual(cached_selector.stats()['forward_passes'], 1 + 3)
+
+    def test_lru_eviction(self):
+        def kv(length):
+            return tuple(
+                (torch.zeros(1, 2, length, 4), torch.zeros(1, 2, length, 4))
+                for _ in range(2))
+
+        # 4 layer tensors x 2 heads x 4 dims x 4 bytes per token
+        self.assertEqual(kv_size(kv(1)), 128)
+        cache = PrefixKVCache(max_memory=128 * 10)
+        cache.put('a', kv(3))
+        cache.put('b', kv(3))
+        cache.put('c', kv(3))
+        self.assertEqual(cache.memory, 128 * 9)
+
+        # `a` is the most recently used now, so `b` is evicted first
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('d', kv(2))
+        self.assertNotIn('b', cache)
+        self.assertEqual(list(cache._cache), ['c', 'a', 'd'])
+        self.assertEqual(cache.memory, 128 * 8)
+
+        # Replacing an entry frees its old size first
+        cache.put('c', kv(5))
+        self.assertEqual(list(cache._cache), ['a', 'd', 'c'])
+        self.assertEqual(cache.memory, 128 * 10)
+        cache.put('c', kv(6))
+        self.assertEqual(list(cache._cache), ['d', 'c'])
+        self.assertEqual(cache.memory, 128 * 8)
+        self.assertEqual(cache.evictions, 2)
+
+        # A prefix larger than the whole budget is never stored
+        cache.put('e', kv(11))
+        self.assertNotIn('e', cache)
+        self.assertEqual(cache.memory, 128 * 8)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_budget_of_selector(self):
+        # The budget holds a single prefix of the posts
+        self.model.set_active_adapter('Adapter_0')
+        selector, cached_selector = self.build_selectors(batch_size=3)
+        cached_selector.cache.max_memory = \
+            kv_size(cached_selector._encode_prefixes(
+                [cached_selector._split(self.samples[-1])[0]])[0])
+        self.check_scores(selector, cached_selector)
+        stats = cached_selector.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertLessEqual(cached_selector.cache.memory,
+                             cached_selector.cache.max_memory)
+        # Each post evicts the other in each call of `score`
+        self.assertEqual(stats['evictions'], 2 * 3 - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import torch
+import torch.nn.functional as F
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.trainers.context import LifecycleDict
+from federatedscope.llm.dataset.llm_dataset import DefaultToken
+from federatedscope.llm.model.adapter_builder import AdapterModel
+from federatedscope.llm.trainer.reward_choice_trainer import \
+    RewardChoiceTrainer
+
+VOCAB_SIZE = 50
+CHOICES = [5, 7]
+
+
+def full_logits_loss(model, input_ids, labels, attention_mask):
+    """
+    Loss and predictions of the choices from the full
+    ``[batch, seq, vocab]`` logits, as before the selector head.
+    """
+    logits = model(input_ids=input_ids,
+                   attention_mask=attention_mask).logits[:, :-1, CHOICES]
+    shift_labels = labels[:, 1:]
+    choice_labels = torch.full_like(shift_labels,
+                                    DefaultToken.IGNORE_INDEX.value)
+    for idx, choice in enumerate(CHOICES):
+        choice_labels[shift_labels == choice] = idx
+    logits = logits.reshape(-1, len(CHOICES))
+    choice_labels = choice_labels.view(-1)
+    loss = F.cross_entropy(logits, choice_labels)
+    mask = choice_labels != DefaultToken.IGNORE_INDEX.value
+    return loss, logits[mask].argmax(-1), choice_labels[mask]
+
+
+class RewardChoiceTrainerTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        config = GPT2Config(vocab_size=VOCAB_SIZE,
+                            n_positions=32,
+                            n_embd=16,
+                            n_layer=2,
+                            n_head=2)
+        self.model = AdapterModel(GPT2LMHeadModel(config),
+                                  use_adapter=True,
+                                  adapter_package='peft',
+                                  adapter_method='lora',
+                                  r=4,
+                                  target_modules=['c_attn'])
+        for name, param in self.model.named_parameters():
+            if 'lora_' in name:
+                torch.nn.init.normal_(param, std=0.5)
+        # No dropout, so that both passes are the same
+        self.model.eval()
+
+        # Right-padded prompts, each followed by a choice token
+        lengths = [12, 9, 12, 6, 10, 12]
+        input_ids = torch.randint(8, VOCAB_SIZE, (len(lengths), 13))
+        labels = torch.full_like(input_ids, DefaultToken.IGNORE_INDEX.value)
+        attention_mask = torch.zeros_like(input_ids)
+        for idx, length in enumerate(lengths):
+            input_ids[idx, length] = CHOICES[idx % 2]
+            labels[idx, length] = CHOICES[idx % 2]
+            attention_mask[idx, :length + 1] = 1
+        self.data_batch = dict(input_ids=input_ids,
+                               labels=labels,
+                               attention_mask=attention_mask)
+
+        self.trainer = RewardChoiceTrainer.__new__(RewardChoiceTrainer)
+        self.trainer.choices = CHOICES
+        self.ctx = LifecycleDict()
+        self.ctx.cfg = global_cfg.clone()
+        self.ctx.model = self.model
+        self.ctx.device = 'cpu'
+
+    def test_selector_head(self):
+        self.ctx.data_batch = self.data_batch
+        self.trainer._hook_on_batch_forward(self.ctx)
+        self.assertFalse(self.ctx.skip_this_batch)
+        self.assertEqual(self.ctx.batch_size, 6)
+        self.assertEqual(list(self.ctx.y_prob.shape), [6, len(CHOICES)])
+        self.ctx.loss_batch.backward()
+        grads = {
+            name: param.grad.clone()
+            for name, param in self.model.named_parameters()
+            if param.requires_grad
+        }
+        self.model.zero_grad()
+
+        loss, predicted, labels = full_logits_loss(self.model,
+                                                   **self.data_batch)
+        loss.backward()
+        self.assertTrue(torch.allclose(self.ctx.loss_batch, loss, atol=1e-6))
+        self.assertEqual(self.ctx.y_true.tolist(), labels.tolist())
+        self.assertEqual(self.ctx.y_true.tolist(), [0, 1, 0, 1, 0, 1])
+        self.assertEqual(self.ctx.y_pred.tolist(), predicted.tolist())
+        # Not a trivial accuracy
+        accuracy = (predicted == labels).float().mean().item()
+        self.assertTrue(0 < accuracy < 1)
+        for name, param in self.model.named_parameters():
+            if param.requires_grad:
+                self.assertTrue(
+                    torch.allclose(grads[name], param.grad, atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+from types import SimpleNamespace
+
+import torch
+
+from federatedscope.llm.dataset.llm_dataset import DefaultToken
+from federatedscope.llm.trainer.reward_trainer import ReferenceLogpCache, \
+    _get_batch_logps, dpo_loss, dpo_rewards
+
+VOCAB_SIZE = 50
+
+
+class ToyAdapterModel(torch.nn.Module):
+    """
+    Language model whose adapter (a residual linear layer) can be disabled
+    like ``AdapterModel``, and which counts the sequences it goes through.
+    """
+    def __init__(self):
+        super().__init__()
+        self.embedding = torch.nn.Embedding(VOCAB_SIZE, 16)
+        self.adapter = torch.nn.Linear(16, 16)
+        self.head = torch.nn.Linear(16, VOCAB_SIZE)
+        self.num_sequences = {True: 0, False: 0}
+
+    def forward(self, disable_adapter=False, input_ids=None, **kwargs):
+        self.num_sequences[disable_adapter] += len(input_ids)
+        hidden = self.embedding(input_ids)
+        if not disable_adapter:
+            hidden = hidden + self.adapter(hidden)
+        return SimpleNamespace(logits=self.head(hidden))
+
+
+def reference_logps(logits, labels):
+    labels = labels[:, 1:].clone()
+    logits = logits[:, :-1, :]
+    loss_mask = labels != DefaultToken.IGNORE_INDEX.value
+    labels[~loss_mask] = 0
+    per_token_logps = torch.gather(logits.log_softmax(-1),
+                                   dim=2,
+                                   index=labels.unsqueeze(2)).squeeze(2)
+    return (per_token_logps * loss_mask).sum(-1)
+
+
+def random_batch(num, length):
+    input_ids = torch.randint(VOCAB_SIZE, (num, length))
+    labels = input_ids.clone()
+    attention_mask = torch.ones_like(input_ids)
+    for idx in range(num):
+        source_len = torch.randint(1, length // 2, ()).item()
+        pad_len = torch.randint(0, length // 4, ()).item()
+        labels[idx, :source_len] = DefaultToken.IGNORE_INDEX.value
+        if pad_len > 0:
+            labels[idx, -pad_len:] = DefaultToken.IGNORE_INDEX.value
+            attention_mask[idx, -pad_len:] = 0
+    return input_ids, labels, attention_mask
+
+
+class RewardTrainerTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+
+    def test_get_batch_logps(self):
+        logits = torch.randn(4, 12, VOCAB_SIZE, requires_grad=True)
+        _, labels, _ = random_batch(4, 12)
+        logps = _get_batch_logps(logits, labels)
+        self.assertTrue(torch.allclose(logps, reference_logps(logits, labels)))
+
+        # The gradients flow back to the logits of the labeled tokens
+        logps.sum().backward()
+        self.assertTrue(logits.grad[:, -1].eq(0).all())
+
+    def test_dpo_rewards(self):
+        model = ToyAdapterModel()
+        batches = []
+        for _ in range(3):
+            input_ids, labels, attention_mask = random_batch(8, 16)
+            batches.append(
+                dict(win_input_ids=input_ids[:4],
+                     win_labels=labels[:4],
+                     win_attention_mask=attention_mask[:4],
+                     lose_input_ids=input_ids[4:],
+                     lose_labels=labels[4:],
+                     lose_attention_mask=attention_mask[4:]))
+
+        cache = ReferenceLogpCache()
+        win_rewards, lose_rewards = dpo_rewards(model,
+                                                batches,
+                                                'cpu',
+                                                ref_logp_cache=cache)
+        # One fused pass per batch and model, which scores all the pairs
+        self.assertEqual(model.num_sequences, {True: 24, False: 24})
+        self.assertEqual(len(cache), 24)
+
+        with torch.no_grad():
+            for idx, batch in enumerate(batches):
+                logps = {(name, disable_adapter): reference_logps(
+                    model(disable_adapter=disable_adapter,
+                          input_ids=batch[f'{name}_input_ids']).logits,
+                    batch[f'{name}_labels'])
+                         for name in ['win', 'lose']
+                         for disable_adapter in [True, False]}
+                _, win, lose = dpo_loss(logps['win', False],
+                                        logps['lose', False],
+                                        logps['win', True],
+                                        logps['lose', True],
+                                        beta=1.0)
+                self.assertTrue(
+                    torch.allclose(torch.tensor(win_rewards[idx * 4:][:4]),
+                                   win,
+                                   atol=1e-5))
+                self.assertTrue(
+                    torch.allclose(torch.tensor(lose_rewards[idx * 4:][:4]),
+                                   lose,
+                                   atol=1e-5))
+
+        # The reference pass is skipped for the cached sequences, even when
+        # they are padded differently
+        model.num_sequences = {True: 0, False: 0}
+        batch = {
+            key: torch.cat([value, torch.zeros_like(value[:, :3])], dim=1)
+            for key, value in batches[0].items()
+        }
+        for name in ['win', 'lose']:
+            batch[f'{name}_labels'][:, -3:] = DefaultToken.IGNORE_INDEX.value
+        again, _ = dpo_rewards(model, [batch], 'cpu', ref_logp_cache=cache)
+        self.assertEqual(model.num_sequences, {True: 0, False: 8})
+        self.assertTrue(
+            torch.allclose(torch.tensor(again), torch.tensor(win_rewards[:4])))
+        self.assertEqual(cache.hits, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import torch
+
+from federatedscope.core.aggregators import BulyanAggregator, \
+    KrumAggregator, MedianAggregator, NormboundingAggregator, \
+    TrimmedmeanAggregator
+from federatedscope.core.aggregators.flat_buffer import pairwise_distances, \
+    stack_state_dicts
+from federatedscope.core.configs.config import global_cfg
+
+
+def loop_distances(models):
+    # The key by key and pair by pair distances, as reference
+    distances = torch.zeros(len(models), len(models))
+    for index_a, model_a in enumerate(models):
+        for index_b, model_b in enumerate(models):
+            distances[index_a, index_b] = sum(
+                torch.dist(model_a[key].float(), model_b[key].float(), p=2)
+                for key in model_a)
+    return distances
+
+
+class RobustDistanceTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.cfg = global_cfg.clone()
+        self.cfg.federate.client_num = 12
+        self.cfg.aggregator.byzantine_node_num = 2
+        self.cfg.aggregator.BFT_args.krum_agg_num = 4
+        self.model = torch.nn.Sequential(torch.nn.Linear(6, 4),
+                                         torch.nn.Linear(4, 2))
+        self.models = [(size, {
+            key: torch.randn_like(value)
+            for key, value in self.model.state_dict().items()
+        }) for size in range(1, 13)]
+
+    def stacked(self):
+        return torch.stack([
+            torch.cat([value.flatten() for value in model.values()])
+            for _, model in self.models
+        ])
+
+    def test_pairwise_distances(self):
+        models = [model for _, model in self.models]
+        expected = loop_distances(models)
+        matrix, layout = stack_state_dicts(models)
+        for max_block_bytes in [4, 2**20]:
+            distances = pairwise_distances(matrix,
+                                           layout,
+                                           max_block_bytes=max_block_bytes)
+            self.assertTrue(torch.allclose(distances, expected, atol=1e-4))
+
+        # Without layout, the distances of the whole rows
+        self.assertTrue(
+            torch.allclose(pairwise_distances(matrix),
+                           torch.cdist(self.stacked(), self.stacked())))
+        # On a materialized matrix
+        self.assertTrue(
+            torch.allclose(pairwise_distances(self.stacked(),
+                                              layout,
+                                              max_block_bytes=4),
+                           expected,
+                           atol=1e-4))
+
+    def test_column_blocks(self):
+        models = [model for _, model in self.models]
+        stacked = self.stacked()
+        # Blocks of 5 columns, which cross the boundaries of the tensors
+        updates, layout = stack_state_dicts(models, max_block_bytes=5 * 12 * 4)
+        blocks = list(updates.column_blocks())
+        self.assertEqual([end - start for start, end, _ in blocks],
+                         [5] * 7 + [3])
+        self.assertTrue(
+            torch.equal(torch.cat([block for _, _, block in blocks], 1),
+                        stacked))
+        self.assertTrue(
+            torch.equal(updates.reduce_columns(lambda block: block.max(0)[0]),
+                        stacked.max(0)[0]))
+        self.assertTrue(
+            torch.allclose(updates.row_norms(), stacked.norm(dim=1)))
+        self.assertTrue(
+            torch.equal(
+                updates.select_rows([3, 1]).columns(0, 38), stacked[[3, 1]]))
+        self.assertTrue(
+            torch.allclose(pairwise_distances(updates,
+                                              layout,
+                                              max_block_bytes=5 * 12 * 4),
+                           loop_distances(models),
+                           atol=1e-4))
+
+    def test_integer_buffers(self):
+        model = torch.nn.Sequential(torch.nn.Linear(6, 4),
+                                    torch.nn.BatchNorm1d(4))
+
+        def update(value, size):
+            if value.is_floating_point():
+                return torch.randn_like(value)
+            return value + 2 * size
+
+        models = [(size, {
+            key: update(value, size)
+            for key, value in model.state_dict().items()
+        }) for size in range(1, 13)]
+        self.cfg.aggregator.BFT_args.trimmedmean_excluded_ratio = 0.25
+        for aggregator in [
+                MedianAggregator(model=model, config=self.cfg),
+                TrimmedmeanAggregator(model=model, config=self.cfg)
+        ]:
+            updated_model = aggregator.aggregate({'client_feedback': models})
+            num_batches_tracked = updated_model['1.num_batches_tracked']
+            # The median and the trimmed mean of 2, 4, ..., 24
+            self.assertEqual(num_batches_tracked.dtype, torch.int64)
+            self.assertEqual(num_batches_tracked.item(), 13)
+
+    def test_krum(self):
+        aggregator = KrumAggregator(model=self.model, config=self.cfg)
+        updates, layout = stack_state_dicts(
+            [model for _, model in self.models])
+        scores = aggregator._calculate_score(updates, layout)
+        distances = loop_distances([model for _, model in self.models])
+        distances.fill_diagonal_(float('inf'))
+        expected = torch.sort(distances)[0][:, :8].sum(-1)
+        self.assertTrue(torch.allclose(scores, expected, atol=1e-4))
+
+        selected = torch.sort(expected)[1][:4].tolist()
+        init_model = self.model.state_dict()
+        updated_model = aggregator.aggregate({
+            'client_feedback': [(model[0], dict(model[1]))
+                                for model in self.models]
+        })
+        total = sum(self.models[idx][0] for idx in selected)
+        for key in init_model:
+            expected = init_model[key] + sum(
+                self.models[idx][0] * self.models[idx][1][key]
+                for idx in selected) / total
+            self.assertTrue(
+                torch.allclose(updated_model[key], expected, atol=1e-5))
+
+    def test_coordinate_wise(self):
+        stacked = self.stacked()
+        init_model = self.model.state_dict()
+        init_flat = torch.cat(
+            [value.flatten() for value in init_model.values()])
+
+        median = MedianAggregator(model=self.model, config=self.cfg)
+        sorted_stacked = torch.sort(stacked, dim=0)[0]
+        expected_median = (sorted_stacked[5] + sorted_stacked[6]) / 2
+
+        self.cfg.aggregator.BFT_args.trimmedmean_excluded_ratio = 0.25
+        trimmedmean = TrimmedmeanAggregator(model=self.model, config=self.cfg)
+        expected_trimmedmean = sorted_stacked[3:9].mean(0)
+
+        for aggregator, expected in [(median, expected_median),
+                                     (trimmedmean, expected_trimmedmean)]:
+            updated_model = aggregator.aggregate(
+                {'client_feedback': self.models})
+            flat = torch.cat(
+                [updated_model[key].flatten() for key in init_model])
+            self.assertTrue(
+                torch.allclose(flat, init_flat + expected, atol=1e-5))
+
+    def test_bulyan(self):
+        self.cfg.federate.sample_client_rate = 1.0
+        aggregator = BulyanAggregator(model=self.model, config=self.cfg)
+        distances = loop_distances([model for _, model in self.models])
+        distances.fill_diagonal_(float('inf'))
+        scores = torch.sort(distances)[0][:, :8].sum(-1)
+        reliable = self.stacked()[torch.sort(scores)[1][:8]]
+        expected = torch.sort(reliable, dim=0)[0][2:6].mean(0)
+
+        updated_model = aggregator.aggregate({'client_feedback': self.models})
+        init_model = self.model.state_dict()
+        flat = torch.cat([
+            updated_model[key].flatten() - init_model[key].flatten()
+            for key in init_model
+        ])
+        self.assertTrue(torch.allclose(flat, expected, atol=1e-5))
+
+    def test_normbounding(self):
+        self.cfg.aggregator.BFT_args.normbounding_norm_bound = 4.0
+        aggregator = NormboundingAggregator(model=self.model, config=self.cfg)
+        stacked = self.stacked()
+        norms = stacked.norm(dim=1, keepdim=True)
+        clipped = torch.where(norms > 4.0, stacked * 4.0 / norms, stacked)
+        sizes = torch.tensor([size for size, _ in self.models],
+                             dtype=torch.float32)
+        expected = (sizes.unsqueeze(1) * clipped).sum(0) / sizes.sum()
+
+        updated_model = aggregator.aggregate({'client_feedback': self.models})
+        init_model = self.model.state_dict()
+        flat = torch.cat([
+            updated_model[key].flatten() - init_model[key].flatten()
+            for key in init_model
+        ])
+        self.assertTrue(torch.allclose(flat, expected, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
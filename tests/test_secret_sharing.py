@@ -0,0 +1,127 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import time
+import unittest
+
+import numpy as np
+import torch
+
+from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.secret_sharing import AdditiveSecretSharing
+from federatedscope.core.secret_sharing.secret_sharing import \
+    benchmark_secret_sharing
+
+
+class LegacyAdditiveSecretSharing(object):
+    # The scalar by scalar implementation, as reference
+    def __init__(self, shared_party_num, size=60):
+        self.shared_party_num = shared_party_num
+        self.maximum = 2**size
+        self.mod_number = 2 * self.maximum + 1
+        self.epsilon = 1e8
+        self.mod_funs = np.vectorize(lambda x: x % self.mod_number)
+        self.float2fixedpoint = np.vectorize(self._float2fixedpoint)
+        self.fixedpoint2float = np.vectorize(self._fixedpoint2float)
+
+    def secret_split(self, secret):
+        secret = np.asarray(secret)
+        shape = [self.shared_party_num - 1] + list(secret.shape)
+        secret = self.float2fixedpoint(secret)
+        secret_seq = np.random.randint(low=0, high=self.mod_number, size=shape)
+        last_seq = self.mod_funs(secret -
+                                 self.mod_funs(np.sum(secret_seq, axis=0)))
+        return np.append(secret_seq, np.expand_dims(last_seq, axis=0), axis=0)
+
+    def _float2fixedpoint(self, x):
+        x = round(x * self.epsilon, 0)
+        assert abs(x) < self.maximum
+        return x % self.mod_number
+
+    def _fixedpoint2float(self, x):
+        x = x % self.mod_number
+        if x > self.maximum:
+            return -1 * (self.mod_number - x) / self.epsilon
+        else:
+            return x / self.epsilon
+
+
+class SecretSharingTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        np.random.seed(0)
+
+    def test_against_legacy(self):
+        secret = np.random.randn(3, 100) * 100
+        legacy = LegacyAdditiveSecretSharing(shared_party_num=3)
+        ss_manager = AdditiveSecretSharing(shared_party_num=3, seed=0)
+
+        frames = ss_manager.secret_split(secret)
+        self.assertEqual(frames.shape, (3, 3, 100))
+        self.assertEqual(frames.dtype, np.int64)
+        recovered = ss_manager.secret_reconstruct(frames)
+        legacy_recovered = legacy.fixedpoint2float(
+            legacy.secret_split(secret).sum(axis=0))
+        np.testing.assert_allclose(recovered, secret, atol=1e-8)
+        np.testing.assert_allclose(recovered, legacy_recovered, atol=1e-5)
+
+        # A single frame tells nothing about the secret
+        self.assertFalse(
+            np.allclose(ss_manager.fixedpoint2float(frames[0]),
+                        secret,
+                        atol=1.))
+
+        # The frames of the same seed are the same
+        again = AdditiveSecretSharing(shared_party_num=3, seed=0)
+        np.testing.assert_array_equal(again.secret_split(secret), frames)
+
+    def test_secure_aggregation(self):
+        # Each client splits sample_size * model_para into a frame for each
+        # client, which sums up the received frames for the server
+        client_num = 4
+        ss_manager = AdditiveSecretSharing(shared_party_num=client_num)
+        models = [(size, {
+            'weight': torch.randn(4, 3),
+            'bias': torch.randn(3).double()
+        }) for size in [10, 20, 30, 40]]
+        frames = [
+            ss_manager.secret_split(
+                {key: value * size
+                 for key, value in model.items()}) for size, model in models
+        ]
+        feedback = []
+        for idx, (size, _) in enumerate(models):
+            merged = dict(frames[0][idx])
+            for client_frames in frames[1:]:
+                for key in merged:
+                    merged[key] = merged[key] + client_frames[idx][key]
+            feedback.append((size, merged))
+
+        cfg = global_cfg.clone()
+        cfg.federate.use_ss = True
+        aggregator = ClientsAvgAggregator(config=cfg)
+        avg_model = aggregator.aggregate({
+            'client_feedback': feedback,
+            'recover_fun': ss_manager.fixedpoint2float
+        })
+        for key in ['weight', 'bias']:
+            expected = sum(size * model[key] for size, model in models) / 100.
+            self.assertTrue(
+                torch.allclose(avg_model[key].double(),
+                               expected.double(),
+                               atol=1e-6))
+
+    def test_benchmark(self):
+        legacy = LegacyAdditiveSecretSharing(shared_party_num=3)
+        secret = np.random.randn(10**4)
+        start = time.time()
+        legacy.fixedpoint2float(legacy.secret_split(secret).sum(axis=0))
+        legacy_throughput = len(secret) / (time.time() - start)
+
+        results = benchmark_secret_sharing(num_params=[10**4], repeat=1)
+        self.assertEqual(results[0]['num_params'], 10**4)
+        self.assertGreater(results[0]['split_params_per_second'],
+                           legacy_throughput)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from federatedscope.llm.eval.pairwise_selector import PairwiseSelector
+from federatedscope.llm.eval.selection_scheduler import \
+    benchmark_schedulers, get_selection_scheduler
+
+
+class CharTokenizer(object):
+    """
+    Character-level tokenizer, whose ids are the ASCII codes.
+    """
+    model_max_length = 256
+    eos_token = '\n'
+    pad_token_id = 0
+
+    def __call__(self, text, return_tensors=None, **kwargs):
+        return SimpleNamespace(input_ids=torch.tensor([[ord(c)
+                                                        for c in text]]))
+
+
+class ToyModel(torch.nn.Module):
+    """
+    Selector whose logits of ``A`` and ``B`` are the (ASCII codes of the)
+    two candidates, i.e., the candidate with the largest code is preferred.
+    """
+    def forward(self, input_ids, labels, choices, **kwargs):
+        return SimpleNamespace(logits=input_ids[:, :2].float())
+
+
+def build_comparison(sample, idx_a, idx_b):
+    return {
+        'output_A': sample[idx_a],
+        'output_B': sample[idx_b],
+        'choice': ' A'
+    }
+
+
+class SelectionSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        rng = np.random.RandomState(0)
+        self.selector = PairwiseSelector(ToyModel(),
+                                         CharTokenizer(),
+                                         '{output_A}{output_B}',
+                                         choices=[ord('A'), ord('B')],
+                                         batch_size=128,
+                                         device='cpu')
+        # The candidates of each sample are distinct letters
+        self.dataset = [
+            ''.join(rng.permutation(list('abcdefgh'))) for _ in range(3)
+        ]
+
+    def select(self, n, **kwargs):
+        dataset = [sample[:n] for sample in self.dataset]
+        results = benchmark_schedulers(self.selector, build_comparison,
+                                       dataset, n, **kwargs)
+        expected = [np.argmax([ord(c) for c in sample]) for sample in dataset]
+        for best_idx, _ in results.values():
+            self.assertEqual(best_idx.tolist(), expected)
+        return {
+            schedule: stats['forward_passes']
+            for schedule, (_, stats) in results.items()
+        }, {
+            schedule: (stats['comparisons'], stats['rounds'])
+            for schedule, (_, stats) in results.items()
+        }
+
+    def test_forward_passes(self):
+        # All the matches of a round are one forward pass
+        forward_passes, counts = self.select(5)
+        self.assertEqual(forward_passes, {
+            'sequential': 4,
+            'knockout': 3,
+            'all_pairs': 1
+        })
+        # (n - 1) comparisons per sample, but all the pairs with all_pairs
+        self.assertEqual(
+            counts, {
+                'sequential': (4 * 3, 4),
+                'knockout': (4 * 3, 3),
+                'all_pairs': (10 * 3, 1)
+            })
+
+        forward_passes, _ = self.select(8)
+        self.assertEqual(forward_passes, {
+            'sequential': 7,
+            'knockout': 3,
+            'all_pairs': 1
+        })
+
+    def test_chunks(self):
+        # Each chunk of samples is scheduled on its own
+        forward_passes, _ = self.select(5, chunk_size=2)
+        self.assertEqual(forward_passes, {
+            'sequential': 4 * 2,
+            'knockout': 3 * 2,
+            'all_pairs': 1 * 2
+        })
+
+        # The rounds larger than a batch of the selector take several passes
+        self.selector.batch_size = 4
+        forward_passes, _ = self.select(5)
+        self.assertEqual(forward_passes, {
+            'sequential': 4,
+            'knockout': 2 + 1 + 1,
+            'all_pairs': 8
+        })
+
+    def test_single_candidate(self):
+        forward_passes, _ = self.select(1)
+        self.assertEqual(forward_passes, {
+            'sequential': 0,
+            'knockout': 0,
+            'all_pairs': 0
+        })
+        with self.assertRaises(ValueError):
+            get_selection_scheduler('round_robin', self.selector,
+                                    build_comparison)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import shutil
+import tempfile
+import unittest
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from federatedscope.core.message import Message
+from federatedscope.core.proto import gRPC_comm_manager_pb2
+from federatedscope.core.proto.tensor_frame import TENSOR_FRAME_VERSION
+from federatedscope.llm.model.adapter_builder import AdapterModel
+from federatedscope.llm.offsite_tuning.shard_store import ShardStore, \
+    array_to_bytes, bytes_to_array, get_missing_shards, \
+    load_model_from_shards, save_model_shards
+from federatedscope.llm.offsite_tuning.utils import \
+    generate_emulator_and_adapter
+
+VOCAB_SIZE = 50
+
+
+def build_adap_model():
+    config = GPT2Config(vocab_size=VOCAB_SIZE,
+                        n_positions=32,
+                        n_embd=16,
+                        n_layer=6,
+                        n_head=2)
+    model = AdapterModel(GPT2LMHeadModel(config).eval(),
+                         use_adapter=True,
+                         adapter_package='peft',
+                         adapter_method='lora',
+                         r=4,
+                         target_modules=['c_attn'])
+    return generate_emulator_and_adapter(model,
+                                         emulator_l=1,
+                                         emulator_r=5,
+                                         drop_ratio=0.5)
+
+
+class ShardStoreTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.root = tempfile.mkdtemp()
+        self.input_ids = torch.randint(VOCAB_SIZE, (2, 10))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_save_and_load(self):
+        adap_model = build_adap_model()
+        store = ShardStore(os.path.join(self.root, 'server'))
+        # Small shards to split the model
+        manifest = save_model_shards(adap_model, store, shard_size=4096)
+        self.assertGreater(len(manifest['shards']), 2)
+
+        loaded_model = load_model_from_shards(manifest, [store])
+        with torch.no_grad():
+            self.assertTrue(
+                torch.equal(
+                    loaded_model(input_ids=self.input_ids).logits,
+                    adap_model(input_ids=self.input_ids).logits))
+        self.assertEqual(
+            {
+                name: param.requires_grad
+                for name, param in loaded_model.named_parameters()
+            }, {
+                name: param.requires_grad
+                for name, param in adap_model.named_parameters()
+            })
+        # The tied weights stay tied
+        self.assertIs(loaded_model.model.get_output_embeddings().weight,
+                      loaded_model.get_input_embeddings().weight)
+        self.assertIs(loaded_model.student_l, loaded_model.student[0])
+
+        # Only the shards of the updated adapter are new
+        with torch.no_grad():
+            for param in adap_model.parameters():
+                if param.requires_grad:
+                    param.add_(1.)
+        new_manifest = save_model_shards(adap_model, store, shard_size=4096)
+        digests = {shard['digest'] for shard in manifest['shards']}
+        new_shards = [
+            shard for shard in new_manifest['shards']
+            if shard['digest'] not in digests
+        ]
+        self.assertTrue(new_shards)
+        for shard in new_shards:
+            self.assertTrue(all('lora' in name for name in shard['names']))
+        self.assertEqual(get_missing_shards(new_manifest, [store]), [])
+
+    def test_chunked_transfer(self):
+        adap_model = build_adap_model()
+        server_store = ShardStore(os.path.join(self.root, 'server'))
+        client_store = ShardStore(os.path.join(self.root, 'client'))
+        manifest = save_model_shards(adap_model, server_store)
+        shard = manifest['shards'][0]
+        self.assertEqual(get_missing_shards(manifest, [client_store]),
+                         manifest['shards'])
+
+        chunk_size = 1000
+        offset = 0
+        while True:
+            data = server_store.read_chunk(shard['digest'], offset, chunk_size)
+            if client_store.write_chunk(shard['digest'], offset, data,
+                                        shard['size']):
+                break
+            offset += len(data)
+            # The transfer resumes from the received bytes
+            self.assertEqual(client_store.num_received(shard['digest']),
+                             offset)
+        self.assertTrue(client_store.has(shard['digest']))
+
+        # Corrupted shards are rejected
+        digest = manifest['shards'][1]['digest']
+        data = bytearray(server_store.read_chunk(digest, 0, -1))
+        data[-1] ^= 1
+        with self.assertRaises(ValueError):
+            client_store.write_chunk(digest, 0, bytes(data), len(data))
+        self.assertFalse(client_store.has(digest))
+
+    def test_grpc_message(self):
+        adap_model = build_adap_model()
+        store = ShardStore(os.path.join(self.root, 'server'))
+        manifest = save_model_shards(adap_model, store)
+        digest = manifest['shards'][0]['digest']
+        chunk = store.read_chunk(digest, 0, 1000)
+
+        for version in [TENSOR_FRAME_VERSION, 0]:
+            received = []
+            for msg_type, content in [
+                ('emulator_and_adapter',
+                 dict(manifest,
+                      skeleton=bytes_to_array(manifest['skeleton']))),
+                ('emulator_shard_chunk',
+                 dict(digest=digest, offset=0, data=bytes_to_array(chunk)))
+            ]:
+                message = Message(msg_type=msg_type,
+                                  sender=0,
+                                  receiver=[1],
+                                  state=0,
+                                  content=content)
+                data = message.transform(to_list=True,
+                                         version=version).SerializeToString()
+                request = gRPC_comm_manager_pb2.MessageRequest.FromString(data)
+                received_message = Message()
+                received_message.parse(request.msg, request.tensor_frame)
+                received.append(received_message.content)
+
+            received_manifest, received_chunk = received
+            self.assertEqual(array_to_bytes(received_chunk['data']), chunk)
+            self.assertEqual(received_chunk['digest'], digest)
+            received_manifest['skeleton'] = array_to_bytes(
+                received_manifest['skeleton'])
+            self.assertEqual(received_manifest['skeleton'],
+                             manifest['skeleton'])
+            loaded_model = load_model_from_shards(received_manifest, [store])
+            with torch.no_grad():
+                self.assertTrue(
+                    torch.equal(
+                        loaded_model(input_ids=self.input_ids).logits,
+                        adap_model(input_ids=self.input_ids).logits))
+
+
+if __name__ == '__main__':
+    unittest.main()
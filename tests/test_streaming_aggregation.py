@@ -0,0 +1,146 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import numpy as np
+import torch
+
+from federatedscope.core.aggregators import ClientsAvgAggregator
+from federatedscope.core.aggregators.running_sum import RunningWeightedSum
+from federatedscope.core.auxiliaries.data_builder import get_data
+from federatedscope.core.auxiliaries.logging import update_logger
+from federatedscope.core.auxiliaries.runner_builder import get_runner
+from federatedscope.core.auxiliaries.utils import setup_seed
+from federatedscope.core.auxiliaries.worker_builder import get_client_cls, \
+    get_server_cls
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.monitors.metric_calculator import \
+    StreamingBLocalDissim, StreamingL2Dissim, calc_blocal_dissim, \
+    calc_l2_dissim
+from federatedscope.llm.llm_local.aggregator import MultiLoRAAvgAggregator
+
+
+def random_state_dict(keys):
+    return {
+        key: torch.randn(4, 3)
+        if key != 'bias' else torch.randn(3).to(torch.bfloat16)
+        for key in keys
+    }
+
+
+class StreamingAggregationTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.cfg = global_cfg.clone()
+
+    def test_running_sum(self):
+        running_sum = RunningWeightedSum()
+        models = [(size, random_state_dict(['a', 'bias']))
+                  for size in [1., 2., 3.]]
+        for size, model in models:
+            running_sum.add(model, size)
+        self.assertEqual(running_sum.num, 3)
+        self.assertEqual(running_sum.totals, {'a': 6., 'bias': 6.})
+
+        avg_model = running_sum.average()
+        for key in ['a', 'bias']:
+            expected = sum(size * model[key].float()
+                           for size, model in models) / 6.
+            self.assertEqual(avg_model[key].dtype, models[0][1][key].dtype)
+            self.assertTrue(
+                torch.allclose(avg_model[key].float(),
+                               expected,
+                               atol=1e-2 if key == 'bias' else 1e-6))
+
+    def test_clients_avg(self):
+        models = [(size, random_state_dict(['a', 'b']))
+                  for size in [10, 30, 60]]
+        buffered = ClientsAvgAggregator(config=self.cfg).aggregate(
+            {'client_feedback': models})
+
+        aggregator = ClientsAvgAggregator(config=self.cfg)
+        for content in models:
+            aggregator.fold(content)
+        # The feedbacks are dropped from the buffer
+        avg_model = aggregator.aggregate(
+            {'client_feedback': [(size, dict()) for size, _ in models]})
+        self.assertIsNone(aggregator.running_sum)
+        for key in buffered:
+            self.assertTrue(
+                torch.allclose(avg_model[key], buffered[key], atol=1e-6))
+
+    def test_multi_lora_on_model(self):
+        model = torch.nn.Linear(3, 4)
+        models = [(10, {
+            'weight': torch.randn(4, 3)
+        }), (30, {
+            'weight': torch.randn(4, 3),
+            'bias': torch.randn(4)
+        })]
+        for total_train_size in [None, 80]:
+            results = []
+            for streaming in [False, True]:
+                aggregator = MultiLoRAAvgAggregator(model=model,
+                                                    config=self.cfg)
+                if total_train_size is not None:
+                    aggregator.total_train_size = total_train_size
+                feedback = models
+                if streaming:
+                    for content in models:
+                        aggregator.fold(content)
+                    feedback = [(size, dict()) for size, _ in models]
+                results.append(
+                    aggregator.aggregate_on_model(
+                        {'client_feedback': feedback}))
+            for key in results[0]:
+                self.assertTrue(
+                    torch.allclose(results[0][key], results[1][key],
+                                   atol=1e-6))
+
+    def test_streaming_model_metrics(self):
+        last_model = random_state_dict(['a', 'b'])
+        models = [(size, random_state_dict(['a', 'b']))
+                  for size in [10, 30, 60]]
+        for estimator, calc in [(StreamingBLocalDissim, calc_blocal_dissim),
+                                (StreamingL2Dissim, calc_l2_dissim)]:
+            streaming = estimator(last_model)
+            for size, model in models:
+                streaming.update(size, model)
+            expected = calc(last_model, models)
+            result = streaming.result()
+            self.assertEqual(set(result), set(expected))
+            for key in expected:
+                np.testing.assert_allclose(result[key],
+                                           expected[key],
+                                           rtol=1e-5)
+
+    def test_toy_standalone(self):
+        results = []
+        for streaming in [False, True]:
+            init_cfg = global_cfg.clone()
+            init_cfg.federate.mode = 'standalone'
+            init_cfg.federate.total_round_num = 10
+            init_cfg.federate.client_num = 5
+            init_cfg.federate.streaming_aggr = streaming
+            init_cfg.eval.freq = 10
+            init_cfg.data.type = 'toy'
+            init_cfg.model.type = 'lr'
+            setup_seed(init_cfg.seed)
+            update_logger(init_cfg, True)
+
+            data, modified_config = get_data(init_cfg.clone())
+            init_cfg.merge_from_other_cfg(modified_config)
+            Fed_runner = get_runner(data=data,
+                                    server_class=get_server_cls(init_cfg),
+                                    client_class=get_client_cls(init_cfg),
+                                    config=init_cfg.clone())
+            Fed_runner.run()
+            results.append(Fed_runner.server.models[0].state_dict())
+
+        for key in results[0]:
+            self.assertTrue(
+                torch.allclose(results[0][key], results[1][key], atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import shutil
+import tempfile
+import unittest
+
+import torch
+
+from federatedscope.llm.offsite_tuning.kd_trainer import get_kd_loss, l2_norm
+from federatedscope.llm.offsite_tuning.teacher_cache import \
+    TeacherActivationCache, build_teacher_cache, get_teacher_cache_path
+from federatedscope.llm.offsite_tuning.utils import add_epilogue, \
+    add_prologue
+
+VOCAB_SIZE = 50
+HIDDEN_SIZE = 8
+
+
+class ToyLayer(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(HIDDEN_SIZE, HIDDEN_SIZE)
+
+    def forward(self, x, attention_mask=None):
+        return (torch.tanh(self.linear(x)), )
+
+
+class ToyAdapModel(torch.nn.Module):
+    """
+    Emulator (layers 1 and 2) and adapter (layers 0 and 3) built like
+    ``set_layers``, with the emulator distilled from a teacher of 3 layers.
+    """
+    def __init__(self):
+        super().__init__()
+        self.embedding = torch.nn.Embedding(VOCAB_SIZE, HIDDEN_SIZE)
+        self.layers = torch.nn.ModuleList([ToyLayer() for _ in range(4)])
+        self.student = self.layers[1:3]
+        self.adapter = self.layers[:1] + self.layers[3:]
+        add_prologue(self.student[0], None)
+        add_epilogue(self.student[-1], None)
+        self.student_l = self.student[0]
+        self.student_r = self.student[-1]
+        self.teacher_model_mapping = [0, 2]
+
+    def forward(self, input_ids, attention_mask=None, **kwargs):
+        hidden = self.embedding(input_ids)
+        for layer in self.layers:
+            hidden = layer(hidden, attention_mask=attention_mask)[0]
+        return hidden
+
+
+class ToyRawModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.teacher = torch.nn.ModuleList([ToyLayer() for _ in range(3)])
+
+
+def padded_batch(sequences):
+    input_ids = torch.nn.utils.rnn.pad_sequence(sequences,
+                                                batch_first=True,
+                                                padding_value=0)
+    attention_mask = torch.zeros_like(input_ids)
+    for row, ids in enumerate(sequences):
+        attention_mask[row, :len(ids)] = 1
+    return dict(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class TeacherCacheTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+        torch.manual_seed(0)
+        self.root = tempfile.mkdtemp()
+        self.adap_model = ToyAdapModel()
+        # The adapter is frozen in the alignment
+        self.adap_model.embedding.requires_grad_(False)
+        self.adap_model.adapter.requires_grad_(False)
+        self.raw_model = ToyRawModel()
+        self.sequences = [
+            torch.randint(1, VOCAB_SIZE, (length, ))
+            for length in [5, 9, 3, 7, 7]
+        ]
+        self.sequences.append(self.sequences[0].clone())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def build(self, layerwise_distill, fp16=False):
+        path = get_teacher_cache_path(self.root,
+                                      layerwise_distill=layerwise_distill,
+                                      fp16=fp16)
+        loader = [
+            padded_batch(self.sequences[:4]),
+            padded_batch(self.sequences[4:])
+        ]
+        build_teacher_cache(path,
+                            self.raw_model,
+                            self.adap_model,
+                            loader,
+                            'cpu',
+                            layerwise_distill=layerwise_distill,
+                            fp16=fp16)
+        return TeacherActivationCache(path)
+
+    def live_and_cached_losses(self, cache, layerwise_distill, batch):
+        self.adap_model(**batch)
+        live = get_kd_loss(l2_norm,
+                           self.raw_model,
+                           self.adap_model,
+                           layerwise_distill=layerwise_distill,
+                           attention_mask=batch['attention_mask'])
+        cached = get_kd_loss(l2_norm,
+                             self.raw_model,
+                             self.adap_model,
+                             layerwise_distill=layerwise_distill,
+                             teacher_outputs=cache.lookup(**batch),
+                             attention_mask=batch['attention_mask'])
+        return live, cached
+
+    def test_lookup(self):
+        cache = self.build(layerwise_distill=True)
+        self.assertEqual(len(cache), len(self.sequences) - 1)  # duplicate
+        self.assertEqual(cache.layers, [0, 2])
+
+        # Any batching (and padding) of the samples hits the cache
+        batch = padded_batch([self.sequences[1], self.sequences[2]])
+        outputs = cache.lookup(**batch)
+        self.assertEqual(outputs[0].shape, (9 + 3, HIDDEN_SIZE))
+
+        self.adap_model(**batch)
+        args = self.adap_model.student_l.input_args
+        hidden = args[0]
+        mask = batch['attention_mask'].bool()
+        with torch.no_grad():
+            for i, layer in enumerate(self.raw_model.teacher):
+                hidden = layer(hidden)[0]
+                if i in cache.layers:
+                    self.assertTrue(
+                        torch.allclose(outputs[cache.layers.index(i)],
+                                       hidden[mask],
+                                       atol=1e-6))
+
+        with self.assertRaises(KeyError):
+            cache.lookup(**padded_batch([torch.tensor([1, 2, 3, 4, 5, 6])]))
+
+    def test_kd_loss(self):
+        # With and without padding, the losses are the same as the live
+        # teacher's
+        batches = [
+            padded_batch(self.sequences[3:5]),
+            padded_batch(self.sequences[:4])
+        ]
+        for layerwise_distill in [False, True]:
+            cache = self.build(layerwise_distill)
+            for batch in batches:
+                live, cached = self.live_and_cached_losses(
+                    cache, layerwise_distill, batch)
+                self.assertTrue(torch.allclose(live, cached, atol=1e-6))
+
+        # The padded tokens are left out of the live loss
+        batch = batches[1]
+        self.adap_model(**batch)
+        self.assertFalse(
+            torch.allclose(
+                get_kd_loss(l2_norm, self.raw_model, self.adap_model),
+                self.live_and_cached_losses(cache, False, batch)[0]))
+
+        # The outputs in half precision are close
+        cache = self.build(False, fp16=True)
+        for batch in batches:
+            live, cached = self.live_and_cached_losses(cache, False, batch)
+            self.assertTrue(torch.allclose(live, cached, atol=1e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
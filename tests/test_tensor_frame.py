@@ -0,0 +1,140 @@
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import numpy as np
+import torch
+
+from federatedscope.core.auxiliaries.utils import param2tensor
+from federatedscope.core.communication import gRPCCommManager
+from federatedscope.core.configs.config import global_cfg
+from federatedscope.core.gRPC_server import WIRE_VERSION
+from federatedscope.core.message import Message
+from federatedscope.core.proto import gRPC_comm_manager_pb2
+from federatedscope.core.proto.tensor_frame import TENSOR_FRAME_VERSION, \
+    benchmark_tensor_frame, decode_tensor_frame, encode_tensor_frame
+
+
+def build_state_dict():
+    torch.manual_seed(0)
+    return {
+        'weight': torch.randn(4, 3),
+        'bias': torch.randn(3).to(torch.bfloat16),
+        'steps': torch.tensor(7),
+        'empty': torch.empty(0, 5),
+        'transposed': torch.randn(3, 5).t(),
+        'array': np.arange(12, dtype=np.int32).reshape(3, 4),
+    }
+
+
+def assert_equal(test, expected, received):
+    test.assertEqual(set(expected), set(received))
+    for key, value in expected.items():
+        test.assertEqual(type(received[key]), type(value))
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(received[key], value)
+            test.assertEqual(received[key].dtype, value.dtype)
+        else:
+            test.assertTrue(torch.equal(received[key], value))
+
+
+class TensorFrameTest(unittest.TestCase):
+    def setUp(self):
+        print(('Testing %s.%s' % (type(self).__name__, self._testMethodName)))
+
+    def test_frame(self):
+        state_dict = build_state_dict()
+        frame = encode_tensor_frame(list(state_dict.values()))
+        received = dict(zip(state_dict, decode_tensor_frame(frame)))
+        assert_equal(self, state_dict, received)
+
+        # The tensors are views on the frame
+        self.assertFalse(received['array'].flags.writeable)
+        address = np.frombuffer(frame, dtype=np.uint8).ctypes.data
+        self.assertTrue(
+            address <= received['weight'].data_ptr() < address + len(frame))
+
+    def test_message(self):
+        state_dict = build_state_dict()
+        results = dict()
+        for version in [TENSOR_FRAME_VERSION, 0]:
+            message = Message(msg_type='model_para',
+                              sender=1,
+                              receiver=[0],
+                              state=3,
+                              content=(16, dict(state_dict)))
+            data = message.transform(to_list=True,
+                                     version=version).SerializeToString()
+            request = gRPC_comm_manager_pb2.MessageRequest.FromString(data)
+            received = Message()
+            received.parse(request.msg, request.tensor_frame)
+            self.assertEqual((received.sender, received.receiver,
+                              received.state, received.msg_type),
+                             (1, [0], 3, 'model_para'))
+            self.assertEqual(received.content[0], 16)
+            results[version] = (len(data), received.content[1])
+
+        assert_equal(self, state_dict, results[TENSOR_FRAME_VERSION][1])
+        # The legacy format carries the pickled (and base64 encoded) tensors
+        legacy = {
+            key: param2tensor(value)
+            for key, value in results[0][1].items()
+        }
+        assert_equal(self, state_dict, legacy)
+        self.assertLess(results[TENSOR_FRAME_VERSION][0], results[0][0])
+
+    def test_negotiation(self):
+        cfg = global_cfg.clone().distribute
+        server = gRPCCommManager(host='127.0.0.1',
+                                 port='50071',
+                                 client_num=1,
+                                 cfg=cfg)
+        legacy_client = gRPCCommManager(host='127.0.0.1',
+                                        port='50072',
+                                        client_num=1,
+                                        cfg=cfg)
+        # Which supports the legacy format only
+        legacy_client.server_funcs.version = 0
+        client = gRPCCommManager(host='127.0.0.1',
+                                 port='50073',
+                                 client_num=1,
+                                 cfg=cfg)
+        server.add_neighbors(1, '127.0.0.1:50072')
+        server.add_neighbors(2, '127.0.0.1:50073')
+        client.add_neighbors(0, '127.0.0.1:50071')
+
+        # The legacy format is used until the version is known
+        for expected_type in [str, torch.Tensor]:
+            server.send(
+                Message(msg_type='model_para',
+                        sender=0,
+                        receiver=[1, 2],
+                        content={'weight': torch.ones(3)}))
+            self.assertIsInstance(legacy_client.receive().content['weight'],
+                                  str)
+            self.assertIsInstance(client.receive().content['weight'],
+                                  expected_type)
+        self.assertEqual(server.peer_versions, {
+            '127.0.0.1:50072': 0,
+            '127.0.0.1:50073': WIRE_VERSION
+        })
+
+        # The client knows the version of the server from its requests
+        client.send(
+            Message(msg_type='model_para',
+                    sender=2,
+                    receiver=[0],
+                    content={'weight': torch.ones(3)}))
+        self.assertIsInstance(server.receive().content['weight'], torch.Tensor)
+
+        for comm_manager in [server, legacy_client, client]:
+            comm_manager.close()
+
+    def test_benchmark(self):
+        results = benchmark_tensor_frame(sizes_mb=[1, 4], tensor_mb=1)
+        for result in results:
+            self.assertLess(result['frame']['bytes'],
+                            result['legacy']['bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()